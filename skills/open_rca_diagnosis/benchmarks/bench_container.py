@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+"""
+Container Analyzer Benchmark - 容器层异常检测回归基准
+对比逐KPI/逐容器循环的原实现与分组向量化实现：结果必须一致，并报告加速比
+
+Usage:
+    python bench_container.py --containers 200 --kpis 60 --points 1440
+    python bench_container.py --min-speedup 5
+"""
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'scripts'))
+from market.analyze_container import classify_kpi, compute_kpi_thresholds, detect_container_anomalies
+
+
+def legacy_thresholds(df: pd.DataFrame) -> dict:
+    """原实现：逐KPI布尔掩码扫描"""
+    thresholds = {}
+    for kpi_name in df['kpi_name'].unique():
+        kpi_data = df[df['kpi_name'] == kpi_name]['value'].dropna()
+        if len(kpi_data) > 0:
+            thresholds[kpi_name] = {
+                'P95': np.percentile(kpi_data, 95),
+                'P90': np.percentile(kpi_data, 90),
+                'P50': np.percentile(kpi_data, 50)
+            }
+    return thresholds
+
+
+def legacy_detect(filtered: pd.DataFrame, thresholds: dict) -> list:
+    """原实现：容器 × KPI 双重循环"""
+    anomalies = []
+    for cmdb_id in filtered['cmdb_id'].unique():
+        container_data = filtered[filtered['cmdb_id'] == cmdb_id]
+        for kpi_name in container_data['kpi_name'].unique():
+            if kpi_name not in thresholds:
+                continue
+            kpi_data = container_data[container_data['kpi_name'] == kpi_name]['value'].dropna()
+            if len(kpi_data) == 0:
+                continue
+            mean_val = kpi_data.mean()
+            max_val = kpi_data.max()
+            threshold_p95 = thresholds[kpi_name]['P95']
+            if mean_val > threshold_p95:
+                deviation = (mean_val - threshold_p95) / threshold_p95
+                if deviation > 0.5:
+                    anomalies.append({
+                        'cmdb_id': cmdb_id,
+                        'kpi_name': kpi_name,
+                        'resource_type': classify_kpi(kpi_name),
+                        'value': mean_val,
+                        'max': max_val,
+                        'threshold': threshold_p95,
+                        'deviation': deviation
+                    })
+    anomalies.sort(key=lambda x: x['deviation'], reverse=True)
+    return anomalies
+
+
+def make_frame(containers: int, kpis: int, points: int, seed: int = 0) -> pd.DataFrame:
+    """生成长格式容器指标，包含缺失值、常量KPI和注入的资源异常"""
+    rng = np.random.default_rng(seed)
+    kinds = ['cpu_usage', 'memory_usage_MB', 'fs_writes_MB', 'fs_reads_MB', 'network_receive_packets', 'threads']
+    kpi_names = [f"container_{kinds[i % len(kinds)]}.{i}" for i in range(kpis)]
+    cmdb_ids = [f"node-{i % 6 + 1}.svc{i // 4}-{i % 4}" for i in range(containers)]
+    timestamps = 1647705600 + 60 * np.arange(points)
+
+    ts = np.tile(np.repeat(timestamps, kpis), containers)
+    cmdb = np.repeat(np.arange(containers), points * kpis)
+    kpi = np.tile(np.arange(kpis), containers * points)
+    value = rng.gamma(4.0, 1.0, len(ts))
+
+    value[kpi == 0] = 0.0                                   # 常量KPI，P95为0
+    value[rng.random(len(ts)) < 0.01] = np.nan              # 缺失值
+    window = (ts >= timestamps[points // 2]) & (ts < timestamps[points // 2 + 30])
+    faulty = np.isin(cmdb, rng.choice(containers, max(containers // 20, 1), replace=False))
+    value[window & faulty & (kpi % 3 == 0)] *= 8.0          # 注入异常
+    value[window & faulty & (kpi == 0)] = 1.0               # P95为0时偏离为 inf
+
+    return pd.DataFrame({
+        'timestamp': ts,
+        'cmdb_id': np.array(cmdb_ids, dtype=object)[cmdb],
+        'kpi_name': np.array(kpi_names, dtype=object)[kpi],
+        'value': value,
+    })
+
+
+def same_result(legacy: list, vectorized: list) -> bool:
+    if len(legacy) != len(vectorized):
+        return False
+    for a, b in zip(legacy, vectorized):
+        if (a['cmdb_id'], a['kpi_name'], a['resource_type']) != (b['cmdb_id'], b['kpi_name'], b['resource_type']):
+            return False
+        for key in ('value', 'max', 'threshold', 'deviation'):
+            if not np.isclose(a[key], b[key], rtol=1e-9, atol=0.0, equal_nan=True):
+                return False
+    return True
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Container Analyzer Benchmark')
+    parser.add_argument('--containers', type=int, default=100, help='Number of containers')
+    parser.add_argument('--kpis', type=int, default=40, help='Number of KPIs per container')
+    parser.add_argument('--points', type=int, default=720, help='Samples per series')
+    parser.add_argument('--min-speedup', type=float, default=1.0, help='Fail if speedup falls below this')
+
+    args = parser.parse_args()
+
+    df = make_frame(args.containers, args.kpis, args.points)
+    mid = df['timestamp'].min() + 60 * (args.points // 2)
+    filtered = df[(df['timestamp'] >= mid) & (df['timestamp'] <= mid + 1800)]
+
+    print(f"{'='*70}")
+    print("容器层异常检测基准")
+    print(f"{'='*70}")
+    print(f"数据量: {len(df):,} 行 ({args.containers} 容器 × {args.kpis} KPI × {args.points} 点)")
+    print(f"窗口数据: {len(filtered):,} 行")
+
+    legacy_th, t_legacy_th = timed(legacy_thresholds, df)
+    with np.errstate(divide='ignore'):
+        legacy, t_legacy_detect = timed(legacy_detect, filtered, legacy_th)
+    vec_th, t_vec_th = timed(compute_kpi_thresholds, df)
+    vectorized, t_vec_detect = timed(detect_container_anomalies, filtered, vec_th)
+
+    t_legacy = t_legacy_th + t_legacy_detect
+    t_vec = t_vec_th + t_vec_detect
+    speedup = t_legacy / t_vec if t_vec > 0 else float('inf')
+    identical = same_result(legacy, vectorized)
+
+    print(f"\n{'阶段':<12}{'循环实现':>12}{'向量化':>12}")
+    print(f"{'阈值计算':<12}{t_legacy_th:>11.3f}s{t_vec_th:>11.3f}s")
+    print(f"{'异常检测':<12}{t_legacy_detect:>11.3f}s{t_vec_detect:>11.3f}s")
+    print(f"{'合计':<12}{t_legacy:>11.3f}s{t_vec:>11.3f}s")
+    print(f"\n加速比: {speedup:.1f}x")
+    print(f"异常数: {len(legacy)} / {len(vectorized)}")
+    print(f"结果一致: {'是' if identical else '否'}")
+
+    if not identical:
+        sys.exit(1)
+    if speedup < args.min_speedup:
+        print(f"回归: 加速比低于 {args.min_speedup}x")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+"""
+Latency Sketch Benchmark - 延迟概要与精确分位数的准确度和内存对比
+用 gen_telemetry 生成一天的 trace_span.csv，在独立子进程中分别：
+
+    精确     读取全部span，按窗口和分组精确计算分位数（interpolation='lower'）
+    构建     按块构建 (操作 × Pod × 分钟) 的 DDSketch 存储（common.latency_store，--max-memory 预算）
+    概要     打开已构建的存储，合并概要回答同样的查询
+
+报告每种方式的峰值RSS（及相对只导入模块的基线的增量）、耗时，概要存储的大小，以及 p50/p95/p99 相对精确值的误差
+（最大值和超过 alpha 的比例）。查询为全天和若干随机的30分钟窗口（对齐到分钟），
+每个窗口按 全部 / 操作 / Pod / 操作 × Pod 分组。
+
+Usage:
+    python bench_latency.py --spans 2M
+    python bench_latency.py --spans 10M --alpha 0.005 --windows 50 --max-memory 128M --data-dir /data/latency
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+from gen_telemetry import SHARES, START_TS, generate, parse_count
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'scripts'))
+from common.latency_store import latency_quantiles, open_latency
+from common.telemetry_cache import load_telemetry, parse_size
+
+QUANTILES = (0.5, 0.95, 0.99)
+GROUPINGS = [[], ['operation_name'], ['cmdb_id'], ['operation_name', 'cmdb_id']]
+WINDOW_MINUTES = 30
+
+MODES = [
+    ('baseline', '解释器+pandas'),
+    ('exact', '精确'),
+    ('build', '构建'),
+    ('sketch', '概要'),
+]
+
+
+def make_queries(windows: int, seed: int = 0) -> list:
+    """全天 + 随机的对齐到分钟的窗口，每个窗口一组分组方式"""
+    rng = np.random.default_rng(seed)
+    minutes = rng.integers(0, 24 * 60 - WINDOW_MINUTES, windows)
+    spans = [(None, None)] + [((START_TS + 60 * int(m)) * 1000, (START_TS + 60 * (int(m) + WINDOW_MINUTES)) * 1000 - 1)
+                              for m in minutes]
+    return [(start, end, by) for start, end in spans for by in GROUPINGS]
+
+
+def exact_quantiles(df: pd.DataFrame, start, end, by: list) -> pd.DataFrame:
+    if start is not None:
+        df = df[(df['timestamp'] >= start) & (df['timestamp'] <= end)]
+    grouped = df.groupby(by, observed=True, sort=True)['duration'] if by else df['duration']
+    columns = {f"p{round(q * 100)}": grouped.quantile(q, interpolation='lower') for q in QUANTILES}
+    if not by:
+        return pd.DataFrame({name: [value] for name, value in columns.items()})
+    result = pd.DataFrame(columns).reset_index()
+    for col in by:
+        result[col] = result[col].astype(str)
+    return result
+
+
+def run_mode(mode: str, path: str, queries: list, alpha: float, max_memory: int) -> dict:
+    """子进程中执行一种方式，返回每个查询的分位数表"""
+    began = time.perf_counter()
+    if mode == 'baseline':
+        return {'time': 0.0}
+    if mode == 'build':
+        store = open_latency(path, alpha, max_memory)
+        return {'time': time.perf_counter() - began, 'bytes': store.nbytes, 'meta': store.meta}
+    tables = []
+    if mode == 'exact':
+        df = load_telemetry(path, columns=['timestamp', 'cmdb_id', 'operation_name', 'duration'], use_cache=False)
+        for start, end, by in queries:
+            tables.append(exact_quantiles(df, start, end, by))
+    else:
+        store = open_latency(path, alpha)
+        for start, end, by in queries:
+            tables.append(latency_quantiles(store, start, end, by, QUANTILES))
+    elapsed = time.perf_counter() - began
+    return {'time': elapsed, 'tables': [t.to_dict('list') for t in tables]}
+
+
+def measure(mode: str, path: str, windows: int, alpha: float, max_memory: str) -> dict:
+    """在子进程中运行，返回峰值RSS（字节）和结果"""
+    cmd = [sys.executable, __file__, '--child', mode, '--file', path, '--windows', str(windows),
+           '--alpha', str(alpha), '--max-memory', max_memory]
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE)
+    output = proc.stdout.read()
+    _, status, usage = os.wait4(proc.pid, 0)
+    if os.waitstatus_to_exitcode(status) != 0:
+        raise RuntimeError(f"{mode} 子进程失败")
+    # Linux 上 ru_maxrss 的单位是 KB
+    return {'rss': usage.ru_maxrss * 1024, **json.loads(output)}
+
+
+def relative_errors(exact: list, sketch: list, queries: list) -> dict:
+    """每个分位数在所有查询、所有分组上的相对误差"""
+    errors = {f"p{round(q * 100)}": [] for q in QUANTILES}
+    for (_, _, by), left, right in zip(queries, exact, sketch):
+        left, right = pd.DataFrame(left), pd.DataFrame(right)
+        if len(left) == 0:
+            continue
+        merged = left.merge(right, on=by, suffixes=('', '_sketch')) if by else left.join(right, rsuffix='_sketch')
+        if len(merged) != len(left):
+            raise RuntimeError(f"分组不一致: {by}")
+        for name, parts in errors.items():
+            truth = merged[name].to_numpy(dtype=np.float64)
+            parts.append(np.abs(merged[f"{name}_sketch"].to_numpy() - truth) / np.maximum(np.abs(truth), 1e-12))
+    return {name: np.concatenate(parts) for name, parts in errors.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Latency Sketch Benchmark')
+    parser.add_argument('--spans', type=str, default='2M', help='Approximate number of spans, e.g. 10M')
+    parser.add_argument('--alpha', type=float, default=0.01, help='Relative accuracy of the sketches')
+    parser.add_argument('--windows', type=int, default=20, help='Random 30-minute windows to query')
+    parser.add_argument('--max-memory', type=str, default='64M', help='Memory budget for building the sketches')
+    parser.add_argument('--data-dir', type=str, help='Keep generated data here (reused when present)')
+    parser.add_argument('--child', type=str, help=argparse.SUPPRESS)
+    parser.add_argument('--file', type=str, help=argparse.SUPPRESS)
+
+    args = parser.parse_args()
+
+    if args.child == 'generate':
+        generate(args.data_dir, int(parse_count(args.spans) / SHARES['trace_span']), files=['trace_span'])
+        return
+    if args.child:
+        print(json.dumps(run_mode(args.child, args.file, make_queries(args.windows), args.alpha,
+                                  parse_size(args.max_memory)), default=str))
+        return
+
+    print(f"{'='*70}")
+    print("延迟概要准确度与内存基准")
+    print(f"{'='*70}")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ['OPENRCA_CACHE_DIR'] = str(Path(tmp) / 'cache')
+        root = Path(args.data_dir or tmp) / f"latency-{args.spans}"
+        path = root / 'cloudbed-1' / 'telemetry' / '2022_03_20' / 'trace' / 'trace_span.csv'
+        if not path.exists():
+            # 在子进程中生成数据：ru_maxrss 会从父进程继承，父进程需要保持较小
+            subprocess.run([sys.executable, __file__, '--child', 'generate', '--data-dir', str(root),
+                            '--spans', args.spans], check=True)
+        queries = make_queries(args.windows)
+        results = {mode: measure(mode, str(path), args.windows, args.alpha, args.max_memory) for mode, _ in MODES}
+
+        meta = results['build']['meta']
+        print(f"\nspan数: {meta['rows']:,}  CSV: {path.stat().st_size / 1024 / 1024:.1f} MB  "
+              f"概要: {results['build']['bytes'] / 1024 / 1024:.1f} MB "
+              f"({meta['cells']:,} 个单元, {meta['buckets']:,} 个非空桶, alpha={args.alpha})")
+        print(f"查询: {len(queries)} 个（{args.windows + 1} 个窗口 × {len(GROUPINGS)} 种分组）")
+        print(f"  {'方式':<14}{'峰值RSS':>12}{'增量':>12}{'耗时':>10}")
+        baseline = results['baseline']['rss']
+        for mode, label in MODES:
+            m = results[mode]
+            delta = (m['rss'] - baseline) / 1024 / 1024
+            print(f"  {label:<14}{m['rss'] / 1024 / 1024:>10.1f}MB{delta:>10.1f}MB{m['time']:>9.2f}s")
+
+        errors = relative_errors(results['exact']['tables'], results['sketch']['tables'], queries)
+        print(f"\n相对误差（概要 vs 精确，{len(errors['p50']):,} 个分组值）:")
+        print(f"  {'分位数':<8}{'中位数':>10}{'最大':>10}{'超过alpha':>12}")
+        worst = 0.0
+        for name, values in errors.items():
+            over = float(np.mean(values > args.alpha + 1e-9))
+            worst = max(worst, float(values.max()))
+            print(f"  {name:<8}{np.median(values):>9.3%}{values.max():>9.3%}{over:>11.2%}")
+        print(f"\n最大相对误差 {worst:.3%}，{'在' if worst <= args.alpha + 1e-9 else '超出'} alpha={args.alpha} 以内")
+
+
+if __name__ == '__main__':
+    main()
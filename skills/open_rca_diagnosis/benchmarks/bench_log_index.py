@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""
+Log Index Benchmark - 日志三元组索引基准
+生成不同规模的日志文件，对比全量正则扫描与索引查询的延迟，并报告索引大小与构建耗时
+
+Usage:
+    python bench_log_index.py --sizes 100000,300000,1000000
+    python bench_log_index.py --sizes 200000 --repeat 5
+"""
+
+import argparse
+import os
+import re
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'scripts'))
+from common.log_index import build_index, index_dir, search
+
+ERROR_PATTERN = 'error|exception|fail|critical|fatal|timeout'
+
+QUERIES = [
+    ('罕见字面量', 'connection refused', None),
+    ('错误关键词', ERROR_PATTERN, None),
+    ('错误+组件', ERROR_PATTERN, 'shippingservice'),
+    ('正则', r'redis.*timeout', None),
+]
+
+TEMPLATES = [
+    'request complete in {n} ms',
+    'severity: info, message: Getting supported currencies...',
+    'severity: info, message: [GetQuote] received request',
+    'severity: info, message: payment went through (transaction_id: {h})',
+    'GET /product/{h} HTTP/1.1 200 {n} ms',
+    'severity: debug, message: conversion request successful',
+    'severity: warning, message: retry {n} for cart {h}',
+]
+
+FAULT_TEMPLATES = [
+    'severity: error, message: failed to connect to redis, "timeout"',
+    'severity: error, message: rpc error: code = Unavailable desc = connection refused',
+    'java.lang.RuntimeException: exception while handling order {h}',
+]
+
+
+def make_logs(path: Path, rows: int, seed: int = 0):
+    """生成 log_service.csv 格式的日志，约1%的行来自故障模板"""
+    rng = np.random.default_rng(seed)
+    pods = [f"{svc}-{i}" for svc in ['frontend', 'cartservice', 'checkoutservice', 'shippingservice',
+                                       'paymentservice', 'currencyservice'] for i in range(3)]
+    timestamps = 1647705600 + np.sort(rng.integers(0, 86400, rows))
+    cmdb = rng.integers(0, len(pods), rows)
+    faulty = rng.random(rows) < 0.01
+    template = np.where(faulty, rng.integers(0, len(FAULT_TEMPLATES), rows), rng.integers(0, len(TEMPLATES), rows))
+    numbers = rng.integers(1, 5000, rows)
+    hashes = rng.integers(0, 16**8, rows)
+
+    values = [
+        (FAULT_TEMPLATES if f else TEMPLATES)[t].format(n=n, h=f"{h:08x}")
+        for f, t, n, h in zip(faulty.tolist(), template.tolist(), numbers.tolist(), hashes.tolist())
+    ]
+    pd.DataFrame({
+        'log_id': [f"L{i:08d}" for i in range(rows)],
+        'timestamp': timestamps,
+        'cmdb_id': np.array(pods, dtype=object)[cmdb],
+        'log_name': [f"log_{pods[c]}_app" for c in cmdb.tolist()],
+        'value': values,
+    }).to_csv(path, index=False)
+
+
+def full_scan(path: Path, pattern: str, component: str | None = None) -> pd.DataFrame:
+    """原实现：读取整个文件后逐行匹配正则"""
+    df = pd.read_csv(path, usecols=['timestamp', 'cmdb_id', 'value'])
+    if component:
+        df = df[df['cmdb_id'].str.contains(component, case=False, na=False)]
+    return df[df['value'].str.contains(pattern, regex=True, flags=re.IGNORECASE, na=False)]
+
+
+def best_of(repeat: int, func, *args):
+    best = float('inf')
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(*args)
+        best = min(best, time.perf_counter() - start)
+    return result, best
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Log Index Benchmark')
+    parser.add_argument('--sizes', type=str, default='100000,300000,1000000', help='Comma-separated row counts')
+    parser.add_argument('--repeat', type=int, default=3, help='Repetitions per query (best is reported)')
+
+    args = parser.parse_args()
+    sizes = [int(size) for size in args.sizes.split(',')]
+
+    print(f"{'='*70}")
+    print("日志三元组索引基准")
+    print(f"{'='*70}")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ['OPENRCA_CACHE_DIR'] = str(Path(tmp) / 'cache')
+        mismatches = 0
+        for rows in sizes:
+            path = Path(tmp) / f"log_{rows}" / 'log_service.csv'
+            path.parent.mkdir()
+            make_logs(path, rows)
+
+            start = time.perf_counter()
+            meta = build_index(str(path))
+            build_time = time.perf_counter() - start
+            index_bytes = sum(f.stat().st_size for f in index_dir(str(path)).iterdir())
+            csv_bytes = path.stat().st_size
+
+            print(f"\n行数: {rows:,}  CSV: {csv_bytes / 1024 / 1024:.1f} MB  "
+                  f"索引: {index_bytes / 1024 / 1024:.1f} MB ({index_bytes / csv_bytes:.0%})  "
+                  f"构建: {build_time:.2f}s  倒排项: {meta['postings']:,}")
+            print(f"  {'查询':<10}{'匹配行':>10}{'候选行':>10}{'全量扫描':>12}{'索引查询':>12}{'加速比':>10}")
+            for name, pattern, component in QUERIES:
+                expected, t_scan = best_of(args.repeat, full_scan, path, pattern, component)
+                (result, stats), t_index = best_of(
+                    args.repeat, search, str(path), pattern, re.IGNORECASE, None, None, component,
+                    ['timestamp', 'cmdb_id', 'value'])
+                if result is None:
+                    print(f"  {name:<10}{'-':>10}{stats['candidates'] if stats else '-':>10}{t_scan:>11.3f}s"
+                          f"{'回退':>12}{'-':>10}")
+                    continue
+                same = expected['value'].tolist() == result['value'].tolist()
+                mismatches += not same
+                print(f"  {name:<10}{len(result):>10,}{stats['candidates']:>10,}{t_scan:>11.3f}s"
+                      f"{t_index:>11.3f}s{t_scan / t_index:>9.1f}x{'' if same else '  结果不一致'}")
+
+    if mismatches:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+"""
+Log String Benchmark - 日志文本匹配的逐行 Python 实现与 Arrow 内核对比
+用 gen_telemetry 生成一天的 log_service.csv 并建立列式缓存，在独立子进程中分别：
+
+    解释器+pandas  只导入模块，作为峰值RSS的基线
+    逐行           原实现：str.contains(flags=re.IGNORECASE)（逐行调用 Python re），iterrows 截断日志内容
+    Arrow          common.arrow_text：RE2 内核的 ignore_case 匹配、类别字典上的组件过滤、utf8_slice_codeunits 截断
+
+两种方式都从列式缓存读取整个文件，执行同样的操作：错误日志分类（ERROR_PATTERNS）、--search 查询、
+组件过滤，以及把全部错误日志截断为前100个字符（脚本只截断前 --top 条，这里截断全部以衡量内核本身）。
+报告读取耗时、匹配耗时、按日志内容字节数计算的吞吐（MB/s）和峰值RSS，并校验每个查询的匹配行和截断结果一致。
+
+Usage:
+    python bench_log_strings.py --logs 1M
+    python bench_log_strings.py --logs 5M --searches "ads,payment.*transaction,timeout|refused" --data-dir /data/logs
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+from gen_telemetry import SHARES, generate, parse_count
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'scripts'))
+from common.arrow_text import match_mask, truncate
+from common.telemetry_cache import ensure_cache, load_telemetry
+from market.analyze_log import ERROR_PATTERNS
+
+COMPONENT = 'shipping'
+WIDTH = 100
+
+MODES = [
+    ('baseline', '解释器+pandas'),
+    ('python', '逐行'),
+    ('arrow', 'Arrow'),
+]
+
+
+def python_ops(df, searches: list) -> tuple:
+    """原实现：带 flags 的 str.contains 与 iterrows 截断"""
+    masks = {}
+    for pattern in ['|'.join(ERROR_PATTERNS)] + searches:
+        masks[pattern] = df['value'].str.contains(pattern, regex=True, flags=re.IGNORECASE, na=False).to_numpy()
+    masks[COMPONENT] = df['cmdb_id'].str.contains(COMPONENT, case=False, na=False).to_numpy()
+    errors = df[masks['|'.join(ERROR_PATTERNS)]]
+    short = [row.get('value', '')[:WIDTH] for _, row in errors.iterrows()]
+    return masks, short
+
+
+def arrow_ops(df, searches: list) -> tuple:
+    masks = {}
+    for pattern in ['|'.join(ERROR_PATTERNS)] + searches:
+        masks[pattern] = match_mask(df['value'], pattern, re.IGNORECASE)
+    masks[COMPONENT] = match_mask(df['cmdb_id'], COMPONENT, re.IGNORECASE)
+    short = truncate(df.loc[masks['|'.join(ERROR_PATTERNS)], 'value'], WIDTH)
+    return masks, short
+
+
+def run_mode(mode: str, path: str, searches: list) -> dict:
+    """子进程中执行一种方式，返回耗时、每个查询的匹配行摘要和截断结果摘要"""
+    if mode == 'baseline':
+        return {'load': 0.0, 'match': 0.0}
+    began = time.perf_counter()
+    df = load_telemetry(path, columns=['timestamp', 'cmdb_id', 'value'])
+    loaded = time.perf_counter()
+    masks, short = (python_ops if mode == 'python' else arrow_ops)(df, searches)
+    matched = time.perf_counter()
+    return {
+        'load': loaded - began,
+        'match': matched - loaded,
+        'rows': len(df),
+        'bytes': int(df['value'].str.len().sum()),  # ASCII 日志：字符数即字节数
+        'counts': {pattern: int(mask.sum()) for pattern, mask in masks.items()},
+        'digests': {pattern: hashlib.sha1(np.flatnonzero(mask).tobytes()).hexdigest() for pattern, mask in masks.items()},
+        'truncated': hashlib.sha1('\n'.join(short).encode()).hexdigest(),
+    }
+
+
+def measure(mode: str, path: str, searches: str) -> dict:
+    """在子进程中运行，返回峰值RSS（字节）和结果"""
+    cmd = [sys.executable, __file__, '--child', mode, '--file', path, '--searches', searches]
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE)
+    output = proc.stdout.read()
+    _, status, usage = os.wait4(proc.pid, 0)
+    if os.waitstatus_to_exitcode(status) != 0:
+        raise RuntimeError(f"{mode} 子进程失败")
+    # Linux 上 ru_maxrss 的单位是 KB
+    return {'rss': usage.ru_maxrss * 1024, **json.loads(output)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Log String Benchmark')
+    parser.add_argument('--logs', type=str, default='1M', help='Approximate number of log lines, e.g. 5M')
+    parser.add_argument('--searches', type=str, default='currenc,payment.*transaction,timeout|refused',
+                        help='Comma-separated --search patterns')
+    parser.add_argument('--data-dir', type=str, help='Keep generated data here (reused when present)')
+    parser.add_argument('--child', type=str, help=argparse.SUPPRESS)
+    parser.add_argument('--file', type=str, help=argparse.SUPPRESS)
+
+    args = parser.parse_args()
+    searches = args.searches.split(',')
+
+    if args.child == 'generate':
+        if not Path(args.file).exists():
+            generate(args.data_dir, int(parse_count(args.logs) / SHARES['log_service']), files=['log_service'])
+        ensure_cache(args.file)
+        return
+    if args.child:
+        print(json.dumps(run_mode(args.child, args.file, searches)))
+        return
+
+    print(f"{'='*70}")
+    print("日志文本匹配吞吐与内存基准")
+    print(f"{'='*70}")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ.setdefault('OPENRCA_CACHE_DIR', str(Path(tmp) / 'cache'))
+        root = Path(args.data_dir or tmp) / f"logs-{args.logs}"
+        path = root / 'cloudbed-1' / 'telemetry' / '2022_03_20' / 'log' / 'log_service.csv'
+        # 在子进程中生成数据和缓存：ru_maxrss 会从父进程继承，父进程需要保持较小
+        subprocess.run([sys.executable, __file__, '--child', 'generate', '--data-dir', str(root), '--logs', args.logs,
+                        '--file', str(path)], check=True)
+        results = {mode: measure(mode, str(path), args.searches) for mode, _ in MODES}
+
+        arrow = results['arrow']
+        megabytes = arrow['bytes'] / 1024 / 1024
+        queries = len(arrow['counts']) - 1
+        print(f"\n日志数: {arrow['rows']:,}  CSV: {path.stat().st_size / 1024 / 1024:.1f} MB  日志内容: {megabytes:.1f} MB")
+        print(f"操作: 错误分类 + {queries - 1} 个搜索 + 组件过滤 + 截断 {arrow['counts']['|'.join(ERROR_PATTERNS)]:,} 条错误日志")
+        print(f"  {'方式':<14}{'峰值RSS':>12}{'增量':>12}{'读取':>10}{'匹配':>10}{'吞吐':>14}")
+        baseline = results['baseline']['rss']
+        for mode, label in MODES:
+            m = results[mode]
+            delta = (m['rss'] - baseline) / 1024 / 1024
+            rate = f"{megabytes * queries / m['match']:>10.1f}MB/s" if m['match'] else f"{'-':>14}"
+            print(f"  {label:<14}{m['rss'] / 1024 / 1024:>10.1f}MB{delta:>10.1f}MB{m['load']:>9.2f}s{m['match']:>9.2f}s{rate}")
+
+        python = results['python']
+        print(f"\n匹配加速比: {python['match'] / arrow['match']:.1f}x  (吞吐按 {queries} 次扫描日志内容计算)")
+        mismatched = [pattern for pattern in arrow['digests'] if arrow['digests'][pattern] != python['digests'][pattern]]
+        if python['truncated'] != arrow['truncated']:
+            mismatched.append('截断')
+        if mismatched:
+            print(f"错误: 结果不一致 {mismatched}")
+            sys.exit(1)
+        print(f"结果一致: {len(arrow['digests'])} 个查询的匹配行和截断内容相同")
+
+
+if __name__ == '__main__':
+    main()
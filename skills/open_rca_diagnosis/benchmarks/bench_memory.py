@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+"""
+Memory Benchmark - 读取方式的峰值内存对比
+生成合成的 metric_container.csv，在独立子进程中分别用三种方式完成容器层异常检测，
+报告每种方式的峰值RSS（os.wait4 的 ru_maxrss）、耗时和检测结果
+
+    默认推断   pd.read_csv 不指定类型（原读取方式）
+    注册表类型 common.schema 的紧凑类型：category 组件/KPI、int64 时间戳
+    分块扫描   --max-memory 模式：按块建立每个KPI的 t-digest，只加载故障窗口
+
+Usage:
+    python bench_memory.py --containers 60 --kpis 40 --points 1440
+    python bench_memory.py --containers 100 --kpis 60 --max-memory 64M
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'scripts'))
+from common.telemetry_cache import load_telemetry, parse_size
+from market.analyze_container import (
+    CONTAINER_COLUMNS,
+    compute_kpi_thresholds,
+    detect_container_anomalies,
+    scan_container_chunks,
+)
+
+START_TS = 1647705600
+STEP = 60
+
+MODES = [
+    ('baseline', '解释器+pandas'),
+    ('infer', '默认推断'),
+    ('registry', '注册表类型'),
+    ('chunked', '分块扫描'),
+]
+
+SERVICES = ['frontend', 'cartservice', 'checkoutservice', 'shippingservice', 'paymentservice',
+            'currencyservice', 'emailservice', 'adservice', 'recommendationservice', 'productcatalogservice']
+KPI_BASES = ['cpu_usage_seconds', 'memory_usage_MB', 'fs_reads', 'fs_writes', 'network_receive_packets',
+             'network_transmit_bytes', 'threads', 'cpu_cfs_throttled_seconds']
+
+
+def fault_window(points: int) -> tuple:
+    """故障窗口：中间的30分钟"""
+    fault_start = START_TS + STEP * (points // 2)
+    return fault_start, fault_start + 30 * STEP
+
+
+def make_containers(path: Path, containers: int, kpis: int, points: int, seed: int = 0):
+    """生成 metric_container.csv，第一个容器的所有KPI在故障窗口内升高"""
+    rng = np.random.default_rng(seed)
+    names = [f"node-{i % 6 + 1}.{SERVICES[i % len(SERVICES)]}-{i // len(SERVICES)}" for i in range(containers)]
+    kpi_names = [f"container_{KPI_BASES[k % len(KPI_BASES)]}.eth{k // len(KPI_BASES)}" for k in range(kpis)]
+
+    timestamps = START_TS + STEP * np.arange(points)
+    fault_start, fault_end = fault_window(points)
+
+    series = len(names) * len(kpi_names)
+    base = rng.uniform(1, 100, series)[:, None]
+    values = base * (1 + 0.1 * rng.standard_normal((series, points)))
+    in_fault = (timestamps >= fault_start) & (timestamps <= fault_end)
+    values[:len(kpi_names), in_fault] *= 3
+
+    pd.DataFrame({
+        'timestamp': np.tile(timestamps, series),
+        'cmdb_id': np.repeat(np.array(names, dtype=object), len(kpi_names) * points),
+        'kpi_name': np.tile(np.repeat(np.array(kpi_names, dtype=object), points), len(names)),
+        'value': values.ravel().round(4),
+    }).sort_values('timestamp', kind='stable').to_csv(path, index=False)
+
+
+def run_mode(mode: str, path: str, start_ts: int, end_ts: int, max_memory: int) -> dict:
+    """子进程中执行一种读取方式的完整检测"""
+    if mode == 'baseline':
+        return {}
+    if mode == 'chunked':
+        scan = scan_container_chunks(path, max_memory)
+        thresholds = scan['thresholds']
+        filtered = load_telemetry(path, columns=CONTAINER_COLUMNS, start_ts=start_ts, end_ts=end_ts, use_cache=False)
+    else:
+        if mode == 'infer':
+            df = pd.read_csv(path)
+        else:
+            df = load_telemetry(path, columns=CONTAINER_COLUMNS, use_cache=False)
+        thresholds = compute_kpi_thresholds(df)
+        filtered = df[(df['timestamp'] >= start_ts) & (df['timestamp'] <= end_ts)]
+    anomalies = detect_container_anomalies(filtered, thresholds)
+    return {'anomalies': len(anomalies), 'top': sorted(f"{a['cmdb_id']}|{a['kpi_name']}" for a in anomalies)}
+
+
+def measure(mode: str, path: Path, start_ts: int, end_ts: int, max_memory: int) -> dict:
+    """在子进程中运行，返回峰值RSS（字节）、耗时和检测结果"""
+    cmd = [sys.executable, __file__, '--child', mode, '--file', str(path),
+           '--window', f"{start_ts},{end_ts}", '--max-memory', str(max_memory)]
+    began = time.perf_counter()
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE)
+    output = proc.stdout.read()
+    _, status, usage = os.wait4(proc.pid, 0)
+    elapsed = time.perf_counter() - began
+    proc.returncode = os.waitstatus_to_exitcode(status)
+    if proc.returncode != 0:
+        raise RuntimeError(f"{mode} 子进程失败，退出码 {proc.returncode}")
+    # Linux 上 ru_maxrss 的单位是 KB
+    return {'rss': usage.ru_maxrss * 1024, 'time': elapsed, 'result': json.loads(output)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Memory Benchmark')
+    parser.add_argument('--containers', type=int, default=60, help='Number of containers')
+    parser.add_argument('--kpis', type=int, default=40, help='KPIs per container')
+    parser.add_argument('--points', type=int, default=1440, help='Samples per series (one per minute)')
+    parser.add_argument('--max-memory', type=str, default='64M', help='Budget for the chunked mode')
+    parser.add_argument('--child', type=str, help=argparse.SUPPRESS)
+    parser.add_argument('--file', type=str, help=argparse.SUPPRESS)
+    parser.add_argument('--window', type=str, help=argparse.SUPPRESS)
+
+    args = parser.parse_args()
+    max_memory = parse_size(args.max_memory)
+
+    if args.child == 'generate':
+        make_containers(Path(args.file), args.containers, args.kpis, args.points)
+        return
+    if args.child:
+        start_ts, end_ts = (int(v) for v in args.window.split(','))
+        print(json.dumps(run_mode(args.child, args.file, start_ts, end_ts, max_memory)))
+        return
+
+    print(f"{'='*70}")
+    print("读取方式峰值内存基准")
+    print(f"{'='*70}")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ['OPENRCA_CACHE_DIR'] = str(Path(tmp) / 'cache')
+        path = Path(tmp) / 'metric_container.csv'
+        # 在子进程中生成数据：ru_maxrss 会从父进程继承，父进程需要保持较小
+        subprocess.run([sys.executable, __file__, '--child', 'generate', '--file', str(path),
+                        '--containers', str(args.containers), '--kpis', str(args.kpis),
+                        '--points', str(args.points)], check=True)
+        start_ts, end_ts = fault_window(args.points)
+        rows = args.containers * args.kpis * args.points
+        print(f"\n行数: {rows:,}  CSV: {path.stat().st_size / 1024 / 1024:.1f} MB  分块预算: {args.max_memory}")
+        print(f"  {'方式':<12}{'峰值RSS':>12}{'增量':>12}{'耗时':>10}{'异常数':>8}")
+
+        results = {}
+        for mode, label in MODES:
+            results[mode] = measure(mode, path, start_ts, end_ts, max_memory)
+        baseline = results['baseline']['rss']
+        for mode, label in MODES:
+            m = results[mode]
+            delta = (m['rss'] - baseline) / 1024 / 1024
+            count = m['result'].get('anomalies', '-')
+            print(f"  {label:<12}{m['rss'] / 1024 / 1024:>10.1f}MB{delta:>10.1f}MB{m['time']:>9.2f}s{count:>8}")
+
+        infer = results['infer']
+        for mode in ('registry', 'chunked'):
+            m = results[mode]
+            ratio = (infer['rss'] - baseline) / max(m['rss'] - baseline, 1)
+            same = m['result']['top'] == infer['result']['top']
+            print(f"\n{dict(MODES)[mode]}: 内存增量为默认推断的 1/{ratio:.1f}，"
+                  f"检测结果{'一致' if same else '不一致'}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+"""
+Incident Replay Benchmark - 批量回放与逐个诊断的耗时对比
+用 gen_telemetry 生成一个cloudbed一天的数据（注入一个已知故障），构造 N 个故障窗口：
+第一个为注入的故障（带标注），其余为随机的30分钟窗口。对每个 N 分别：
+
+    回放     一次 replay_incidents.py 进程，数据文件按文件分组只加载一次
+    逐个     每个故障一次 scan_fleet.py 进程（只运行前 --sequential 个，按平均值外推到 N）
+
+两种方式都使用已构建的列式缓存和边表/索引（计时前先回放一次预热）。报告耗时、每个故障的耗时、
+加速比，以及回放耗时随故障数增长的阶数（k≈0 表示只取决于数据文件数，k≈1 表示与故障数成正比）；
+同时校验两种方式对每个被逐个诊断的故障给出相同的前 --top 个候选。
+
+Usage:
+    python bench_replay.py --rows 1M --incidents 1,10,100
+    python bench_replay.py --rows 10M --incidents 1,50,500 --sequential 5 --data-dir /data/replay
+"""
+
+import argparse
+import json
+import math
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+from gen_telemetry import START_TS, parse_count
+
+SCRIPTS = Path(__file__).resolve().parent.parent / 'scripts' / 'market'
+WINDOW_SECONDS = 30 * 60
+ANALYSES = 'metric,container,trace,log'
+
+
+def make_incidents(truth: dict, count: int, seed: int = 0) -> list:
+    """注入的故障 + (count - 1) 个随机的、对齐到半小时的窗口"""
+    rng = np.random.default_rng(seed)
+    fault = truth['fault']
+    incidents = [{'id': 'fault', 'start': fault['start'], 'end': fault['end'] - 1, 'component': fault['component']}]
+    for i, slot in enumerate(rng.integers(0, 24 * 3600 // WINDOW_SECONDS, count - 1)):
+        start = START_TS + int(slot) * WINDOW_SECONDS
+        incidents.append({'id': f"r{i}", 'start': start, 'end': start + WINDOW_SECONDS - 1, 'component': ''})
+    return incidents
+
+
+def write_incidents(path: Path, incidents: list):
+    lines = ['id,cloudbed,start,end,component']
+    lines += [f"{i['id']},cloudbed-1,{i['start']},{i['end']},{i['component']}" for i in incidents]
+    path.write_text('\n'.join(lines) + '\n')
+
+
+def sections(output: bytes) -> dict:
+    """NDJSON 结构化输出 -> 节名 -> 最后一次出现的内容"""
+    result = {}
+    for line in output.decode().splitlines():
+        if line.startswith('{'):
+            item = json.loads(line)
+            result[item['section']] = item.get('rows', item.get('data'))
+    return result
+
+
+def timed(cmd: list) -> tuple:
+    """运行一个脚本进程，返回 (墙钟耗时, 结构化输出)"""
+    began = time.perf_counter()
+    proc = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, check=True)
+    return time.perf_counter() - began, sections(proc.stdout)
+
+
+def replay_cmd(root: Path, incidents_path: Path, top: int) -> list:
+    return [sys.executable, str(SCRIPTS / 'replay_incidents.py'), '--data-root', str(root), '--incidents',
+            str(incidents_path), '--analyses', ANALYSES, '--top', str(top), '--format', 'json', '--max-rows', '10000']
+
+
+def scan_cmd(root: Path, incident: dict, top: int) -> list:
+    return [sys.executable, str(SCRIPTS / 'scan_fleet.py'), '--data-root', str(root), '--start', str(incident['start']),
+            '--end', str(incident['end']), '--analyses', ANALYSES, '--top', str(top), '--format', 'json']
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Incident Replay Benchmark')
+    parser.add_argument('--rows', type=str, default='1M', help='Approximate total rows of the generated day, e.g. 10M')
+    parser.add_argument('--incidents', type=str, default='1,10,100', help='Comma-separated incident counts')
+    parser.add_argument('--sequential', type=int, default=10, help='Incidents diagnosed one process at a time per count')
+    parser.add_argument('--top', type=int, default=5, help='Candidates compared between the two ways')
+    parser.add_argument('--data-dir', type=str, help='Keep generated data here (reused when present)')
+
+    args = parser.parse_args()
+    counts = [int(parse_count(value)) for value in args.incidents.split(',')]
+
+    print(f"{'='*70}")
+    print("批量回放与逐个诊断耗时基准")
+    print(f"{'='*70}")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ.setdefault('OPENRCA_CACHE_DIR', str(Path(tmp) / 'cache'))
+        root = Path(args.data_dir or tmp) / f"replay-{args.rows}"
+        truth_path = root / 'ground_truth.json'
+        if not truth_path.exists():
+            subprocess.run([sys.executable, str(Path(__file__).resolve().parent / 'gen_telemetry.py'), '--out',
+                            str(root), '--rows', str(parse_count(args.rows))], check=True, stdout=subprocess.DEVNULL)
+        truth = json.loads(truth_path.read_text())
+
+        incidents_path = Path(tmp) / 'incidents.csv'
+        write_incidents(incidents_path, make_incidents(truth, 1))
+        warmup, _ = timed(replay_cmd(root, incidents_path, args.top))
+        print(f"\n数据: {root} ({truth['rows']:,} 行, 根因 {truth['fault']['component']})  预热: {warmup:.1f}s")
+
+        print(f"\n  {'故障数':<8}{'数据文件':>8}{'回放':>10}{'每个':>10}{'逐个(外推)':>14}{'每个':>10}{'加速比':>8}"
+              f"{'一致':>8}")
+        points, mismatches = [], 0
+        for count in counts:
+            incidents = make_incidents(truth, count)
+            write_incidents(incidents_path, incidents)
+            replay_time, replayed = timed(replay_cmd(root, incidents_path, args.top))
+            rows = {row['id']: row for row in replayed['incidents']}
+
+            sample = incidents[:max(1, min(args.sequential, count))]
+            sequential, agree = 0.0, 0
+            for incident in sample:
+                seconds, scanned = timed(scan_cmd(root, incident, args.top))
+                sequential += seconds
+                expected = [row['component'] for row in scanned['ranking']][:args.top]
+                row = rows[incident['id']]
+                agree += [row[f'top_{i}'] for i in range(1, len(expected) + 1)] == expected
+            mismatches += len(sample) - agree
+            per_incident = sequential / len(sample)
+            points.append((count, replay_time))
+            print(f"  {count:<10}{replayed['summary']['files']:>8}{replay_time:>9.2f}s{replay_time / count:>9.3f}s"
+                  f"{per_incident * count:>13.1f}s{per_incident:>9.2f}s{per_incident * count / replay_time:>7.1f}x"
+                  f"{agree:>5}/{len(sample)}")
+
+        fault_row = rows['fault']
+        print(f"\n注入故障的标注名次: {fault_row['rank'] or '-'}  (Top 1 候选 {fault_row['top_1']})")
+        if len(points) > 1:
+            (n1, t1), (n2, t2) = points[0], points[-1]
+            slope = (math.log(t2) - math.log(t1)) / (math.log(n2) - math.log(n1))
+            print(f"回放耗时随故障数增长的阶数: k={slope:.2f} ({n1} → {n2} 个故障, {t1:.2f}s → {t2:.2f}s)")
+        if mismatches:
+            print(f"错误: {mismatches} 个故障的候选与逐个诊断不一致")
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,335 @@
+#!/usr/bin/env python3
+"""
+Scene Memory Benchmark - bank/telecom 分析脚本的固定内存预算基准
+按 specs/bank_spec.md、specs/telecom_spec.md 的模式生成一天的合成数据（注入已知组件的故障），
+在独立子进程中用 --max-memory 预算逐个运行各场景分析脚本（--format json），报告耗时、吞吐、峰值RSS增量，
+并校验增量不超过预算、排名第一的组件为注入的根因
+
+    场景     文件                    分析脚本                          注入故障
+    bank     metric_app.csv          bank.analyze_metric              ServiceTest2 mrt 升高
+    bank     metric_container.csv    bank.analyze_container           Tomcat02 CPU 升高
+    bank     trace_span.csv          bank.analyze_trace               Tomcat02 耗时升高
+    telecom  metric_app.csv          telecom.analyze_metric           osb_002 avg_time 升高
+    telecom  metric_node.csv 等      telecom.analyze_kpi              os_017 / docker_003 / db_003 CPU 升高
+    telecom  trace_span.csv          telecom.analyze_trace            docker_003 耗时和失败率升高
+
+数据按时间分块生成并追加写入，生成时的内存与规模无关。峰值RSS增量相对同一脚本处理
+该文件开头 10000 行时的峰值RSS（解释器、pandas 和首次调用的固定开销），即随数据规模增长的部分。
+任一用例超出预算或未命中时以退出码 1 结束。
+
+Usage:
+    python bench_scenes.py --rows 10M --max-memory 256M
+    python bench_scenes.py --rows 1M --scenes telecom --data-dir /data/scenes
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+from gen_telemetry import parse_count
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'scripts'))
+from common.telemetry_cache import parse_size
+
+SCRIPTS = Path(__file__).resolve().parent.parent / 'scripts'
+
+DAY = 86400
+METRIC_STEP = 60
+FAULT_OFFSET = 10 * 3600
+FAULT_SECONDS = 30 * 60
+
+# 单次生成并写出的最大行数
+CHUNK_ROWS = 500_000
+
+# 固定开销基线：同一脚本处理文件开头这么多行时的峰值RSS
+HEAD_ROWS = 10_000
+
+BANK_START = 1614873600       # 2021-03-05 00:00:00 UTC+8
+TELECOM_START = 1586534400    # 2020-04-11 00:00:00 UTC+8
+
+BANK_COMPONENTS = ['apache01', 'apache02', 'Tomcat01', 'Tomcat02', 'Tomcat03', 'Tomcat04', 'MG01', 'MG02',
+                   'IG01', 'IG02', 'Mysql01', 'Mysql02', 'Redis01', 'Redis02']
+BANK_SERVICES = [f"ServiceTest{i}" for i in range(1, 11)]
+BANK_KPIS = {
+    'OSLinux-CPU_CPU_CPUCpuUtil': 25.0,
+    'OSLinux-OSLinux_MEMORY_MEMORY_MEMUsedMemPerc': 60.0,
+    'OSLinux-OSLinux_LOCALDISK_LOCALDISK-sdb_DSKRead': 40.0,
+    'OSLinux-OSLinux_FILESYSTEM_-tomcat_FSCapacity': 55.0,
+    'OSLinux-OSLinux_NETWORK_NETWORK_TCP-FIN-WAIT': 12.0,
+    'JVM-Operating System_7779_JVM_JVM_CPULoad': 0.3,
+    'JVM-Memory_7778_JVM_Memory_HeapMemoryUsage': 45.0,
+}
+
+TELECOM_FILES = {
+    'metric_node': ([f"os_{i:03d}" for i in range(1, 23)],
+                    {'CPU_util_pct': 20.0, 'CPU_iowait_time': 0.5, 'Memory_used_pct': 55.0,
+                     'Disk_io_util': 10.0, 'Sent_queue': 3.0, 'Received_queue': 3.0}),
+    'metric_container': ([f"docker_{i:03d}" for i in range(1, 9)],
+                         {'container_cpu_used': 15.0, 'container_mem_used': 60.0, 'container_session_used': 40.0}),
+    'metric_middleware': ([f"redis_{i:03d}" for i in range(1, 5)],
+                          {'connected_clients': 25.0, 'used_memory': 2e6, 'keyspace_hits': 500.0}),
+    'metric_service': ([f"db_{i:03d}" for i in range(1, 14)],
+                       {'Proc_Used_Pct': 30.0, 'Sess_Connect': 80.0, 'MEM_Total': 380.0, 'CPU_Used_Pct': 20.0}),
+}
+TELECOM_SERVICES = [f"osb_{i:03d}" for i in range(1, 9)]
+CALL_TYPES = ['JDBC', 'LOCAL', 'RemoteProcess', 'FlyRemote', 'OSB']
+
+# 各文件占总行数的比例
+SHARES = {
+    'bank': {'metric_app': 0.01, 'metric_container': 0.39, 'trace_span': 0.6},
+    'telecom': {'metric_app': 0.01, 'metric_node': 0.3, 'metric_container': 0.08, 'metric_middleware': 0.04,
+                'metric_service': 0.17, 'trace_span': 0.4},
+}
+
+# (场景, 文件) -> (模块, 注入故障的组件)
+CASES = [
+    ('bank', 'metric_app', 'bank.analyze_metric', 'ServiceTest2'),
+    ('bank', 'metric_container', 'bank.analyze_container', 'Tomcat02'),
+    ('bank', 'trace_span', 'bank.analyze_trace', 'Tomcat02'),
+    ('telecom', 'metric_app', 'telecom.analyze_metric', 'osb_002'),
+    ('telecom', 'metric_node', 'telecom.analyze_kpi', 'os_017'),
+    ('telecom', 'metric_container', 'telecom.analyze_kpi', 'docker_003'),
+    ('telecom', 'metric_middleware', 'telecom.analyze_kpi', None),
+    ('telecom', 'metric_service', 'telecom.analyze_kpi', 'db_003'),
+    ('telecom', 'trace_span', 'telecom.analyze_trace', 'docker_003'),
+]
+
+FAULT_COMPONENTS = {'ServiceTest2', 'Tomcat02', 'osb_002', 'os_017', 'docker_003', 'db_003'}
+
+
+def fault_window(start_ts: int) -> tuple:
+    return start_ts + FAULT_OFFSET, start_ts + FAULT_OFFSET + FAULT_SECONDS - 1
+
+
+def _append(path: Path, frame: pd.DataFrame):
+    frame.to_csv(path, mode='a', header=not path.exists(), index=False)
+
+
+def _series_values(rng, base: np.ndarray, ts: np.ndarray, start_ts: int, faulty: np.ndarray) -> np.ndarray:
+    """(序列, 时间) 的取值：基线 × (1 + 10% 噪声)，故障序列在故障窗口内 ×3"""
+    values = base[:, None] * (1 + 0.1 * rng.standard_normal((len(base), len(ts))))
+    lo, hi = fault_window(start_ts)
+    in_fault = (ts >= lo) & (ts <= hi)
+    values[np.ix_(faulty, in_fault)] *= 3
+    return np.abs(values)
+
+
+def write_long_metric(path: Path, ids: list, kpis: dict, rows: int, start_ts: int, rng, telecom: bool):
+    """长表指标；行数超过 ids × kpis × 每天采样点时增加KPI（加后缀），故障组件的CPU类KPI在窗口内升高"""
+    points = DAY // METRIC_STEP
+    copies = max(1, round(rows / (len(ids) * len(kpis) * points)))
+    names = [name if c == 0 else f"{name}.{c}" for c in range(copies) for name in kpis]
+    bases = np.array([kpis[name.split('.')[0]] for name in names])
+    series_ids = np.repeat(np.array(ids, dtype=object), len(names))
+    series_kpis = np.tile(np.array(names, dtype=object), len(ids))
+    base = np.tile(bases, len(ids)) * rng.uniform(0.5, 1.5, len(series_ids))
+    faulty = np.isin(series_ids, list(FAULT_COMPONENTS)) & (
+        np.char.find(np.char.lower(series_kpis.astype(str)), 'cpu') >= 0)
+    if telecom:
+        itemid = np.array([str(999999990000000 + i) for i in range(len(series_ids))], dtype=object)
+        bomc_id = np.array([f"ZJ-{i % 7:03d}-{i % 97:03d}" for i in range(len(series_ids))], dtype=object)
+
+    per_chunk = max(1, CHUNK_ROWS // len(series_ids))
+    for lo in range(0, points, per_chunk):
+        ts = start_ts + METRIC_STEP * np.arange(lo, min(points, lo + per_chunk))
+        values = _series_values(rng, base, ts, start_ts, faulty).T.ravel().round(4)
+        n = len(ts)
+        if telecom:
+            frame = pd.DataFrame({
+                'itemid': np.tile(itemid, n), 'name': np.tile(series_kpis, n), 'bomc_id': np.tile(bomc_id, n),
+                'timestamp': np.repeat(ts * 1000, len(series_ids)), 'value': values,
+                'cmdb_id': np.tile(series_ids, n),
+            })
+        else:
+            frame = pd.DataFrame({
+                'timestamp': np.repeat(ts, len(series_ids)), 'cmdb_id': np.tile(series_ids, n),
+                'kpi_name': np.tile(series_kpis, n), 'value': values,
+            })
+        _append(path, frame)
+
+
+def write_app_metric(path: Path, services: list, rows: int, start_ts: int, rng, telecom: bool):
+    """应用层指标，采样间隔按行数缩短；故障服务的响应时间在窗口内升高"""
+    step = max(1, min(METRIC_STEP, DAY * len(services) // max(rows, 1)))
+    ts = start_ts + step * np.arange(DAY // step)
+    faulty = np.isin(services, list(FAULT_COMPONENTS))
+    latency = _series_values(rng, np.full(len(services), 50.0), ts, start_ts, faulty).T.ravel().round(3)
+    rate = np.clip(1 - np.abs(0.002 * rng.standard_normal(len(latency))), 0, 1)
+    count = rng.integers(10, 100, len(latency))
+    names = np.tile(np.array(services, dtype=object), len(ts))
+    if telecom:
+        frame = pd.DataFrame({
+            'serviceName': names, 'startTime': np.repeat(ts * 1000, len(services)), 'avg_time': latency,
+            'num': count, 'succee_num': (count * rate).round().astype(int), 'succee_rate': rate.round(4),
+        })
+    else:
+        frame = pd.DataFrame({
+            'timestamp': np.repeat(ts, len(services)), 'rr': (100 * rate).round(3), 'sr': (100 * rate).round(3),
+            'cnt': count, 'mrt': latency, 'tc': names,
+        })
+    _append(path, frame)
+
+
+def _hex_ids(rng, n: int) -> np.ndarray:
+    return np.char.mod('%016x', rng.integers(0, 2 ** 62, n)).astype(object)
+
+
+def write_traces(path: Path, components: list, rows: int, start_ts: int, rng, telecom: bool):
+    """span 按时间均匀分布；故障组件在窗口内耗时 ×3，telecom 另有20%失败"""
+    lo, hi = fault_window(start_ts)
+    base = rng.uniform(5, 50, len(components))
+    names = np.array(components, dtype=object)
+    databases = np.array([f"db_{i:03d}" for i in range(1, 14)], dtype=object)
+    for offset in range(0, rows, CHUNK_ROWS):
+        n = min(CHUNK_ROWS, rows - offset)
+        ts_ms = start_ts * 1000 + (offset + np.arange(n, dtype=np.int64)) * (DAY * 1000) // rows
+        which = rng.integers(0, len(components), n)
+        duration = base[which] * rng.lognormal(0, 0.3, n)
+        fault = np.isin(names[which], list(FAULT_COMPONENTS)) & (ts_ms >= lo * 1000) & (ts_ms < (hi + 1) * 1000)
+        duration[fault] *= 3
+        if telecom:
+            call_type = np.array(CALL_TYPES, dtype=object)[rng.integers(0, len(CALL_TYPES), n)]
+            failed = rng.random(n) < np.where(fault, 0.2, 0.005)
+            frame = pd.DataFrame({
+                'callType': call_type, 'startTime': ts_ms, 'elapsedTime': duration.round(1),
+                'success': np.where(failed, 'False', 'True'), 'traceId': _hex_ids(rng, n),
+                'id': _hex_ids(rng, n), 'pid': _hex_ids(rng, n), 'cmdb_id': names[which],
+                'dsName': np.where(call_type == 'JDBC', databases[rng.integers(0, len(databases), n)], None),
+                'serviceName': np.where(call_type == 'OSB', 'osb_001', None),
+            })
+        else:
+            frame = pd.DataFrame({
+                'timestamp': ts_ms, 'cmdb_id': names[which], 'parent_id': _hex_ids(rng, n),
+                'span_id': _hex_ids(rng, n), 'trace_id': _hex_ids(rng, n),
+                'duration': duration.round().astype(int),
+            })
+        _append(path, frame)
+
+
+def generate(root: Path, scene: str, rows: int, seed: int = 0) -> dict:
+    """生成一个场景一天的数据，返回 {文件: 路径}"""
+    telecom = scene == 'telecom'
+    start_ts = TELECOM_START if telecom else BANK_START
+    day_dir = root / scene / 'telemetry' / ('2020_04_11' if telecom else '2021_03_05')
+    files = {}
+    for name, share in SHARES[scene].items():
+        rng = np.random.default_rng([seed, list(SHARES[scene]).index(name)])
+        path = day_dir / ('trace' if name.startswith('trace') else 'metric') / f"{name}.csv"
+        path.parent.mkdir(parents=True, exist_ok=True)
+        files[name] = str(path)
+        if path.exists():
+            continue
+        count = max(1000, int(rows * share))
+        tmp = path.with_suffix('.tmp')
+        tmp.unlink(missing_ok=True)
+        if name == 'metric_app':
+            write_app_metric(tmp, TELECOM_SERVICES if telecom else BANK_SERVICES, count, start_ts, rng, telecom)
+        elif name == 'trace_span':
+            components = [f"docker_{i:03d}" for i in range(1, 9)] if telecom else BANK_COMPONENTS
+            write_traces(tmp, components, count, start_ts, rng, telecom)
+        elif telecom:
+            ids, kpis = TELECOM_FILES[name]
+            write_long_metric(tmp, ids, kpis, count, start_ts, rng, telecom)
+        else:
+            write_long_metric(tmp, BANK_COMPONENTS, BANK_KPIS, count, start_ts, rng, telecom)
+        os.replace(tmp, path)
+    return files
+
+
+def head_copy(path: str, root: Path, lines: int = HEAD_ROWS) -> str:
+    """文件开头 lines 行的副本（同名，放在 root 下），用作同一脚本的固定开销基线"""
+    target = root / Path(path).parent.name / Path(path).name
+    target.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, 'rb') as src, open(target, 'wb') as dst:
+        dst.writelines(line for _, line in zip(range(lines + 1), src))
+    return str(target)
+
+
+def measure(module: str, path: str, start_ts: int, end_ts: int, max_memory: str) -> dict:
+    """在子进程中运行分析脚本（--format json），返回峰值RSS（字节）、耗时、行数和排名第一的组件"""
+    cmd = [sys.executable, str(SCRIPTS / f"{module.replace('.', '/')}.py"), '--file', path,
+           '--start', str(start_ts), '--end', str(end_ts), '--max-memory', max_memory,
+           '--format', 'json', '--max-rows', '1']
+    began = time.perf_counter()
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    output = proc.stdout.read()
+    _, status, usage = os.wait4(proc.pid, 0)
+    elapsed = time.perf_counter() - began
+    if os.waitstatus_to_exitcode(status) != 0:
+        raise RuntimeError(f"{module} 子进程失败: {path}")
+    result = {'rss': usage.ru_maxrss * 1024, 'time': elapsed, 'top': None}  # Linux 上 ru_maxrss 的单位是 KB
+    for line in output.decode().splitlines():
+        section = json.loads(line)
+        if section['section'] == 'summary':
+            result['rows'] = section['data']['rows']
+            result['anomalies'] = section['data']['anomalies']
+        elif section['section'] == 'anomalies' and section['rows']:
+            result['top'] = section['rows'][0]['component']
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Scene Memory Benchmark')
+    parser.add_argument('--rows', type=str, default='1M', help='Approximate total rows per scene, e.g. 10M')
+    parser.add_argument('--max-memory', type=str, default='256M', help='Memory budget passed to the analyzers')
+    parser.add_argument('--scenes', type=str, default='bank,telecom', help='Comma-separated scenes')
+    parser.add_argument('--data-dir', type=str, help='Keep generated data here (reused when present)')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed')
+    parser.add_argument('--child', type=str, help=argparse.SUPPRESS)
+
+    args = parser.parse_args()
+    rows = parse_count(args.rows)
+    budget = parse_size(args.max_memory)
+    scenes = [s.strip() for s in args.scenes.split(',') if s.strip()]
+
+    if args.child:
+        generate(Path(args.data_dir), args.child, rows, args.seed)
+        return
+
+    print(f"{'='*70}")
+    print("bank/telecom 场景固定内存预算基准")
+    print(f"{'='*70}")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        root = Path(args.data_dir or tmp)
+        os.environ['OPENRCA_CACHE_DIR'] = str(Path(tmp) / 'cache')
+        failures = 0
+        for scene in scenes:
+            # 在子进程中生成数据：ru_maxrss 会从父进程继承，父进程需要保持较小
+            subprocess.run([sys.executable, __file__, '--child', scene, '--data-dir', str(root),
+                            '--rows', args.rows, '--seed', str(args.seed)], check=True)
+            files = generate(root, scene, rows, args.seed)
+            start_ts, end_ts = fault_window(TELECOM_START if scene == 'telecom' else BANK_START)
+            size = sum(Path(p).stat().st_size for p in files.values())
+            print(f"\n[{scene}] CSV: {size / 1024 / 1024:.1f} MB  内存预算: {args.max_memory}")
+            print(f"  {'文件':<20}{'行数':>12}{'耗时':>9}{'行/秒':>12}{'基线RSS':>11}{'RSS增量':>11}  "
+                  f"{'第一':<14}结果")
+            for case_scene, name, module, expected in CASES:
+                if case_scene != scene:
+                    continue
+                head = head_copy(files[name], Path(tmp) / 'head' / scene)
+                baseline = measure(module, head, start_ts, end_ts, args.max_memory)['rss']
+                m = measure(module, files[name], start_ts, end_ts, args.max_memory)
+                delta = m['rss'] - baseline
+                hit = expected is None and not m['anomalies'] or m.get('top') == expected
+                ok = hit and delta <= budget
+                failures += not ok
+                print(f"  {name:<20}{m['rows']:>12,}{m['time']:>8.2f}s{m['rows'] / m['time']:>12,.0f}"
+                      f"{baseline / 1024 / 1024:>9.1f}MB{delta / 1024 / 1024:>9.1f}MB  {m.get('top')!s:<14}"
+                      f"{'✓' if ok else ('超出预算' if hit else '未命中')}")
+
+    print(f"\n{'全部用例在预算内命中' if not failures else f'{failures} 个用例超出预算或未命中'}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
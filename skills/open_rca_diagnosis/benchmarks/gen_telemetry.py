@@ -0,0 +1,657 @@
+#!/usr/bin/env python3
+"""
+Synthetic Telemetry Generator - 合成遥测数据生成器
+按 specs/market_spec.md 的模式生成一天的 Market 场景数据（容器/节点/Mesh/运行时/服务指标、
+trace_span、log_service、log_proxy），注入一个已知类型和位置的故障，并写出标注文件 ground_truth.json
+
+规模由 --rows 指定（全部文件的近似总行数，10k ~ 100M），按真实数据中各文件的比例分配；
+每个文件至少覆盖完整拓扑（10个服务 × 4个Pod、6个节点）和 MIN_POINTS 个采样点，
+因此很小的规模会大于指定值：低于 min_rows() 的指标文件行数不再随 --rows 变化，ground_truth.json
+中标记为 floored，规模基准不用这些点估计增长阶数。指标采样间隔默认60秒，行数超出时增加KPI（指标文件）
+或缩短采样间隔（服务指标）。数据按时间分块生成并追加写入，内存占用与总规模无关。
+
+同样的参数（含 --seed）总是生成逐字节相同的文件。
+
+    out/
+    ├── ground_truth.json
+    └── cloudbed-1/telemetry/2022_03_20/{metric,trace,log}/*.csv
+
+Usage:
+    python gen_telemetry.py --out /tmp/market --rows 1M
+    python gen_telemetry.py --out /tmp/market --rows 100M --fault "container memory load" --component cartservice-2
+    python gen_telemetry.py --list-faults
+"""
+
+import argparse
+import binascii
+import json
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytz
+
+TIMEZONE = 'Asia/Shanghai'
+START_TS = 1647705600  # 2022-03-20 00:00:00 UTC+8
+METRIC_STEP = 60
+FAULT_SECONDS = 30 * 60
+MIN_POINTS = 60
+
+# 单次生成并写出的最大行数
+CHUNK_ROWS = 1_000_000
+
+SERVICES = ['frontend', 'shippingservice', 'checkoutservice', 'currencyservice', 'adservice', 'emailservice',
+            'cartservice', 'productcatalogservice', 'recommendationservice', 'paymentservice']
+PODS = [f"{service}-{i}" for service in SERVICES for i in range(3)] + [f"{service}2-0" for service in SERVICES]
+POD_SERVICE = {pod: pod.rsplit('-', 1)[0].removesuffix('2') for pod in PODS}
+NODES = [f"node-{i}" for i in range(1, 7)]
+POD_NODE = {pod: NODES[i % len(NODES)] for i, pod in enumerate(PODS)}
+
+# 各文件占总行数的比例（参照真实数据一天的文件大小）
+SHARES = {
+    'metric_container': 0.12,
+    'metric_mesh': 0.08,
+    'metric_node': 0.01,
+    'metric_runtime': 0.02,
+    'metric_service': 0.002,
+    'trace_span': 0.45,
+    'log_service': 0.12,
+    'log_proxy': 0.198,
+}
+
+FILE_DIRS = {name: 'trace' if name.startswith('trace') else name.split('_')[0] for name in SHARES}
+
+# KPI名称 -> 典型量级
+CONTAINER_KPIS = {
+    'container_cpu_usage_seconds': 4.0,
+    'container_memory_usage_MB': 512.0,
+    'container_fs_reads_MB./dev/vda': 2.0,
+    'container_fs_writes_MB./dev/vda': 3.0,
+    'container_network_receive_packets.eth0': 800.0,
+}
+NODE_KPIS = {
+    'system.cpu.pct_usage': 20.0,
+    'system.cpu.iowait': 0.5,
+    'system.mem.used': 8000.0,
+    'system.io.r_s': 30.0,
+    'system.io.w_s': 60.0,
+    'system.disk.pct_usage': 40.0,
+    'system.net.bytes_rcvd': 5e5,
+}
+MESH_KPIS = {
+    'istio_requests.grpc.200.0.0': 120.0,
+    'istio_request_duration_milliseconds.grpc.200.0.0': 15.0,
+    'istio_tcp_sent_bytes.-': 1200.0,
+}
+RUNTIME_KPIS = {
+    'java_lang_Memory_HeapMemoryUsage_used': 2e8,
+    'java_lang_Threading_ThreadCount': 60.0,
+    'java_nio_BufferPool_TotalCapacity.direct': 57343.0,
+}
+
+# 故障类型（specs/market_spec.md 的候选根因原因）及其在各类数据上的表现：
+#   kpi      受影响KPI名称中的关键词（容器故障对应容器指标，节点故障对应节点指标），None 表示指标无变化
+#   factor   故障窗口内受影响KPI的倍数（相对该KPI的典型量级）
+#   latency  根因Pod（节点故障为该节点上的Pod）的span耗时倍数
+#   errors   根因Pod的span出错概率，错误沿调用链向上游传播
+#   log      根因Pod在故障窗口内输出的错误日志
+FAULTS = {
+    'container CPU load': {'level': 'pod', 'kpi': 'cpu', 'factor': 5.0, 'latency': 3.0, 'errors': 0.1,
+                           'log': 'severity: error, message: rpc error: code = DeadlineExceeded desc = context deadline exceeded'},
+    'container memory load': {'level': 'pod', 'kpi': 'memory', 'factor': 3.0, 'latency': 2.0, 'errors': 0.2,
+                              'log': 'severity: error, message: java.lang.OutOfMemoryError: Java heap space'},
+    'container read I/O load': {'level': 'pod', 'kpi': 'fs_reads', 'factor': 8.0, 'latency': 2.0, 'errors': 0.05,
+                                'log': 'severity: error, message: read /data/cache: i/o timeout'},
+    'container write I/O load': {'level': 'pod', 'kpi': 'fs_writes', 'factor': 8.0, 'latency': 2.0, 'errors': 0.05,
+                                 'log': 'severity: error, message: write /data/cache: i/o timeout'},
+    'container network latency': {'level': 'pod', 'kpi': None, 'factor': 1.0, 'latency': 10.0, 'errors': 0.05,
+                                  'log': 'severity: warning, message: upstream request timeout'},
+    'container packet loss': {'level': 'pod', 'kpi': 'network', 'factor': 0.3, 'latency': 2.0, 'errors': 0.4,
+                              'log': 'severity: error, message: connection reset by peer'},
+    'node CPU load': {'level': 'node', 'kpi': 'cpu.pct', 'factor': 4.0, 'latency': 1.5, 'errors': 0.0, 'log': None},
+    'node memory consumption': {'level': 'node', 'kpi': 'mem.used', 'factor': 2.5, 'latency': 1.2, 'errors': 0.0,
+                                'log': None},
+    'node disk write I/O consumption': {'level': 'node', 'kpi': 'io.w_s', 'factor': 8.0, 'latency': 1.3,
+                                        'errors': 0.0, 'log': None},
+    'node disk space consumption': {'level': 'node', 'kpi': 'disk.pct', 'factor': 2.2, 'latency': 1.0,
+                                    'errors': 0.0, 'log': None},
+}
+
+# 请求类型：(权重, [(服务, 父span序号, 操作名)])，父span在子span之前
+TRACE_TEMPLATES = [
+    (0.35, [('frontend', -1, 'hipstershop.Frontend/Home'),
+            ('currencyservice', 0, 'hipstershop.CurrencyService/GetSupportedCurrencies'),
+            ('productcatalogservice', 0, 'hipstershop.ProductCatalogService/ListProducts'),
+            ('cartservice', 0, 'hipstershop.CartService/GetCart'),
+            ('adservice', 0, 'hipstershop.AdService/GetAds')]),
+    (0.30, [('frontend', -1, 'hipstershop.Frontend/Product'),
+            ('productcatalogservice', 0, 'hipstershop.ProductCatalogService/GetProduct'),
+            ('recommendationservice', 0, 'hipstershop.RecommendationService/ListRecommendations'),
+            ('productcatalogservice', 2, 'hipstershop.ProductCatalogService/ListProducts'),
+            ('currencyservice', 0, 'hipstershop.CurrencyService/Convert')]),
+    (0.20, [('frontend', -1, 'hipstershop.Frontend/ViewCart'),
+            ('cartservice', 0, 'hipstershop.CartService/GetCart'),
+            ('shippingservice', 0, 'hipstershop.ShippingService/GetQuote'),
+            ('currencyservice', 0, 'hipstershop.CurrencyService/Convert')]),
+    (0.15, [('frontend', -1, 'hipstershop.Frontend/PlaceOrder'),
+            ('checkoutservice', 0, 'hipstershop.CheckoutService/PlaceOrder'),
+            ('cartservice', 1, 'hipstershop.CartService/GetCart'),
+            ('productcatalogservice', 1, 'hipstershop.ProductCatalogService/GetProduct'),
+            ('currencyservice', 1, 'hipstershop.CurrencyService/Convert'),
+            ('shippingservice', 1, 'hipstershop.ShippingService/ShipOrder'),
+            ('paymentservice', 1, 'hipstershop.PaymentService/Charge'),
+            ('emailservice', 1, 'hipstershop.EmailService/SendOrderConfirmation'),
+            ('cartservice', 1, 'hipstershop.CartService/EmptyCart')]),
+]
+
+# 各服务自身处理耗时的典型值（ms）
+SERVICE_LATENCY = {
+    'frontend': 8.0, 'shippingservice': 3.0, 'checkoutservice': 6.0, 'currencyservice': 1.5, 'adservice': 4.0,
+    'emailservice': 5.0, 'cartservice': 3.5, 'productcatalogservice': 2.0, 'recommendationservice': 5.0,
+    'paymentservice': 4.0,
+}
+
+LOG_TEMPLATES = [
+    'severity: info, message: Getting supported currencies...',
+    'severity: info, message: [GetQuote] received request',
+    'severity: info, message: conversion request successful',
+    'request complete in {n} ms',
+    'GetCartAsync called with userId={h}',
+    'severity: info, message: payment went through (transaction_id: {h})',
+    'severity: debug, message: order confirmation email sent to {h}@example.com',
+]
+BACKGROUND_ERROR = 'severity: error, message: failed to retrieve ads, retrying'
+BACKGROUND_ERROR_RATE = 0.005
+# 故障窗口内改为根因Pod错误日志的比例（约为根因Pod正常日志量的 0.2 × Pod数 = 8 倍）
+FAULT_LOG_SHARE = 0.2
+
+
+def parse_count(text: str) -> int:
+    """解析 10k / 1.5M / 100M 形式的行数（十进制）"""
+    text = text.strip().upper()
+    units = {'K': 10 ** 3, 'M': 10 ** 6, 'G': 10 ** 9}
+    if text and text[-1] in units:
+        return int(float(text[:-1]) * units[text[-1]])
+    return int(float(text))
+
+
+def _rng(seed: int, *stream) -> np.random.Generator:
+    """每个文件、每个数据块使用独立的随机流，生成结果与分块方式以外的参数无关"""
+    return np.random.default_rng([seed, *stream])
+
+
+def _hex_ids(rng: np.random.Generator, n: int, words: int = 1) -> np.ndarray:
+    """n 个 16*words 位的十六进制ID"""
+    raw = rng.integers(0, 2 ** 63, size=n * words, dtype=np.int64).astype('>u8').tobytes()
+    return np.frombuffer(binascii.hexlify(raw), dtype=f'S{16 * words}').astype(str)
+
+
+def _metric_shape(rows: int, series: int, span: int, extendable: bool = True) -> tuple:
+    """
+    (采样点数, 序列倍数)：行数不超过 序列数 × 每分钟一个点 时减少采样点（不少于 MIN_POINTS），
+    超出时可扩展的文件按倍数增加KPI，不可扩展的缩短采样间隔
+    """
+    per_minute = max(span // METRIC_STEP, 1)
+    if rows <= series * per_minute:
+        return max(MIN_POINTS, rows // series), 1
+    if not extendable:
+        return min(span, rows // series), 1
+    return per_minute, max(1, round(rows / (series * per_minute)))
+
+
+def min_rows(name: str) -> int:
+    """文件的最小行数（完整拓扑 × MIN_POINTS 个采样点）；trace 和日志文件没有下限"""
+    series = {
+        'metric_container': len(PODS) * len(CONTAINER_KPIS),
+        'metric_node': len(NODES) * len(NODE_KPIS),
+        'metric_mesh': len(_mesh_ids()) * len(MESH_KPIS),
+        'metric_runtime': len(SERVICES) * len(RUNTIME_KPIS),
+        'metric_service': len(SERVICES),
+    }
+    return series[name] * MIN_POINTS if name in series else 1
+
+
+def fault_window(start_ts: int, span: int) -> tuple:
+    """故障窗口：从全天约60%处开始（对齐到分钟），持续30分钟（不超过总时长的1/5）"""
+    duration = min(FAULT_SECONDS, span // 5)
+    begin = start_ts + (int(span * 0.6) // METRIC_STEP) * METRIC_STEP
+    return begin, begin + duration
+
+
+def _fault_mask(ids: list, fault: dict, level: str) -> np.ndarray:
+    """各 cmdb_id 是否直接受故障影响（容器指标的 node-x.pod 按 pod 匹配）"""
+    if fault['level'] != level:
+        return np.zeros(len(ids), dtype=bool)
+    return np.array([cmdb_id == fault['component'] or cmdb_id.endswith('.' + fault['component']) for cmdb_id in ids])
+
+
+def write_long_metric(path: Path, ids: list, kpis: dict, rows: int, start_ts: int, span: int, fault: dict,
+                      fault_ids: np.ndarray, seed: int, stream: int) -> int:
+    """
+    写出 timestamp,cmdb_id,kpi_name,value 长格式指标，按时间排序
+
+    每个序列的水平为KPI典型量级 × 对数正态扰动，叠加日周期和10%噪声；fault_ids 中的组件
+    在故障窗口内把名称含 fault['kpi'] 的KPI乘以 fault['factor']（以典型量级为下限）。
+    """
+    base_names = list(kpis)
+    points, multiplier = _metric_shape(rows, len(ids) * len(base_names), span)
+    names = [name if k == 0 else f"{name}.x{k}" for k in range(multiplier) for name in base_names]
+    scales = np.array([kpis[name] for _ in range(multiplier) for name in base_names])
+
+    rng = _rng(seed, stream, 0)
+    n_series = len(ids) * len(names)
+    series_id = np.repeat(np.array(ids, dtype=object), len(names))
+    series_kpi = np.tile(np.array(names, dtype=object), len(ids))
+    series_scale = np.tile(scales, len(ids))
+    level = series_scale * rng.lognormal(0.0, 0.3, n_series)
+    phase = rng.uniform(0, 2 * np.pi, n_series)
+
+    keyword = fault['kpi']
+    affected = np.repeat(fault_ids, len(names))
+    if keyword:
+        affected &= np.array([keyword in name for name in series_kpi])
+    else:
+        affected[:] = False
+    begin, end = fault_window(start_ts, span)
+
+    step = max(span // points, 1)
+    timestamps = start_ts + step * np.arange(points, dtype=np.int64)
+    per_chunk = max(1, CHUNK_ROWS // n_series)
+    written = 0
+    with open(path, 'w', newline='') as f:
+        f.write('timestamp,cmdb_id,kpi_name,value\n')
+        for chunk, lo in enumerate(range(0, points, per_chunk)):
+            ts = timestamps[lo:lo + per_chunk]
+            chunk_rng = _rng(seed, stream, chunk + 1)
+            diurnal = 1 + 0.2 * np.sin(2 * np.pi * (ts[:, None] - start_ts) / 86400 + phase[None, :])
+            values = level[None, :] * diurnal * (1 + 0.1 * chunk_rng.standard_normal((len(ts), n_series)))
+            in_fault = (ts >= begin) & (ts < end)
+            if in_fault.any() and affected.any():
+                hit = np.ix_(in_fault, affected)
+                values[hit] = np.maximum(values[hit], series_scale[affected]) * fault['factor']
+            frame = pd.DataFrame({
+                'timestamp': np.repeat(ts, n_series),
+                'cmdb_id': np.tile(series_id, len(ts)),
+                'kpi_name': np.tile(series_kpi, len(ts)),
+                'value': np.abs(values).ravel().round(4),
+            })
+            frame.to_csv(f, header=False, index=False)
+            written += len(frame)
+    return written
+
+
+def write_service_metric(path: Path, rows: int, start_ts: int, span: int, fault: dict, seed: int, stream: int) -> int:
+    """
+    写出 service,timestamp,rr,sr,mrt,count
+
+    根因Pod所属服务在故障窗口内（该服务4个Pod中的1个出问题）：成功率按 errors/4 降低，
+    响应时间按 (latency-1)/4 升高；节点故障按该节点上的Pod占比同样处理。
+    """
+    services = [f"{service}-grpc" for service in SERVICES]
+    points, _ = _metric_shape(rows, len(services), span, extendable=False)
+    step = max(span // points, 1)
+    timestamps = start_ts + step * np.arange(points, dtype=np.int64)
+    begin, end = fault_window(start_ts, span)
+
+    share = np.zeros(len(SERVICES))
+    for pod in _fault_pods(fault):
+        share[SERVICES.index(POD_SERVICE[pod])] += 1 / 4
+    rng = _rng(seed, stream, 0)
+    mrt_level = np.array([SERVICE_LATENCY[s] * 3 for s in SERVICES]) * rng.lognormal(0, 0.2, len(SERVICES))
+
+    per_chunk = max(1, CHUNK_ROWS // len(services))
+    written = 0
+    with open(path, 'w', newline='') as f:
+        f.write('service,timestamp,rr,sr,mrt,count\n')
+        for chunk, lo in enumerate(range(0, points, per_chunk)):
+            ts = timestamps[lo:lo + per_chunk]
+            chunk_rng = _rng(seed, stream, chunk + 1)
+            shape = (len(ts), len(services))
+            rr = 100 - chunk_rng.exponential(0.2, shape)
+            sr = 100 - chunk_rng.exponential(0.2, shape)
+            mrt = mrt_level[None, :] * chunk_rng.gamma(5, 0.2, shape)
+            in_fault = ((ts >= begin) & (ts < end))[:, None] & (share > 0)[None, :]
+            drop = np.where(in_fault, share[None, :] * fault['errors'] * 100, 0.0)
+            rr, sr = rr - drop, sr - drop
+            mrt = np.where(in_fault, mrt * (1 + share[None, :] * (fault['latency'] - 1)), mrt)
+            frame = pd.DataFrame({
+                'service': np.tile(np.array(services, dtype=object), len(ts)),
+                'timestamp': np.repeat(ts, len(services)),
+                'rr': rr.ravel().round(6),
+                'sr': sr.ravel().round(6),
+                'mrt': mrt.ravel().round(6),
+                'count': chunk_rng.integers(10, 200, shape).ravel(),
+            })
+            frame.to_csv(f, header=False, index=False)
+            written += len(frame)
+    return written
+
+
+def _fault_pods(fault: dict) -> list:
+    """直接受影响的Pod：容器故障为根因Pod，节点故障为该节点上的所有Pod"""
+    if fault['level'] == 'pod':
+        return [fault['component']]
+    return [pod for pod in PODS if POD_NODE[pod] == fault['component']]
+
+
+def _pods_of(service: str) -> list:
+    return [pod for pod in PODS if POD_SERVICE[pod] == service]
+
+
+def write_traces(path: Path, rows: int, start_ts: int, span: int, fault: dict, seed: int, stream: int) -> int:
+    """
+    写出 trace_span.csv（毫秒时间戳），每条trace按请求类型模板展开为一棵调用树
+
+    每个span的耗时为自身处理时间加上子span耗时之和；故障窗口内受影响Pod的span耗时乘以 latency、
+    以 errors 的概率出错，出错状态沿调用链传播到所有上游span。
+    """
+    weights = np.array([w for w, _ in TRACE_TEMPLATES])
+    weights = weights / weights.sum()
+    mean_spans = sum(w * len(spans) for w, (_, spans) in zip(weights, TRACE_TEMPLATES))
+    traces = max(1, int(rows / mean_spans))
+    begin, end = fault_window(start_ts, span)
+    faulty = set(_fault_pods(fault))
+    pods = {service: np.array(_pods_of(service), dtype=object) for service in SERVICES}
+
+    columns = ['timestamp', 'cmdb_id', 'span_id', 'trace_id', 'duration', 'type', 'status_code', 'operation_name',
+               'parent_span']
+    chunks = max(1, int(np.ceil(traces * mean_spans / CHUNK_ROWS)))
+    written = 0
+    with open(path, 'w', newline='') as f:
+        f.write(','.join(columns) + '\n')
+        for chunk in range(chunks):
+            rng = _rng(seed, stream, chunk)
+            n = traces // chunks + (1 if chunk < traces % chunks else 0)
+            lo_ms = (start_ts + span * chunk // chunks) * 1000
+            hi_ms = (start_ts + span * (chunk + 1) // chunks) * 1000
+            starts = np.sort(rng.integers(lo_ms, hi_ms, n))
+            kinds = rng.choice(len(TRACE_TEMPLATES), size=n, p=weights)
+            trace_ids = _hex_ids(rng, n, 2)
+            frames = []
+            for kind, (_, spans) in enumerate(TRACE_TEMPLATES):
+                sel = np.flatnonzero(kinds == kind)
+                if len(sel) == 0:
+                    continue
+                m, s = len(sel), len(spans)
+                t0 = starts[sel]
+                in_fault = (t0 >= begin * 1000) & (t0 < end * 1000)
+                cmdb = np.empty((m, s), dtype=object)
+                own = np.empty((m, s))
+                error = np.zeros((m, s), dtype=bool)
+                for j, (service, _, _) in enumerate(spans):
+                    cmdb[:, j] = pods[service][rng.integers(0, len(pods[service]), m)]
+                    own[:, j] = rng.gamma(2.0, SERVICE_LATENCY[service] / 2, m)
+                    if faulty:
+                        hit = in_fault & np.isin(cmdb[:, j], list(faulty))
+                        own[hit, j] *= fault['latency']
+                        error[:, j] = hit & (rng.random(m) < fault['errors'])
+                duration = own.copy()
+                for j in range(s - 1, 0, -1):
+                    parent = spans[j][1]
+                    duration[:, parent] += duration[:, j]
+                    error[:, parent] |= error[:, j]
+                span_ids = _hex_ids(rng, m * s).reshape(m, s)
+                parent_ids = np.empty((m, s), dtype=object)
+                for j, (_, parent, _) in enumerate(spans):
+                    parent_ids[:, j] = span_ids[:, parent] if parent >= 0 else ''
+                frames.append(pd.DataFrame({
+                    'timestamp': (t0[:, None] + np.arange(s)[None, :]).ravel(),
+                    'cmdb_id': cmdb.ravel(),
+                    'span_id': span_ids.ravel(),
+                    'trace_id': np.repeat(trace_ids[sel], s),
+                    'duration': np.maximum(duration.round(), 1).astype(np.int64).ravel(),
+                    'type': 'rpc',
+                    'status_code': error.astype(np.int64).ravel(),
+                    'operation_name': np.tile(np.array([op for _, _, op in spans], dtype=object), m),
+                    'parent_span': parent_ids.ravel(),
+                }))
+            frame = pd.concat(frames, ignore_index=True).sort_values('timestamp', kind='stable')
+            frame.to_csv(f, header=False, index=False, columns=columns)
+            written += len(frame)
+    return written
+
+
+def _fill_templates(rng: np.random.Generator, templates: np.ndarray) -> np.ndarray:
+    """替换模板中的 {n}（数字）和 {h}（十六进制ID）"""
+    values = pd.Series(templates, dtype=object)
+    numbers = pd.Series(rng.integers(1, 5000, len(values)).astype(str))
+    hexes = pd.Series(_hex_ids(rng, len(values)))
+    for placeholder, fill in (('{n}', numbers), ('{h}', hexes)):
+        has = values.str.contains(placeholder, regex=False)
+        if has.any():
+            parts = values[has].str.split(placeholder, n=1, regex=False)
+            values[has] = parts.str[0] + fill[has] + parts.str[1]
+    return values.to_numpy()
+
+
+def write_service_logs(path: Path, rows: int, start_ts: int, span: int, fault: dict, seed: int, stream: int) -> int:
+    """
+    写出 log_service.csv：各Pod均匀输出常规日志，约0.5%为背景错误；
+    故障窗口内 FAULT_LOG_SHARE 的日志改为根因Pod输出的该故障错误日志（节点故障不产生错误日志）
+    """
+    begin, end = fault_window(start_ts, span)
+    pods = np.array(PODS, dtype=object)
+    root = PODS.index(fault['component']) if fault['log'] and fault['level'] == 'pod' else None
+    log_names = np.array([f"log_{POD_SERVICE[pod]}-service_application" for pod in PODS], dtype=object)
+    templates = np.array(LOG_TEMPLATES, dtype=object)
+
+    chunks = max(1, int(np.ceil(rows / CHUNK_ROWS)))
+    written = 0
+    with open(path, 'w', newline='') as f:
+        f.write('log_id,timestamp,cmdb_id,log_name,value\n')
+        for chunk in range(chunks):
+            rng = _rng(seed, stream, chunk)
+            n = rows // chunks + (1 if chunk < rows % chunks else 0)
+            lo = start_ts + span * chunk // chunks
+            hi = start_ts + span * (chunk + 1) // chunks
+            ts = np.sort(rng.integers(lo, hi, n))
+            which = rng.integers(0, len(pods), n)
+            values = templates[rng.integers(0, len(templates), n)]
+            values = np.where(rng.random(n) < BACKGROUND_ERROR_RATE, BACKGROUND_ERROR, values)
+            if root is not None:
+                hit = (ts >= begin) & (ts < end) & (rng.random(n) < FAULT_LOG_SHARE)
+                which = np.where(hit, root, which)
+                values = np.where(hit, fault['log'], values)
+            frame = pd.DataFrame({
+                'log_id': _hex_ids(rng, n),
+                'timestamp': ts,
+                'cmdb_id': pods[which],
+                'log_name': log_names[which],
+                'value': _fill_templates(rng, values),
+            })
+            frame.to_csv(f, header=False, index=False)
+            written += len(frame)
+    return written
+
+
+def write_proxy_logs(path: Path, rows: int, start_ts: int, span: int, fault: dict, seed: int, stream: int) -> int:
+    """
+    写出 log_proxy.csv（envoy 访问日志）：调用受影响Pod的请求在故障窗口内以 errors 的概率返回503，
+    耗时乘以 latency
+    """
+    begin, end = fault_window(start_ts, span)
+    faulty = np.array(_fault_pods(fault), dtype=object)
+    ops = np.array([op for _, spans in TRACE_TEMPLATES for service, _, op in spans], dtype=object)
+    op_service = np.array([service for _, spans in TRACE_TEMPLATES for service, _, _ in spans], dtype=object)
+    # 服务端代理日志：cmdb_id 为被调用服务的某个Pod
+    op_pods = np.array([_pods_of(service) for service in op_service], dtype=object)
+    log_names = np.array([f"log_{service}-istio-proxy" for service in op_service], dtype=object)
+    base = np.array([SERVICE_LATENCY[service] for service in op_service])
+
+    chunks = max(1, int(np.ceil(rows / CHUNK_ROWS)))
+    written = 0
+    with open(path, 'w', newline='') as f:
+        f.write('log_id,timestamp,cmdb_id,log_name,value\n')
+        for chunk in range(chunks):
+            rng = _rng(seed, stream, chunk)
+            n = rows // chunks + (1 if chunk < rows % chunks else 0)
+            lo = start_ts + span * chunk // chunks
+            hi = start_ts + span * (chunk + 1) // chunks
+            ts = np.sort(rng.integers(lo, hi, n))
+            op = rng.integers(0, len(ops), n)
+            which = op_pods[op, rng.integers(0, op_pods.shape[1], n)]
+            duration = rng.gamma(2.0, base[op] / 2)
+            code = np.full(n, '200', dtype=object)
+            if len(faulty):
+                hit = (ts >= begin) & (ts < end) & np.isin(which, faulty)
+                duration = np.where(hit, duration * fault['latency'], duration)
+                code = np.where(hit & (rng.random(n) < fault['errors']), '503', code)
+            flags = np.where(code == '503', 'UF,URX', '-')
+            value = ('"POST /' + pd.Series(ops[op]) + ' HTTP/2" ' + pd.Series(code) + ' ' + pd.Series(flags)
+                     + ' via_upstream - "-" ' + pd.Series(rng.integers(5, 500, n).astype(str)) + ' '
+                     + pd.Series(rng.integers(5, 5000, n).astype(str)) + ' '
+                     + pd.Series(np.maximum(duration.round(), 1).astype(np.int64).astype(str))
+                     + ' - "-" "grpc-go/1.31.0"')
+            frame = pd.DataFrame({
+                'log_id': _hex_ids(rng, n),
+                'timestamp': ts,
+                'cmdb_id': which,
+                'log_name': log_names[op],
+                'value': value.to_numpy(),
+            })
+            frame.to_csv(f, header=False, index=False)
+            written += len(frame)
+    return written
+
+
+def generate(out_dir: str, rows: int, fault_type: str = 'container CPU load', component: str | None = None,
+             seed: int = 0, hours: float = 24, start_ts: int = START_TS, files: list | None = None, progress=None) -> dict:
+    """
+    生成一个cloudbed一天的数据并写出 ground_truth.json，返回标注内容
+
+    component 默认为 shippingservice-1（容器故障）或 node-3（节点故障）；files 为 SHARES 中的文件名子集。
+    """
+    if fault_type not in FAULTS:
+        raise ValueError(f"未知故障类型: {fault_type}")
+    spec = FAULTS[fault_type]
+    if component is None:
+        component = 'shippingservice-1' if spec['level'] == 'pod' else 'node-3'
+    valid = PODS if spec['level'] == 'pod' else NODES
+    if component not in valid:
+        raise ValueError(f"{fault_type} 的根因组件应为 {', '.join(valid[:3])} 等，而不是 {component}")
+
+    span = int(hours * 3600)
+    begin, end = fault_window(start_ts, span)
+    fault = {**spec, 'component': component}
+    tz = pytz.timezone(TIMEZONE)
+    date = datetime.fromtimestamp(start_ts, tz).strftime('%Y_%m_%d')
+    telemetry = Path(out_dir) / 'cloudbed-1' / 'telemetry' / date
+
+    writers = {
+        'metric_container': lambda path, n, stream: write_long_metric(
+            path, [f"{POD_NODE[pod]}.{pod}" for pod in PODS], CONTAINER_KPIS, n, start_ts, span, fault,
+            _fault_mask([f"{POD_NODE[pod]}.{pod}" for pod in PODS], fault, 'pod'), seed, stream),
+        'metric_node': lambda path, n, stream: write_long_metric(
+            path, NODES, NODE_KPIS, n, start_ts, span, fault, _fault_mask(NODES, fault, 'node'), seed, stream),
+        'metric_mesh': lambda path, n, stream: write_long_metric(
+            path, _mesh_ids(), MESH_KPIS, n, start_ts, span, dict(fault, kpi=None),
+            np.zeros(len(_mesh_ids()), dtype=bool), seed, stream),
+        'metric_runtime': lambda path, n, stream: write_long_metric(
+            path, [f"{service}.ts:8088" for service in SERVICES], RUNTIME_KPIS, n, start_ts, span,
+            dict(fault, kpi=None), np.zeros(len(SERVICES), dtype=bool), seed, stream),
+        'metric_service': lambda path, n, stream: write_service_metric(path, n, start_ts, span, fault, seed, stream),
+        'trace_span': lambda path, n, stream: write_traces(path, n, start_ts, span, fault, seed, stream),
+        'log_service': lambda path, n, stream: write_service_logs(path, n, start_ts, span, fault, seed, stream),
+        'log_proxy': lambda path, n, stream: write_proxy_logs(path, n, start_ts, span, fault, seed, stream),
+    }
+
+    written = {}
+    for stream, name in enumerate(SHARES):
+        if files and name not in files:
+            continue
+        path = telemetry / FILE_DIRS[name] / f"{name}.csv"
+        path.parent.mkdir(parents=True, exist_ok=True)
+        began = time.perf_counter()
+        requested = max(1, int(rows * SHARES[name]))
+        count = writers[name](path, requested, stream)
+        written[name] = {'path': str(path), 'rows': count, 'floored': requested < min_rows(name)}
+        if progress:
+            progress(name, count, time.perf_counter() - began)
+
+    truth = {
+        'cloudbed': 'cloudbed-1',
+        'date': date,
+        'telemetry': str(telemetry),
+        'rows': rows,
+        'seed': seed,
+        'hours': hours,
+        'fault': {
+            'reason': fault_type,
+            'level': spec['level'],
+            'component': component,
+            'service': POD_SERVICE[component] if spec['level'] == 'pod' else None,
+            'node': POD_NODE[component] if spec['level'] == 'pod' else component,
+            'start': begin,
+            'end': end,
+        },
+        'files': written,
+    }
+    Path(out_dir, 'ground_truth.json').write_text(json.dumps(truth, ensure_ascii=False, indent=2))
+    return truth
+
+
+def _mesh_ids() -> list:
+    """调用图中的每条边：{源Pod}.source.{源服务}.{目标服务}"""
+    edges = sorted({(spans[parent][0], service) for _, spans in TRACE_TEMPLATES
+                    for service, parent, _ in spans if parent >= 0})
+    return [f"{pod}.source.{caller}.{callee}" for caller, callee in edges for pod in _pods_of(caller)]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Synthetic Telemetry Generator')
+    parser.add_argument('--out', type=str, help='Output directory')
+    parser.add_argument('--rows', type=str, default='1M', help='Approximate total rows, e.g. 10k, 1M, 100M')
+    parser.add_argument('--fault', type=str, default='container CPU load', help='Fault type (see --list-faults)')
+    parser.add_argument('--component', type=str, help='Root cause pod or node (default: shippingservice-1 / node-3)')
+    parser.add_argument('--hours', type=float, default=24, help='Time span in hours')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed')
+    parser.add_argument('--files', type=str, help=f"Comma-separated subset of {','.join(SHARES)}")
+    parser.add_argument('--list-faults', action='store_true', help='List fault types and exit')
+
+    args = parser.parse_args(argv)
+
+    if args.list_faults:
+        for name, spec in FAULTS.items():
+            print(f"{name:<34} {spec['level']:<5} kpi={spec['kpi']} x{spec['factor']}  "
+                  f"latency x{spec['latency']}  errors={spec['errors']}")
+        return
+    if not args.out:
+        parser.error('--out is required')
+
+    files = [name.strip() for name in args.files.split(',')] if args.files else None
+    unknown = sorted(set(files or []) - set(SHARES))
+    if unknown:
+        parser.error(f"unknown files: {','.join(unknown)}")
+
+    print(f"{'='*70}")
+    print("合成遥测数据生成")
+    print(f"{'='*70}")
+    print(f"输出目录: {args.out}")
+    print(f"总行数: ≈{parse_count(args.rows):,}  时长: {args.hours}h  种子: {args.seed}")
+
+    def progress(name, count, seconds):
+        print(f"  {name:<18} {count:>14,} 行  {seconds:6.1f}s", flush=True)
+
+    try:
+        truth = generate(args.out, parse_count(args.rows), args.fault, args.component, args.seed, args.hours,
+                         files=files, progress=progress)
+    except ValueError as e:
+        print(f"错误: {e}")
+        sys.exit(1)
+
+    floored = [name for name, info in truth['files'].items() if info['floored']]
+    if floored:
+        print(f"\n注意: {', '.join(floored)} 低于最小规模（完整拓扑 × {MIN_POINTS} 个采样点），行数不随 --rows 变化")
+
+    tz = pytz.timezone(TIMEZONE)
+    fault = truth['fault']
+    print(f"\n注入故障: {fault['reason']} @ {fault['component']}")
+    print(f"故障窗口: {datetime.fromtimestamp(fault['start'], tz)} ~ {datetime.fromtimestamp(fault['end'], tz)}")
+    print(f"标注文件: {Path(args.out) / 'ground_truth.json'}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,336 @@
+#!/usr/bin/env python3
+"""
+Scale Benchmark - 分析函数的规模基准
+用 gen_telemetry.py 生成不同规模、注入已知故障的数据，在独立子进程中逐个运行各分析函数，
+记录耗时、峰值RSS和准确性（排名第一的组件是否为注入的根因），并估计耗时随行数增长的阶数
+
+    用例                 分析函数                                       定位层级
+    metric               analyze_metric.service_window_result          服务
+    container            analyze_container.container_window_result     Pod
+    node                 container_window_result (metric_node.csv)     节点
+    container_matrix     container_window_result(matrix=True)          Pod
+    node_matrix          analyze_kpi.kpi_window_result                 节点
+    container_changepoint analyze_kpi.kpi_changepoints                Pod
+    node_changepoint     kpi_changepoints (metric_node.csv)            节点
+    trace_errors         analyze_trace.analyze_errors_by_component     Pod
+    trace_critical_path  analyze_trace.analyze_critical_paths          Pod
+    trace_graph          trace_graph.load_edges + propagation_scores   Pod
+    log_errors           analyze_log.analyze_errors                    Pod
+    log_templates        analyze_log.mine_templates + burst_scores     Pod
+    diagnose             diagnose.diagnose（全部阶段）                  Pod
+
+定位层级与注入故障不符的用例（如节点故障下的 trace 用例）准确性记为 n/a。
+所有分析均使用 use_cache=False，耗时只包含分析函数本身（*_matrix、*_changepoint 用例的矩阵在计时前构建，
+计时部分为打开内存映射矩阵和分析；*_changepoint 不使用故障窗口，排名第一的是全天最早变化的组件）；峰值RSS为子进程的 ru_maxrss，
+增量相对只导入模块的基线子进程。
+
+--save 保存结果，--baseline 与保存的结果对比：耗时或峰值RSS超过基线的 (1 + --threshold) 倍
+（且超过绝对下限 MIN_TIME_DELTA / MIN_RSS_DELTA），或原来命中的用例不再命中时，以退出码 1 结束。
+
+Usage:
+    python run_benchmarks.py --scales 10k,100k,1M
+    python run_benchmarks.py --scales 1M,10M --data-dir /data/bench --cases container,trace_graph --save bench.json
+    python run_benchmarks.py --scales 1M --baseline bench.json --threshold 0.2
+"""
+
+import argparse
+import json
+import math
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from itertools import pairwise
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+from gen_telemetry import FAULTS, parse_count
+
+SCRIPTS = Path(__file__).resolve().parent.parent / 'scripts'
+
+# 用例 -> (输入文件, 定位层级)
+CASES = {
+    'metric': ('metric_service', 'service'),
+    'container': ('metric_container', 'pod'),
+    'node': ('metric_node', 'node'),
+    'container_matrix': ('metric_container', 'pod'),
+    'node_matrix': ('metric_node', 'node'),
+    'container_changepoint': ('metric_container', 'pod'),
+    'node_changepoint': ('metric_node', 'node'),
+    'trace_errors': ('trace_span', 'pod'),
+    'trace_critical_path': ('trace_span', 'pod'),
+    'trace_graph': ('trace_span', 'pod'),
+    'log_errors': ('log_service', 'pod'),
+    'log_templates': ('log_service', 'pod'),
+    'diagnose': (None, 'pod'),
+}
+
+DEFAULT_SCALES = '10k,100k,1M'
+DEFAULT_THRESHOLD = 0.25
+
+# 低于该差值的变化视为噪声
+MIN_TIME_DELTA = 0.05
+MIN_RSS_DELTA = 16 * 1024 * 1024
+
+
+def _top(rows, column: str, score: str | None = None):
+    """结果表（DataFrame 或字典列表）中得分最高一行的组件，无结果为 None"""
+    import pandas as pd
+    frame = rows if isinstance(rows, pd.DataFrame) else pd.DataFrame(list(rows))
+    if len(frame) == 0:
+        return None
+    if score:
+        frame = frame.sort_values(score, ascending=False, kind='stable')
+    return str(frame[column].iloc[0])
+
+
+def run_case(case: str, truth: dict) -> dict:
+    """子进程中执行一个用例，返回耗时、排名第一的组件和输入行数"""
+    # 分析模块只在子进程中导入：ru_maxrss 会从父进程继承，父进程需要保持较小
+    sys.path.insert(0, str(SCRIPTS))
+    from common.log_templates import burst_scores
+    from common.series_store import open_matrix
+    from common.telemetry_cache import load_telemetry
+    from common.time_utils import file_time_unit, window_bounds
+    from common.trace_graph import load_edges, propagation_scores
+    from market.analyze_container import container_window_result
+    from market.analyze_kpi import kpi_changepoints, kpi_window_result
+    from market.analyze_log import analyze_errors, mine_templates
+    from market.analyze_metric import service_window_result
+    from market.analyze_trace import analyze_critical_paths, analyze_errors_by_component
+    from market.diagnose import LOG_COLUMNS, TRACE_COLUMNS, diagnose, locate_files
+    from market.scan_fleet import canonical_component
+
+    files = {name: info['path'] for name, info in truth['files'].items()}
+    start_ts, end_ts = truth['fault']['start'], truth['fault']['end']
+    source = CASES[case][0]
+    if case.endswith(('_matrix', '_changepoint')):
+        open_matrix(files[source], use_cache=False)
+
+    began = time.perf_counter()
+    if case == 'metric':
+        result = service_window_result(files[source], start_ts, end_ts, use_cache=False)
+        top = _top(result['anomalies'], 'service', 'deviation')
+    elif case in ('container', 'node'):
+        result = container_window_result(files[source], start_ts, end_ts, use_cache=False)
+        top = _top(result['anomalies'], 'cmdb_id', 'deviation')
+    elif case == 'container_matrix':
+        result = container_window_result(files[source], start_ts, end_ts, use_cache=False, matrix=True)
+        top = _top(result['anomalies'], 'cmdb_id', 'deviation')
+    elif case == 'node_matrix':
+        result = kpi_window_result(files[source], start_ts, end_ts, use_cache=False)
+        top = _top(result['anomalies'], 'cmdb_id', 'deviation')
+    elif case.endswith('_changepoint'):
+        result = kpi_changepoints(files[source], use_cache=False)
+        top = _top(result['ranking'], 'cmdb_id')
+    elif case.startswith('trace_') and case != 'trace_graph':
+        lo, hi = window_bounds(start_ts, end_ts, file_time_unit(files[source]))
+        df = load_telemetry(files[source], columns=TRACE_COLUMNS, start_ts=lo, end_ts=hi, use_cache=False)
+        if case == 'trace_errors':
+            top = _top(analyze_errors_by_component(df), 'cmdb_id')
+        else:
+            _, components = analyze_critical_paths(df)
+            top = _top(components, 'cmdb_id')
+    elif case == 'trace_graph':
+        lo, hi = window_bounds(start_ts, end_ts, file_time_unit(files[source]))
+        scores = propagation_scores(load_edges(files[source], lo, hi, use_cache=False))
+        top = _top(scores[scores['score'] > 0], 'cmdb_id')
+    elif case == 'log_errors':
+        df = load_telemetry(files[source], columns=LOG_COLUMNS, start_ts=start_ts, end_ts=end_ts, use_cache=False)
+        counts = analyze_errors(df)['cmdb_id'].value_counts()
+        top = str(counts.index[0]) if len(counts) else None
+    elif case == 'log_templates':
+        with tempfile.TemporaryDirectory() as tmp:
+            # 整天挖掘，突增得分以全天每分钟计数为基线
+            counts, n_minutes, _, _ = mine_templates(files[source], state_file=str(Path(tmp) / 'templates.json'),
+                                                     use_cache=False)
+        top = _top(burst_scores(counts, n_minutes), 'cmdb_id')
+    elif case == 'diagnose':
+        result = diagnose(locate_files(truth['telemetry']), start_ts, end_ts, use_cache=False)
+        conclusion = [e for e in result['evidence'] if e.stage == 'conclusion']
+        top = conclusion[0].details.get('root_cause_component') if conclusion else None
+    else:
+        return {}
+    elapsed = time.perf_counter() - began
+
+    if top is not None:
+        top = canonical_component(top).removesuffix('-grpc')
+    inputs = list(truth['files'].values()) if source is None else [truth['files'][source]]
+    rows = sum(info['rows'] for info in inputs)
+    floored = any(info.get('floored', False) for info in inputs)
+    return {'time': elapsed, 'top': top, 'rows': rows, 'floored': floored}
+
+
+def expected_component(case: str, fault: dict):
+    """用例在该故障下应排第一的组件，定位层级不符时为 None"""
+    level = CASES[case][1]
+    if level == 'service':
+        return fault['service']
+    if level == 'node':
+        return fault['node'] if fault['level'] == 'node' else None
+    return fault['component'] if fault['level'] == 'pod' else None
+
+
+def measure(case: str, truth_path: Path) -> dict:
+    """在子进程中运行用例，返回结果和峰值RSS（字节）"""
+    cmd = [sys.executable, __file__, '--child', case, '--truth', str(truth_path)]
+    with tempfile.TemporaryFile() as stderr:
+        proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=stderr)
+        output = proc.stdout.read()
+        _, status, usage = os.wait4(proc.pid, 0)
+        proc.returncode = os.waitstatus_to_exitcode(status)
+        if proc.returncode != 0:
+            stderr.seek(0)
+            sys.stderr.write(stderr.read().decode(errors='replace'))
+            raise RuntimeError(f"{case} 子进程失败，退出码 {proc.returncode}")
+    # Linux 上 ru_maxrss 的单位是 KB
+    return dict(json.loads(output.decode().strip().splitlines()[-1]), rss=usage.ru_maxrss * 1024)
+
+
+def prepare(data_dir: Path, rows: int, fault: str, seed: int) -> Path:
+    """生成（或复用已生成的）数据集，返回 ground_truth.json 路径"""
+    out = data_dir / f"{rows}-{fault.replace(' ', '_').replace('/', '')}-s{seed}"
+    truth_path = out / 'ground_truth.json'
+    if truth_path.exists():
+        truth = json.loads(truth_path.read_text())
+        if truth['rows'] == rows and truth['fault']['reason'] == fault and truth['seed'] == seed:
+            return truth_path
+    began = time.perf_counter()
+    subprocess.run([sys.executable, str(Path(__file__).resolve().parent / 'gen_telemetry.py'), '--out', str(out),
+                    '--rows', str(rows), '--fault', fault, '--seed', str(seed)], check=True, stdout=subprocess.DEVNULL)
+    print(f"  生成 {rows:,} 行数据: {time.perf_counter() - began:.1f}s -> {out}", flush=True)
+    return truth_path
+
+
+def scaling_exponents(results: list) -> dict:
+    """
+    用例 -> 相邻规模之间 log(耗时) 对 log(行数) 的斜率列表（约1为线性，约2为平方）
+
+    小规模时固定开销占主导，斜率偏小，应以最大规模之间的斜率为准；输入文件低于最小规模
+    （行数不随 --rows 变化）的点和输入行数相同的规模跳过。
+    """
+    exponents = {}
+    for case in dict.fromkeys(r['case'] for r in results):
+        points = sorted({r['rows']: r['time'] for r in results if r['case'] == case and not r.get('floored')}.items())
+        slopes = [(math.log(max(t2, 1e-4)) - math.log(max(t1, 1e-4))) / (math.log(n2) - math.log(n1))
+                  for (n1, t1), (n2, t2) in pairwise(points)]
+        if slopes:
+            exponents[case] = slopes
+    return exponents
+
+
+def compare(results: list, baseline: list, threshold: float) -> list:
+    """与基线结果逐个 (规模, 用例) 对比，返回回归描述"""
+    previous = {(r['scale'], r['case']): r for r in baseline}
+    regressions = []
+    for r in results:
+        base = previous.get((r['scale'], r['case']))
+        if base is None:
+            continue
+        label = f"{r['scale']}/{r['case']}"
+        if r['time'] > base['time'] * (1 + threshold) and r['time'] - base['time'] > MIN_TIME_DELTA:
+            regressions.append(f"{label}: 耗时 {base['time']:.2f}s -> {r['time']:.2f}s")
+        if r['rss'] > base['rss'] * (1 + threshold) and r['rss'] - base['rss'] > MIN_RSS_DELTA:
+            regressions.append(f"{label}: 峰值RSS {base['rss'] / 2**20:.0f}MB -> {r['rss'] / 2**20:.0f}MB")
+        if base.get('hit') is True and r.get('hit') is False:
+            regressions.append(f"{label}: 根因不再排第一 ({base['top']} -> {r['top']})")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Scale Benchmark')
+    parser.add_argument('--scales', type=str, default=DEFAULT_SCALES, help='Comma-separated total rows, e.g. 10k,1M,100M')
+    parser.add_argument('--fault', type=str, default='container CPU load', help='Injected fault type')
+    parser.add_argument('--seed', type=int, default=0, help='Generator seed')
+    parser.add_argument('--cases', type=str, help=f"Comma-separated subset of {','.join(CASES)}")
+    parser.add_argument('--repeat', type=int, default=1, help='Runs per case; the fastest is kept')
+    parser.add_argument('--data-dir', type=str, help='Keep generated datasets here and reuse them across runs')
+    parser.add_argument('--save', type=str, help='Save results as JSON')
+    parser.add_argument('--baseline', type=str, help='Compare against saved results and fail on regressions')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help='Allowed relative increase of time / peak RSS over the baseline')
+    parser.add_argument('--child', type=str, help=argparse.SUPPRESS)
+    parser.add_argument('--truth', type=str, help=argparse.SUPPRESS)
+
+    args = parser.parse_args(argv)
+
+    if args.child:
+        truth = json.loads(Path(args.truth).read_text())
+        # 分析过程中的提示信息转到 stderr（父进程只在失败时显示），stdout 只输出结果
+        stdout, sys.stdout = sys.stdout, sys.stderr
+        result = run_case(args.child, truth) if args.child != 'baseline' else {}
+        stdout.write(json.dumps(result) + '\n')
+        return
+
+    if args.fault not in FAULTS:
+        parser.error(f"unknown fault: {args.fault}")
+    cases = [name.strip() for name in args.cases.split(',')] if args.cases else list(CASES)
+    unknown = sorted(set(cases) - set(CASES))
+    if unknown:
+        parser.error(f"unknown cases: {','.join(unknown)}")
+    scales = [(text.strip(), parse_count(text)) for text in args.scales.split(',')]
+
+    print(f"{'='*70}")
+    print("分析函数规模基准")
+    print(f"{'='*70}")
+    print(f"注入故障: {args.fault}  种子: {args.seed}  规模: {', '.join(text for text, _ in scales)}")
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ['OPENRCA_CACHE_DIR'] = str(Path(tmp) / 'cache')
+        data_dir = Path(args.data_dir) if args.data_dir else Path(tmp)
+        for text, rows in scales:
+            truth_path = prepare(data_dir, rows, args.fault, args.seed)
+            fault = json.loads(truth_path.read_text())['fault']
+            baseline_rss = measure('baseline', truth_path)['rss']
+
+            print(f"\n规模 {text}  根因: {fault['component']}")
+            print(f"  {'用例':<22}{'行数':>12}{'耗时':>9}{'行/秒':>12}{'峰值RSS':>10}{'增量':>9}  {'排名第一':<24}命中")
+            for case in cases:
+                runs = [measure(case, truth_path) for _ in range(max(args.repeat, 1))]
+                best = dict(min(runs, key=lambda r: r['time']), rss=min(r['rss'] for r in runs))
+                expected = expected_component(case, fault)
+                hit = None if expected is None else best['top'] == expected
+                results.append({'scale': text, 'case': case, 'rows': best['rows'], 'floored': best['floored'],
+                                'time': best['time'],
+                                'rss': best['rss'], 'rss_delta': best['rss'] - baseline_rss,
+                                'top': best['top'], 'expected': expected, 'hit': hit})
+                mark = 'n/a' if hit is None else ('✓' if hit else '✗')
+                print(f"  {case:<24}{best['rows']:>11,}{'*' if best['floored'] else ' '}{best['time']:>8.2f}s"
+                      f"{best['rows'] / max(best['time'], 1e-6):>13,.0f}"
+                      f"{best['rss'] / 2**20:>10.0f}MB{(best['rss'] - baseline_rss) / 2**20:>8.0f}MB"
+                      f"  {best['top']!s:<24}{mark}", flush=True)
+
+    exponents = scaling_exponents(results)
+    if exponents:
+        print(f"\n{'='*70}")
+        print("耗时增长阶数 (相邻规模间 log 耗时 / log 行数，k≈1 线性，k≈2 平方):")
+        print(f"{'='*70}")
+        for case, slopes in exponents.items():
+            print(f"  {case:<24} k = {' → '.join(f'{k:.2f}' for k in slopes)}")
+    if any(r['floored'] for r in results):
+        print("\n* 输入文件低于最小规模（完整拓扑 × 最少采样点），行数不随 --rows 变化，不参与增长阶数估计")
+
+    scored = [r for r in results if r['hit'] is not None]
+    if scored:
+        print(f"\n准确性: {sum(r['hit'] for r in scored)}/{len(scored)} 个用例的排名第一为注入的根因")
+
+    if args.save:
+        Path(args.save).write_text(json.dumps({
+            'fault': args.fault, 'seed': args.seed, 'results': results, 'exponents': exponents,
+        }, ensure_ascii=False, indent=2))
+        print(f"结果已保存到: {args.save}")
+
+    if args.baseline:
+        regressions = compare(results, json.loads(Path(args.baseline).read_text())['results'], args.threshold)
+        print(f"\n与基线 {args.baseline} 对比 (阈值 +{args.threshold:.0%}):")
+        if regressions:
+            for line in regressions:
+                print(f"  ✗ {line}")
+            sys.exit(1)
+        print("  ✓ 无回归")
+
+
+if __name__ == '__main__':
+    main()
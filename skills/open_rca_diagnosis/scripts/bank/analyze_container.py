@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Container Analyzer for Bank - 银行场景容器层资源指标分析工具
+按块扫描 metric_container.csv：计算每个KPI的全局阈值 + 检测故障窗口内资源异常的组件（与 market 容器层规则相同）
+
+Usage:
+    python analyze_container.py --file metric_container.csv --start "2021-03-05 10:00:00" --end "2021-03-05 10:30:00"
+
+    # 按组件过滤；按每个组件自身的全天分布计算阈值
+    python analyze_container.py --file metric_container.csv --start ... --end ... --component Tomcat --baseline series
+"""
+
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from common.rca_client import add_server_argument, forward_early, forward_if_requested
+
+if __name__ == '__main__':
+    forward_early('bank_analyze_container')  # --server: 在导入 pandas 之前转发给常驻服务
+
+import argparse
+
+import pandas as pd
+
+from common.output import add_format_arguments, check_format_arguments
+from common.profiling import add_profile_arguments, check_profile_arguments, profile_session
+from common.scene_scan import add_scene_arguments, run_scene
+
+CONTAINER_COLUMNS = ['timestamp', 'cmdb_id', 'kpi_name', 'value']
+
+# 资源类型 -> KPI名称（小写）需同时包含的关键词，按顺序匹配：JVM 先于通用的 CPU/内存
+RESOURCE_PATTERNS = [
+    ('jvm_cpu', ('jvm', 'cpu')),
+    ('jvm_heap', ('jvm', 'heap')),
+    ('jvm_heap', ('jvm', 'memory')),
+    ('cpu', ('cpu',)),
+    ('memory', ('mem',)),
+    ('disk_read', ('read',)),
+    ('disk_space', ('filesystem',)),
+    ('disk_space', ('fscapacity',)),
+    ('disk_space', ('disk',)),
+    ('packet_loss', ('loss',)),
+    ('packet_loss', ('drop',)),
+    ('packet_loss', ('retrans',)),
+    ('network', ('network',)),
+    ('network', ('tcp',)),
+]
+
+# 资源类型 -> 候选根因原因（specs/bank_spec.md）
+RESOURCE_REASONS = {
+    'jvm_cpu': 'high JVM CPU load',
+    'jvm_heap': 'JVM Out of Memory (OOM) Heap',
+    'cpu': 'high CPU usage',
+    'memory': 'high memory usage',
+    'disk_read': 'high disk I/O read usage',
+    'disk_space': 'high disk space usage',
+    'packet_loss': 'network packet loss',
+    'network': 'network latency',
+}
+
+
+def classify_kpi(kpi_name: str) -> tuple:
+    """(资源类型, 候选根因原因)"""
+    kpi_lower = kpi_name.lower()
+    for res_type, keywords in RESOURCE_PATTERNS:
+        if all(kw in kpi_lower for kw in keywords):
+            return res_type, RESOURCE_REASONS[res_type]
+    return 'other', None
+
+
+def to_long(chunk: pd.DataFrame) -> pd.DataFrame:
+    return chunk.rename(columns={'cmdb_id': 'component', 'kpi_name': 'kpi'})
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Bank Container Analyzer for OpenRCA')
+    add_scene_arguments(parser, 'Container metric file (metric_container.csv)', min_deviation=0.5)
+    add_format_arguments(parser)
+    add_profile_arguments(parser)
+    add_server_argument(parser)
+
+    args = parser.parse_args(argv)
+    forward_if_requested(args, 'bank_analyze_container', argv)
+    check_format_arguments(parser, args)
+    check_profile_arguments(parser, args)
+
+    with profile_session(args, 'bank_analyze_container'):
+        run(parser, args)
+
+
+def run(parser, args):
+    run_scene(parser, args, '银行场景容器层资源指标分析报告', CONTAINER_COLUMNS, to_long, classify=classify_kpi)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+"""
+App Metric Analyzer for Bank - 银行场景应用层指标分析工具
+按块扫描 metric_app.csv：计算 rr/sr/mrt 的全局阈值 + 检测故障窗口内异常的服务（与 market 服务层规则相同）
+
+Usage:
+    python analyze_metric.py --file metric_app.csv --start "2021-03-05 10:00:00" --end "2021-03-05 10:30:00"
+
+    # 内存上限（默认512M）决定分块大小，阈值为 t-digest 近似值
+    python analyze_metric.py --file metric_app.csv --start ... --end ... --max-memory 256M
+"""
+
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from common.rca_client import add_server_argument, forward_early, forward_if_requested
+
+if __name__ == '__main__':
+    forward_early('bank_analyze_metric')  # --server: 在导入 pandas 之前转发给常驻服务
+
+import argparse
+
+import pandas as pd
+
+from common.output import add_format_arguments, check_format_arguments
+from common.profiling import add_profile_arguments, check_profile_arguments, profile_session
+from common.scene_scan import add_scene_arguments, run_scene
+
+# cnt 不参与判定，读取时即丢弃
+APP_COLUMNS = ['timestamp', 'tc', 'rr', 'sr', 'mrt']
+
+# 成功率类指标低于P5为异常，响应时间高于P95为异常
+RULES = {'rr': 'below', 'sr': 'below', 'mrt': 'above'}
+
+
+def to_long(chunk: pd.DataFrame) -> pd.DataFrame:
+    return chunk.melt(id_vars=['timestamp', 'tc'], value_vars=list(RULES), var_name='kpi') \
+        .rename(columns={'tc': 'component'})
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Bank App Metric Analyzer for OpenRCA')
+    add_scene_arguments(parser, 'App metric file (metric_app.csv)')
+    add_format_arguments(parser)
+    add_profile_arguments(parser)
+    add_server_argument(parser)
+
+    args = parser.parse_args(argv)
+    forward_if_requested(args, 'bank_analyze_metric', argv)
+    check_format_arguments(parser, args)
+    check_profile_arguments(parser, args)
+
+    with profile_session(args, 'bank_analyze_metric'):
+        run(parser, args)
+
+
+def run(parser, args):
+    run_scene(parser, args, '银行场景应用层指标分析报告', APP_COLUMNS, to_long, rules=RULES)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""
+Trace Analyzer for Bank - 银行场景链路耗时分析工具
+按块扫描 trace_span.csv（毫秒时间戳，无状态码）：每个组件的全天耗时分布 + 故障窗口内平均耗时超过自身P95的组件
+
+Usage:
+    python analyze_trace.py --file trace_span.csv --start "2021-03-05 10:00:00" --end "2021-03-05 10:30:00"
+"""
+
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from common.rca_client import add_server_argument, forward_early, forward_if_requested
+
+if __name__ == '__main__':
+    forward_early('bank_analyze_trace')  # --server: 在导入 pandas 之前转发给常驻服务
+
+import argparse
+
+import numpy as np
+import pandas as pd
+
+from common.output import add_format_arguments, check_format_arguments
+from common.profiling import add_profile_arguments, check_profile_arguments, profile_session
+from common.scene_scan import add_scene_arguments, run_scene
+
+# span/trace ID 不参与统计，读取时即丢弃
+TRACE_COLUMNS = ['timestamp', 'cmdb_id', 'duration']
+
+
+def to_long(chunk: pd.DataFrame) -> pd.DataFrame:
+    return pd.DataFrame({
+        'timestamp': chunk['timestamp'],
+        'component': chunk['cmdb_id'],
+        'kpi': pd.Categorical.from_codes(np.zeros(len(chunk), dtype=np.int8), ['duration']),
+        'value': chunk['duration'].astype('float32'),
+    })
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Bank Trace Analyzer for OpenRCA')
+    add_scene_arguments(parser, 'Trace file (trace_span.csv)', baseline='series')
+    add_format_arguments(parser)
+    add_profile_arguments(parser)
+    add_server_argument(parser)
+
+    args = parser.parse_args(argv)
+    forward_if_requested(args, 'bank_analyze_trace', argv)
+    check_format_arguments(parser, args)
+    check_profile_arguments(parser, args)
+
+    with profile_session(args, 'bank_analyze_trace'):
+        run(parser, args)
+
+
+def run(parser, args):
+    run_scene(parser, args, '银行场景链路耗时分析报告', TRACE_COLUMNS, to_long)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,61 @@
+"""
+Arrow Text Kernels for OpenRCA
+日志文本的向量化匹配与截断 - 在 Arrow 字符串/字典数组上运行，不为每行创建 Python 对象
+
+pandas 的 Arrow 字符串列（pandas 3 的默认 str 类型）零拷贝地交给 pyarrow.compute；
+category 列（cmdb_id、log_name）只在类别字典上匹配一次，再按编码展开为行掩码。
+
+带 flags 的 str.contains 会退回逐行调用 Python re，这里改用 RE2 内核的 ignore_case 选项。
+RE2 不支持的语法（反向引用、环视等）或 IGNORECASE 以外的 flags 仍交给 Python re，结果不变。
+
+    from common.arrow_text import match_mask, truncate
+    errors = df[match_mask(df['value'], 'error|timeout', re.IGNORECASE)]
+    truncate(errors['value'].head(10), 100)
+"""
+
+import re
+
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+except ImportError:  # pyarrow 不可用时使用 pandas 的字符串方法
+    pa = None
+
+
+def _python_mask(values: pd.Series, pattern: str, flags: int) -> np.ndarray:
+    return values.str.contains(pattern, regex=True, flags=flags, na=False).to_numpy(dtype=bool)
+
+
+def _arrow_mask(values: pd.Series, pattern: str, ignore_case: bool) -> np.ndarray:
+    """RE2 内核匹配，缺失值视为不匹配"""
+    matched = pc.match_substring_regex(pa.array(values), pattern, ignore_case=ignore_case)
+    return matched.fill_null(False).to_numpy(zero_copy_only=False)
+
+
+def match_mask(values: pd.Series, pattern: str, flags: int = 0) -> np.ndarray:
+    """
+    正则匹配的行掩码（与 values.str.contains(pattern, regex=True, flags=flags, na=False) 一致）
+
+    category 列在类别上匹配后按编码展开；其余列转为 Arrow 数组（Arrow 字符串列零拷贝，object 列转换一次）。
+    """
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        categories = pd.Series(values.cat.categories)
+        hits = np.append(match_mask(categories, pattern, flags), False)
+        return hits[values.cat.codes.to_numpy()]  # 缺失值的编码为 -1，取到末尾的 False
+    if pa is None or flags & ~re.IGNORECASE:
+        return _python_mask(values, pattern, flags)
+    try:
+        return _arrow_mask(values, pattern, bool(flags & re.IGNORECASE))
+    except pa.ArrowInvalid:  # RE2 不支持的正则语法
+        return _python_mask(values, pattern, flags)
+
+
+def truncate(values: pd.Series, width: int) -> list:
+    """按字符截断为前 width 个字符，缺失值为空字符串"""
+    if pa is None:
+        return [value[:width] if isinstance(value, str) else '' for value in values.tolist()]
+    array = pa.array(values.astype(object) if isinstance(values.dtype, pd.CategoricalDtype) else values)
+    return pc.utf8_slice_codeunits(array, 0, width).fill_null('').to_pylist()
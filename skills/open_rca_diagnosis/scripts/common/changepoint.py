@@ -0,0 +1,364 @@
+"""
+Changepoint Detection for OpenRCA
+变点检测 - 在 (序列 × 时间网格) 矩阵上一次性找出所有序列的变化起点、幅度和方向
+
+窗口均值对比全局P95的规则需要先猜窗口，并且会漏掉短时尖峰、不给出起始时间。这里对每条序列做
+二分分割：每一层在所有序列的所有段上同时计算均值漂移的 CUSUM 统计量
+
+    T(k) = |右段均值 - 左段均值| * sqrt(n_左 * n_右 / n) / sigma
+
+在得分超过 min_score 的段内最大处切开，直到没有新的切点或达到 max_depth 层；之后把偏离所在段
+均值超过 min_score 个 sigma 的连续点单独切出（分段统计量对段中间的短时尖峰不敏感）。每层都是
+累积和与按段归约，单条序列 O(n)；sigma 为一阶差分的稳健标准差（MAD），不受水平漂移影响。
+
+每个切点的幅度为右侧段均值减左侧段均值；序列的起点为满足得分和相对变化（|幅度| / |左侧均值|
+>= min_change）的最早切点，组件按最早起点排序。
+
+    from common.changepoint import detect_onsets, frame_matrix, rank_components
+    onsets = detect_onsets(matrix.values, matrix.times, matrix.series, start_ts, end_ts)
+    ranking = rank_components(onsets)
+
+    # 宽表（每个KPI一列）先转换为矩阵
+    values, times, labels = frame_matrix(df, 'service', ['rr', 'sr', 'mrt'])
+"""
+
+import sys
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from common.profiling import stage
+from common.series_store import detect_step
+from common.time_utils import format_timestamp
+
+DEFAULT_MIN_SCORE = 8.0
+DEFAULT_MIN_CHANGE = 0.5
+DEFAULT_MAX_DEPTH = 8
+
+# 每次处理的序列数，限制中间数组的大小（约 BLOCK_ROWS × 时间桶数 × 8 字节 × 数个）
+BLOCK_ROWS = 1024
+
+# MAD -> 正态标准差
+MAD_SCALE = 1.4826
+
+
+def fill_gaps(values: np.ndarray) -> np.ndarray:
+    """沿时间轴前向填充 NaN，开头的 NaN 取第一个有值的点；全部缺失的行保持 NaN"""
+    values = np.asarray(values, dtype=np.float64)
+    n = values.shape[1]
+    valid = ~np.isnan(values)
+    index = np.where(valid, np.arange(n), 0)
+    np.maximum.accumulate(index, axis=1, out=index)
+    filled = np.take_along_axis(values, index, axis=1)
+    first = valid.argmax(axis=1)
+    lead = np.arange(n)[None, :] < first[:, None]
+    return np.where(lead, values[np.arange(len(values)), first][:, None], filled)
+
+
+def noise_scale(filled: np.ndarray) -> np.ndarray:
+    """每行一阶差分的稳健标准差 / sqrt(2)；MAD 为0（大量重复值）时改用标准差，下限与量级相关"""
+    diffs = np.diff(filled, axis=1)
+    if diffs.shape[1] == 0:
+        return np.ones(len(filled))
+    center = np.median(diffs, axis=1, keepdims=True)
+    sigma = MAD_SCALE * np.median(np.abs(diffs - center), axis=1)
+    sigma = np.where(sigma > 0, sigma, diffs.std(axis=1)) / np.sqrt(2)
+    floor = 1e-9 * (np.abs(filled).mean(axis=1) + 1)
+    return np.maximum(np.nan_to_num(sigma), floor)
+
+
+def _segment_bounds(cuts: np.ndarray) -> tuple:
+    """每个位置所在段的起点和终点（不含），cuts[:, k] 表示在第 k 列之前切开"""
+    n = cuts.shape[1]
+    positions = np.arange(n)
+    start = np.where(cuts, positions, 0)
+    start[:, 0] = 0
+    np.maximum.accumulate(start, axis=1, out=start)
+    # 终点为右侧第一个切点，没有时为 n
+    end = np.where(cuts, positions, n)[:, ::-1]
+    end = np.minimum.accumulate(np.concatenate([np.full((len(cuts), 1), n), end[:, :-1]], axis=1), axis=1)[:, ::-1]
+    return start, end
+
+
+def segment(filled: np.ndarray, sigma: np.ndarray, min_score: float = DEFAULT_MIN_SCORE,
+            max_depth: int = DEFAULT_MAX_DEPTH) -> np.ndarray:
+    """
+    所有行同时做二分分割，返回切点矩阵：cuts[i, k] 表示第 i 行在第 k 列之前切开
+
+    每层只计算上一层新切出的段（没有显著切点的段不再变化），所有段的元素拼接为一个一维数组，
+    按段取最大值；没有变化的序列只计算一次。
+    """
+    rows, n = filled.shape
+    cumsum = np.zeros((rows, n + 1))
+    np.cumsum(filled, axis=1, out=cumsum[:, 1:])
+    cumsum = cumsum.ravel()
+    cuts = np.zeros((rows, n), dtype=bool)
+    # 待计算的段：(行, 起点, 终点)，终点不含
+    seg_row, seg_lo, seg_hi = np.arange(rows), np.zeros(rows, dtype=np.int64), np.full(rows, n, dtype=np.int64)
+    for _ in range(max_depth):
+        keep = seg_hi - seg_lo >= 2
+        seg_row, seg_lo, seg_hi = seg_row[keep], seg_lo[keep], seg_hi[keep]
+        if len(seg_row) == 0:
+            break
+        lengths = seg_hi - seg_lo
+        offsets = np.concatenate([[0], np.cumsum(lengths)[:-1]])
+        # 段内每个位置 k 为候选切点（在 k 之前切开），left 为左段长度
+        left = np.arange(lengths.sum()) - np.repeat(offsets, lengths)
+        base = np.repeat(seg_row * (n + 1) + seg_lo, lengths)
+        right = np.repeat(lengths, lengths) - left
+        start_sum = cumsum[base]
+        split_sum = cumsum[base + left]
+        end_sum = np.repeat(cumsum[seg_row * (n + 1) + seg_hi], lengths)
+        # 段的起点不是候选切点：左段长度按1计算，得分置0
+        at_start = left == 0
+        left, right = np.maximum(left, 1).astype(np.float64), right.astype(np.float64)
+        stat = np.abs((end_sum - split_sum) / right - (split_sum - start_sum) / left) \
+            * np.sqrt(left * right / (left + right)) / np.repeat(sigma[seg_row], lengths)
+        stat[at_start] = 0.0
+
+        best = np.maximum.reduceat(stat, offsets)
+        at_best = stat == np.repeat(best, lengths)
+        first = np.minimum.reduceat(np.where(at_best & ~at_start, left, n), offsets).astype(np.int64)
+        split = best >= min_score
+        if not split.any():
+            break
+        seg_row, seg_lo, seg_hi, first = seg_row[split], seg_lo[split], seg_hi[split], first[split]
+        cut = seg_lo + first
+        cuts[seg_row, cut] = True
+        seg_row = np.concatenate([seg_row, seg_row])
+        seg_lo, seg_hi = np.concatenate([seg_lo, cut]), np.concatenate([cut, seg_hi])
+    return cuts
+
+
+def _spikes(filled: np.ndarray, sigma: np.ndarray, cuts: np.ndarray, min_score: float):
+    """把偏离所在段均值超过 min_score 个 sigma 的连续点切成单独的段（就地修改 cuts）"""
+    rows, n = filled.shape
+    start, end = _segment_bounds(cuts)
+    cumsum = np.zeros((rows, n + 1))
+    np.cumsum(filled, axis=1, out=cumsum[:, 1:])
+    row_index = np.arange(rows)[:, None]
+    mean = (cumsum[row_index, end] - cumsum[row_index, start]) / (end - start)
+    z = (filled - mean) / sigma[:, None]
+    # 同一方向连续超出的点为一段：段的第一个点和段后的第一个点之前都切开
+    sign = np.sign(z) * (np.abs(z) >= min_score)
+    new = np.zeros((rows, n), dtype=bool)
+    new[:, 1:] = sign[:, 1:] != sign[:, :-1]
+    cuts |= new
+
+
+def _changes(filled: np.ndarray, sigma: np.ndarray, cuts: np.ndarray) -> dict:
+    """
+    每个切点两侧段的均值和得分（按最终的分段重新计算：切开时的统计量可能来自更大的段，
+    与最终两侧段的幅度不对应）
+    """
+    rows, n = filled.shape
+    row, col = np.nonzero(cuts)
+    start, end = _segment_bounds(cuts)
+    cumsum = np.zeros((rows, n + 1))
+    np.cumsum(filled, axis=1, out=cumsum[:, 1:])
+    # 左侧段为切点前一列所在的段，右侧段为切点所在的段
+    left_start, right_end = start[row, col - 1], end[row, col]
+    left, right = col - left_start, right_end - col
+    before = (cumsum[row, col] - cumsum[row, left_start]) / left
+    after = (cumsum[row, right_end] - cumsum[row, col]) / right
+    score = np.abs(after - before) * np.sqrt(left * right / (left + right)) / sigma[row]
+    return {'row': row, 'col': col, 'score': score, 'before': before, 'after': after}
+
+
+def detect_onsets(values: np.ndarray, times: np.ndarray, labels: pd.DataFrame, start_ts=None, end_ts=None,
+                  min_score: float = DEFAULT_MIN_SCORE, min_change: float = DEFAULT_MIN_CHANGE,
+                  max_depth: int = DEFAULT_MAX_DEPTH, block_rows: int = BLOCK_ROWS) -> pd.DataFrame:
+    """
+    每条序列在 [start_ts, end_ts] 内的最早显著变化
+
+    values 为 (序列 × 时间) 矩阵（可以是内存映射，按 block_rows 行分块处理），times 为每列的时间戳，
+    labels 为每行序列的标识列。分段始终使用整条序列，窗口只限定起点所在的列。
+    返回 labels 各列 + onset、score、before、after、magnitude、relative、direction、changes（窗口内
+    满足条件的切点数），按起点、得分排序；没有显著变化的序列不返回。
+    """
+    times = np.asarray(times)
+    in_range = np.ones(len(times), dtype=bool)
+    if start_ts is not None:
+        in_range &= times >= start_ts
+    if end_ts is not None:
+        in_range &= times <= end_ts
+    found = []
+    for lo in range(0, len(values), block_rows):
+        block = np.asarray(values[lo:lo + block_rows], dtype=np.float64)
+        present = ~np.isnan(block).all(axis=1)
+        if not present.any():
+            continue
+        filled = fill_gaps(block[present])
+        sigma = noise_scale(filled)
+        cuts = segment(filled, sigma, min_score, max_depth)
+        _spikes(filled, sigma, cuts, min_score)
+        change = _changes(filled, sigma, cuts)
+        change['row'] = lo + np.flatnonzero(present)[change['row']]
+        found.append(pd.DataFrame(change))
+
+    columns = list(labels.columns) + ['onset', 'score', 'before', 'after', 'magnitude', 'relative', 'direction',
+                                      'changes']
+    if not found:
+        return pd.DataFrame(columns=columns)
+    cps = pd.concat(found, ignore_index=True)
+    cps['magnitude'] = cps['after'] - cps['before']
+    with np.errstate(invalid='ignore', divide='ignore'):
+        cps['relative'] = cps['magnitude'] / cps['before'].abs()
+    # 变化前均值为0时相对变化无穷大，只要求得分
+    significant = (cps['score'] >= min_score) & (cps['relative'].abs() >= min_change) & in_range[cps['col']]
+    cps = cps[significant]
+    if len(cps) == 0:
+        return pd.DataFrame(columns=columns)
+
+    cps = cps.sort_values(['row', 'col'], kind='stable')
+    counts = cps.groupby('row', sort=False).size()
+    first = cps.drop_duplicates('row').reset_index(drop=True)
+    result = labels.iloc[first['row'].to_numpy()].reset_index(drop=True)
+    result['onset'] = times[first['col'].to_numpy()]
+    for name in ['score', 'before', 'after', 'magnitude']:
+        result[name] = first[name].to_numpy()
+    result['relative'] = first['relative'].replace([np.inf, -np.inf], np.nan).to_numpy()
+    result['direction'] = np.where(first['magnitude'].to_numpy() > 0, 'up', 'down')
+    result['changes'] = counts.loc[first['row']].to_numpy()
+    return result.sort_values(['onset', 'score'], ascending=[True, False], kind='stable').reset_index(drop=True)
+
+
+def rank_components(onsets: pd.DataFrame, component: str = 'cmdb_id', kpi: str = 'kpi_name') -> pd.DataFrame:
+    """按组件汇总：最早起点、该起点的KPI和方向、发生变化的序列数和最大得分，按最早起点排序"""
+    columns = [component, 'onset', kpi, 'direction', 'relative', 'series', 'max_score']
+    if len(onsets) == 0:
+        return pd.DataFrame(columns=columns)
+    # onsets 已按 (起点, 得分降序) 排序，每个组件的第一行即最早、最显著的变化
+    first = onsets.drop_duplicates(component).set_index(component)
+    grouped = onsets.groupby(component, sort=False)
+    ranking = pd.DataFrame({
+        'onset': first['onset'],
+        kpi: first[kpi],
+        'direction': first['direction'],
+        'relative': first['relative'],
+        'series': grouped.size(),
+        'max_score': grouped['score'].max(),
+    }).reset_index()
+    return ranking.sort_values(['onset', 'max_score'], ascending=[True, False], kind='stable').reset_index(drop=True)[
+        columns]
+
+
+def frame_matrix(df: pd.DataFrame, key: str, kpis: list, step: int | None = None) -> tuple:
+    """
+    宽表（每个KPI一列，如 metric_service 的 service,timestamp,rr,sr,mrt）转换为 (序列 × 时间网格) 矩阵
+
+    每个 (key, KPI) 为一行，同一桶内的多个点取均值，缺失为 NaN；返回 (values, times, labels)，
+    labels 的列为 key 和 kpi。网格步长默认为最常见的采样间隔（与 common.series_store 相同）。
+    """
+    ts = df['timestamp'].to_numpy(dtype=np.int64)
+    if len(ts) == 0:
+        return np.empty((0, 0)), np.empty(0, dtype=np.int64), pd.DataFrame(columns=[key, 'kpi'])
+    step = int(step or detect_step(ts))
+    t0 = int(ts.min() // step * step)
+    n_bins = int((ts.max() - t0) // step) + 1
+    codes, names = pd.factorize(df[key], sort=True)
+    column = (ts - t0) // step
+    blocks, labels = [], []
+    for kpi in kpis:
+        values = df[kpi].to_numpy(dtype=np.float64, na_value=np.nan)
+        ok = ~np.isnan(values) & (codes >= 0)
+        cell = codes[ok] * n_bins + column[ok]
+        size = len(names) * n_bins
+        counts = np.bincount(cell, minlength=size)
+        sums = np.bincount(cell, weights=values[ok], minlength=size)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            blocks.append((sums / counts).reshape(len(names), n_bins))
+        labels.append(pd.DataFrame({key: np.asarray(names, dtype=object), 'kpi': kpi}))
+    return np.vstack(blocks), t0 + step * np.arange(n_bins, dtype=np.int64), pd.concat(labels, ignore_index=True)
+
+
+def changepoint_result(values: np.ndarray, times: np.ndarray, labels: pd.DataFrame, start_ts=None, end_ts=None,
+                       min_score: float = DEFAULT_MIN_SCORE, min_change: float = DEFAULT_MIN_CHANGE,
+                       component: str = 'cmdb_id', kpi: str = 'kpi_name', rows: int | None = None) -> dict:
+    """检测所有序列的变化起点并按组件排序（阶段 detect、rank），返回结构化结果；rows 为源数据行数"""
+    with stage('detect') as span:
+        onsets = detect_onsets(values, times, labels, start_ts, end_ts, min_score, min_change)
+        span.rows = int(np.prod(np.shape(values)))
+        span.set(series=len(values), changed=len(onsets))
+    with stage('rank') as span:
+        ranking = rank_components(onsets, component, kpi)
+        span.rows = len(onsets)
+    return {
+        'rows': rows,
+        'series': len(values),
+        'bins': len(times),
+        'start': start_ts,
+        'end': end_ts,
+        'min_score': min_score,
+        'min_change': min_change,
+        'component': component,
+        'kpi': kpi,
+        'onsets': onsets,
+        'ranking': ranking,
+    }
+
+
+def print_changepoints(title: str, file_path: str, result: dict, tz, unit: str, top: int = 15, filters: dict | None = None):
+    """文本报告：数据概况、规则、最早变化的组件和序列、结论；filters 为 {名称: 过滤条件}"""
+    onsets, ranking = result['onsets'], result['ranking']
+    component, kpi = result['component'], result['kpi']
+    print(f"{'='*70}")
+    print(title)
+    print(f"{'='*70}")
+    print(f"数据文件: {file_path}")
+    print(f"总数据量: {result['rows']} 条")
+    print(f"分析时间: {datetime.now(tz).strftime('%Y-%m-%d %H:%M:%S')}")
+    for name, value in (filters or {}).items():
+        if value:
+            print(f"{name}: {value}")
+    if result['start'] is not None or result['end'] is not None:
+        first = format_timestamp(result['start'], tz, unit) if result['start'] is not None else '开始'
+        last = format_timestamp(result['end'], tz, unit) if result['end'] is not None else '结束'
+        print(f"起点范围: {first} ~ {last}")
+    print(f"规则: 二分分割 CUSUM 得分 >= {result['min_score']:g}，相对变化 >= {result['min_change']*100:.0f}%")
+    print(f"序列: {result['series']} 条, 时间桶: {result['bins']} 个, 发生变化: {len(onsets)} 条")
+
+    print(f"\n{'#'*70}")
+    print("# 第一步：最早变化的组件")
+    print(f"{'#'*70}")
+    if len(onsets) == 0:
+        print("未检测到显著变化")
+        return
+    print(f"\n共 {len(ranking)} 个组件发生变化：\n")
+    for i, r in enumerate(ranking.head(top).itertuples(index=False), 1):
+        print(f"{i}. [{getattr(r, component)}] 起点 {format_timestamp(r.onset, tz, unit)}")
+        print(f"   {getattr(r, kpi)} {_describe(r.direction, r.relative)}, "
+              f"{r.series} 条序列变化, 最大得分 {r.max_score:.1f}")
+
+    print(f"\n{'#'*70}")
+    print("# 第二步：最早变化的序列")
+    print(f"{'#'*70}\n")
+    for i, r in enumerate(onsets.head(top).itertuples(index=False), 1):
+        print(f"{i}. [{getattr(r, component)}] {getattr(r, kpi)}")
+        print(f"   起点: {format_timestamp(r.onset, tz, unit)}, {r.before:.2f} -> {r.after:.2f} "
+              f"({_describe(r.direction, r.relative)}), 得分={r.score:.1f}, 范围内变点 {r.changes} 个")
+
+    print(f"\n{'#'*70}")
+    print("# 第三步：结论")
+    print(f"{'#'*70}")
+    first = ranking.iloc[0]
+    print(f"\n最早变化的组件: {first[component]}")
+    print(f"起点: {format_timestamp(first['onset'], tz, unit)}, KPI: {first[kpi]} "
+          f"{_describe(first['direction'], first['relative'])}")
+
+
+def _describe(direction: str, relative) -> str:
+    text = '上升' if direction == 'up' else '下降'
+    return text if pd.isna(relative) else f"{text} {abs(relative)*100:.0f}%"
+
+
+def emit_changepoints(out, result: dict, **summary):
+    """--format json|arrow：概要、按最早起点排序的组件和序列"""
+    out.record('summary', **summary, rows=result['rows'], series=result['series'], bins=result['bins'], start=result['start'],
+               end=result['end'], min_score=result['min_score'], min_change=result['min_change'],
+               changed=len(result['onsets']), components=len(result['ranking']))
+    out.table('components', result['ranking'])
+    out.table('onsets', result['onsets'])
@@ -0,0 +1,270 @@
+"""
+Memory-Budget Chunked Reading for OpenRCA
+内存受限读取 - 估算文件完整加载后的内存占用，超过上限时按块读取并用流式概要结构聚合
+
+估算方法：按注册表类型解析开头 SAMPLE_ROWS 行，得到每行内存占用和每行字节数，
+再按文件大小推算总行数。分块大小按上限和 CHUNK_MEMORY_FACTOR 反推，分块读取时浮点列
+使用 float32；全局分位数阈值改用每组一个 t-digest 近似（common.sketches.TDigest）。
+
+    from common.chunked import fits_in_memory, iter_chunks, GroupedQuantiles
+    if not fits_in_memory('metric_container.csv', columns, max_memory):
+        digests = GroupedQuantiles()
+        for chunk in iter_chunks('metric_container.csv', columns, max_memory=max_memory):
+            digests.add(chunk['kpi_name'], chunk['value'])
+        thresholds = digests.quantiles([0.5, 0.9, 0.95])
+
+单遍窗口扫描（bank/telecom 分析脚本）：每块转换为 timestamp,component,kpi,value 长表，
+同时更新每个KPI（或每个序列）的 t-digest、全天和窗口内每个序列的 count/sum/min/max，
+内存与序列数成正比而与行数无关：
+
+    scan = scan_window('metric_container.csv', columns, to_long, lo, hi, max_memory=parse_size('512M'))
+    anomalies = window_deviations(scan, {'rr': 'below', 'mrt': 'above'})
+"""
+
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from common.sketches import TDigest
+from common.telemetry_cache import column_dtypes, read_header
+
+# 估算内存占用时解析的开头行数
+SAMPLE_ROWS = 10_000
+
+# 解析后的数据帧约为其内存占用的几倍：read_csv 的中间缓冲 + 分组/计数时的临时数组
+CHUNK_MEMORY_FACTOR = 4
+MIN_CHUNK_ROWS = 10_000
+MAX_CHUNK_ROWS = 2_000_000
+
+
+def _sample(file_path: str, columns=None, dtypes: dict | None = None, float32: bool = False) -> pd.DataFrame:
+    """按注册表类型解析开头若干行"""
+    if dtypes is None:
+        dtypes = column_dtypes(read_header(Path(file_path)), float32)
+    return pd.read_csv(file_path, nrows=SAMPLE_ROWS, usecols=columns, dtype=dtypes)
+
+
+def estimate_rows(file_path: str) -> int:
+    """按开头若干行的平均长度估算总行数（文件不超过 SAMPLE_ROWS 行时为精确值）"""
+    path = Path(file_path)
+    with open(path, 'rb') as f:
+        header_bytes = len(f.readline())
+        lines = 0
+        read = 0
+        for line in f:
+            lines += 1
+            read += len(line)
+            if lines >= SAMPLE_ROWS:
+                break
+    if lines < SAMPLE_ROWS:
+        return lines
+    return round((path.stat().st_size - header_bytes) / (read / lines))
+
+
+def estimate_frame_bytes(file_path: str, columns=None, float32: bool = False) -> int:
+    """估算按注册表类型完整加载 columns 列后数据帧的内存占用（字节）"""
+    head = _sample(file_path, columns, float32=float32)
+    if len(head) == 0:
+        return 0
+    row_bytes = head.memory_usage(deep=True, index=False).sum() / len(head)
+    return int(row_bytes * estimate_rows(file_path))
+
+
+def fits_in_memory(file_path: str, columns, max_memory: int) -> bool:
+    """完整加载后的内存占用（含处理时的临时数组）是否在上限以内"""
+    return estimate_frame_bytes(file_path, columns) * CHUNK_MEMORY_FACTOR <= max_memory
+
+
+def chunk_rows_for(file_path: str, max_memory: int, columns=None, dtypes: dict | None = None,
+                   float32: bool = False) -> int:
+    """
+    根据开头若干行的内存占用，计算满足内存上限的分块行数
+
+    category 列在解析时先生成字符串再编码，按字符串计算每行占用。
+    """
+    if dtypes is None:
+        dtypes = column_dtypes(read_header(Path(file_path)), float32)
+    dtypes = {col: 'str' if dtype == 'category' else dtype for col, dtype in dtypes.items()}
+    head = _sample(file_path, columns, dtypes)
+    if len(head) == 0:
+        return MIN_CHUNK_ROWS
+    row_bytes = head.memory_usage(deep=True).sum() / len(head)
+    rows = int(max_memory / (row_bytes * CHUNK_MEMORY_FACTOR))
+    return max(MIN_CHUNK_ROWS, min(MAX_CHUNK_ROWS, rows))
+
+
+def iter_chunks(file_path: str, columns=None, max_memory: int | None = None, chunk_rows: int | None = None):
+    """
+    按块读取 columns 列，浮点列为 float32
+
+    分块行数未指定时按 max_memory 计算；各块的 category 列类别集合互不相同，
+    需要跨块比较时先转为字符串或按取值聚合。
+    """
+    dtypes = column_dtypes(read_header(Path(file_path)), float32=True)
+    if chunk_rows is None:
+        chunk_rows = chunk_rows_for(file_path, max_memory, columns, dtypes) if max_memory else MAX_CHUNK_ROWS
+    for chunk in pd.read_csv(file_path, usecols=columns, dtype=dtypes, chunksize=chunk_rows):
+        yield chunk[list(columns)] if columns is not None else chunk
+
+
+class GroupedQuantiles:
+    """
+    每组一个 t-digest 的分组分位数，内存与组数成正比而与行数无关
+
+    max_buffered 限制所有组缓冲区内的值的总数，超过时全部并入质心；
+    组数很多时各组缓冲区合计可达 组数 × TDigest.buffer_size。
+    """
+
+    def __init__(self, compression: float = 200, max_buffered: int | None = None):
+        self.compression = compression
+        self.max_buffered = max_buffered
+        self.digests = {}
+
+    def add(self, keys, values: pd.Series):
+        """keys 为一列（组为取值）或多列的数据帧（组为取值元组）"""
+        if isinstance(keys, pd.DataFrame):
+            frame = keys.reset_index(drop=True).assign(_value=values.to_numpy(dtype=np.float64))
+            by = list(keys.columns)
+        else:
+            frame = pd.DataFrame({'key': keys.to_numpy(), '_value': values.to_numpy(dtype=np.float64)})
+            by = 'key'
+        frame = frame.dropna()
+        for key, group in frame.groupby(by, sort=False, observed=True)['_value']:
+            digest = self.digests.get(key)
+            if digest is None:
+                digest = self.digests[key] = TDigest(self.compression)
+            digest.add(group.to_numpy())
+        if self.max_buffered is not None and sum(d.buffered for d in self.digests.values()) > self.max_buffered:
+            for digest in self.digests.values():
+                digest.flush()
+
+    def merge(self, other: 'GroupedQuantiles'):
+        for key, digest in other.digests.items():
+            if key in self.digests:
+                self.digests[key].merge(digest)
+            else:
+                self.digests[key] = digest
+
+    def quantiles(self, qs: list) -> pd.DataFrame:
+        """索引为组，每个分位数一列"""
+        rows = {key: [digest.quantile(q) for q in qs] for key, digest in self.digests.items()}
+        return pd.DataFrame.from_dict(rows, orient='index', columns=list(qs))
+
+
+# 单遍扫描同时持有分块、其长表和分组聚合的临时数据，分块按上限的 1/SCAN_MEMORY_FACTOR 计算
+SCAN_MEMORY_FACTOR = 2
+
+# 累计的分块聚合结果超过该数量时合并一次
+COMPACT_PARTS = 16
+
+SERIES_KEYS = ['component', 'kpi']
+
+
+def _aggregate(long: pd.DataFrame, first: int) -> pd.DataFrame:
+    """按序列聚合一块数据，first 为各序列首次出现的全局序号"""
+    stats = long.groupby(SERIES_KEYS, sort=False, observed=True)['value'].agg(['count', 'sum', 'min', 'max'])
+    stats = stats.reset_index()
+    for col in SERIES_KEYS:
+        stats[col] = stats[col].astype(str).astype(object)
+    stats['first'] = first + np.arange(len(stats))
+    return stats
+
+
+def _combine(parts: list) -> list:
+    if len(parts) <= 1:
+        return parts
+    merged = pd.concat(parts, ignore_index=True).groupby(SERIES_KEYS, sort=False).agg(
+        count=('count', 'sum'), sum=('sum', 'sum'), min=('min', 'min'), max=('max', 'max'), first=('first', 'min'))
+    return [merged.reset_index()]
+
+
+def scan_window(file_path: str, columns: list, to_long, lo: int, hi: int, max_memory: int | None = None,
+                baseline: str = 'kpi', chunk_rows: int | None = None) -> dict:
+    """
+    一遍扫描完成阈值和窗口统计
+
+    to_long 把一块数据（只含 columns 列）转换为 timestamp,component,kpi,value 长表；
+    lo/hi 为文件时间单位下的闭区间。baseline 为 'kpi' 时阈值按KPI（跨组件）统计，
+    为 'series' 时按 (组件, KPI) 统计。返回行数、时间范围、阈值（P5/P50/P95）、
+    全天和窗口内每个序列的 count/sum/min/max（first 为序列首次出现的顺序）。
+    """
+    budget = max_memory // SCAN_MEMORY_FACTOR if max_memory else None
+    # t-digest 缓冲区（float64）合计不超过上限的 1/(2 × CHUNK_MEMORY_FACTOR)
+    digests = GroupedQuantiles(max_buffered=max_memory // (16 * CHUNK_MEMORY_FACTOR) if max_memory else None)
+    day, window = [], []
+    rows = 0
+    first, last = None, None
+    seen = 0
+    for chunk in iter_chunks(file_path, columns, max_memory=budget, chunk_rows=chunk_rows):
+        rows += len(chunk)
+        long = to_long(chunk)
+        long = long[long['value'].notna()]
+        if len(long) == 0:
+            continue
+        ts = long['timestamp'].to_numpy()
+        first = ts.min() if first is None else min(first, ts.min())
+        last = ts.max() if last is None else max(last, ts.max())
+        digests.add(long['kpi'] if baseline == 'kpi' else long[SERIES_KEYS], long['value'])
+        day.append(_aggregate(long, seen))
+        seen += len(day[-1])
+        inside = long[(ts >= lo) & (ts <= hi)]
+        if len(inside):
+            window.append(_aggregate(inside, seen))
+            seen += len(window[-1])
+        if len(day) > COMPACT_PARTS:
+            day = _combine(day)
+        if len(window) > COMPACT_PARTS:
+            window = _combine(window)
+
+    thresholds = digests.quantiles([0.05, 0.5, 0.95])
+    thresholds.columns = ['P5', 'P50', 'P95']
+    if baseline == 'series':
+        thresholds.index = pd.MultiIndex.from_tuples(thresholds.index, names=SERIES_KEYS) if len(thresholds) \
+            else pd.MultiIndex.from_arrays([[], []], names=SERIES_KEYS)
+    else:
+        thresholds.index.name = 'kpi'
+    empty = pd.DataFrame(columns=SERIES_KEYS + ['count', 'sum', 'min', 'max', 'first'])
+    return {
+        'rows': rows,
+        'time_range': (first, last),
+        'baseline': baseline,
+        'thresholds': thresholds,
+        'day': _combine(day)[0] if day else empty,
+        'window': _combine(window)[0] if window else empty,
+    }
+
+
+def window_deviations(scan: dict, rules: dict | None = None, min_deviation: float = 0.0) -> pd.DataFrame:
+    """
+    窗口均值越过阈值的序列，按偏离程度降序（偏离相同时按序列首次出现的顺序）
+
+    rules 为 {kpi: 'above' | 'below' | 'rate'}，未列出的KPI为 'above'：
+    above 为均值高于P95，below 为均值低于P5，rate 为均值高于该序列的全天均值（错误率等）。
+    偏离程度 = |均值 - 阈值| / 阈值，只保留超过 min_deviation 的序列。
+    """
+    rules = rules or {}
+    stats = scan['window']
+    columns = SERIES_KEYS + ['value', 'min', 'max', 'count', 'threshold', 'type', 'deviation']
+    if len(stats) == 0:
+        return pd.DataFrame(columns=columns)
+    stats = stats.sort_values('first', kind='stable').reset_index(drop=True)
+    stats['value'] = stats['sum'] / stats['count']
+    stats['type'] = stats['kpi'].map(lambda kpi: rules.get(kpi, 'above'))
+
+    thresholds = scan['thresholds']
+    on = 'kpi' if scan['baseline'] == 'kpi' else SERIES_KEYS
+    stats = stats.join(thresholds[['P5', 'P95']], on=on)
+    day = scan['day'].set_index(SERIES_KEYS)
+    day_mean = (day['sum'] / day['count']).rename('day_mean')
+    stats = stats.join(day_mean, on=SERIES_KEYS)
+
+    stats['threshold'] = np.select(
+        [stats['type'] == 'below', stats['type'] == 'rate'], [stats['P5'], stats['day_mean']], stats['P95'])
+    below = stats['type'] == 'below'
+    hit = np.where(below, stats['value'] < stats['threshold'], stats['value'] > stats['threshold'])
+    stats = stats[hit & (stats['threshold'] != 0) & stats['threshold'].notna()]
+    stats = stats.assign(deviation=(stats['value'] - stats['threshold']).abs() / stats['threshold'].abs())
+    stats = stats[stats['deviation'] > min_deviation]
+    stats = stats.sort_values('deviation', ascending=False, kind='stable')
+    return stats[columns].reset_index(drop=True)
@@ -0,0 +1,237 @@
+"""
+Cross-layer Lagged Correlation for OpenRCA
+跨层滞后相关 - 把服务层KPI与容器、节点、网格指标对齐到同一时间网格，批量计算滞后相关和领先得分
+
+    from common.correlation import align_series, rank_causes
+    targets = align_series(service_long, ['service', 'kpi'], 'value', lo, hi, step)
+    candidates = align_series(container_df, ['cmdb_id', 'kpi_name'], 'value', lo, hi, step)
+    causes = rank_causes(targets, {'container': candidates}, start_ts, end_ts, step)
+
+所有序列按 step 秒分桶取均值，缺失的桶向前填充，标准化后一次 rfft。每批候选序列与全部目标的
+互相关为频域逐元素相乘后一次 irfft，得到 [-max_lag, max_lag] 内每个滞后的相关系数：
+滞后 k > 0 表示候选序列领先目标 k 个桶。
+
+领先得分（Granger 式）：以目标自身的上一桶为控制变量，候选序列滞后 k 桶与目标的偏相关
+    fwd(k) = (r(k) - a_y·r(k-1)) / sqrt((1 - a_y²)(1 - r(k-1)²))
+a_y 为目标的一阶自相关；反方向 bwd(k) 同理。lead = max|fwd| - max|bwd|，取值 [-1, 1]，
+为正说明候选序列的变化领先于目标，而不只是同时变化。偏相关全部由同一组互相关系数得出，
+不需要逐对回归。
+
+得分 = |r| × (1 + lead) / 2，r 为 [0, max_lag] 内绝对值最大的相关系数（候选不晚于目标）。
+候选序列按窗口内相对窗口前的变化幅度排序，先算变化最大的；超过时间预算时停止并报告覆盖率。
+"""
+
+import time
+
+import numpy as np
+import pandas as pd
+
+DEFAULT_STEP = 60
+DEFAULT_MAX_LAG = 10
+DEFAULT_CONTEXT = 3600
+DEFAULT_TOP = 5
+DEFAULT_BUDGET = 10.0
+
+# 每批互相关结果（目标 × 候选 × FFT长度）的内存上限
+BATCH_BYTES = 64 * 1024 * 1024
+
+# 参与相关的序列至少需要的有效桶数
+MIN_POINTS = 8
+
+EPS = 1e-9
+
+
+class Aligned:
+    """对齐到时间网格的一组序列：keys 为每行序列的标识，values 为 (序列数, 桶数)"""
+
+    def __init__(self, keys: pd.DataFrame, values: np.ndarray, lo: int, step: int):
+        self.keys = keys.reset_index(drop=True)
+        self.values = values
+        self.lo = lo
+        self.step = step
+
+    def __len__(self):
+        return len(self.values)
+
+    def take(self, rows) -> 'Aligned':
+        return Aligned(self.keys.iloc[rows], self.values[rows], self.lo, self.step)
+
+
+def grid_bins(lo: int, hi: int, step: int) -> int:
+    """[lo, hi] 按 step 分桶的桶数"""
+    return int((hi - lo) // step) + 1
+
+
+def align_series(df: pd.DataFrame, key_columns: list, value_column: str, lo: int, hi: int,
+                 step: int = DEFAULT_STEP, min_points: int = MIN_POINTS) -> Aligned:
+    """
+    长表按 key_columns 分成序列，在 [lo, hi] 上按 step 分桶取均值
+
+    一次 bincount 完成全部序列的分桶；缺失的桶向前填充（开头缺失的用第一个有效值），
+    有效桶少于 min_points 或整段不变的序列被丢弃。时间戳与 lo/hi/step 单位相同。
+    """
+    n_bins = grid_bins(lo, hi, step)
+    ts = df['timestamp'].to_numpy(dtype=np.int64)
+    values = df[value_column].to_numpy(dtype=np.float64, na_value=np.nan)
+    mask = (ts >= lo) & (ts <= hi) & np.isfinite(values)
+    if not mask.any():
+        return Aligned(pd.DataFrame(columns=key_columns), np.empty((0, n_bins)), lo, step)
+
+    window = df.loc[mask, key_columns]
+    codes = window.groupby(key_columns, observed=True, sort=True).ngroup().to_numpy()
+    keys = window.drop_duplicates().sort_values(key_columns, kind='stable')
+    n_series = len(keys)
+    flat = codes * n_bins + (ts[mask] - lo) // step
+    sums = np.bincount(flat, weights=values[mask], minlength=n_series * n_bins).reshape(n_series, n_bins)
+    counts = np.bincount(flat, minlength=n_series * n_bins).reshape(n_series, n_bins)
+
+    valid = counts > 0
+    matrix = np.divide(sums, counts, out=np.zeros_like(sums), where=valid)
+    # 向前填充：每个位置取不晚于它的最后一个有效桶
+    last = np.maximum.accumulate(np.where(valid, np.arange(n_bins), 0), axis=1)
+    first = valid.argmax(axis=1)
+    last = np.maximum(last, first[:, None])
+    matrix = np.take_along_axis(matrix, last, axis=1)
+
+    keep = (valid.sum(axis=1) >= min_points) & (matrix.std(axis=1) > EPS)
+    return Aligned(keys[keep], matrix[keep], lo, step)
+
+
+def service_long(df: pd.DataFrame, kpis: list) -> pd.DataFrame:
+    """服务层宽表（每个KPI一列）转为 service/kpi/value 长表"""
+    return df.melt(id_vars=['service', 'timestamp'], value_vars=kpis, var_name='kpi', value_name='value')
+
+
+def standardize(values: np.ndarray) -> np.ndarray:
+    """每行减均值除标准差"""
+    centered = values - values.mean(axis=1, keepdims=True)
+    std = centered.std(axis=1, keepdims=True)
+    return centered / np.maximum(std, EPS)
+
+
+def lag1_autocorrelation(z: np.ndarray) -> np.ndarray:
+    """标准化序列的一阶自相关（与互相关同样除以序列长度）"""
+    return (z[:, 1:] * z[:, :-1]).sum(axis=1) / z.shape[1]
+
+
+def cross_correlation(targets: np.ndarray, candidates: np.ndarray, max_lag: int) -> np.ndarray:
+    """
+    标准化序列两两之间的滞后相关，返回 (目标数, 候选数, 2*max_lag+1)
+
+    下标 max_lag + k 为 corr(target[t], candidate[t-k])，k > 0 表示候选领先。
+    """
+    n_bins = targets.shape[1]
+    nfft = 1 << int(np.ceil(np.log2(2 * n_bins)))
+    ft = np.fft.rfft(targets, nfft)
+    fc = np.fft.rfft(candidates, nfft).conj()
+    lags = np.arange(-max_lag, max_lag + 1) % nfft
+    cc = np.fft.irfft(ft[:, None, :] * fc[None, :, :], nfft)
+    return cc[:, :, lags] / n_bins
+
+
+def lead_scores(cc: np.ndarray, target_ac: np.ndarray, candidate_ac: np.ndarray, max_lag: int) -> np.ndarray:
+    """由互相关系数计算 Granger 式领先得分 max|fwd| - max|bwd|，形状 (目标数, 候选数)"""
+    if max_lag < 1:
+        return np.zeros(cc.shape[:2])
+    center = max_lag
+    k = np.arange(1, max_lag + 1)
+    a_y = target_ac[:, None, None]
+    a_x = candidate_ac[None, :, None]
+
+    r, r_prev = cc[:, :, center + k], cc[:, :, center + k - 1]
+    fwd = (r - a_y * r_prev) / np.sqrt(np.maximum((1 - a_y ** 2) * (1 - r_prev ** 2), EPS))
+    r, r_prev = cc[:, :, center - k], cc[:, :, center - k + 1]
+    bwd = (r - a_x * r_prev) / np.sqrt(np.maximum((1 - a_x ** 2) * (1 - r_prev ** 2), EPS))
+    return np.clip(np.abs(fwd).max(axis=2), 0, 1) - np.clip(np.abs(bwd).max(axis=2), 0, 1)
+
+
+def change_scores(aligned: Aligned, start_ts: int, end_ts: int) -> np.ndarray:
+    """每个序列窗口内均值相对窗口前的变化（以窗口前的标准差为单位），窗口前没有数据时为整段标准差"""
+    n_bins = aligned.values.shape[1]
+    first = min(max(int((start_ts - aligned.lo) // aligned.step), 0), n_bins - 1)
+    last = min(max(int((end_ts - aligned.lo) // aligned.step), first), n_bins - 1)
+    inside = aligned.values[:, first:last + 1]
+    before = aligned.values[:, :first] if first >= 2 else aligned.values
+    return np.abs(inside.mean(axis=1) - before.mean(axis=1)) / np.maximum(before.std(axis=1), EPS)
+
+
+def rank_causes(targets: Aligned, layers: dict, start_ts: int, end_ts: int, max_lag: int = DEFAULT_MAX_LAG,
+                top: int = DEFAULT_TOP, budget: float = DEFAULT_BUDGET) -> dict:
+    """
+    每个目标序列的前 top 个候选原因
+
+    layers 为 层名 -> Aligned（与 targets 同一时间网格）。候选序列按变化幅度降序分批处理，
+    超过 budget 秒后不再提交新批次。返回 {'causes': DataFrame, 'candidates', 'processed', 'truncated', 'seconds'}，
+    truncated 只在因超时跳过剩余批次时为 True（没有目标或候选序列时 processed 为 0 但不算截断）。
+    """
+    began = time.perf_counter()
+    keys, parts = [], []
+    for layer, aligned in layers.items():
+        if len(aligned):
+            key = aligned.keys.copy()
+            key.columns = ['cmdb_id', 'kpi_name']
+            keys.append(key.assign(layer=layer))
+            parts.append(aligned)
+    total = sum(len(part) for part in parts)
+    columns = ['target', 'kpi', 'layer', 'cmdb_id', 'kpi_name', 'corr', 'lag', 'lead', 'change', 'score']
+    if len(targets) == 0 or total == 0:
+        return {'causes': pd.DataFrame(columns=columns), 'candidates': total, 'processed': 0, 'truncated': False,
+                'seconds': time.perf_counter() - began}
+
+    candidate_keys = pd.concat(keys, ignore_index=True)
+    values = np.vstack([part.values for part in parts])
+    change = np.concatenate([change_scores(part, start_ts, end_ts) for part in parts])
+    order = np.argsort(-change, kind='stable')
+
+    zt = standardize(targets.values)
+    target_ac = lag1_autocorrelation(zt)
+    n_bins = zt.shape[1]
+    nfft = 1 << int(np.ceil(np.log2(2 * n_bins)))
+    batch = max(BATCH_BYTES // (len(targets) * nfft * 16), 1)
+    k = min(top, total)
+
+    best_score = np.full((len(targets), 0), -np.inf)
+    best_index = np.empty((len(targets), 0), dtype=np.int64)
+    best_corr, best_lag, best_lead = best_score.copy(), best_index.copy(), best_score.copy()
+    processed = 0
+    truncated = False
+    for begin in range(0, total, batch):
+        if processed and time.perf_counter() - began > budget:
+            truncated = True
+            break
+        rows = order[begin:begin + batch]
+        zc = standardize(values[rows])
+        cc = cross_correlation(zt, zc, max_lag)
+        lead = lead_scores(cc, target_ac, lag1_autocorrelation(zc), max_lag)
+        causal = cc[:, :, max_lag:]  # 滞后 0..max_lag：候选不晚于目标
+        lag = np.abs(causal).argmax(axis=2)
+        corr = np.take_along_axis(causal, lag[:, :, None], axis=2)[:, :, 0]
+        score = np.abs(corr) * (1 + lead) / 2
+
+        # 与已有的前 k 名合并后重新取前 k 名
+        best_score = np.hstack([best_score, score])
+        best_index = np.hstack([best_index, np.broadcast_to(rows, score.shape)])
+        best_corr = np.hstack([best_corr, corr])
+        best_lag = np.hstack([best_lag, lag])
+        best_lead = np.hstack([best_lead, lead])
+        keep = np.argsort(-best_score, axis=1, kind='stable')[:, :k]
+        best_score, best_index, best_corr, best_lag, best_lead = (
+            np.take_along_axis(a, keep, axis=1) for a in (best_score, best_index, best_corr, best_lag, best_lead))
+        processed += len(rows)
+
+    target_keys = targets.keys.iloc[np.repeat(np.arange(len(targets)), best_index.shape[1])].reset_index(drop=True)
+    flat = best_index.ravel()
+    causes = pd.concat([
+        target_keys.set_axis(['target', 'kpi'], axis=1),
+        candidate_keys.iloc[flat][['layer', 'cmdb_id', 'kpi_name']].reset_index(drop=True),
+    ], axis=1).assign(
+        corr=best_corr.ravel(),
+        lag=best_lag.ravel() * targets.step,
+        lead=best_lead.ravel(),
+        change=change[flat],
+        score=best_score.ravel(),
+    )
+    for col in ('target', 'kpi', 'layer', 'cmdb_id', 'kpi_name'):
+        causes[col] = causes[col].astype(str)
+    return {'causes': causes[columns], 'candidates': total, 'processed': processed, 'truncated': truncated,
+            'seconds': time.perf_counter() - began}
@@ -3,18 +3,85 @@
 Data Explorer - 数据探索工具
 探索CSV文件结构，帮助Agent了解数据模式
 
+按块流式读取文件，每列只保留固定大小的概要结构（common.sketches）：HyperLogLog 去重计数、
+t-digest 分位数、Misra-Gries 高频项，整行再做一个 bottom-k 随机样本。内存占用由 --max-memory
+决定的分块大小控制，与文件大小无关。--dir 模式只读取每个CSV的表头和开头一段，并行估算行数。
+
 Usage:
-    python explore_data.py --file <csv_path> [--sample-size 100]
+    python explore_data.py --file <csv_path> [--sample-size 100] [--max-memory 512M]
+    python explore_data.py --dir <telemetry_dir> [--workers 16]
 """
 
-import argparse
-import pandas as pd
 import sys
 from pathlib import Path
-from collections import Counter
 
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from common.rca_client import add_server_argument, forward_early, forward_if_requested
+
+if __name__ == '__main__':
+    forward_early('explore_data')  # --server: 在导入 pandas 之前转发给常驻服务
+
+import argparse
+import math
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+from common.chunked import chunk_rows_for
+from common.output import add_format_arguments, check_format_arguments, structured_output
+from common.profiling import add_profile_arguments, check_profile_arguments, profile_session, stage
+from common.sketches import ColumnProfile, Reservoir
+from common.telemetry_cache import COLUMN_DTYPES, STRING_COLUMNS, column_dtypes, parse_size, read_header
+
+DEFAULT_MAX_MEMORY = '512M'
+
+# 估算行数时读取的文件开头字节数
+HEAD_BYTES = 1024 * 1024
+
+
+def known_dtypes(header: list) -> dict:
+    """规格中已知字段使用固定类型，其余字段按块推断"""
+    return {col: dtype for col, dtype in column_dtypes(header).items()
+            if col in COLUMN_DTYPES or col in STRING_COLUMNS}
+
+
+def profile_csv(file_path: str, chunk_rows: int, sample_size: int = 100, reservoir_size: int = 10) -> dict:
+    """流式扫描整个文件，返回每列的概要、开头样本和均匀随机样本"""
+    header = read_header(Path(file_path))
+    profiles = {col: ColumnProfile() for col in header}
+    reservoir = Reservoir(reservoir_size)
+    head = None
+    rows = 0
+    for chunk in pd.read_csv(file_path, chunksize=chunk_rows, dtype=known_dtypes(header)):
+        if head is None:
+            head = chunk.head(sample_size)
+        rows += len(chunk)
+        for col in header:
+            profiles[col].add(chunk[col])
+        reservoir.add(chunk)
+    return {
+        'rows': rows,
+        'columns': header,
+        'profiles': profiles,
+        'head': head if head is not None else pd.DataFrame(columns=header),
+        'sample': reservoir.rows(),
+    }
 
-def explore_csv(file_path: str, sample_size: int = 100):
+
+def _display_value(value, width: int = 100) -> str:
+    """分布中的取值单行显示（日志内容可能包含换行）"""
+    text = str(value).replace('\n', '\\n')
+    return text if len(text) <= width else text[:width] + '...'
+
+
+def _format_number(value: float) -> str:
+    if isinstance(value, float) and (math.isnan(value) or not value.is_integer()):
+        return f"{value:.6g}"
+    return f"{int(value)}"
+
+
+def explore_csv(file_path: str, sample_size: int = 100, max_memory: int | None = None, reservoir_size: int = 10):
     """探索CSV文件结构"""
     path = Path(file_path)
     if not path.exists():
@@ -25,51 +92,112 @@ def explore_csv(file_path: str, sample_size: int = 100):
     print(f"数据探索报告: {path.name}")
     print(f"{'='*70}")
     
-    df = pd.read_csv(file_path)
+    max_memory = max_memory or parse_size(DEFAULT_MAX_MEMORY)
+    chunk_rows = chunk_rows_for(file_path, max_memory, dtypes=known_dtypes(read_header(path)))
+    began = time.perf_counter()
+    with stage('scan', file=file_path, chunk_rows=chunk_rows) as span:
+        result = profile_csv(file_path, chunk_rows, sample_size, reservoir_size)
+        span.rows = result['rows']
+    profiles = result['profiles']
+    rows = result['rows']
     
     print(f"\n## 基本信息")
-    print(f"行数: {len(df):,}")
-    print(f"列数: {len(df.columns)}")
+    print(f"行数: {rows:,}")
+    print(f"列数: {len(result['columns'])}")
     print(f"文件大小: {path.stat().st_size / 1024 / 1024:.2f} MB")
+    print(f"扫描: 每块 {chunk_rows:,} 行, 耗时 {time.perf_counter() - began:.1f}s")
     
     print(f"\n## 列结构")
-    print(f"列名: {list(df.columns)}")
+    print(f"列名: {result['columns']}")
     
-    print(f"\n## 列类型")
-    for col in df.columns:
-        dtype = df[col].dtype
-        null_count = df[col].isnull().sum()
-        null_pct = null_count / len(df) * 100
-        unique_count = df[col].nunique()
-        print(f"  {col}: {dtype}, null={null_count}({null_pct:.1f}%), unique={unique_count}")
+    print("\n## 列类型 (unique≈ 为 HyperLogLog 估计值，不同取值较少时为精确值)")
+    for col, profile in profiles.items():
+        dtype = '/'.join(sorted(profile.dtypes))
+        null_pct = profile.nulls / rows * 100 if rows else 0.0
+        unique = f"unique={profile.distinct()}" if profile.distinct_exact else f"unique≈{profile.distinct()}"
+        print(f"  {col}: {dtype}, null={profile.nulls}({null_pct:.1f}%), {unique}")
     
     print(f"\n## 数据样本 (前{sample_size}行)")
-    print(df.head(sample_size).to_string())
+    print(result['head'].to_string())
+    
+    if len(result['sample']):
+        print(f"\n## 随机样本 (全文件均匀抽取{len(result['sample'])}行)")
+        print(result['sample'].to_string())
     
-    print(f"\n## 数值列统计")
-    numeric_cols = df.select_dtypes(include=['number']).columns
-    if len(numeric_cols) > 0:
-        print(df[numeric_cols].describe().to_string())
+    print("\n## 数值列统计 (分位数为 t-digest 近似值)")
+    numeric = {col: profile.describe() for col, profile in profiles.items() if profile.is_numeric}
+    if numeric:
+        stats = pd.DataFrame(numeric)
+        print(stats.map(_format_number).to_string())
     
     print(f"\n## 分类列分布 (Top 10)")
-    for col in df.columns:
-        if df[col].dtype == 'object' or df[col].nunique() < 20:
-            value_counts = df[col].value_counts().head(10)
-            if len(value_counts) > 1:
-                print(f"\n  {col}:")
-                for val, count in value_counts.items():
-                    print(f"    {val}: {count} ({count/len(df)*100:.1f}%)")
-    
-    if 'timestamp' in df.columns:
+    for col, profile in profiles.items():
+        if profile.is_numeric and profile.distinct() >= 20:
+            continue
+        top = profile.top(10)
+        if len(top) > 1:
+            bound = '' if profile.heavy.exact else f" (计数为下界，误差≤{profile.heavy.error})"
+            print(f"\n  {col}:{bound}")
+            for val, count in top.items():
+                print(f"    {_display_value(val)}: {count} ({count/rows*100:.1f}%)")
+    
+    if 'timestamp' in profiles and profiles['timestamp'].is_numeric:
         print(f"\n## 时间范围")
-        ts = df['timestamp']
-        print(f"  最小: {ts.min()}")
-        print(f"  最大: {ts.max()}")
-        print(f"  范围: {ts.max() - ts.min()} 单位")
+        digest = profiles['timestamp'].digest
+        print(f"  最小: {int(digest.min)}")
+        print(f"  最大: {int(digest.max)}")
+        print(f"  范围: {int(digest.max - digest.min)} 单位")
+
 
+def emit_csv_profile(out, file_path: str, sample_size: int = 100, max_memory: int | None = None, reservoir_size: int = 10):
+    """--format json|arrow：列画像、数值统计、开头和随机样本"""
+    max_memory = max_memory or parse_size(DEFAULT_MAX_MEMORY)
+    chunk_rows = chunk_rows_for(file_path, max_memory, dtypes=known_dtypes(read_header(Path(file_path))))
+    with stage('scan', file=file_path, chunk_rows=chunk_rows) as span:
+        result = profile_csv(file_path, chunk_rows, sample_size, reservoir_size)
+        span.rows = result['rows']
+    profiles = result['profiles']
+    out.record('summary', file=file_path, rows=result['rows'], columns=result['columns'],
+               bytes=Path(file_path).stat().st_size)
+    out.table('columns', [{
+        'column': col,
+        'dtype': '/'.join(sorted(profile.dtypes)),
+        'nulls': profile.nulls,
+        'distinct': profile.distinct(),
+        'distinct_exact': profile.distinct_exact,
+        'numeric': profile.is_numeric,
+        **(profile.describe() if profile.is_numeric else {}),
+    } for col, profile in profiles.items()])
+    for col, profile in profiles.items():
+        if profile.is_numeric and profile.distinct() >= 20:
+            continue
+        top = profile.top(10)
+        if len(top) > 1:
+            out.table(f"top:{col}", top.rename_axis('value').rename('count').reset_index())
+    out.table('head', result['head'])
+    out.table('sample', result['sample'])
 
-def explore_directory(dir_path: str):
-    """探索目录结构"""
+
+def profile_header(file_path: Path) -> dict:
+    """只读取表头和开头一段，按平均行长估算行数（文件不超过 HEAD_BYTES 时为精确值）"""
+    size = file_path.stat().st_size
+    with open(file_path, 'rb') as f:
+        head = f.read(HEAD_BYTES)
+    header_end = head.find(b'\n')
+    columns = head[:header_end if header_end >= 0 else len(head)].decode('utf-8', 'replace').strip().split(',')
+    body = head[header_end + 1:] if header_end >= 0 else b''
+    lines = body.count(b'\n')
+    if size <= HEAD_BYTES:
+        rows = lines + (1 if body and not body.endswith(b'\n') else 0)
+        exact = True
+    else:
+        rows = int((size - header_end - 1) / (len(body) / lines)) if lines else 0
+        exact = False
+    return {'file': file_path, 'size': size, 'columns': columns, 'rows': rows, 'exact': exact}
+
+
+def explore_directory(dir_path: str, workers: int | None = None):
+    """探索目录结构：并行读取每个CSV的表头并估算行数"""
     path = Path(dir_path)
     if not path.exists():
         print(f"错误: 目录不存在 {dir_path}")
@@ -79,28 +207,59 @@ def explore_directory(dir_path: str):
     print(f"目录探索报告: {path}")
     print(f"{'='*70}")
     
-    for root, dirs, files in path.rglob('*'):
-        root = Path(root)
-        csv_files = list(root.glob('*.csv'))
-        if csv_files:
-            print(f"\n{root.relative_to(path)}/")
-            for f in csv_files:
-                size_mb = f.stat().st_size / 1024 / 1024
-                print(f"  {f.name}: {size_mb:.2f} MB")
+    csv_files = sorted(path.rglob('*.csv'), key=lambda f: (f.parent, f.name))
+    with stage('scan', files=len(csv_files)), ThreadPoolExecutor(max_workers=workers) as pool:
+        results = list(pool.map(profile_header, csv_files))
+    
+    current = None
+    for info in results:
+        parent = info['file'].parent
+        if parent != current:
+            current = parent
+            print(f"\n{parent.relative_to(path)}/")
+        size_mb = info['size'] / 1024 / 1024
+        rows = f"{info['rows']:,}" if info['exact'] else f"≈{info['rows']:,}"
+        print(f"  {info['file'].name}: {size_mb:.2f} MB, {rows} 行")
+        print(f"    列: {', '.join(info['columns'])}")
+    
+    total_mb = sum(info['size'] for info in results) / 1024 / 1024
+    print(f"\n共 {len(results)} 个CSV文件, {total_mb:.2f} MB")
 
 
-def main():
+def main(argv=None):
     parser = argparse.ArgumentParser(description='Data Explorer for OpenRCA')
     parser.add_argument('--file', type=str, help='CSV file to explore')
     parser.add_argument('--dir', type=str, help='Directory to explore')
     parser.add_argument('--sample-size', type=int, default=100, help='Sample rows to show')
+    parser.add_argument('--reservoir', type=int, default=10, help='Uniform random sample rows drawn from the whole file')
+    parser.add_argument('--max-memory', type=str, default=DEFAULT_MAX_MEMORY,
+                        help='Memory ceiling for the streaming scan, e.g. 512M (sets the chunk size)')
+    parser.add_argument('--workers', type=int, help='Threads for --dir header scans')
+    add_format_arguments(parser)
+    add_profile_arguments(parser)
+    add_server_argument(parser)
     
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
+    forward_if_requested(args, 'explore_data', argv)
+    check_format_arguments(parser, args)
+    check_profile_arguments(parser, args)
     
-    if args.file:
-        explore_csv(args.file, args.sample_size)
+    with profile_session(args, 'explore_data'):
+        run(parser, args)
+
+
+def run(parser, args):
+    """按参数探索单个文件或整个目录"""
+    if args.file and args.format != 'text':
+        if not Path(args.file).exists():
+            print(f"错误: 文件不存在 {args.file}")
+            sys.exit(1)
+        with structured_output(args.format, args.max_rows) as out:
+            emit_csv_profile(out, args.file, args.sample_size, parse_size(args.max_memory), args.reservoir)
+    elif args.file:
+        explore_csv(args.file, args.sample_size, parse_size(args.max_memory), args.reservoir)
     elif args.dir:
-        explore_directory(args.dir)
+        explore_directory(args.dir, args.workers)
     else:
         parser.print_help()
 
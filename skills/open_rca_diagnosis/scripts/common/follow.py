@@ -0,0 +1,394 @@
+"""
+Telemetry Follower for OpenRCA
+在线跟踪 - 跟踪持续追加的遥测CSV，按序列维护运行状态并在新样本到达后立即输出异常
+
+    FileTail         从上次的字节偏移读取新追加的完整行；文件被截断或替换时从头读取
+    SeriesEWMA       每个序列的指数加权均值和方差
+    StreamDetector   每个KPI一个 t-digest 作为全局分位数阈值，每个 (组件, KPI) 一个 EWMA；
+                     EWMA 均值越过阈值（偏离超过 min_deviation）时输出"异常"，回到阈值内时输出"恢复"
+    follow           轮询循环；状态定期写入检查点（JSON），重启后从检查点的偏移继续，无需重新扫描历史
+
+阈值只用此前的历史计算（先判定、再把新样本加入 t-digest），与批量分析"全局阈值 + 窗口均值"的
+规则一致。KPI 还没有足够历史时（启动时一次读入的已有数据，或新出现的KPI），先把本批样本加入 t-digest
+再判定，与批量分析在全部数据上计算阈值相同；加入后样本仍不足 min_history 的KPI不判定。
+
+    from common.follow import StreamDetector, checkpoint_path, follow
+    detector = StreamDetector(below={'rr', 'sr'})
+    follow('metric_service.csv', detector, to_long, checkpoint_path('metric_service.csv', 'follow_metric.json'), config)
+"""
+
+import io
+import json
+import math
+import os
+import signal
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from common.sketches import TDigest
+from common.telemetry_cache import cache_unwritable, column_dtypes, read_header, sidecar_path
+from common.time_utils import DEFAULT_TIMEZONE, format_timestamp, zone
+
+CHECKPOINT_VERSION = 1
+
+# 单次轮询最多读取的字节数，追赶积压数据时分多次处理
+MAX_POLL_BYTES = 64 * 1024 * 1024
+
+DEFAULT_INTERVAL = 1.0
+DEFAULT_CHECKPOINT_EVERY = 30.0
+DEFAULT_ALPHA = 0.3
+DEFAULT_MIN_HISTORY = 100
+
+LONG_COLUMNS = ['timestamp', 'component', 'kpi', 'value']
+
+TIMEZONE = DEFAULT_TIMEZONE
+
+
+class FileTail:
+    """读取文件新追加的完整行（以换行结尾），未写完的最后一行留到下次"""
+
+    def __init__(self, file_path: str, offset: int = 0, inode: int | None = None):
+        self.path = Path(file_path)
+        self.offset = offset
+        self.inode = inode
+        self.header = None
+        self.dtypes = None
+        self.restarted = False
+
+    def poll(self, max_bytes: int = MAX_POLL_BYTES):
+        """返回新增记录的 DataFrame，没有新的完整行时返回 None"""
+        stat = os.stat(self.path)
+        if self.inode is not None and (stat.st_ino != self.inode or stat.st_size < self.offset):
+            # 文件被替换或截断：从头读取
+            self.offset = 0
+            self.restarted = True
+        self.inode = stat.st_ino
+        if self.header is None or self.offset == 0:
+            self.header = read_header(self.path)
+            self.dtypes = column_dtypes(self.header)
+        if stat.st_size <= self.offset:
+            return None
+
+        with open(self.path, 'rb') as f:
+            f.seek(self.offset)
+            data = f.read(min(stat.st_size - self.offset, max_bytes))
+            skip = 0
+            if self.offset == 0:
+                skip = data.find(b'\n') + 1
+                if skip == 0:
+                    return None
+        cut = data.rfind(b'\n') + 1
+        if cut <= skip:
+            return None
+        frame = pd.read_csv(io.BytesIO(data[skip:cut]), header=None, names=self.header, dtype=self.dtypes)
+        self.offset += cut
+        return frame
+
+
+class SeriesEWMA:
+    """
+    每个序列的指数加权均值和方差（增量公式，序列按首次出现分配槽位）
+
+    同一批次中一个序列有多个样本时，按样本顺序逐层更新：第 r 层包含每个序列的第 r 个样本。
+    """
+
+    def __init__(self, alpha: float = DEFAULT_ALPHA):
+        self.alpha = alpha
+        self.slots = {}
+        self.keys = []
+        self.mean = np.zeros(0)
+        self.var = np.zeros(0)
+        self.count = np.zeros(0, dtype=np.int64)
+
+    def slot_of(self, keys: list) -> np.ndarray:
+        """键 -> 槽位，新键追加到末尾"""
+        new = [key for key in dict.fromkeys(keys) if key not in self.slots]
+        if new:
+            for key in new:
+                self.slots[key] = len(self.keys)
+                self.keys.append(key)
+            grow = len(self.keys) - len(self.mean)
+            self.mean = np.concatenate([self.mean, np.zeros(grow)])
+            self.var = np.concatenate([self.var, np.zeros(grow)])
+            self.count = np.concatenate([self.count, np.zeros(grow, dtype=np.int64)])
+        return np.array([self.slots[key] for key in keys], dtype=np.intp)
+
+    def update(self, slots: np.ndarray, values: np.ndarray) -> tuple:
+        """按顺序加入样本，返回每个样本加入前的 (均值, 标准差)（序列的第一个样本为 NaN）"""
+        prev_mean = np.full(len(slots), np.nan)
+        prev_std = np.full(len(slots), np.nan)
+        rank = pd.Series(slots).groupby(slots).cumcount().to_numpy()
+        alpha = self.alpha
+        for r in range(int(rank.max()) + 1 if len(rank) else 0):
+            rows = np.flatnonzero(rank == r)
+            s, x = slots[rows], values[rows]
+            seen = self.count[s] > 0
+            prev_mean[rows[seen]] = self.mean[s[seen]]
+            prev_std[rows[seen]] = np.sqrt(self.var[s[seen]])
+            diff = x - self.mean[s]
+            incr = alpha * diff
+            self.mean[s] = np.where(seen, self.mean[s] + incr, x)
+            self.var[s] = np.where(seen, (1 - alpha) * (self.var[s] + diff * incr), 0.0)
+            self.count[s] += 1
+        return prev_mean, prev_std
+
+    def to_state(self) -> dict:
+        return {
+            'alpha': self.alpha,
+            'keys': [list(key) for key in self.keys],
+            'mean': self.mean.tolist(),
+            'var': self.var.tolist(),
+            'count': self.count.tolist(),
+        }
+
+    @classmethod
+    def from_state(cls, state: dict) -> 'SeriesEWMA':
+        ewma = cls(state['alpha'])
+        ewma.keys = [tuple(key) for key in state['keys']]
+        ewma.slots = {key: i for i, key in enumerate(ewma.keys)}
+        ewma.mean = np.asarray(state['mean'], dtype=np.float64)
+        ewma.var = np.asarray(state['var'], dtype=np.float64)
+        ewma.count = np.asarray(state['count'], dtype=np.int64)
+        return ewma
+
+
+class StreamDetector:
+    """
+    在线异常检测：输入长表 (timestamp, component, kpi, value)，输出状态变化事件
+
+    below 中的KPI低于 P5 为异常，其余高于 P95 为异常；偏离 = |均值 - 阈值| / 阈值，
+    阈值不为正的KPI不判定（偏离无意义）。
+    """
+
+    def __init__(self, below: set = (), min_deviation: float = 0.0, alpha: float = DEFAULT_ALPHA,
+                 min_history: int = DEFAULT_MIN_HISTORY):
+        self.below = set(below)
+        self.min_deviation = min_deviation
+        self.min_history = min_history
+        self.ewma = SeriesEWMA(alpha)
+        self.digests = {}
+        self.active = {}  # (组件, KPI) -> 进入异常时的事件
+        self.rows = 0
+
+    def thresholds(self, kpis) -> dict:
+        """历史样本足够的KPI的当前阈值"""
+        result = {}
+        for kpi in kpis:
+            digest = self.digests.get(kpi)
+            if digest is not None and digest.count >= self.min_history:
+                result[kpi] = digest.quantile(0.05 if kpi in self.below else 0.95)
+        return result
+
+    def update(self, frame: pd.DataFrame) -> list:
+        """处理一批样本，返回进入异常和恢复正常的事件（按时间排序）"""
+        frame = frame.dropna(subset=['value'])
+        if len(frame) == 0:
+            return []
+        frame = frame.sort_values('timestamp', kind='stable')
+        components = frame['component'].astype(str).to_numpy()
+        kpis = frame['kpi'].astype(str).to_numpy()
+        values = frame['value'].to_numpy(dtype=np.float64)
+        timestamps = frame['timestamp'].to_numpy(dtype=np.int64)
+        self.rows += len(frame)
+
+        # 有历史阈值的KPI先判定再加入样本；没有的先加入本批样本，用包含本批的阈值判定
+        thresholds = self.thresholds(pd.unique(kpis))
+        known = np.isin(kpis, list(thresholds))
+        self._add(values[~known], kpis[~known])
+        thresholds.update(self.thresholds(pd.unique(kpis[~known])))
+        codes, pairs = pd.MultiIndex.from_arrays([components, kpis]).factorize()
+        slots = self.ewma.slot_of(list(pairs))[codes]
+        prev_mean, prev_std = self.ewma.update(slots, values)
+
+        # 每个序列只按本批最后一个样本之后的 EWMA 均值判定
+        last = pd.Series(np.arange(len(slots))).groupby(slots).last().to_numpy()
+        events = []
+        for row in last:
+            key = (components[row], kpis[row])
+            threshold = thresholds.get(key[1])
+            if threshold is None or threshold <= 0:
+                continue
+            level = float(self.ewma.mean[slots[row]])
+            below = key[1] in self.below
+            deviation = ((threshold - level) if below else (level - threshold)) / threshold
+            anomalous = deviation > self.min_deviation and (level < threshold if below else level > threshold)
+            std = prev_std[row]
+            event = {
+                'timestamp': int(timestamps[row]),
+                'component': key[0],
+                'kpi': key[1],
+                'value': float(values[row]),
+                'level': level,
+                'threshold': float(threshold),
+                'threshold_name': 'P5' if below else 'P95',
+                'type': 'below' if below else 'above',
+                'deviation': float(deviation),
+                'z': float((values[row] - prev_mean[row]) / std) if std > 0 else math.nan,
+            }
+            if anomalous and key not in self.active:
+                self.active[key] = event
+                events.append(dict(event, state='异常'))
+            elif not anomalous and key in self.active:
+                del self.active[key]
+                events.append(dict(event, state='恢复'))
+
+        self._add(values[known], kpis[known])
+        events.sort(key=lambda e: e['timestamp'])
+        return events
+
+    def _add(self, values: np.ndarray, kpis: np.ndarray):
+        """样本按KPI加入 t-digest"""
+        for kpi, group in pd.Series(values).groupby(kpis, sort=False):
+            digest = self.digests.get(kpi)
+            if digest is None:
+                digest = self.digests[kpi] = TDigest()
+            digest.add(group.to_numpy())
+
+    def to_state(self) -> dict:
+        return {
+            'below': sorted(self.below),
+            'min_deviation': self.min_deviation,
+            'min_history': self.min_history,
+            'rows': self.rows,
+            'ewma': self.ewma.to_state(),
+            'digests': {kpi: digest.to_state() for kpi, digest in self.digests.items()},
+            'active': [event for event in self.active.values()],
+        }
+
+    @classmethod
+    def from_state(cls, state: dict) -> 'StreamDetector':
+        detector = cls(state['below'], state['min_deviation'], state['ewma']['alpha'], state['min_history'])
+        detector.rows = state['rows']
+        detector.ewma = SeriesEWMA.from_state(state['ewma'])
+        detector.digests = {kpi: TDigest.from_state(s) for kpi, s in state['digests'].items()}
+        detector.active = {(event['component'], event['kpi']): event for event in state['active']}
+        return detector
+
+
+def checkpoint_path(file_path: str, name: str) -> Path:
+    """默认的检查点路径（数据文件的旁路目录）"""
+    return sidecar_path(file_path, name)
+
+
+def save_checkpoint(path: Path, tail: FileTail, detector: StreamDetector, config: dict):
+    """原子地写入检查点"""
+    state = {
+        'version': CHECKPOINT_VERSION,
+        'config': config,
+        'offset': tail.offset,
+        'inode': tail.inode,
+        'detector': detector.to_state(),
+    }
+    tmp = path.with_name(path.name + f".tmp{os.getpid()}")
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp.write_text(json.dumps(state, ensure_ascii=False))
+        tmp.replace(path)
+    except OSError:
+        if tmp.exists():
+            tmp.unlink()
+        raise
+
+
+def _try_checkpoint(path: Path, tail: FileTail, detector: StreamDetector, config: dict):
+    """写入检查点，无法写入时提示一行并返回 None（之后不再写入）"""
+    try:
+        save_checkpoint(path, tail, detector, config)
+    except OSError as e:
+        cache_unwritable(path, e, '不再保存检查点')
+        return None
+    return path
+
+
+def load_checkpoint(path: Path, config: dict):
+    """读取检查点，返回 (偏移, inode, 检测器)；不存在、版本或配置不符时返回 None"""
+    if not path.exists():
+        return None
+    try:
+        state = json.loads(path.read_text())
+    except (OSError, ValueError):
+        return None
+    if state.get('version') != CHECKPOINT_VERSION or state.get('config') != config:
+        return None
+    return state['offset'], state['inode'], StreamDetector.from_state(state['detector'])
+
+
+def format_event(event: dict) -> str:
+    """单行事件描述"""
+    moment = format_timestamp(event['timestamp'], zone(TIMEZONE))
+    arrow = '↓' if event['type'] == 'below' else '↑'
+    z = '' if math.isnan(event['z']) else f", z={event['z']:.1f}"
+    return (f"[{moment}] {event['state']} {arrow} [{event['component']}] {event['kpi']}: "
+            f"均值={event['level']:.2f}, 阈值({event['threshold_name']})={event['threshold']:.2f}, "
+            f"偏离={event['deviation']*100:.1f}%{z}")
+
+
+def _print(text: str):
+    print(text, flush=True)
+
+
+def follow(file_path: str, detector: StreamDetector, to_long, checkpoint: Path, config: dict,
+           interval: float = DEFAULT_INTERVAL, checkpoint_every: float = DEFAULT_CHECKPOINT_EVERY,
+           emit=_print, max_polls: int | None = None, on_event=None):
+    """
+    跟踪文件直到被中断（Ctrl-C / SIGTERM）或轮询 max_polls 次，退出前写入检查点
+
+    to_long 把新读入的记录转换为 LONG_COLUMNS 长表。没有检查点（或检查点的 config 与本次不同）时
+    先处理已有的全部数据（不输出事件，只报告当前处于异常的序列），之后每次轮询输出状态变化事件。
+    事件默认格式化为一行文本交给 emit；给定 on_event 时直接传入事件字典（结构化输出）。
+    """
+    if on_event is None:
+        on_event = lambda event: emit(format_event(event))
+    restored = load_checkpoint(checkpoint, config)
+    if restored is not None:
+        offset, inode, detector = restored
+        tail = FileTail(file_path, offset, inode)
+        emit(f"从检查点恢复: 偏移 {offset:,} 字节, 已处理 {detector.rows:,} 个样本, 当前异常 {len(detector.active)} 个")
+    else:
+        tail = FileTail(file_path)
+
+    def stop(signum, frame):
+        raise KeyboardInterrupt
+    try:
+        previous = signal.signal(signal.SIGTERM, stop)
+    except ValueError:  # 非主线程中无法安装信号处理
+        previous = None
+
+    catching_up = restored is None
+    last_saved = time.monotonic()
+    polls = 0
+    try:
+        while max_polls is None or polls < max_polls:
+            frame = tail.poll()
+            if tail.restarted:
+                emit(f"文件被截断或替换，从头读取: {file_path}")
+                tail.restarted = False
+            if frame is not None:
+                events = detector.update(to_long(frame))
+                if not catching_up:
+                    for event in events:
+                        on_event(event)
+                continue  # 可能还有积压数据，立即再读
+
+            if catching_up:
+                catching_up = False
+                emit(f"已加载历史数据: {detector.rows:,} 个样本, 当前异常 {len(detector.active)} 个")
+                for event in sorted(detector.active.values(), key=lambda e: -e['deviation']):
+                    on_event(dict(event, state='异常中'))
+                emit("开始跟踪新数据 (Ctrl-C 退出)")
+
+            if checkpoint is not None and time.monotonic() - last_saved >= checkpoint_every:
+                checkpoint = _try_checkpoint(checkpoint, tail, detector, config)
+                last_saved = time.monotonic()
+            polls += 1
+            time.sleep(interval)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if previous is not None:
+            signal.signal(signal.SIGTERM, previous)
+        if checkpoint is not None and _try_checkpoint(checkpoint, tail, detector, config) is not None:
+            emit(f"检查点已保存: {checkpoint}")
@@ -0,0 +1,376 @@
+#!/usr/bin/env python3
+"""
+Latency Sketch Store for OpenRCA
+延迟概要存储 - 按 (操作 × Pod × 分钟) 保存 trace_span.csv 耗时的 DDSketch，任意窗口和分组的分位数由合并概要得到
+
+按块读取 trace（内存由 max_memory 控制），每个单元（operation_name, cmdb_id, 分钟）一个 DDSketch
+（common.sketches.DDSketch，相对误差 alpha，默认1%），以稀疏表的形式保存：
+
+    cells     每个单元的 span 数、耗时总和/最小/最大、错误数（status_code != 0），按分钟排序
+    buckets   每个单元每个非空桶的计数（耗时 <= 0 的 span 计入桶号最小的零值桶）
+
+DDSketch 的合并就是对应桶的计数相加，所以任意时间窗口（对齐到分钟）、按操作/Pod/二者/时间桶的
+p50/p95/p99 都是在桶表的一个连续切片上做一次分组求和，再按累计计数定位分位数所在的桶，无需重新扫描 span。
+均值、最大值和错误率由单元表精确得到。存储与列式缓存并列（common.telemetry_cache.sidecar_path），
+源文件变化时自动重建。
+
+Usage:
+    python latency_store.py --build trace_span.csv
+    python latency_store.py --info trace_span.csv
+
+    from common.latency_store import open_latency, latency_quantiles
+    store = open_latency('trace_span.csv')
+    latency_quantiles(store, 1647738000000, 1647739800000, by=['operation_name', 'cmdb_id'])
+"""
+
+import argparse
+import json
+import shutil
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from common.chunked import iter_chunks
+from common.output import notice
+from common.sketches import DDSketch
+from common.telemetry_cache import parse_size, read_header, sidecar_path, source_stat, write_sidecar_dir
+from common.time_utils import UNIT_SCALES, file_time_unit
+
+STORE_VERSION = 1
+
+LATENCY_COLUMNS = ['timestamp', 'cmdb_id', 'operation_name', 'duration', 'status_code']
+KEYS = ['operation_name', 'cmdb_id']
+
+DEFAULT_ALPHA = 0.01
+DEFAULT_QUANTILES = (0.5, 0.95, 0.99)
+DEFAULT_MAX_MEMORY = '512M'
+
+# 单元时长（秒）
+CELL_SECONDS = 60
+
+# 耗时 <= 0 的 span 计入的桶号（小于任何正值的桶号，排序时在最前）
+ZERO_BUCKET = np.iinfo(np.int16).min
+BUCKET_RANGE = 1 << 16
+
+# 累计的分块聚合结果超过该数量时合并一次
+COMPACT_PARTS = 16
+
+CELL_FILES = {'operation': np.int32, 'pod': np.int32, 'minute': np.int32, 'count': np.int64, 'sum': np.float64,
+              'min': np.float64, 'max': np.float64, 'errors': np.int64}
+BUCKET_FILES = {'cell': np.int32, 'bucket': np.int16, 'count': np.int64}
+
+
+class LatencyStore:
+    """
+    内存映射的延迟概要
+
+    cells 每行一个 (operation, pod, minute) 单元，按 (minute, operation, pod) 排序；buckets 按 (cell, bucket)
+    排序。时间窗口因此是两张表上的连续切片。minute 为相对 t0 的分钟序号，t0 使用文件自身的时间单位。
+    """
+
+    def __init__(self, directory: Path, meta: dict):
+        self.directory = directory
+        self.meta = meta
+        self.cells = {name: np.load(directory / f"cell_{name}.npy", mmap_mode='r') for name in CELL_FILES}
+        self.buckets = {name: np.load(directory / f"bucket_{name}.npy", mmap_mode='r') for name in BUCKET_FILES}
+        self.operations = np.load(directory / 'operation_name.npy')
+        self.pods = np.load(directory / 'cmdb_id.npy')
+        self.sketch = DDSketch(meta['alpha'])
+        self.t0 = meta['t0']
+        self.step = meta['step']
+
+    def minutes(self, start_ts=None, end_ts=None) -> tuple:
+        """与闭区间 [start_ts, end_ts] 相交的分钟序号范围 [lo, hi)（与整分钟对齐的 end_ts 包含该分钟）"""
+        lo = 0 if start_ts is None else -(-(int(start_ts) - self.t0 - self.step + 1) // self.step)
+        hi = self.meta['minutes'] if end_ts is None else (int(end_ts) - self.t0) // self.step + 1
+        return max(0, lo), max(0, hi)
+
+    def covered(self, start_ts=None, end_ts=None) -> tuple:
+        """窗口实际计入的时间范围（闭区间，文件自身的时间单位），没有相交的分钟时为 (None, None)"""
+        lo, hi = self.minutes(start_ts, end_ts)
+        hi = min(hi, self.meta['minutes'])
+        if hi <= lo:
+            return None, None
+        return self.t0 + lo * self.step, self.t0 + hi * self.step - 1
+
+    @property
+    def nbytes(self) -> int:
+        return sum(a.nbytes for a in self.cells.values()) + sum(a.nbytes for a in self.buckets.values())
+
+
+def latency_dir(file_path: str) -> Path:
+    return sidecar_path(file_path, 'latency')
+
+
+def _read_meta(directory: Path):
+    try:
+        return json.loads((directory / '_meta.json').read_text())
+    except (OSError, ValueError):
+        return None
+
+
+def _is_fresh(meta, path: Path, alpha) -> bool:
+    return (
+        meta is not None
+        and meta.get('version') == STORE_VERSION
+        and meta.get('source') == source_stat(path)
+        and (alpha is None or meta.get('alpha') == alpha)
+    )
+
+
+def _encode(values: pd.Series, dictionary: dict) -> np.ndarray:
+    """按全局字典编码（新值追加到字典末尾），缺失值编码为空字符串"""
+    values = values.astype('category')
+    categories = values.cat.categories.astype(str)
+    mapping = np.array([dictionary.setdefault(name, len(dictionary)) for name in categories] +
+                       [dictionary.setdefault('', len(dictionary))], dtype=np.int32)
+    # 缺失值的 code 为 -1，取到 mapping 的最后一项
+    return mapping[values.cat.codes.to_numpy()]
+
+
+def _combine(parts: list, keys: list, sums: dict) -> list:
+    if len(parts) <= 1:
+        return parts
+    return [pd.concat(parts, ignore_index=True).groupby(keys, sort=False).agg(**sums).reset_index()]
+
+
+CELL_KEYS = ['minute', 'operation', 'pod']
+CELL_SUMS = {'count': ('count', 'sum'), 'sum': ('sum', 'sum'), 'min': ('min', 'min'), 'max': ('max', 'max'),
+             'errors': ('errors', 'sum')}
+BUCKET_KEYS = CELL_KEYS + ['bucket']
+BUCKET_SUMS = {'count': ('count', 'sum')}
+
+
+def build_latency(file_path: str, alpha: float = DEFAULT_ALPHA, max_memory: int | None = None) -> tuple:
+    """按块读取 trace 并写出单元表和桶表，返回 (概要目录, 元数据)"""
+    path = Path(file_path).resolve()
+    header = read_header(path)
+    if not {'timestamp', 'cmdb_id', 'duration'} <= set(header):
+        raise ValueError(f"不是包含 timestamp,cmdb_id,duration 的 trace 文件: {file_path}")
+    columns = [col for col in LATENCY_COLUMNS if col in header]
+
+    directory = latency_dir(file_path)
+    notice(f"构建延迟概要: {path.name} -> {directory}")
+
+    source = source_stat(path)
+    unit = file_time_unit(file_path) or 'ms'
+    step = CELL_SECONDS * UNIT_SCALES[unit]
+    sketch = DDSketch(alpha)
+    operations, pods = {}, {}
+    cells, buckets = [], []
+    rows = 0
+    for chunk in iter_chunks(file_path, columns, max_memory=max_memory or parse_size(DEFAULT_MAX_MEMORY)):
+        duration = chunk['duration'].to_numpy(dtype=np.float64, na_value=np.nan)
+        keep = np.isfinite(duration) & chunk['timestamp'].notna().to_numpy()
+        chunk, duration = chunk[keep], duration[keep]
+        rows += len(chunk)
+        if len(chunk) == 0:
+            continue
+        operation = chunk['operation_name'] if 'operation_name' in chunk else pd.Series('', index=chunk.index)
+        errors = chunk['status_code'].fillna(0).to_numpy() != 0 if 'status_code' in chunk \
+            else np.zeros(len(chunk), dtype=bool)
+        frame = pd.DataFrame({
+            'operation': _encode(operation, operations),
+            'pod': _encode(chunk['cmdb_id'], pods),
+            'minute': (chunk['timestamp'].to_numpy(dtype=np.int64) // step).astype(np.int32),
+            'duration': duration,
+            'errors': errors,
+        })
+        positive = duration > 0
+        frame['bucket'] = np.full(len(frame), ZERO_BUCKET, dtype=np.int16)
+        frame.loc[positive, 'bucket'] = sketch.index_of(duration[positive]).astype(np.int16)
+
+        cells.append(frame.groupby(CELL_KEYS, sort=False).agg(
+            count=('duration', 'size'), sum=('duration', 'sum'), min=('duration', 'min'),
+            max=('duration', 'max'), errors=('errors', 'sum')).reset_index())
+        buckets.append(frame.groupby(BUCKET_KEYS, sort=False).size().rename('count').reset_index())
+        if len(cells) > COMPACT_PARTS:
+            cells = _combine(cells, CELL_KEYS, CELL_SUMS)
+            buckets = _combine(buckets, BUCKET_KEYS, BUCKET_SUMS)
+
+    empty_cells = pd.DataFrame({name: np.array([], dtype=dtype) for name, dtype in CELL_FILES.items()})
+    cell_table = _combine(cells, CELL_KEYS, CELL_SUMS)[0] if cells else empty_cells
+    bucket_table = _combine(buckets, BUCKET_KEYS, BUCKET_SUMS)[0] if buckets else \
+        pd.DataFrame({name: np.array([], dtype=np.int64) for name in BUCKET_KEYS + ['count']})
+    first_minute = int(cell_table['minute'].min()) if len(cell_table) else 0
+    cell_table['minute'] -= first_minute
+    bucket_table['minute'] -= first_minute
+    cell_table = cell_table.sort_values(CELL_KEYS, kind='stable').reset_index(drop=True)
+    bucket_table = bucket_table.sort_values(BUCKET_KEYS, kind='stable').reset_index(drop=True)
+    # 桶表按单元行号引用单元：两表按相同的键排序，单元键每变化一次行号加一
+    changed = np.zeros(len(bucket_table), dtype=bool)
+    changed[:1] = True
+    for key in CELL_KEYS:
+        values = bucket_table[key].to_numpy()
+        changed[1:] |= values[1:] != values[:-1]
+    bucket_table['cell'] = np.cumsum(changed) - 1
+
+    meta = {
+        'version': STORE_VERSION,
+        'source': source,
+        'alpha': alpha,
+        'unit': unit,
+        't0': first_minute * step,
+        'step': step,
+        'minutes': int(cell_table['minute'].max()) + 1 if len(cell_table) else 0,
+        'rows': rows,
+        'operations': len(operations),
+        'pods': len(pods),
+        'cells': len(cell_table),
+        'buckets': len(bucket_table),
+    }
+
+    def write(out: Path):
+        for name, dtype in CELL_FILES.items():
+            np.save(out / f"cell_{name}.npy", cell_table[name].to_numpy(dtype=dtype))
+        for name, dtype in BUCKET_FILES.items():
+            np.save(out / f"bucket_{name}.npy", bucket_table[name].to_numpy(dtype=dtype))
+        np.save(out / 'operation_name.npy', np.array(list(operations), dtype='U'))
+        np.save(out / 'cmdb_id.npy', np.array(list(pods), dtype='U'))
+        (out / '_meta.json').write_text(json.dumps(meta))
+
+    return write_sidecar_dir(directory, write), meta
+
+
+def open_latency(file_path: str, alpha: float | None = None, max_memory: int | None = None) -> LatencyStore:
+    """打开最新的延迟概要，源文件变化或精度不同时重建"""
+    path = Path(file_path).resolve()
+    directory = latency_dir(file_path)
+    meta = _read_meta(directory)
+    if not _is_fresh(meta, path, alpha):
+        directory, meta = build_latency(file_path, alpha or DEFAULT_ALPHA, max_memory)
+    return LatencyStore(directory, meta)
+
+
+def _matching(names: np.ndarray, pattern: str) -> np.ndarray:
+    return np.flatnonzero(pd.Series(names).str.contains(pattern, case=False, na=False).to_numpy())
+
+
+def latency_quantiles(store: LatencyStore, start_ts=None, end_ts=None, by=('operation_name',),
+                      quantiles=DEFAULT_QUANTILES, interval: int | None = None, component: str | None = None,
+                      operation: str | None = None) -> pd.DataFrame:
+    """
+    窗口内按 by（operation_name / cmdb_id 的任意组合）分组的 span 数、均值、分位数、最大值和错误率
+
+    start_ts/end_ts 使用文件自身的时间单位，窗口对齐到分钟（与窗口相交的分钟全部计入）；
+    interval 为分钟数时再按时间桶分组，增加 time 列（桶的起始时间戳）。
+    component/operation 为组件名/操作名过滤（大小写不敏感的正则）。
+    """
+    by = list(by)
+    lo, hi = store.minutes(start_ts, end_ts)
+    cells = store.cells
+    first, last = np.searchsorted(cells['minute'], [lo, hi])
+    cell_range = {name: np.asarray(column[first:last]) for name, column in cells.items()}
+    mask = np.ones(last - first, dtype=bool)
+    if component:
+        mask &= np.isin(cell_range['pod'], _matching(store.pods, component))
+    if operation:
+        mask &= np.isin(cell_range['operation'], _matching(store.operations, operation))
+    selected = np.flatnonzero(mask)
+
+    # 每个选中单元所属的输出分组
+    codes = {'operation_name': 'operation', 'cmdb_id': 'pod'}
+    keys = pd.DataFrame({name: cell_range[codes[name]][selected] for name in by})
+    if interval:
+        keys['time'] = cell_range['minute'][selected] // interval
+    group_cols = list(keys.columns)
+    if group_cols:
+        group = keys.groupby(group_cols, sort=True).ngroup().to_numpy()
+        heads = keys.drop_duplicates().sort_values(group_cols).reset_index(drop=True)
+    else:
+        group = np.zeros(len(selected), dtype=np.int64)
+        heads = pd.DataFrame(index=range(1 if len(selected) else 0))
+    n_groups = len(heads)
+
+    stats = pd.DataFrame({
+        'group': group,
+        **{name: cell_range[name][selected] for name in ('count', 'sum', 'min', 'max', 'errors')},
+    }).groupby('group').agg(count=('count', 'sum'), sum=('sum', 'sum'), min=('min', 'min'), max=('max', 'max'),
+                            errors=('errors', 'sum')).reindex(range(n_groups))
+
+    # 合并概要：窗口内单元的桶是桶表的连续切片，按 (分组, 桶号) 对计数求和
+    cell_group = np.full(last - first, -1, dtype=np.int64)
+    cell_group[selected] = group
+    bucket_first, bucket_last = np.searchsorted(store.buckets['cell'], [first, last])
+    bucket_group = cell_group[np.asarray(store.buckets['cell'][bucket_first:bucket_last]) - first]
+    inside = bucket_group >= 0
+    offset = np.asarray(store.buckets['bucket'][bucket_first:bucket_last])[inside].astype(np.int64) - ZERO_BUCKET
+    merged_key, inverse = np.unique(bucket_group[inside] * BUCKET_RANGE + offset, return_inverse=True)
+    merged_count = np.bincount(inverse, weights=np.asarray(store.buckets['count'][bucket_first:bucket_last])[inside],
+                               minlength=len(merged_key)).astype(np.int64)
+    group_of = merged_key // BUCKET_RANGE
+    bucket = (merged_key % BUCKET_RANGE + ZERO_BUCKET).astype(np.int64)
+
+    result = heads.copy()
+    for name in by:
+        names = store.operations if name == 'operation_name' else store.pods
+        result[name] = names[result[name].to_numpy()].astype(object)
+    if interval:
+        result['time'] = store.t0 + result['time'].to_numpy(dtype=np.int64) * interval * store.step
+    result['spans'] = stats['count'].to_numpy(dtype=np.int64)
+    result['mean'] = (stats['sum'] / stats['count']).to_numpy()
+
+    cumulative = np.cumsum(merged_count)
+    starts = np.searchsorted(group_of, np.arange(n_groups))
+    before = np.where(starts > 0, cumulative[np.maximum(starts - 1, 0)], 0)
+    low, high = stats['min'].to_numpy(), stats['max'].to_numpy()
+    for q in quantiles:
+        rank = np.floor(q * (result['spans'].to_numpy() - 1))
+        position = np.searchsorted(cumulative, before + rank, side='right')
+        position = np.minimum(position, len(bucket) - 1) if len(bucket) else position
+        values = np.where(bucket[position] == ZERO_BUCKET, 0.0, store.sketch.value_of(bucket[position])) \
+            if len(bucket) else np.zeros(n_groups)
+        result[f"p{round(q * 100)}"] = np.clip(values, low, high)
+    result['max'] = high
+    result['error_rate'] = (stats['errors'] / stats['count']).to_numpy()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Latency Sketch Store for OpenRCA')
+    parser.add_argument('--build', type=str, help='Build (or refresh) the latency sketches for a trace file')
+    parser.add_argument('--info', type=str, help='Show sketch store metadata for a trace file')
+    parser.add_argument('--clear', type=str, help='Remove the sketch store for a trace file')
+    parser.add_argument('--alpha', type=float, default=DEFAULT_ALPHA, help='Relative accuracy of the sketches')
+    parser.add_argument('--max-memory', type=str, default=DEFAULT_MAX_MEMORY, help='Memory ceiling while building')
+
+    args = parser.parse_args()
+
+    target = args.build or args.info or args.clear
+    if target and not Path(target).exists():
+        print(f"错误: 文件不存在 {target}")
+        sys.exit(1)
+
+    if args.build:
+        try:
+            store = open_latency(args.build, args.alpha, parse_size(args.max_memory))
+        except ValueError as e:
+            print(f"错误: {e}")
+            sys.exit(1)
+        meta = store.meta
+        print(f"概要目录: {store.directory}")
+        print(f"span: {meta['rows']:,}, 操作: {meta['operations']:,}, Pod: {meta['pods']:,}, "
+              f"单元: {meta['cells']:,}, 非空桶: {meta['buckets']:,} (相对误差 {meta['alpha']:.1%})")
+        print(f"概要大小: {store.nbytes / 1024 / 1024:.1f} MB")
+    elif args.info:
+        directory = latency_dir(args.info)
+        meta = _read_meta(directory)
+        if meta is None:
+            print(f"尚未构建延迟概要: {args.info}")
+        else:
+            fresh = _is_fresh(meta, Path(args.info).resolve(), None)
+            print(f"概要目录: {directory}")
+            print(f"状态: {'有效' if fresh else '已过期'}")
+            print(json.dumps(meta, indent=2, ensure_ascii=False))
+    elif args.clear:
+        shutil.rmtree(latency_dir(args.clear), ignore_errors=True)
+        print(f"已清除延迟概要: {args.clear}")
+    else:
+        parser.print_help()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,491 @@
+#!/usr/bin/env python3
+"""
+Log Trigram Index for OpenRCA
+日志三元组索引 - 为日志 value 列建立倒排索引，正则搜索只校验候选行
+
+索引在一次流式扫描中建立：把每行日志转为小写字节，向量化地提取所有三字节组合（trigram），
+以CSR形式保存 trigram -> 行号 的倒排表，同时保存每行的时间戳、组件编码和字节偏移。
+每个数据块的 (trigram, 行号) 对排序后作为有序段写到磁盘，扫描结束后合并为倒排表，构建时的内存占用与文件大小无关。
+查询时从正则的语法树中提取必须出现的字面量（分支取并集、拼接取交集），用倒排表求出候选行，
+叠加时间范围和组件过滤后只读取候选行的字节区间，再用原正则校验，结果与全量扫描一致。
+
+包含非ASCII字符的行无法安全地做大小写折叠，始终作为候选行交给正则校验。
+索引以目录形式保存在数据文件旁（sidecar），数组以内存映射方式读取；源文件变化时自动重建。
+
+Usage:
+    python log_index.py --build log_service.csv
+    python log_index.py --file log_service.csv --search "timeout|refused" --time-range "1647738000,1647739800"
+"""
+
+import argparse
+import io
+import json
+import mmap
+import os
+import re
+import shutil
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from common.arrow_text import match_mask
+from common.output import notice
+from common.telemetry_cache import cache_unwritable, column_dtypes, read_header, sidecar_path, source_stat
+from common.time_utils import unit_scale
+from common.ts_index import iter_records
+
+try:
+    from re import _constants as sre_constants
+    from re import _parser as sre_parse
+except ImportError:  # Python < 3.11
+    import sre_constants
+    import sre_parse
+
+
+INDEX_VERSION = 1
+BLOCK_BYTES = 4 * 1024 * 1024  # 每块的 (trigram, 行号) 对约占块大小的数十倍内存
+
+# 出现在超过该比例行中的trigram几乎不能缩小范围，只记录为常见trigram而不保存倒排表
+COMMON_GRAM_RATIO = 0.2
+
+# 候选行超过窗口行数的该比例时，索引不再带来收益，改为读取整个窗口
+MAX_CANDIDATE_RATIO = 0.5
+
+INDEX_COLUMNS = ['timestamp', 'cmdb_id', 'value']
+ARRAYS = ['grams', 'offsets', 'postings', 'common', 'timestamps', 'components', 'starts', 'ends', 'non_ascii']
+
+
+def index_dir(file_path: str) -> Path:
+    """索引目录路径"""
+    return sidecar_path(file_path, 'logidx')
+
+
+def _sorted_unique(values: np.ndarray) -> np.ndarray:
+    """排序去重（比 np.unique 的哈希路径快得多）"""
+    values = np.sort(values)
+    if len(values) == 0:
+        return values
+    return values[np.concatenate(([True], values[1:] != values[:-1]))]
+
+
+def _block_trigrams(values: pd.Series, row_base: int):
+    """一个数据块内的 (trigram, 行号) 对（已去重并排序）以及包含非ASCII字节的行号"""
+    values = values.fillna('').astype(str)
+    text = '\0'.join(values.tolist()).encode('utf-8')
+    buf = np.frombuffer(text, dtype=np.uint8)
+    if len(buf) == 0:
+        return np.array([], dtype=np.uint64), np.array([], dtype=np.uint32)
+
+    sep = buf == 0
+    if np.count_nonzero(sep) != len(values) - 1:
+        # 日志内容本身含有NUL字符时替换掉，保证分隔符与行一一对应
+        text = '\0'.join(values.str.replace('\0', ' ', regex=False).tolist()).encode('utf-8')
+        buf = np.frombuffer(text, dtype=np.uint8)
+        sep = buf == 0
+    rows = np.cumsum(sep, dtype=np.int64) + row_base
+    non_ascii = _sorted_unique(rows[buf >= 0x80]).astype(np.uint32)
+
+    lower = np.where((buf >= 0x41) & (buf <= 0x5A), buf + 0x20, buf).astype(np.uint32)
+    grams = (lower[:-2] << 16) | (lower[1:-1] << 8) | lower[2:]
+    valid = ~(sep[:-2] | sep[1:-1] | sep[2:])
+    pairs = (grams[valid].astype(np.uint64) << np.uint64(32)) | rows[:-2][valid].astype(np.uint64)
+    return _sorted_unique(pairs), non_ascii
+
+
+def _save_run(run_dir: Path, pairs: np.ndarray):
+    """把一个块内已排序的 (trigram, 行号) 对保存为有序段：trigram、每个 trigram 的行数、行号"""
+    grams = (pairs >> np.uint64(32)).astype(np.uint32)
+    first = np.flatnonzero(np.diff(grams, prepend=np.int64(-1)) != 0)
+    run_dir.mkdir(parents=True)
+    np.save(run_dir / 'grams.npy', grams[first])
+    np.save(run_dir / 'counts.npy', np.diff(np.append(first, len(grams))).astype(np.int64))
+    np.save(run_dir / 'postings.npy', (pairs & np.uint64(0xFFFFFFFF)).astype(np.uint32))
+
+
+def _merge_runs(run_dirs: list, rows: int, out: Path) -> tuple:
+    """
+    合并各块的有序段，把倒排表直接写入 out/postings.npy
+
+    先累计每个 trigram 的总行数并去掉常见 trigram，得到倒排表的偏移；再按块的顺序把每段的行号
+    写到对应倒排表的当前末尾。块的行号递增，所以每个倒排表内行号有序。内存占用只与单个块的大小有关。
+    返回 (trigram, 偏移, 常见trigram, 倒排项数)。
+    """
+    if run_dirs:
+        grams = _sorted_unique(np.concatenate([np.load(run / 'grams.npy') for run in run_dirs]))
+    else:
+        grams = np.array([], dtype=np.uint32)
+    counts = np.zeros(len(grams), dtype=np.int64)
+    for run in run_dirs:
+        counts[np.searchsorted(grams, np.load(run / 'grams.npy'))] += np.load(run / 'counts.npy')
+
+    common = counts > COMMON_GRAM_RATIO * max(rows, 1)
+    kept = grams[~common]
+    offsets = np.concatenate(([0], np.cumsum(counts[~common]))).astype(np.int64)
+    total = int(offsets[-1])
+    if total == 0:
+        np.save(out / 'postings.npy', np.array([], dtype=np.uint32))
+        return kept, offsets, grams[common], 0
+
+    postings = np.lib.format.open_memmap(out / 'postings.npy', mode='w+', dtype=np.uint32, shape=(total,))
+    cursor = offsets[:-1].copy()
+    for run in run_dirs:
+        run_grams = np.load(run / 'grams.npy')
+        run_counts = np.load(run / 'counts.npy')
+        keep = ~common[np.searchsorted(grams, run_grams)]
+        slots = np.searchsorted(kept, run_grams[keep])
+        lengths = run_counts[keep]
+        # 段内第 k 个 trigram 的行号整体写到 cursor[slots[k]] 开始的位置
+        dest = np.repeat(cursor[slots] - (np.cumsum(lengths) - lengths), lengths) + np.arange(lengths.sum())
+        postings[dest] = np.load(run / 'postings.npy')[np.repeat(keep, run_counts)]
+        cursor[slots] += lengths
+    postings.flush()
+    del postings
+    return kept, offsets, grams[common], total
+
+
+def build_index(file_path: str) -> dict:
+    """扫描日志文件并写入三元组索引目录，返回元数据"""
+    path = Path(file_path)
+    header = read_header(path)
+    missing = [col for col in INDEX_COLUMNS if col not in header]
+    if missing:
+        raise ValueError(f"文件缺少列 {missing}: {file_path}")
+
+    notice(f"构建日志索引: {path.name}")
+
+    out = index_dir(file_path)
+    tmp = out.with_name(out.name + f".tmp{os.getpid()}")
+    shutil.rmtree(tmp, ignore_errors=True)
+    tmp.mkdir(parents=True)
+    try:
+        meta = _build(path, header, tmp)
+    except BaseException:
+        shutil.rmtree(tmp, ignore_errors=True)
+        raise
+    shutil.rmtree(out, ignore_errors=True)
+    os.replace(tmp, out)
+    return meta
+
+
+def _build(path: Path, header: list, tmp: Path) -> dict:
+    """
+    在临时目录中建立索引
+
+    每个数据块的 (trigram, 行号) 对排序后作为有序段写到磁盘，扫描结束后合并，
+    不在内存中保存整个文件的 (trigram, 行号) 对。
+    """
+    stat = source_stat(path)
+    run_dirs, non_ascii_parts = [], []
+    timestamps, components, starts, ends = [], [], [], []
+    pods = {}
+    rows = 0
+    for block_starts, block_ends, frame in iter_records(str(path), INDEX_COLUMNS, BLOCK_BYTES):
+        valid = frame['timestamp'].notna().to_numpy()  # 空行
+        frame = frame[valid]
+        pairs, non_ascii = _block_trigrams(frame['value'], rows)
+        run_dirs.append(tmp / '_runs' / f"{len(run_dirs):06d}")
+        _save_run(run_dirs[-1], pairs)
+        del pairs
+        non_ascii_parts.append(non_ascii)
+        timestamps.append(frame['timestamp'].to_numpy(dtype=np.int64))
+        codes, uniques = pd.factorize(frame['cmdb_id'].astype(str))
+        mapping = np.array([pods.setdefault(pod, len(pods)) for pod in uniques], dtype=np.int32)
+        components.append(mapping[codes])
+        starts.append(block_starts[valid])
+        ends.append(block_ends[valid])
+        rows += len(frame)
+
+    if rows >= 2**32:
+        raise ValueError(f"行数超过索引上限: {rows}")
+
+    grams, offsets, common_grams, postings = _merge_runs(run_dirs, rows, tmp)
+    shutil.rmtree(tmp / '_runs', ignore_errors=True)
+
+    arrays = {
+        'grams': grams.astype(np.uint32),
+        'offsets': offsets,
+        'common': common_grams.astype(np.uint32),
+        'timestamps': np.concatenate(timestamps) if timestamps else np.array([], dtype=np.int64),
+        'components': np.concatenate(components) if components else np.array([], dtype=np.int32),
+        'starts': np.concatenate(starts) if starts else np.array([], dtype=np.int64),
+        'ends': np.concatenate(ends) if ends else np.array([], dtype=np.int64),
+        'non_ascii': np.concatenate(non_ascii_parts) if non_ascii_parts else np.array([], dtype=np.uint32),
+    }
+    meta = {
+        'version': INDEX_VERSION,
+        'source': stat,
+        'header': header,
+        'rows': rows,
+        'pods': list(pods),
+        'trigrams': len(grams),
+        'common_trigrams': len(common_grams),
+        'postings': postings,
+    }
+    for name, array in arrays.items():
+        np.save(tmp / f"{name}.npy", array)
+    (tmp / '_meta.json').write_text(json.dumps(meta))
+    return meta
+
+
+def load_index(file_path: str) -> dict:
+    """读取索引（数组为内存映射），文件变化或索引不存在时重建；索引无法写入时返回 None"""
+    out = index_dir(file_path)
+    meta_path = out / '_meta.json'
+    meta = None
+    if meta_path.exists():
+        try:
+            meta = json.loads(meta_path.read_text())
+        except (OSError, ValueError):
+            meta = None
+    if (
+        meta is None
+        or meta.get('version') != INDEX_VERSION
+        or meta.get('source') != source_stat(Path(file_path))
+        or not all((out / f"{name}.npy").exists() for name in ARRAYS)
+    ):
+        try:
+            meta = build_index(file_path)
+        except OSError as e:
+            cache_unwritable(out, e, '改为逐行扫描')
+            return None
+
+    index = dict(meta)
+    for name in ARRAYS:
+        index[name] = np.load(out / f"{name}.npy", mmap_mode='r')
+    return index
+
+
+# ---------------------------------------------------------------------------
+# 从正则中提取必须出现的字面量
+# 查询表示为 None（不能缩小范围）、('lit', str)、('and', [...])、('or', [...])
+# ---------------------------------------------------------------------------
+
+_REPEATS = {sre_constants.MAX_REPEAT, sre_constants.MIN_REPEAT}
+if hasattr(sre_constants, 'POSSESSIVE_REPEAT'):
+    _REPEATS.add(sre_constants.POSSESSIVE_REPEAT)
+_ATOMIC_GROUP = getattr(sre_constants, 'ATOMIC_GROUP', None)
+
+
+def _and(parts: list):
+    parts = [part for part in parts if part is not None]
+    if not parts:
+        return None
+    return parts[0] if len(parts) == 1 else ('and', parts)
+
+
+def _or(parts: list):
+    if not parts or any(part is None for part in parts):
+        return None
+    return parts[0] if len(parts) == 1 else ('or', parts)
+
+
+def _literal_run(run: list):
+    """长度不足3的字面量无法形成trigram，不构成约束"""
+    return ('lit', ''.join(run)) if len(run) >= 3 else None
+
+
+def _sequence_query(items) -> tuple:
+    """拼接序列：连续的ASCII字面量组成一个字面量串，其余节点递归求约束后取交集"""
+    parts = []
+    run = []
+    for op, av in items:
+        if op == sre_constants.LITERAL and av < 0x80:
+            run.append(chr(av))
+            continue
+        if op == sre_constants.SUBPATTERN and all(
+                sub_op == sre_constants.LITERAL and sub_av < 0x80 for sub_op, sub_av in av[-1]):
+            # 只含字面量的分组可以并入当前字面量串
+            run.extend(chr(sub_av) for _, sub_av in av[-1])
+            continue
+        parts.append(_literal_run(run))
+        run = []
+        parts.append(_node_query(op, av))
+    parts.append(_literal_run(run))
+    return _and(parts)
+
+
+def _node_query(op, av):
+    if op == sre_constants.SUBPATTERN:
+        return _sequence_query(av[-1])
+    if op == sre_constants.BRANCH:
+        return _or([_sequence_query(alt) for alt in av[1]])
+    if op in _REPEATS:
+        low, _, body = av
+        return _sequence_query(body) if low >= 1 else None
+    if _ATOMIC_GROUP is not None and op == _ATOMIC_GROUP:
+        return _sequence_query(av)
+    return None
+
+
+def regex_query(pattern: str, flags: int = 0):
+    """
+    从正则中提取候选行必须满足的字面量约束，无法缩小范围时返回 None
+
+    正则本身不合法时抛出 re.error。
+    """
+    re.compile(pattern, flags)
+    return _sequence_query(sre_parse.parse(pattern, flags))
+
+
+def _gram_keys(literal: str) -> np.ndarray:
+    data = np.frombuffer(literal.lower().encode('ascii'), dtype=np.uint8).astype(np.uint32)
+    return np.unique((data[:-2] << 16) | (data[1:-1] << 8) | data[2:])
+
+
+def _postings(index: dict, gram: int):
+    """trigram 的倒排表；常见trigram返回 None（不构成约束），不存在的trigram返回空数组"""
+    common = index['common']
+    pos = np.searchsorted(common, gram)
+    if pos < len(common) and common[pos] == gram:
+        return None
+    grams = index['grams']
+    pos = np.searchsorted(grams, gram)
+    if pos >= len(grams) or grams[pos] != gram:
+        return np.array([], dtype=np.uint32)
+    return index['postings'][index['offsets'][pos]:index['offsets'][pos + 1]]
+
+
+def _intersect(lists: list):
+    """多个有序行号数组求交集，None 表示不构成约束"""
+    lists = sorted((rows for rows in lists if rows is not None), key=len)
+    if not lists:
+        return None
+    result = np.asarray(lists[0])
+    for rows in lists[1:]:
+        if len(result) == 0:
+            break
+        result = np.intersect1d(result, rows, assume_unique=True)
+    return result
+
+
+def _evaluate(index: dict, query):
+    """求出满足约束的候选行号（有序），无法缩小范围时返回 None"""
+    kind, value = query
+    if kind == 'lit':
+        return _intersect([_postings(index, gram) for gram in _gram_keys(value)])
+    if kind == 'and':
+        return _intersect([_evaluate(index, part) for part in value])
+    parts = [_evaluate(index, part) for part in value]
+    if any(rows is None for rows in parts):
+        return None
+    return np.unique(np.concatenate(parts))
+
+
+def window_rows(index: dict, start_ts=None, end_ts=None, component: str | None = None) -> np.ndarray:
+    """时间范围与组件过滤后的行掩码"""
+    timestamps = index['timestamps']
+    mask = np.ones(len(timestamps), dtype=bool)
+    if start_ts is not None:
+        mask &= timestamps >= start_ts
+    if end_ts is not None:
+        mask &= timestamps <= end_ts
+    if component:
+        pods = pd.Series(index['pods'], dtype=object)
+        codes = np.flatnonzero(match_mask(pods, component, re.IGNORECASE))
+        mask &= np.isin(index['components'], codes)
+    return mask
+
+
+def read_rows(file_path: str, index: dict, rows: np.ndarray, columns=None) -> pd.DataFrame:
+    """按字节偏移读取指定行（相邻行合并为一次拷贝）"""
+    header = index['header']
+    usecols = list(columns) if columns is not None else header
+    dtypes = column_dtypes(header)
+    if len(rows) == 0:
+        return pd.DataFrame({col: pd.Series(dtype=dtypes[col]) for col in usecols})
+
+    starts = np.asarray(index['starts'][rows])
+    ends = np.asarray(index['ends'][rows])
+    # 合并首尾相接的行，减少切片次数
+    breaks = np.flatnonzero(starts[1:] != ends[:-1]) + 1
+    span_starts = starts[np.concatenate(([0], breaks))]
+    span_ends = ends[np.concatenate((breaks - 1, [len(rows) - 1]))]
+
+    with open(file_path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        chunks = [mm[s:e] for s, e in zip(span_starts.tolist(), span_ends.tolist())]
+    data = b''.join(chunks)
+    if not data.endswith(b'\n'):
+        data += b'\n'
+    csv_header = (','.join(header) + '\n').encode()
+    return pd.read_csv(io.BytesIO(csv_header + data), usecols=usecols, dtype=dtypes)[usecols]
+
+
+def search(file_path: str, pattern: str, flags: int = re.IGNORECASE, start_ts=None, end_ts=None,
+           component: str | None = None, columns=None):
+    """
+    用索引搜索匹配正则的日志行
+
+    返回 (匹配的DataFrame, 统计信息)，统计信息包含窗口行数、组件过滤后行数和候选行数。
+    正则无法缩小范围、文件缺少索引列或索引无法写入时返回 (None, None)，候选行过多时返回 (None, 统计信息)，调用方应退回全量扫描。
+    """
+    query = regex_query(pattern, flags)
+    if query is None or not set(INDEX_COLUMNS).issubset(read_header(Path(file_path))):
+        return None, None
+    index = load_index(file_path)
+    if index is None:
+        return None, None
+
+    timestamps = index['timestamps']
+    mask = window_rows(index, start_ts, end_ts)
+    stats = {'rows': int(np.count_nonzero(mask))}
+    if component:
+        mask &= window_rows(index, component=component)
+    stats['component_rows'] = int(np.count_nonzero(mask))
+
+    matched = _evaluate(index, query)
+    if matched is None:
+        stats['candidates'] = stats['component_rows']
+        return None, stats
+    candidates = np.union1d(matched, index['non_ascii']).astype(np.int64)
+    candidates = candidates[mask[candidates]]
+    stats['candidates'] = len(candidates)
+    if len(candidates) > MAX_CANDIDATE_RATIO * max(stats['component_rows'], 1):
+        return None, stats
+
+    # 与列式缓存的读取顺序一致：按小时分区，分区内保持文件顺序
+    candidate_ts = timestamps[candidates]
+    hour = 3600 * (unit_scale(candidate_ts.max()) if len(candidate_ts) else 1)
+    candidates = candidates[np.argsort(candidate_ts // hour, kind='stable')]
+    df = read_rows(file_path, index, candidates, columns)
+    return df[match_mask(df['value'], pattern, flags)].reset_index(drop=True), stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Log Trigram Index for OpenRCA')
+    parser.add_argument('--build', type=str, help='Build (or rebuild) the index for a log CSV file')
+    parser.add_argument('--file', type=str, help='Log CSV file to query')
+    parser.add_argument('--search', type=str, help='Search pattern (regex, case-insensitive)')
+    parser.add_argument('--time-range', type=str, help='Time range (start_ts,end_ts)')
+    parser.add_argument('--component', type=str, help='Filter by component name')
+
+    args = parser.parse_args()
+
+    if args.build:
+        meta = build_index(args.build)
+        size = sum(f.stat().st_size for f in index_dir(args.build).iterdir())
+        print(f"索引: {index_dir(args.build)}")
+        print(f"行数: {meta['rows']:,}, trigram: {meta['trigrams']:,} (常见 {meta['common_trigrams']:,}), "
+              f"倒排项: {meta['postings']:,}, 大小: {size / 1024 / 1024:.1f} MB")
+    elif args.file and args.search:
+        start = end = None
+        if args.time_range:
+            start, end = map(int, args.time_range.split(','))
+        result, stats = search(args.file, args.search, re.IGNORECASE, start, end, args.component)
+        if stats is None:
+            print("正则中没有可用于索引的字面量（至少3个连续字符）或索引不可用，需要全量扫描")
+            return
+        print(f"窗口行数: {stats['rows']:,}, 组件过滤后: {stats['component_rows']:,}, 候选行: {stats['candidates']:,}")
+        if result is None:
+            print("索引无法缩小范围，需要全量扫描")
+        else:
+            print(f"匹配行数: {len(result):,}")
+            print(result.head(10).to_string(index=False))
+    else:
+        parser.print_help()
+
+
+if __name__ == '__main__':
+    main()
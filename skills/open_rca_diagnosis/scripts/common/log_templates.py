@@ -0,0 +1,478 @@
+#!/usr/bin/env python3
+"""
+Log Template Miner for OpenRCA
+日志模板挖掘 - 流式聚类日志模板，统计 模板 × 组件 × 分钟 的计数并计算突增得分
+
+模板挖掘采用 Drain 风格的固定深度解析树：按词数和前几个词定位叶节点，在叶节点的模板中
+按相同词比例匹配，匹配成功时把不同的词泛化为 <*>。"severity: info, message: ..." 这类结构化前缀
+（key: value, ... key:）必须完全相同，但不计入相同词比例，否则前缀较长的短消息会被合并为同一个模板。模板表有上限，超出时淘汰最久未使用的模板。
+数字、IP、十六进制串等变量先用向量化正则替换为 <*>，每个数据块内相同的消息只挖掘一次。
+
+日志按小时分块读取，内存占用与时间窗口长度无关。挖掘状态（模板表）保存在数据文件旁，
+之后查询其他时间窗口时复用已学到的模板，模板编号保持稳定。
+
+突增的基线是整个文件（一天）的每分钟计数：首次查询时挖掘整个文件，计数表按挖掘状态保存在数据文件旁，
+之后的时间窗口只取窗口内的分钟与全天基线比较。
+
+Usage:
+    python log_templates.py --file log_service.csv --time-range "1647738000,1647739800"
+    python log_templates.py --file log_service.csv --show-state
+"""
+
+import argparse
+import json
+import os
+import re
+import sys
+import uuid
+from collections import OrderedDict
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from common.arrow_text import match_mask
+from common.telemetry_cache import (
+    cache_unwritable,
+    column_dtypes,
+    load_telemetry,
+    read_header,
+    sidecar_path,
+    source_stat,
+)
+from common.time_utils import unit_scale
+
+STATE_VERSION = 2
+WILDCARD = '<*>'
+
+DEFAULT_DEPTH = 4
+DEFAULT_SIMILARITY = 0.4
+DEFAULT_MAX_CHILDREN = 100
+DEFAULT_MAX_TEMPLATES = 2000
+
+CHUNK_ROWS = 500_000
+
+# 每块内缓存 "掩码后消息 -> 模板编号"，超过上限时清空
+MAX_ASSIGNMENT_CACHE = 200_000
+
+# 变量掩码，按顺序替换
+MASKS = [
+    r'[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}',  # UUID
+    r'\d{1,3}(?:\.\d{1,3}){3}(?::\d+)?',                                              # IP[:port]
+    r'\b0x[0-9a-fA-F]+\b',                                                           # 0x十六进制
+    r'\b[0-9a-fA-F]*\d[0-9a-fA-F]*[a-fA-F][0-9a-fA-F]*\b',                          # 含数字和字母的十六进制串
+    r'\b\d+(?:\.\d+)?\b',                                                            # 数字
+]
+
+# 结构化前缀中的键（severity:、message:）
+KEY_TOKEN = re.compile(r'[A-Za-z_][\w.-]*:')
+
+LOG_COLUMNS = ['timestamp', 'cmdb_id', 'value']
+
+
+def state_path(file_path: str) -> Path:
+    """默认的挖掘状态文件路径"""
+    return sidecar_path(file_path, 'templates.json')
+
+
+def counts_path(file_path: str) -> Path:
+    """整个文件的计数表（突增基线）路径"""
+    return sidecar_path(file_path, 'template_counts.npz')
+
+
+def mask_messages(values: pd.Series) -> pd.Series:
+    """把变量替换为 <*> 并压缩空白"""
+    masked = values.fillna('').astype(str)
+    for pattern in MASKS:
+        masked = masked.str.replace(pattern, WILDCARD, regex=True)
+    return masked.str.replace(r'\s+', ' ', regex=True).str.strip()
+
+
+def prefix_length(tokens: list) -> int:
+    """结构化前缀 key: value, ... key: 的词数，其后为消息正文；没有前缀时为0"""
+    length = i = 0
+    while i < len(tokens) and KEY_TOKEN.fullmatch(tokens[i]):
+        length = i + 1
+        if i + 2 < len(tokens) and tokens[i + 1].endswith(',') and KEY_TOKEN.fullmatch(tokens[i + 2]):
+            i += 2
+            continue
+        break
+    return length
+
+
+class TemplateMiner:
+    """
+    Drain 风格的日志模板挖掘器
+
+    模板以 OrderedDict 按最近使用顺序保存，数量超过 max_templates 时淘汰最久未使用的模板。
+    """
+
+    def __init__(self, depth: int = DEFAULT_DEPTH, similarity: float = DEFAULT_SIMILARITY,
+                 max_children: int = DEFAULT_MAX_CHILDREN, max_templates: int = DEFAULT_MAX_TEMPLATES):
+        self.depth = max(depth, 3)
+        self.similarity = similarity
+        self.max_children = max_children
+        self.max_templates = max_templates
+        self.templates = OrderedDict()  # id -> {'tokens': [...], 'size': int}
+        self.tree = {}                  # 词数 -> 节点 {'children': {}, 'ids': []}
+        self.next_id = 1
+        self.instance = uuid.uuid4().hex  # 标识一份挖掘状态，保存的计数表只对同一状态有效
+        self.created = 0
+        self.evicted = 0
+
+    def _leaf(self, tokens: list, create: bool):
+        """按词数和前 depth-2 个词定位叶节点，create 时沿途创建节点"""
+        node = self.tree.get(len(tokens))
+        if node is None:
+            if not create:
+                return None
+            node = self.tree[len(tokens)] = {'children': {}, 'ids': []}
+        for token in tokens[:self.depth - 2]:
+            children = node['children']
+            key = WILDCARD if any(ch.isdigit() for ch in token) else token
+            if key in children:
+                node = children[key]
+            elif not create:
+                if WILDCARD not in children:
+                    return None
+                node = children[WILDCARD]
+            else:
+                if len(children) >= self.max_children - 1 and key != WILDCARD:
+                    key = WILDCARD
+                node = children.setdefault(key, {'children': {}, 'ids': []})
+        return node
+
+    def _best_match(self, leaf: dict, tokens: list):
+        skip = prefix_length(tokens)
+        body = len(tokens) - skip
+        best_id, best_sim, best_params = None, -1.0, -1
+        for template_id in leaf['ids']:
+            template = self.templates[template_id]['tokens']
+            if template[:skip] != tokens[:skip]:
+                continue
+            same = sum(1 for a, b in zip(template[skip:], tokens[skip:]) if a == b and a != WILDCARD)
+            params = template.count(WILDCARD)
+            sim = same / body if body else 1.0
+            if sim > best_sim or (sim == best_sim and params > best_params):
+                best_id, best_sim, best_params = template_id, sim, params
+        if best_id is not None and (best_sim >= self.similarity or not tokens):
+            return best_id
+        return None
+
+    def _insert(self, template_id: int):
+        tokens = self.templates[template_id]['tokens']
+        self._leaf(tokens, create=True)['ids'].append(template_id)
+
+    def _evict(self):
+        while len(self.templates) > self.max_templates:
+            template_id, template = self.templates.popitem(last=False)
+            leaf = self._leaf(template['tokens'], create=False)
+            if leaf is not None and template_id in leaf['ids']:
+                leaf['ids'].remove(template_id)
+            self.evicted += 1
+
+    def add(self, message: str, count: int = 1) -> int:
+        """把一条（已掩码的）消息归入模板，返回模板编号"""
+        tokens = message.split()
+        leaf = self._leaf(tokens, create=False)
+        template_id = self._best_match(leaf, tokens) if leaf is not None else None
+
+        if template_id is None:
+            template_id = self.next_id
+            self.next_id += 1
+            self.created += 1
+            self.templates[template_id] = {'tokens': tokens, 'size': count}
+            self._insert(template_id)
+            self._evict()
+            return template_id
+
+        template = self.templates[template_id]
+        merged = [a if a == b else WILDCARD for a, b in zip(template['tokens'], tokens)]
+        if merged[:self.depth - 2] != template['tokens'][:self.depth - 2]:
+            # 前缀被泛化时移动到 <*> 分支，保证树结构与模板一致（重新加载状态时位置相同）
+            leaf['ids'].remove(template_id)
+            template['tokens'] = merged
+            self._insert(template_id)
+        else:
+            template['tokens'] = merged
+        template['size'] += count
+        self.templates.move_to_end(template_id)
+        return template_id
+
+    def template(self, template_id: int) -> str:
+        template = self.templates.get(template_id)
+        return ' '.join(template['tokens']) if template is not None else None
+
+    def to_state(self) -> dict:
+        return {
+            'version': STATE_VERSION,
+            'config': {
+                'depth': self.depth, 'similarity': self.similarity,
+                'max_children': self.max_children, 'max_templates': self.max_templates,
+            },
+            'next_id': self.next_id,
+            'instance': self.instance,
+            'templates': [
+                {'id': template_id, 'template': ' '.join(t['tokens']), 'size': t['size']}
+                for template_id, t in self.templates.items()
+            ],
+        }
+
+    def save(self, path: Path):
+        """原子地写入挖掘状态；无法写入时提示一行，状态只在本次使用"""
+        tmp = path.with_name(path.name + f".tmp{os.getpid()}")
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp.write_text(json.dumps(self.to_state(), ensure_ascii=False))
+            tmp.replace(path)
+        except OSError as e:
+            if tmp.exists():
+                tmp.unlink()
+            cache_unwritable(path, e, '模板状态不保存')
+
+    @classmethod
+    def load(cls, path: Path, **config):
+        """读取挖掘状态，文件不存在或版本不符时返回新的挖掘器；config 覆盖保存的配置"""
+        state = None
+        if path.exists():
+            try:
+                state = json.loads(path.read_text())
+            except (OSError, ValueError):
+                state = None
+        if state is None or state.get('version') != STATE_VERSION:
+            return cls(**config)
+
+        saved = dict(state['config'])
+        saved.update({key: value for key, value in config.items() if value is not None})
+        miner = cls(**saved)
+        miner.next_id = state['next_id']
+        miner.instance = state.get('instance', miner.instance)
+        for item in state['templates']:
+            miner.templates[item['id']] = {'tokens': item['template'].split(), 'size': item['size']}
+            miner._insert(item['id'])
+        miner._evict()
+        return miner
+
+
+def iter_log_chunks(file_path: str, columns: list, start_ts=None, end_ts=None, use_cache: bool = True):
+    """
+    按块读取日志：指定时间范围时逐小时读取（经过列式缓存或时间索引），否则按行数分块读取CSV
+    """
+    if start_ts is not None and end_ts is not None:
+        hour = 3600 * unit_scale(end_ts)
+        lower = start_ts
+        while lower <= end_ts:
+            upper = min((lower // hour + 1) * hour - 1, end_ts)
+            chunk = load_telemetry(file_path, columns=columns, start_ts=lower, end_ts=upper, use_cache=use_cache)
+            if len(chunk):
+                yield chunk
+            lower = upper + 1
+        return
+
+    header = read_header(Path(file_path))
+    reader = pd.read_csv(file_path, usecols=columns, dtype=column_dtypes(header), chunksize=CHUNK_ROWS)
+    for chunk in reader:
+        if start_ts is not None:
+            chunk = chunk[chunk['timestamp'] >= start_ts]
+        if end_ts is not None:
+            chunk = chunk[chunk['timestamp'] <= end_ts]
+        if len(chunk):
+            yield chunk[columns]
+
+
+def mine_frame(miner: TemplateMiner, df: pd.DataFrame, cache: dict, minute: int = 60) -> pd.DataFrame:
+    """挖掘一块日志，返回该块的 模板 × 组件 × 分钟 计数"""
+    # 先对原始消息去重再掩码，掩码后再次去重，每种消息只挖掘一次
+    raw_codes, raw_uniques = pd.factorize(df['value'].fillna(''), sort=False)
+    masked_codes, uniques = pd.factorize(mask_messages(pd.Series(raw_uniques, dtype=object)), sort=False)
+    codes = masked_codes[raw_codes]
+    counts = np.bincount(codes, minlength=len(uniques))
+
+    if len(cache) > MAX_ASSIGNMENT_CACHE:
+        cache.clear()
+    ids = np.empty(len(uniques), dtype=np.int64)
+    for i, (message, count) in enumerate(zip(uniques.tolist(), counts.tolist())):
+        template_id = cache.get(message)
+        if template_id is None or template_id not in miner.templates:
+            template_id = miner.add(message, count)
+            cache[message] = template_id
+        else:
+            template = miner.templates[template_id]
+            template['size'] += count
+            miner.templates.move_to_end(template_id)
+        ids[i] = template_id
+
+    rows = pd.DataFrame({
+        'template_id': ids[codes],
+        'cmdb_id': df['cmdb_id'].to_numpy(),
+        'minute': df['timestamp'].to_numpy(dtype=np.int64) // minute * minute,
+    })
+    return rows.groupby(['template_id', 'cmdb_id', 'minute'], sort=False).size().rename('count').reset_index()
+
+
+def mine_file(file_path: str, miner: TemplateMiner, start_ts=None, end_ts=None, component: str | None = None,
+              use_cache: bool = True):
+    """
+    流式挖掘日志文件，返回 (模板 × 组件 × 分钟 计数表, 统计的分钟数)
+
+    分钟数按读取到的全部日志（组件过滤之前）的时间跨度计算，指定时间范围时取整个窗口，
+    作为突增得分的基线长度。
+    """
+    cache = {}
+    parts = []
+    minute = None
+    first = last = None
+    for chunk in iter_log_chunks(file_path, LOG_COLUMNS, start_ts, end_ts, use_cache):
+        if minute is None:
+            minute = 60 * unit_scale(chunk['timestamp'].max())
+        lo, hi = int(chunk['timestamp'].min()), int(chunk['timestamp'].max())
+        first = lo if first is None else min(first, lo)
+        last = hi if last is None else max(last, hi)
+        if component:
+            chunk = chunk[match_mask(chunk['cmdb_id'], component, re.IGNORECASE)]
+            if len(chunk) == 0:
+                continue
+        parts.append(mine_frame(miner, chunk, cache, minute))
+
+    if start_ts is not None and end_ts is not None:
+        minute = 60 * unit_scale(end_ts)
+        first, last = start_ts, end_ts
+    n_minutes = last // minute - first // minute + 1 if first is not None else 0
+
+    if not parts:
+        empty = pd.DataFrame({'template_id': pd.Series(dtype='int64'), 'cmdb_id': pd.Series(dtype=object),
+                              'minute': pd.Series(dtype='int64'), 'count': pd.Series(dtype='int64')})
+        return empty, n_minutes
+    counts = pd.concat(parts, ignore_index=True)
+    counts = counts.groupby(['template_id', 'cmdb_id', 'minute'], sort=True)['count'].sum().reset_index()
+    return counts, n_minutes
+
+
+def _read_counts(path: Path, expected: dict):
+    """读取保存的计数表，不存在或与当前数据文件/挖掘状态不符时返回 None"""
+    try:
+        with np.load(path, allow_pickle=False) as data:
+            meta = json.loads(str(data['meta']))
+            if meta != expected:
+                return None
+            counts = pd.DataFrame({
+                'template_id': data['template_id'],
+                'cmdb_id': pd.Series(data['pods'], dtype=object)[data['pod_codes']].to_numpy(),
+                'minute': data['minute'],
+                'count': data['count'],
+            })
+            return counts, int(data['n_minutes'])
+    except (OSError, KeyError, ValueError):
+        return None
+
+
+def _write_counts(path: Path, counts: pd.DataFrame, n_minutes: int, meta: dict):
+    codes, pods = pd.factorize(counts['cmdb_id'].astype(str), sort=True)
+    tmp = path.with_name(path.name + f".tmp{os.getpid()}.npz")
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        np.savez(tmp, meta=json.dumps(meta), n_minutes=n_minutes,
+                 template_id=counts['template_id'].to_numpy(np.int64), pods=np.asarray(pods, dtype=str),
+                 pod_codes=codes.astype(np.int32), minute=counts['minute'].to_numpy(np.int64),
+                 count=counts['count'].to_numpy(np.int64))
+        tmp.replace(path)
+    except OSError as e:
+        if tmp.exists():
+            tmp.unlink()
+        cache_unwritable(path, e, '下次查询重新挖掘')
+
+
+def file_counts(file_path: str, miner: TemplateMiner, use_cache: bool = True):
+    """
+    整个文件的 模板 × 组件 × 分钟 计数和分钟数（突增的基线）
+
+    同一份挖掘状态下的结果保存在数据文件旁，数据文件不变时直接读取；use_cache=False 时每次重新挖掘。
+    """
+    path = counts_path(file_path)
+    expected = {'source': source_stat(Path(file_path)), 'instance': miner.instance}
+    if use_cache:
+        saved = _read_counts(path, expected)
+        if saved is not None:
+            return saved
+    counts, n_minutes = mine_file(file_path, miner, use_cache=use_cache)
+    if use_cache:
+        _write_counts(path, counts, n_minutes, expected)
+    return counts, n_minutes
+
+
+def window_counts(counts: pd.DataFrame, start_ts=None, end_ts=None) -> pd.DataFrame:
+    """计数表中与闭区间 [start_ts, end_ts] 相交的分钟（按整分钟计入，与整分钟对齐的 end_ts 包含该分钟）"""
+    if start_ts is None or end_ts is None:
+        return counts
+    minute = 60 * unit_scale(end_ts)
+    inside = (counts['minute'] >= start_ts // minute * minute) & (counts['minute'] <= end_ts)
+    return counts[inside.to_numpy()]
+
+
+def burst_scores(counts: pd.DataFrame, n_minutes: int, start_ts=None, end_ts=None) -> pd.DataFrame:
+    """
+    计算每个 模板 × 组件 序列在每分钟的突增得分
+
+    基线为该序列在 counts 覆盖的整个范围（n_minutes 分钟，通常为全天）内的每分钟均值 mean 与标准差 std
+    （没有日志的分钟按0计），score = (count - mean) / (std + 1)。给出 start_ts/end_ts 时只在窗口内的分钟中取峰值。
+    返回每个序列得分最高的一分钟，按得分降序。
+    """
+    empty = counts.iloc[:0].assign(mean=pd.Series(dtype='float64'), std=pd.Series(dtype='float64'),
+                                   score=pd.Series(dtype='float64'))
+    if len(counts) == 0:
+        return empty
+    n_minutes = max(n_minutes, 1)
+    values = counts['count'].to_numpy(dtype=np.float64)
+    keys = [counts['template_id'].to_numpy(), counts['cmdb_id'].to_numpy()]  # 按位置分组，counts 可以是筛选后的子表
+    total = pd.Series(values).groupby(keys).transform('sum').to_numpy()
+    total_sq = pd.Series(values ** 2).groupby(keys).transform('sum').to_numpy()
+
+    mean = total / n_minutes
+    std = np.sqrt(np.maximum(total_sq / n_minutes - mean ** 2, 0.0))
+    scored = window_counts(counts.assign(mean=mean, std=std, score=(values - mean) / (std + 1)), start_ts, end_ts)
+    if len(scored) == 0:
+        return empty
+
+    peak = scored.sort_values('score', ascending=False, kind='stable').drop_duplicates(['template_id', 'cmdb_id'])
+    return peak.reset_index(drop=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Log Template Miner for OpenRCA')
+    parser.add_argument('--file', type=str, required=True, help='Log CSV file path')
+    parser.add_argument('--time-range', type=str, help='Time range (start_ts,end_ts)')
+    parser.add_argument('--component', type=str, help='Filter by component name')
+    parser.add_argument('--state', type=str, help='Miner state file (default: next to the telemetry cache)')
+    parser.add_argument('--show-state', action='store_true', help='List the learned templates')
+    parser.add_argument('--top', type=int, default=20, help='Top N results')
+
+    args = parser.parse_args()
+
+    path = Path(args.state) if args.state else state_path(args.file)
+    miner = TemplateMiner.load(path)
+
+    if args.show_state:
+        print(f"模板状态: {path} ({len(miner.templates)} 个模板)")
+        items = sorted(miner.templates.items(), key=lambda item: item[1]['size'], reverse=True)
+        for template_id, template in items[:args.top]:
+            print(f"  [{template_id}] {template['size']:>10,}  {' '.join(template['tokens'])}")
+        return
+
+    start = end = None
+    if args.time_range:
+        start, end = map(int, args.time_range.split(','))
+    counts, n_minutes = file_counts(args.file, miner)
+    miner.save(path)
+    if args.component:
+        counts = counts[match_mask(counts['cmdb_id'], args.component, re.IGNORECASE)]
+
+    window = window_counts(counts, start, end)
+    print(f"模板数: {window['template_id'].nunique()} (新增 {miner.created}), 计数表: {len(window)} 行")
+    bursts = burst_scores(counts, n_minutes, start, end).head(args.top)
+    bursts['template'] = [miner.template(template_id) for template_id in bursts['template_id']]
+    print(bursts.to_string(index=False))
+
+
+if __name__ == '__main__':
+    main()
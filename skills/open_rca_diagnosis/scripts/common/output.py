@@ -0,0 +1,201 @@
+"""
+Structured Output for OpenRCA
+结构化输出 - 分析脚本的 --format json|arrow 模式与 --output 的文件格式
+
+结构化模式不生成文本报告，只输出结果本身（异常、阈值、计数和 top-k 表格），每算出一节立即写出：
+
+    --format json   NDJSON，每节一行
+                    {"section": "summary", "data": {...}}                       标量结果
+                    {"section": "anomalies", "total": 37, "rows": [{...}, ...]}   表格，最多 --max-rows 行
+    --format arrow  每节一个 Arrow IPC 流，依次拼接在标准输出上；节名和总行数在 schema 元数据中，
+                    用 read_arrow_sections() 读回
+
+表格行数不超过 --max-rows（上限 MAX_ROWS），字符串单元格截断到 MAX_TEXT 个字符；
+分析过程中的提示信息转到 stderr，stdout 只包含结构化结果。
+
+--output 按扩展名选择格式：.parquet 为 Parquet，.arrow/.ipc/.feather 为 Arrow IPC 文件，其余为CSV。
+
+    with structured_output(args.format, args.max_rows) as out:
+        out.record('summary', rows=len(df), window_rows=len(filtered))
+        out.table('anomalies', anomalies)
+"""
+
+import contextlib
+import json
+import math
+import sys
+import threading
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    from pyarrow import feather
+except ImportError:  # pyarrow 不可用时只支持 json 格式和CSV输出
+    pa = None
+
+
+FORMATS = ['text', 'json', 'arrow']
+
+DEFAULT_MAX_ROWS = 100
+MAX_ROWS = 10_000
+
+# 字符串单元格（日志内容、调用链等）的最大长度
+MAX_TEXT = 500
+
+ARROW_SUFFIXES = {'.arrow', '.ipc', '.feather'}
+
+_NOTICE_LOCK = threading.Lock()
+
+
+def add_format_arguments(parser):
+    """为分析脚本添加 --format 和 --max-rows 参数"""
+    parser.add_argument('--format', choices=FORMATS, default='text',
+                        help='text report, or only the structured result as NDJSON (json) / Arrow IPC stream (arrow)')
+    parser.add_argument('--max-rows', type=int, default=DEFAULT_MAX_ROWS,
+                        help=f'Structured formats: rows per table (at most {MAX_ROWS})')
+
+
+def notice(message: str):
+    """
+    向 stderr 输出一行提示（缓存/索引构建等进度）
+
+    并发读取的线程各自构建缓存时，print 分别写出内容和换行符，两行会拼在一起；这里加锁后整行一次写出。
+    """
+    with _NOTICE_LOCK:
+        sys.stderr.write(f"{message}\n")
+        sys.stderr.flush()
+
+
+def check_format_arguments(parser, args):
+    """arrow 格式和 Arrow/Parquet 输出文件需要 pyarrow"""
+    output = getattr(args, 'output', None)
+    arrow_output = output and Path(output).suffix.lower() in ARROW_SUFFIXES | {'.parquet'}
+    if pa is None and (getattr(args, 'format', 'text') == 'arrow' or arrow_output):
+        parser.error('--format arrow and .arrow/.ipc/.feather/.parquet output require pyarrow')
+
+
+def write_table(df: pd.DataFrame, path: str):
+    """按扩展名保存表格：.parquet 为 Parquet，.arrow/.ipc/.feather 为 Arrow IPC 文件，其余为CSV"""
+    suffix = Path(path).suffix.lower()
+    if suffix != '.parquet' and suffix not in ARROW_SUFFIXES:
+        df.to_csv(path, index=False)
+        return
+    if pa is None:
+        raise RuntimeError(f"保存 {suffix} 文件需要 pyarrow")
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    if suffix == '.parquet':
+        pq.write_table(table, path)
+    else:
+        feather.write_feather(table, path)
+
+
+def _native(value):
+    """转换为可JSON序列化的Python值：numpy标量转为内置类型，NaN/NA 为 None，长字符串截断"""
+    if isinstance(value, dict):
+        return {str(k): _native(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple, np.ndarray)):
+        return [_native(v) for v in value]
+    if value is None or value is pd.NA or value is pd.NaT:
+        return None
+    if isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, float) and not math.isfinite(value):
+        return None
+    if isinstance(value, str) and len(value) > MAX_TEXT:
+        return value[:MAX_TEXT]
+    if isinstance(value, (pd.Timestamp, pd.Timedelta)):
+        return str(value)
+    return value
+
+
+def _as_frame(rows) -> pd.DataFrame:
+    """DataFrame、Series（如 value_counts 的结果）或字典列表统一为 DataFrame"""
+    if isinstance(rows, pd.DataFrame):
+        return rows
+    if isinstance(rows, pd.Series):
+        return rows.reset_index()
+    return pd.DataFrame(list(rows))
+
+
+def _clip_strings(frame: pd.DataFrame) -> pd.DataFrame:
+    """字符串列截断到 MAX_TEXT 个字符，category 列转为普通字符串"""
+    frame = frame.copy()
+    for col in frame.columns:
+        series = frame[col]
+        if isinstance(series.dtype, pd.CategoricalDtype):
+            series = series.astype(object)
+        if pd.api.types.infer_dtype(series, skipna=True) == 'string':
+            frame[col] = series.str.slice(0, MAX_TEXT)
+    return frame
+
+
+class ResultWriter:
+    """按节写出结构化结果，每节写完立即 flush"""
+
+    def __init__(self, fmt: str, stream=None, max_rows: int = DEFAULT_MAX_ROWS):
+        if fmt not in ('json', 'arrow'):
+            raise ValueError(f"不支持的结构化格式: {fmt}")
+        stream = stream if stream is not None else sys.stdout
+        if fmt == 'arrow':
+            if pa is None:
+                raise RuntimeError("--format arrow 需要 pyarrow")
+            stream = getattr(stream, 'buffer', stream)
+        self.fmt = fmt
+        self.stream = stream
+        self.max_rows = max(0, min(max_rows, MAX_ROWS))
+
+    def record(self, section: str, **data):
+        """写出一节标量结果"""
+        data = _native(data)
+        if self.fmt == 'json':
+            self._write_line({'section': section, 'data': data})
+        else:
+            self._write_arrow(section, 1, pa.Table.from_pylist([data]))
+
+    def table(self, section: str, rows, limit: int | None = None):
+        """写出一节表格结果，只保留前 min(limit, max_rows) 行，total 为截断前的行数"""
+        frame = _as_frame(rows)
+        total = len(frame)
+        cap = self.max_rows if limit is None else min(limit, self.max_rows)
+        frame = frame.head(cap)
+        if self.fmt == 'json':
+            self._write_line({'section': section, 'total': total, 'rows': _native(frame.to_dict('records'))})
+        else:
+            self._write_arrow(section, total, pa.Table.from_pandas(_clip_strings(frame), preserve_index=False))
+
+    def _write_line(self, obj: dict):
+        self.stream.write(json.dumps(obj, ensure_ascii=False, default=str) + '\n')
+        self.stream.flush()
+
+    def _write_arrow(self, section: str, total: int, table):
+        metadata = dict(table.schema.metadata or {})
+        metadata.update({b'section': section.encode(), b'total': str(total).encode()})
+        table = table.replace_schema_metadata(metadata)
+        with pa.ipc.new_stream(self.stream, table.schema) as writer:
+            writer.write_table(table)
+        self.stream.flush()
+
+
+@contextlib.contextmanager
+def structured_output(fmt: str, max_rows: int = DEFAULT_MAX_ROWS):
+    """结构化结果写到当前 stdout；期间其余 print 转到 stderr，避免混入结果"""
+    writer = ResultWriter(fmt, sys.stdout, max_rows)
+    with contextlib.redirect_stdout(sys.stderr):
+        yield writer
+
+
+def read_arrow_sections(source):
+    """读回 --format arrow 的输出（文件路径或二进制文件对象），依次返回 (节名, 总行数, pyarrow.Table)"""
+    stream = pa.input_stream(source) if isinstance(source, (str, Path)) else pa.PythonFile(source, mode='r')
+    while True:
+        try:
+            reader = pa.ipc.open_stream(stream)
+        except (pa.ArrowInvalid, EOFError):
+            return
+        table = reader.read_all()
+        metadata = table.schema.metadata or {}
+        yield metadata.get(b'section', b'').decode(), int(metadata.get(b'total', b'0')), table
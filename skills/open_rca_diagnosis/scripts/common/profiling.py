@@ -0,0 +1,366 @@
+"""
+Stage Profiling for OpenRCA
+阶段剖析 - 分析脚本的 --profile：记录每个阶段（加载、阈值、过滤、检测、报告）的耗时、CPU时间、
+峰值内存增量和行数
+
+    with stage('load', file=path) as span:
+        df = load_telemetry(path)
+        span.rows = len(df)
+
+未启用剖析时 stage() 只是一个空的上下文管理器。启用后：
+
+    --profile [FILE]     结束时在 stderr 输出阶段汇总表；指定 FILE 时同时写出 OTLP JSON 格式的 span
+                         （resourceSpans/scopeSpans/spans，可导入 OpenTelemetry Collector 或 Jaeger）
+    --profile-dump FILE  同时记录函数级剖析：.html/.txt 使用 pyinstrument（需安装），其余为 cProfile
+                         统计（用 python -m pstats FILE 或 snakeviz 查看）；只覆盖主线程
+
+内存为进程RSS：每个阶段记录开始、结束时的RSS和阶段内的峰值（后台线程每 SAMPLE_INTERVAL 秒采样，
+极短的峰值可能漏掉）。CPU时间为进程所有线程之和，包括 pyarrow 的工作线程；
+并行执行的阶段（diagnose 的线程池）时间重叠，CPU时间和内存也互相包含。
+每个线程的阶段各自嵌套，线程中没有父阶段的 span 挂到脚本的根 span 下。
+"""
+
+import contextlib
+import json
+import os
+import sys
+import threading
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+
+try:
+    import resource
+except ImportError:  # 非 Unix 平台没有 ru_maxrss
+    resource = None
+
+try:
+    from pyinstrument import Profiler as Pyinstrument
+except ImportError:  # pyinstrument 不可用时 --profile-dump 只支持 cProfile
+    Pyinstrument = None
+
+
+SAMPLE_INTERVAL = 0.01
+
+PYINSTRUMENT_SUFFIXES = {'.html', '.txt'}
+
+# OTLP 的 SPAN_KIND_INTERNAL
+SPAN_KIND_INTERNAL = 1
+
+try:
+    PAGE_SIZE = os.sysconf('SC_PAGE_SIZE')
+except (AttributeError, ValueError, OSError):
+    PAGE_SIZE = 4096
+
+
+def current_rss() -> int:
+    """当前进程的常驻内存（字节）；没有 /proc 时退回进程峰值 ru_maxrss"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * PAGE_SIZE
+    except (OSError, ValueError, IndexError):
+        pass
+    if resource is None:
+        return 0
+    # Linux 上 ru_maxrss 的单位是 KB，macOS 上是字节
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return maxrss if sys.platform == 'darwin' else maxrss * 1024
+
+
+@dataclass
+class Span:
+    """一个阶段的记录；rows 和 attributes 可在阶段执行过程中设置"""
+    name: str
+    span_id: str
+    parent_id: str
+    depth: int
+    start_ns: int
+    end_ns: int = 0
+    cpu_seconds: float = 0.0
+    rss_start: int = 0
+    rss_end: int = 0
+    rss_peak: int = 0
+    rows: int = None
+    attributes: dict = field(default_factory=dict)
+    thread: str = ''
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    @property
+    def seconds(self) -> float:
+        return (self.end_ns - self.start_ns) / 1e9
+
+    @property
+    def peak_delta(self) -> int:
+        """阶段内峰值相对开始时的RSS增量"""
+        return self.rss_peak - self.rss_start
+
+
+class _NullSpan:
+    """未启用剖析时 stage() 返回的占位对象，设置的值被丢弃"""
+    rows = None
+
+    def set(self, **attributes):
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class Profiler:
+    """收集一次脚本运行的阶段 span，根 span 覆盖从 start() 到 stop() 的整个运行"""
+
+    def __init__(self, name: str, sample_interval: float = SAMPLE_INTERVAL):
+        self.name = name
+        self.trace_id = os.urandom(16).hex()
+        self.spans = []
+        self.sample_interval = sample_interval
+        self._lock = threading.Lock()
+        self._open = {}
+        self._cpu_start = {}
+        self._local = threading.local()
+        self._stopped = threading.Event()
+        self._sampler = None
+        self.root = None
+
+    def _stack(self) -> list:
+        if not hasattr(self._local, 'stack'):
+            self._local.stack = []
+        return self._local.stack
+
+    def _begin(self, name: str, attributes: dict) -> Span:
+        stack = self._stack()
+        parent = stack[-1] if stack else self.root
+        rss = current_rss()
+        span = Span(name, os.urandom(8).hex(), parent.span_id if parent else '',
+                    parent.depth + 1 if parent else 0, time.time_ns(), rss_start=rss, rss_peak=rss,
+                    attributes=dict(attributes), thread=threading.current_thread().name)
+        with self._lock:
+            self.spans.append(span)
+            self._open[id(span)] = span
+            self._cpu_start[id(span)] = time.process_time()
+        stack.append(span)
+        return span
+
+    def _end(self, span: Span):
+        rss = current_rss()
+        span.end_ns = time.time_ns()
+        span.rss_end = rss
+        with self._lock:
+            span.rss_peak = max(span.rss_peak, rss)
+            span.cpu_seconds = time.process_time() - self._cpu_start.pop(id(span))
+            self._open.pop(id(span), None)
+        stack = self._stack()
+        if stack and stack[-1] is span:
+            stack.pop()
+
+    def _sample(self):
+        """后台采样RSS，更新所有未结束阶段的峰值"""
+        while not self._stopped.wait(self.sample_interval):
+            rss = current_rss()
+            with self._lock:
+                for span in self._open.values():
+                    span.rss_peak = max(span.rss_peak, rss)
+
+    def start(self):
+        self.root = self._begin(self.name, {'argv': ' '.join(sys.argv[1:])})
+        self._stack().pop()
+        self._sampler = threading.Thread(target=self._sample, name='profile-sampler', daemon=True)
+        self._sampler.start()
+
+    def stop(self):
+        self._stopped.set()
+        self._sampler.join()
+        self._end(self.root)
+
+    @contextlib.contextmanager
+    def stage(self, name: str, **attributes):
+        span = self._begin(name, attributes)
+        try:
+            yield span
+        finally:
+            self._end(span)
+
+    def ordered(self) -> list:
+        """按调用树深度优先、同层按开始时间排列的 span"""
+        children = {}
+        for span in self.spans:
+            children.setdefault(span.parent_id, []).append(span)
+        result = []
+
+        def walk(span):
+            result.append(span)
+            for child in sorted(children.get(span.span_id, []), key=lambda s: s.start_ns):
+                walk(child)
+        walk(self.root)
+        return result
+
+    def report(self, stream=None):
+        """阶段汇总表"""
+        stream = stream if stream is not None else sys.stderr
+        print(f"\n{'='*70}", file=stream)
+        print(f"阶段剖析: {self.name}", file=stream)
+        print(f"{'='*70}", file=stream)
+        print(f"  {'阶段':<28}{'耗时':>9}{'CPU':>9}{'峰值增量':>11}{'结束RSS':>10}{'行数':>13}", file=stream)
+        for span in self.ordered():
+            label = '  ' * span.depth + span.name
+            rows = f"{span.rows:,}" if span.rows is not None else ''
+            print(f"  {label:<30}{span.seconds:>8.3f}s{span.cpu_seconds:>8.3f}s"
+                  f"{span.peak_delta / 2**20:>+10.1f}MB{span.rss_end / 2**20:>8.0f}MB{rows:>13}", file=stream)
+
+    def to_otlp(self) -> dict:
+        """OTLP JSON（ExportTraceServiceRequest）格式"""
+        spans = []
+        for span in self.ordered():
+            attributes = {
+                'rca.cpu_seconds': span.cpu_seconds,
+                'rca.rss.start': span.rss_start,
+                'rca.rss.end': span.rss_end,
+                'rca.rss.peak': span.rss_peak,
+                'rca.rss.peak_delta': span.peak_delta,
+                'thread.name': span.thread,
+            }
+            if span.rows is not None:
+                attributes['rca.rows'] = span.rows
+            attributes.update({f"rca.{key}": value for key, value in span.attributes.items()})
+            record = {
+                'traceId': self.trace_id,
+                'spanId': span.span_id,
+                'name': span.name,
+                'kind': SPAN_KIND_INTERNAL,
+                'startTimeUnixNano': str(span.start_ns),
+                'endTimeUnixNano': str(span.end_ns),
+                'attributes': _otlp_attributes(attributes),
+            }
+            if span.parent_id:
+                record['parentSpanId'] = span.parent_id
+            spans.append(record)
+        resource_attributes = {'service.name': 'openrca', 'process.pid': os.getpid()}
+        return {'resourceSpans': [{
+            'resource': {'attributes': _otlp_attributes(resource_attributes)},
+            'scopeSpans': [{'scope': {'name': 'openrca.profiling'}, 'spans': spans}],
+        }]}
+
+    def write(self, path: str):
+        Path(path).write_text(json.dumps(self.to_otlp(), ensure_ascii=False, indent=2))
+
+
+def _otlp_attributes(attributes: dict) -> list:
+    """OTLP AnyValue：整数按规范编码为字符串"""
+    result = []
+    for key, value in attributes.items():
+        if value is None:
+            continue
+        if hasattr(value, 'item'):  # numpy 标量
+            value = value.item()
+        if isinstance(value, bool):
+            encoded = {'boolValue': value}
+        elif isinstance(value, int):
+            encoded = {'intValue': str(value)}
+        elif isinstance(value, float):
+            encoded = {'doubleValue': value}
+        else:
+            encoded = {'stringValue': str(value)}
+        result.append({'key': key, 'value': encoded})
+    return result
+
+
+# 当前启用的剖析器，库函数通过 stage() 记录阶段而不需要传递参数
+_active = None
+
+
+@contextlib.contextmanager
+def stage(name: str, **attributes):
+    """记录一个阶段；未启用剖析时不做任何事"""
+    profiler = _active
+    if profiler is None:
+        yield _NULL_SPAN
+        return
+    with profiler.stage(name, **attributes) as span:
+        yield span
+
+
+class _FunctionProfiler:
+    """--profile-dump：cProfile 或 pyinstrument"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.pyinstrument = Path(path).suffix.lower() in PYINSTRUMENT_SUFFIXES
+        if self.pyinstrument:
+            self.profiler = Pyinstrument()
+        else:
+            import cProfile
+            self.profiler = cProfile.Profile()
+
+    def start(self):
+        if self.pyinstrument:
+            self.profiler.start()
+        else:
+            self.profiler.enable()
+
+    def stop(self):
+        if self.pyinstrument:
+            self.profiler.stop()
+        else:
+            self.profiler.disable()
+
+    def save(self):
+        if not self.pyinstrument:
+            self.profiler.dump_stats(self.path)
+        elif Path(self.path).suffix.lower() == '.html':
+            Path(self.path).write_text(self.profiler.output_html())
+        else:
+            Path(self.path).write_text(self.profiler.output_text(unicode=True))
+
+
+def add_profile_arguments(parser):
+    """为分析脚本添加 --profile 和 --profile-dump 参数"""
+    parser.add_argument('--profile', type=str, nargs='?', const='', metavar='FILE',
+                        help='Print per-stage wall/CPU time, peak memory and rows to stderr; '
+                             'with FILE also write them as OTLP JSON spans')
+    parser.add_argument('--profile-dump', type=str, metavar='FILE',
+                        help='Also record a function-level profile: .html/.txt via pyinstrument, otherwise cProfile stats')
+
+
+def check_profile_arguments(parser, args):
+    """.html/.txt 的函数级剖析需要 pyinstrument"""
+    dump = getattr(args, 'profile_dump', None)
+    if dump and Path(dump).suffix.lower() in PYINSTRUMENT_SUFFIXES and Pyinstrument is None:
+        parser.error('--profile-dump .html/.txt requires pyinstrument (use .prof for cProfile)')
+
+
+@contextlib.contextmanager
+def profile_session(args, name: str):
+    """
+    按 --profile/--profile-dump 剖析整个脚本运行（--profile-dump 同时启用阶段剖析）
+
+    结束时（包括 sys.exit）输出汇总表并写出文件。
+    """
+    global _active
+    profile = getattr(args, 'profile', None)
+    dump = getattr(args, 'profile_dump', None)
+    if profile is None and not dump:
+        yield None
+        return
+    profiler = Profiler(name)
+    functions = _FunctionProfiler(dump) if dump else None
+    _active = profiler
+    profiler.start()
+    if functions:
+        functions.start()
+    try:
+        yield profiler
+    finally:
+        if functions:
+            functions.stop()
+        profiler.stop()
+        _active = None
+        sys.stdout.flush()
+        profiler.report(sys.stderr)
+        if profile:
+            profiler.write(profile)
+            print(f"阶段剖析已保存到: {profile}", file=sys.stderr)
+        if functions:
+            functions.save()
+            print(f"函数级剖析已保存到: {dump}", file=sys.stderr)
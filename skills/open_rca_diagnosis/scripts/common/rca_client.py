@@ -0,0 +1,136 @@
+"""
+RCA Server Client for OpenRCA
+常驻服务客户端 - 分析脚本的 --server 转发逻辑
+
+本模块只依赖标准库，分析脚本在导入 pandas 之前调用 forward_early()，
+服务可用时整个调用在毫秒级完成；服务不可用时退回本地执行。
+"""
+
+import argparse
+import io
+import json
+import os
+import socket
+import sys
+import tempfile
+from pathlib import Path
+
+# 本进程是否已尝试过转发（失败后不再重复尝试）
+_attempted = False
+
+
+def default_socket() -> str:
+    """默认的Unix socket路径，可通过 OPENRCA_SERVER 覆盖"""
+    return os.environ.get('OPENRCA_SERVER') or str(Path(tempfile.gettempdir()) / f"openrca-{os.getuid()}.sock")
+
+
+def send_request(socket_path: str, request: dict, timeout: float | None = None) -> dict:
+    """发送一个JSON请求并读取完整响应"""
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(timeout)
+        sock.connect(socket_path)
+        sock.sendall(json.dumps(request).encode() + b'\n')
+        sock.shutdown(socket.SHUT_WR)
+        chunks = []
+        while True:
+            data = sock.recv(1 << 20)
+            if not data:
+                break
+            chunks.append(data)
+    return json.loads(b''.join(chunks))
+
+
+def split_server_args(argv: list):
+    """
+    从命令行中取出 --server [SOCKET]，返回 (socket路径或None, 其余参数)
+
+    --server 后面紧跟的非选项参数视为socket路径。
+    """
+    socket_path = None
+    rest = []
+    skip = False
+    for i, arg in enumerate(argv):
+        if skip:
+            skip = False
+            continue
+        if arg == '--server':
+            if i + 1 < len(argv) and not argv[i + 1].startswith('-'):
+                socket_path = argv[i + 1]
+                skip = True
+            else:
+                socket_path = default_socket()
+            continue
+        if arg.startswith('--server='):
+            socket_path = arg.split('=', 1)[1] or default_socket()
+            continue
+        rest.append(arg)
+    return socket_path, rest
+
+
+def binary_output(argv: list) -> bool:
+    """--format arrow 输出二进制流，无法通过JSON响应回放"""
+    for i, arg in enumerate(argv):
+        if arg == '--format=arrow' or (arg == '--format' and argv[i + 1:i + 2] == ['arrow']):
+            return True
+    return False
+
+
+def follow_mode(argv: list) -> bool:
+    """--follow 不会结束，在单线程的常驻服务中运行会阻塞之后的所有请求（也接受 argparse 的前缀缩写）"""
+    return any(arg.startswith('--fol') and '--follow'.startswith(arg) for arg in argv)
+
+
+def run_on_server(socket_path: str, script: str, argv: list):
+    """
+    把脚本调用转发给常驻服务并回放其输出，返回退出码
+
+    服务不可用时返回 None，调用方应退回本地执行。
+    """
+    global _attempted
+    _attempted = True
+    if binary_output(argv):
+        print("--format arrow 不经过常驻服务，改为本地执行", file=sys.stderr)
+        return None
+    if follow_mode(argv):
+        print("--follow 不经过常驻服务，改为本地执行", file=sys.stderr)
+        return None
+    request = {'script': script, 'argv': argv, 'cwd': os.getcwd()}
+    if '-' in argv:
+        # 参数中的 '-' 表示从stdin读取，需要把stdin内容一并发送
+        request['stdin'] = sys.stdin.read()
+    try:
+        response = send_request(socket_path, request)
+    except (OSError, ValueError) as e:
+        print(f"常驻服务不可用（{e}），改为本地执行", file=sys.stderr)
+        if 'stdin' in request:
+            sys.stdin = io.StringIO(request['stdin'])
+        return None
+    sys.stdout.write(response.get('stdout', ''))
+    sys.stderr.write(response.get('stderr', ''))
+    return response.get('exit_code', 0)
+
+
+def forward_early(script: str):
+    """在脚本导入重量级依赖之前检查 --server，转发成功则直接退出"""
+    socket_path, rest = split_server_args(sys.argv[1:])
+    if socket_path is None or '-h' in rest or '--help' in rest:
+        return
+    code = run_on_server(socket_path, script, rest)
+    if code is not None:
+        sys.exit(code)
+
+
+def forward_if_requested(args, script: str, argv) -> None:
+    """以函数方式调用 main(argv) 时的转发入口，已在 forward_early 中尝试过则跳过"""
+    if not getattr(args, 'server', None) or _attempted:
+        return
+    _, rest = split_server_args(sys.argv[1:] if argv is None else list(argv))
+    code = run_on_server(args.server, script, rest)
+    if code is not None:
+        sys.exit(code)
+
+
+def add_server_argument(parser: argparse.ArgumentParser):
+    """为分析脚本添加 --server [SOCKET] 参数"""
+    parser.add_argument('--server', type=str, nargs='?', const=default_socket(),
+                        help='Run on the resident RCA server if available (optional socket path)')
@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+"""
+RCA Query Server for OpenRCA
+常驻遥测查询服务 - 一次加载数据到内存，以毫秒级响应分析脚本的调用
+
+服务进程预先导入 pandas 和各分析脚本，并把遥测目录加载到按内存上限淘汰的LRU中。
+各分析脚本加上 --server 参数后会把命令行转发给服务执行，输出与本地执行一致；
+服务未启动时自动退回本地执行。
+
+Usage:
+    # 启动服务并预加载一天的数据
+    python rca_server.py --serve --data-dir cloudbed-1/telemetry/2022_03_20 --memory 8G &
+
+    # 通过服务执行分析脚本
+    python scripts/market/analyze_trace.py --server --file trace_span.csv --errors-by-component
+
+    python rca_server.py --status
+    python rca_server.py --stop
+"""
+
+import argparse
+import contextlib
+import importlib
+import io
+import json
+import os
+import socketserver
+import sys
+import threading
+import time
+import traceback
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from common.rca_client import default_socket, follow_mode, send_request
+from common.telemetry_cache import DATA_ERRORS, load_telemetry, memory_stats, parse_size, set_memory_budget
+
+# 可由服务执行的脚本：名称 -> 模块
+SCRIPTS = {
+    'analyze_metric': 'market.analyze_metric',
+    'analyze_container': 'market.analyze_container',
+    'analyze_trace': 'market.analyze_trace',
+    'analyze_log': 'market.analyze_log',
+    'analyze_correlation': 'market.analyze_correlation',
+    'analyze_kpi': 'market.analyze_kpi',
+    'bank_analyze_metric': 'bank.analyze_metric',
+    'bank_analyze_container': 'bank.analyze_container',
+    'bank_analyze_trace': 'bank.analyze_trace',
+    'telecom_analyze_metric': 'telecom.analyze_metric',
+    'telecom_analyze_kpi': 'telecom.analyze_kpi',
+    'telecom_analyze_trace': 'telecom.analyze_trace',
+    'explore_data': 'common.explore_data',
+}
+
+DEFAULT_MEMORY = '4G'
+
+
+@contextlib.contextmanager
+def _redirect_stdin(text: str):
+    old = sys.stdin
+    sys.stdin = io.StringIO(text)
+    try:
+        yield
+    finally:
+        sys.stdin = old
+
+
+def _run_script(script: str, argv: list, cwd: str, stdin: str = '') -> dict:
+    """在服务进程内执行脚本的 main(argv)，捕获输出"""
+    if script not in SCRIPTS:
+        return {'exit_code': 2, 'stdout': '', 'stderr': f"未知脚本: {script}\n"}
+    if follow_mode(argv):
+        return {'exit_code': 2, 'stdout': '', 'stderr': "--follow 不能在常驻服务中运行，请在本地执行\n"}
+
+    stdout, stderr = io.StringIO(), io.StringIO()
+    exit_code = 0
+    old_cwd = os.getcwd()
+    started = time.perf_counter()
+    try:
+        os.chdir(cwd)
+        module = importlib.import_module(SCRIPTS[script])
+        with contextlib.redirect_stdout(stdout), contextlib.redirect_stderr(stderr), _redirect_stdin(stdin):
+            try:
+                module.main(argv)
+            except SystemExit as e:
+                if isinstance(e.code, int):
+                    exit_code = e.code
+                elif e.code is not None:
+                    print(e.code, file=sys.stderr)
+                    exit_code = 1
+            except DATA_ERRORS:
+                traceback.print_exc()
+                exit_code = 1
+    finally:
+        os.chdir(old_cwd)
+    return {
+        'exit_code': exit_code,
+        'stdout': stdout.getvalue(),
+        'stderr': stderr.getvalue(),
+        'elapsed_ms': (time.perf_counter() - started) * 1000,
+    }
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        try:
+            request = json.loads(self.rfile.read())
+        except ValueError as e:
+            response = {'exit_code': 2, 'stdout': '', 'stderr': f"请求格式错误: {e}\n"}
+        else:
+            command = request.get('command')
+            if command == 'status':
+                response = {'pid': os.getpid(), 'uptime': time.time() - self.server.started, **memory_stats()}
+            elif command == 'stop':
+                response = {'stopping': True}
+                # shutdown() 会等待服务循环退出，必须在其他线程中调用
+                threading.Thread(target=self.server.shutdown, daemon=True).start()
+            else:
+                try:
+                    response = _run_script(request.get('script'), request.get('argv', []), request.get('cwd', '.'),
+                                           request.get('stdin', ''))
+                except Exception:
+                    # 脚本中的程序错误：traceback 返回给调用方，异常交给 socketserver 记入服务日志后继续服务
+                    self._respond({'exit_code': 1, 'stdout': '', 'stderr': traceback.format_exc()})
+                    raise
+        self._respond(response)
+
+    def _respond(self, response: dict):
+        self.wfile.write(json.dumps(response, ensure_ascii=False).encode())
+
+
+class RCAServer(socketserver.UnixStreamServer):
+    """单线程串行处理请求：脚本通过重定向 stdout 输出，不能并发执行"""
+
+    def __init__(self, socket_path: str):
+        self.started = time.time()
+        super().__init__(socket_path, _Handler)
+
+
+def preload(data_dir: str):
+    """把目录下的遥测CSV加载到进程内LRU"""
+    for path in sorted(Path(data_dir).rglob('*.csv')):
+        started = time.perf_counter()
+        try:
+            df = load_telemetry(str(path))
+        except DATA_ERRORS as e:
+            print(f"  跳过 {path}: {e}", file=sys.stderr)
+            continue
+        print(f"  {path.relative_to(data_dir)}: {len(df):,} 行, {time.perf_counter() - started:.1f}s", file=sys.stderr)
+
+
+def serve(socket_path: str, data_dir: str | None = None, memory: str = DEFAULT_MEMORY):
+    """启动常驻服务"""
+    if os.path.exists(socket_path):
+        try:
+            send_request(socket_path, {'command': 'status'}, timeout=1)
+        except OSError:
+            os.unlink(socket_path)  # 残留的socket文件
+        else:
+            print(f"错误: 服务已在运行 {socket_path}")
+            sys.exit(1)
+
+    set_memory_budget(parse_size(memory))
+    for module in SCRIPTS.values():
+        importlib.import_module(module)
+
+    if data_dir:
+        print(f"预加载数据: {data_dir}", file=sys.stderr)
+        preload(data_dir)
+
+    server = RCAServer(socket_path)
+    print(f"RCA服务已启动: {socket_path} (内存上限 {memory})", file=sys.stderr)
+    try:
+        server.serve_forever(poll_interval=0.2)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='RCA Query Server for OpenRCA')
+    parser.add_argument('--serve', action='store_true', help='Start the server in the foreground')
+    parser.add_argument('--status', action='store_true', help='Show server status')
+    parser.add_argument('--stop', action='store_true', help='Stop the server')
+    parser.add_argument('--socket', type=str, default=default_socket(), help='Unix socket path')
+    parser.add_argument('--data-dir', type=str, help='Telemetry directory to preload (e.g. cloudbed-1/telemetry/2022_03_20)')
+    parser.add_argument('--memory', type=str, default=DEFAULT_MEMORY, help='Memory budget for resident data (e.g. 8G)')
+
+    args = parser.parse_args()
+
+    if args.serve:
+        if args.data_dir and not Path(args.data_dir).is_dir():
+            print(f"错误: 目录不存在 {args.data_dir}")
+            sys.exit(1)
+        serve(args.socket, args.data_dir, args.memory)
+    elif args.status or args.stop:
+        try:
+            response = send_request(args.socket, {'command': 'stop' if args.stop else 'status'}, timeout=5)
+        except OSError:
+            print(f"服务未运行: {args.socket}")
+            sys.exit(1)
+        if args.stop:
+            print(f"已停止服务: {args.socket}")
+        else:
+            print(f"服务进程: {response['pid']}, 运行时间: {response['uptime']:.0f}s")
+            print(f"内存使用: {response['used'] / 1024 / 1024:.1f} MB / {response['budget'] / 1024 / 1024:.0f} MB")
+            for item in response['files']:
+                print(f"  {item['file']}: {item['rows']:,} 行, {item['bytes'] / 1024 / 1024:.1f} MB")
+    else:
+        parser.print_help()
+
+
+if __name__ == '__main__':
+    main()
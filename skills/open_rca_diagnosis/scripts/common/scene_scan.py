@@ -0,0 +1,200 @@
+"""
+Scene Window Analysis for OpenRCA
+场景窗口分析 - bank/telecom 分析脚本共用的单遍扫描、异常检测和报告
+
+各场景脚本只需给出读取的列、把一块数据转换为 timestamp,component,kpi,value 长表的函数、
+每个KPI的判定方向和KPI -> (资源类型, 候选原因) 的分类；读取始终按块进行
+（common.chunked.scan_window），内存由 --max-memory 控制，与文件大小无关。
+
+    from common.scene_scan import add_scene_arguments, run_scene
+    add_scene_arguments(parser, 'Container metric file (metric_container.csv)')
+    run_scene(parser, args, '容器层资源指标分析报告', COLUMNS, to_long, rules=RULES, classify=classify_kpi)
+"""
+
+import sys
+from datetime import datetime
+from pathlib import Path
+
+import pandas as pd
+
+from common.chunked import scan_window, window_deviations
+from common.output import structured_output
+from common.profiling import stage
+from common.telemetry_cache import parse_size
+from common.time_utils import file_time_unit, format_timestamp, parse_time, window_bounds, zone
+
+DEFAULT_MAX_MEMORY = '512M'
+DEFAULT_TOP = 15
+
+
+def component_filter_of(pattern: str):
+    """返回按组件名过滤长表的函数（大小写不敏感的正则，只在唯一值上匹配）"""
+    def apply(long: pd.DataFrame) -> pd.DataFrame:
+        ids = pd.Series(long['component'].dropna().unique())
+        matched = ids[ids.astype(str).str.contains(pattern, case=False, na=False)]
+        return long[long['component'].isin(matched)]
+    return apply
+
+
+def scene_window_result(file_path: str, columns: list, to_long, start_ts: int, end_ts: int, rules: dict | None = None,
+                        min_deviation: float = 0.0, baseline: str = 'kpi', max_memory: int | None = None,
+                        component_filter: str | None = None, classify=None) -> dict:
+    """
+    单窗口分析的结构化结果：数据概况、阈值、窗口内数据量和越过阈值的序列
+
+    start_ts/end_ts 为秒级，按文件自身的时间单位换算；classify 为 KPI -> (资源类型, 候选原因)。
+    """
+    unit = file_time_unit(file_path) or 's'
+    lo, hi = window_bounds(start_ts, end_ts, unit)
+    convert = to_long
+    if component_filter:
+        keep = component_filter_of(component_filter)
+        convert = lambda chunk: keep(to_long(chunk))
+
+    with stage('scan', file=file_path, chunked=True) as span:
+        scan = scan_window(file_path, columns, convert, lo, hi, max_memory=max_memory, baseline=baseline)
+        span.rows = scan['rows']
+    with stage('detect') as span:
+        anomalies = window_deviations(scan, rules, min_deviation)
+        if classify is not None:
+            labels = [classify(kpi) for kpi in anomalies['kpi']]
+            anomalies.insert(2, 'resource_type', [label[0] for label in labels])
+            anomalies['reason'] = [label[1] for label in labels]
+        span.rows = int(scan['window']['count'].sum())
+        span.set(anomalies=len(anomalies))
+    day = scan['day']
+    return {
+        'rows': scan['rows'],
+        'unit': unit,
+        'time_range': scan['time_range'],
+        'baseline': baseline,
+        'series': len(day),
+        'components': day['component'].nunique(),
+        'kpis': day['kpi'].nunique(),
+        'window_rows': int(scan['window']['count'].sum()),
+        'thresholds': scan['thresholds'],
+        'anomalies': anomalies,
+    }
+
+
+def report_scene_window(result: dict, title: str, file_path: str, start_ts: int, end_ts: int,
+                        component_filter: str | None = None, max_memory: int | None = None, top: int = DEFAULT_TOP):
+    """文本报告：扫描概况、窗口数据量、阈值、异常序列和结论"""
+    tz = zone()
+    unit = result['unit']
+    anomalies = result['anomalies']
+    with stage('report'):
+        print(f"{'='*70}")
+        print(title)
+        print(f"{'='*70}")
+        print(f"数据文件: {file_path}")
+        print(f"总数据量: {result['rows']} 条")
+        print(f"时间范围: {format_timestamp(start_ts, tz, 's')} ~ {format_timestamp(end_ts, tz, 's')}")
+        print(f"分析时间: {datetime.now(tz).strftime('%Y-%m-%d %H:%M:%S')}")
+        if max_memory:
+            print(f"读取模式: 分块扫描（内存上限 {max_memory / 1024 / 1024:.0f} MB，阈值为 t-digest 近似值）")
+        if component_filter:
+            print(f"组件过滤: {component_filter}")
+
+        print(f"\n{'#'*70}")
+        print("# 第一步：统计组件和KPI")
+        print(f"{'#'*70}")
+        first, last = result['time_range']
+        if first is not None:
+            print(f"数据时间: {format_timestamp(first, tz, unit)} ~ {format_timestamp(last, tz, unit)}")
+        print(f"组件数量: {result['components']}, KPI数量: {result['kpis']}, 序列数量: {result['series']}")
+
+        print(f"\n{'#'*70}")
+        print("# 第二步：过滤故障时间窗口")
+        print(f"{'#'*70}")
+        print(f"时间窗口内数据: {result['window_rows']} 条")
+        if result['window_rows'] == 0:
+            print("警告: 指定时间范围内无数据！")
+            return
+
+        print(f"\n{'#'*70}")
+        print("# 第三步：计算全局阈值")
+        print(f"{'#'*70}")
+        scope = '每个KPI（跨组件）' if result['baseline'] == 'kpi' else '每个组件的每个KPI'
+        print(f"按{scope}计算了 {len(result['thresholds'])} 组阈值（P5/P50/P95）")
+
+        print(f"\n{'#'*70}")
+        print("# 第四步：检测异常")
+        print(f"{'#'*70}")
+        if len(anomalies) == 0:
+            print("未检测到明显的异常")
+        else:
+            print(f"\n检测到 {len(anomalies)} 个异常：\n")
+            for i, a in enumerate(anomalies.head(top).to_dict('records'), 1):
+                label = f" {a['resource_type']}" if 'resource_type' in a else ''
+                print(f"{i}. [{a['component']}]{label}")
+                print(f"   KPI: {a['kpi']}")
+                print(f"   均值={a['value']:.2f}, 阈值={a['threshold']:.2f} ({a['type']}), "
+                      f"最小={a['min']:.2f}, 最大={a['max']:.2f}")
+                print(f"   偏离程度: {a['deviation']*100:.1f}%")
+                print()
+
+        print(f"{'#'*70}")
+        print("# 第五步：结论与建议")
+        print(f"{'#'*70}")
+        if len(anomalies):
+            counts = anomalies.groupby('component', sort=False).size().sort_values(ascending=False, kind='stable')
+            print("\n异常组件分布:")
+            for component, count in counts.head(5).items():
+                print(f"  {component}: {count} 个异常KPI")
+            first_hit = anomalies.iloc[0]
+            print(f"\n最显著异常: {first_hit['component']}")
+            print(f"KPI: {first_hit['kpi']}")
+            print(f"偏离阈值: {first_hit['deviation']*100:.1f}%")
+            if pd.notna(first_hit.get('reason')):
+                print(f"可能原因: {first_hit['reason']}")
+        else:
+            print("\n建议: 检查其他层的指标或链路追踪")
+
+
+def emit_scene_window(out, result: dict, file_path: str, start_ts: int, end_ts: int, component_filter: str | None = None):
+    """--format json|arrow：概要、异常序列及其阈值"""
+    anomalies = result['anomalies']
+    with stage('report', format=out.fmt):
+        out.record('summary', file=file_path, rows=result['rows'], start=start_ts, end=end_ts,
+                   component=component_filter, baseline=result['baseline'], components=result['components'],
+                   kpis=result['kpis'], series=result['series'], window_rows=result['window_rows'],
+                   thresholds=len(result['thresholds']), anomalies=len(anomalies))
+        out.table('anomalies', anomalies)
+        if len(anomalies):
+            keys = anomalies['kpi'] if result['baseline'] == 'kpi' else anomalies[['component', 'kpi']]
+            index = list(dict.fromkeys(keys)) if result['baseline'] == 'kpi' \
+                else list(dict.fromkeys(map(tuple, keys.to_numpy())))
+            out.table('thresholds', result['thresholds'].loc[index].reset_index())
+
+
+def add_scene_arguments(parser, file_help: str, baseline: str = 'kpi', min_deviation: float = 0.0):
+    """bank/telecom 分析脚本的公共参数"""
+    parser.add_argument('--file', type=str, required=True, help=file_help)
+    parser.add_argument('--start', type=str, required=True, help='Start time (YYYY-MM-DD HH:MM:SS or epoch seconds)')
+    parser.add_argument('--end', type=str, required=True, help='End time (YYYY-MM-DD HH:MM:SS or epoch seconds)')
+    parser.add_argument('--component', type=str, help='Filter by component name (case-insensitive regex)')
+    parser.add_argument('--baseline', choices=['kpi', 'series'], default=baseline,
+                        help='Thresholds per KPI across components, or per component and KPI')
+    parser.add_argument('--min-deviation', type=float, default=min_deviation,
+                        help='Report series whose window mean passes the threshold by more than this fraction')
+    parser.add_argument('--max-memory', type=str, default=DEFAULT_MAX_MEMORY,
+                        help='Memory ceiling for the chunked scan, e.g. 512M')
+    parser.add_argument('--top', type=int, default=DEFAULT_TOP, help='Anomalies shown in the text report')
+
+
+def run_scene(parser, args, title: str, columns: list, to_long, rules: dict | None = None, classify=None):
+    """按参数执行单窗口分析，输出文本报告或结构化结果"""
+    if not Path(args.file).exists():
+        print(f"错误: 文件不存在 {args.file}")
+        sys.exit(1)
+    tz = zone()
+    start_ts, end_ts = parse_time(args.start, tz), parse_time(args.end, tz)
+    max_memory = parse_size(args.max_memory)
+    result = scene_window_result(args.file, columns, to_long, start_ts, end_ts, rules, args.min_deviation,
+                                 args.baseline, max_memory, args.component, classify)
+    if args.format != 'text':
+        with structured_output(args.format, args.max_rows) as out:
+            emit_scene_window(out, result, args.file, start_ts, end_ts, args.component)
+        return
+    report_scene_window(result, title, args.file, start_ts, end_ts, args.component, max_memory, args.top)
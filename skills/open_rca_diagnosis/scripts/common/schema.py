@@ -0,0 +1,139 @@
+"""
+Telemetry Schema Registry for OpenRCA
+数据模式注册表 - 从 specs/*_spec.md 的字段表解析每个数据文件的列类型，给出紧凑的读取类型
+
+规格文档中每个 "### N. 标题 (文件名.csv)" 之后的 字段名/类型 表格即为该文件的模式。
+表格其余列（单位、描述）保留为说明，时间列的单位（秒/毫秒）由说明得出。
+同名文件在不同场景中字段不同（如 metric_container.csv），按 文件名 + 表头 匹配。
+
+类型映射：
+    int     时间列为 int64，其余为可空的 Int32
+    float   float64（内存受限模式下为 float32）
+    string  低基数字段（组件、KPI、服务名等）为 category；ID 和日志内容保持字符串
+
+    from common.schema import schema_dtypes
+    dtypes = schema_dtypes('metric_container.csv', header)   # 未登记的文件返回 None
+"""
+
+import re
+from functools import cache
+from pathlib import Path
+
+import pandas as pd
+
+SPECS_DIR = Path(__file__).resolve().parent.parent.parent / 'specs'
+
+TIME_COLUMNS = {'timestamp', 'startTime'}
+
+# 取值几乎各不相同的字符串字段，转为 category 反而更占内存
+HIGH_CARDINALITY_COLUMNS = {
+    'span_id', 'trace_id', 'parent_span', 'parent_id', 'log_id', 'id', 'pid', 'traceId', 'value',
+}
+
+_HEADING = re.compile(r'^###\s+.*\(([\w.]+\.csv)\)\s*$')
+
+
+def parse_spec(text: str) -> dict:
+    """解析一个规格文档，返回 {文件名: [(字段名, 类型, 说明), ...]}（同名文件只取第一张表）"""
+    schemas = {}
+    current = None
+    fields = None
+    for line in text.splitlines() + ['']:
+        line = line.strip()
+        if line.startswith('|') and current is not None:
+            cells = [cell.strip() for cell in line.strip('|').split('|')]
+            if fields is None:
+                fields = [] if cells[:2] == ['字段名', '类型'] else None
+                if fields is None:
+                    current = None
+            elif not set(cells[0]) <= set('-: '):
+                fields.append((cells[0], cells[1], ' '.join(cells[2:])))
+            continue
+        if fields:
+            schemas.setdefault(current, fields)
+            current = None
+        fields = None
+        heading = _HEADING.match(line)
+        if heading:
+            current = heading.group(1)
+        elif line.startswith('#'):
+            current = None
+    return schemas
+
+
+@cache
+def load_registry(specs_dir: str = str(SPECS_DIR)) -> dict:
+    """{场景: {文件名: [(字段名, 类型, 说明), ...]}}，规格目录不存在时为空"""
+    registry = {}
+    for spec in sorted(Path(specs_dir).glob('*_spec.md')):
+        registry[spec.stem[:-len('_spec')]] = parse_spec(spec.read_text(encoding='utf-8'))
+    return registry
+
+
+def find_schema(file_name: str, header: list):
+    """
+    按文件名和表头查找模式，返回 (场景, 字段列表) 或 None
+
+    字段集合必须与表头一致；文件名不匹配（如被重命名）时退而按字段集合在所有模式中查找。
+    """
+    columns = set(header)
+    registry = load_registry()
+    candidates = [(scene, fields) for scene, files in registry.items()
+                  for name, fields in files.items() if name == file_name]
+    candidates += [(scene, fields) for scene, files in registry.items()
+                   for name, fields in files.items() if name != file_name]
+    for scene, fields in candidates:
+        if {field[0] for field in fields} == columns:
+            return scene, fields
+    return None
+
+
+def field_dtype(name: str, spec_type: str, float32: bool = False) -> str:
+    """把规格中的类型映射为 pandas 读取类型"""
+    spec_type = spec_type.lower()
+    if spec_type == 'int':
+        return 'int64' if name in TIME_COLUMNS else 'Int32'
+    if spec_type == 'float':
+        return 'float32' if float32 else 'float64'
+    return 'str' if name in HIGH_CARDINALITY_COLUMNS else 'category'
+
+
+def schema_dtypes(file_name: str, header: list, float32: bool = False):
+    """已登记文件的 {列: 读取类型}，未登记时返回 None"""
+    found = find_schema(file_name, header)
+    if found is None:
+        return None
+    types = {name: spec_type for name, spec_type, _ in found[1]}
+    return {col: field_dtype(col, types[col], float32) for col in header}
+
+
+def schema_time_unit(file_name: str, header: list):
+    """已登记文件时间列的单位（'s' 或 'ms'），未登记或规格未注明时返回 None"""
+    found = find_schema(file_name, header)
+    if found is None:
+        return None
+    for name, _, note in found[1]:
+        if name in TIME_COLUMNS:
+            return 'ms' if '毫秒' in note else 's' if '秒' in note else None
+    return None
+
+
+def conform_frame(df: pd.DataFrame, dtypes: dict) -> pd.DataFrame:
+    """
+    统一读取结果的类型：分块读取或Parquet读取后 category 列的类别集合可能各不相同，
+    这里去掉未出现的类别并按字典序排列，使排序和分组结果与字符串列一致
+    """
+    for col in df.columns:
+        dtype = dtypes.get(col)
+        if dtype is None:
+            continue
+        if dtype == 'category':
+            series = df[col] if isinstance(df[col].dtype, pd.CategoricalDtype) else df[col].astype('category')
+            series = series.cat.remove_unused_categories()
+            categories = series.cat.categories
+            if not categories.is_monotonic_increasing:
+                series = series.cat.reorder_categories(categories.sort_values())
+            df[col] = series
+        elif dtype != 'str' and str(df[col].dtype) != dtype:
+            df[col] = df[col].astype(dtype)
+    return df
@@ -0,0 +1,311 @@
+#!/usr/bin/env python3
+"""
+Series Matrix Store for OpenRCA
+长表指标矩阵存储 - 把 timestamp,cmdb_id,kpi_name,value 长表转换为 (序列 × 时间网格) 的 float32 稠密矩阵
+
+metric_container/node/mesh/runtime 都是长表，每次分析都要在数千万行上做布尔掩码。
+转换一次后，矩阵保存为 .npy 并以内存映射方式打开（零拷贝），序列字典为两个定长字符串
+.npy（cmdb_id、kpi_name，按首次出现顺序）。之后：
+
+    - 时间窗口 = 列切片（网格是等间隔的，窗口边界直接换算为列号）
+    - 窗口均值/最大值/点数 = 沿时间轴的归约
+    - KPI阈值 = 同一KPI的全部行展平后求分位数
+
+网格步长默认取文件中相邻不同时间戳之差的众数（market 为60秒），时间戳向下取整到所在的桶；
+同一序列落在同一个桶的多个点取均值（元数据中记录合并的点数）。缺失为 NaN。
+存储与列式缓存并列（common.telemetry_cache.sidecar_path），源文件变化时自动重建。
+
+Usage:
+    python series_store.py --build metric_node.csv
+    python series_store.py --info metric_container.csv
+
+    from common.series_store import open_matrix, kpi_thresholds, window_anomalies
+    matrix = open_matrix('metric_node.csv')
+    thresholds = kpi_thresholds(matrix)
+    anomalies = window_anomalies(matrix, thresholds, 1647738000, 1647739800)
+"""
+
+import argparse
+import json
+import shutil
+import sys
+import warnings
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from common.output import notice
+from common.telemetry_cache import (
+    load_telemetry,
+    read_header,
+    sidecar_path,
+    source_stat,
+    time_column,
+    write_sidecar_dir,
+)
+from common.time_utils import unit_scale
+
+STORE_VERSION = 1
+
+LONG_COLUMNS = ['timestamp', 'cmdb_id', 'kpi_name', 'value']
+
+# 矩阵大小上限（字节），超过时需要更大的 --step
+MAX_MATRIX_BYTES = 4 * 1024 ** 3
+
+
+class SeriesMatrix:
+    """
+    内存映射的 (序列 × 时间网格) 矩阵
+
+    values[i, j] 为序列 i 在 [t0 + j*step, t0 + (j+1)*step) 内的均值，缺失为 NaN；
+    时间戳使用文件自身的单位。cmdb_id/kpi_name 为每行序列的标识。
+    """
+
+    def __init__(self, directory: Path, meta: dict):
+        self.directory = directory
+        self.meta = meta
+        self.values = np.load(directory / 'values.npy', mmap_mode='r')
+        self.cmdb_id = np.load(directory / 'cmdb_id.npy', mmap_mode='r')
+        self.kpi_name = np.load(directory / 'kpi_name.npy', mmap_mode='r')
+        self.t0 = meta['t0']
+        self.step = meta['step']
+
+    def __len__(self):
+        return self.values.shape[0]
+
+    @property
+    def n_bins(self) -> int:
+        return self.values.shape[1]
+
+    @property
+    def times(self) -> np.ndarray:
+        """每列的起始时间戳"""
+        return self.t0 + self.step * np.arange(self.n_bins, dtype=np.int64)
+
+    @property
+    def series(self) -> pd.DataFrame:
+        return pd.DataFrame({'cmdb_id': np.asarray(self.cmdb_id).astype(object),
+                             'kpi_name': np.asarray(self.kpi_name).astype(object)})
+
+    def columns(self, start_ts=None, end_ts=None) -> slice:
+        """与闭区间 [start_ts, end_ts] 相交的列"""
+        lo = 0 if start_ts is None else max(0, -(-(int(start_ts) - self.t0 - self.step + 1) // self.step))
+        hi = self.n_bins if end_ts is None else min(self.n_bins, (int(end_ts) - self.t0) // self.step + 1)
+        return slice(lo, max(lo, hi))
+
+    def rows(self, component_filter: str | None = None, kpi_filter: str | None = None) -> np.ndarray:
+        """按组件名/KPI名过滤（大小写不敏感的正则）的行号"""
+        mask = np.ones(len(self), dtype=bool)
+        if component_filter:
+            mask &= self.series['cmdb_id'].str.contains(component_filter, case=False, na=False).to_numpy()
+        if kpi_filter:
+            mask &= self.series['kpi_name'].str.contains(kpi_filter, case=False, na=False).to_numpy()
+        return np.flatnonzero(mask)
+
+
+def matrix_dir(file_path: str) -> Path:
+    return sidecar_path(file_path, 'matrix')
+
+
+def _read_meta(directory: Path):
+    try:
+        return json.loads((directory / '_meta.json').read_text())
+    except (OSError, ValueError):
+        return None
+
+
+def _is_fresh(meta, path: Path, step) -> bool:
+    return (
+        meta is not None
+        and meta.get('version') == STORE_VERSION
+        and meta.get('source') == source_stat(path)
+        and (step is None or meta.get('step') == step)
+    )
+
+
+def detect_step(ts: np.ndarray) -> int:
+    """相邻不同时间戳之差的众数，只有一个时间戳时为1"""
+    unique = np.unique(ts)
+    if len(unique) < 2:
+        return 1
+    diffs, counts = np.unique(np.diff(unique), return_counts=True)
+    return int(diffs[np.argmax(counts)])
+
+
+def build_matrix(file_path: str, step: int | None = None, use_cache: bool = True) -> tuple:
+    """读取长表并写出矩阵和序列字典，返回 (矩阵目录, 元数据)；step 使用文件自身的时间单位"""
+    path = Path(file_path).resolve()
+    header = read_header(path)
+    if time_column(header) != 'timestamp' or not set(LONG_COLUMNS) <= set(header):
+        raise ValueError(f"不是 timestamp,cmdb_id,kpi_name,value 长表: {file_path}")
+
+    directory = matrix_dir(file_path)
+    notice(f"构建指标矩阵: {path.name} -> {directory}")
+
+    source = source_stat(path)
+    df = load_telemetry(file_path, columns=LONG_COLUMNS, use_cache=use_cache)
+    df = df[df['value'].notna() & df['cmdb_id'].notna() & df['kpi_name'].notna()]
+    ts = df['timestamp'].to_numpy(dtype=np.int64)
+    values = df['value'].to_numpy(dtype=np.float64, na_value=np.nan)
+
+    step = int(step or detect_step(ts))
+    t0 = int(ts.min() // step * step) if len(ts) else 0
+    n_bins = int((ts.max() - t0) // step) + 1 if len(ts) else 0
+
+    # 序列按首次出现顺序编号
+    codes = df.groupby(['cmdb_id', 'kpi_name'], sort=False, observed=True).ngroup().to_numpy(dtype=np.int64)
+    keys = df[['cmdb_id', 'kpi_name']].iloc[np.unique(codes, return_index=True)[1]]
+    n_series = len(keys)
+    if n_series * n_bins * 4 > MAX_MATRIX_BYTES:
+        raise ValueError(f"矩阵过大 ({n_series} 个序列 × {n_bins} 个桶)，请使用更大的步长")
+
+    cell = codes * n_bins + (ts - t0) // step
+    size = n_series * n_bins
+    counts = np.bincount(cell, minlength=size)
+    sums = np.bincount(cell, weights=values, minlength=size)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        matrix = (sums / counts).astype(np.float32).reshape(n_series, n_bins)
+
+    meta = {
+        'version': STORE_VERSION,
+        'source': source,
+        'unit_scale': unit_scale(ts.max()) if len(ts) else 1,
+        't0': t0,
+        'step': step,
+        'series': n_series,
+        'bins': n_bins,
+        'rows': len(df),
+        'merged': int(len(df) - np.count_nonzero(counts)),
+    }
+
+    def write(out: Path):
+        np.save(out / 'values.npy', matrix)
+        np.save(out / 'cmdb_id.npy', keys['cmdb_id'].astype(str).to_numpy(dtype='U'))
+        np.save(out / 'kpi_name.npy', keys['kpi_name'].astype(str).to_numpy(dtype='U'))
+        (out / '_meta.json').write_text(json.dumps(meta))
+
+    return write_sidecar_dir(directory, write), meta
+
+
+def open_matrix(file_path: str, step: int | None = None, use_cache: bool = True) -> SeriesMatrix:
+    """打开最新的矩阵，源文件变化或步长不同时重建"""
+    path = Path(file_path).resolve()
+    directory = matrix_dir(file_path)
+    meta = _read_meta(directory)
+    if not _is_fresh(meta, path, step):
+        directory, meta = build_matrix(file_path, step, use_cache)
+    return SeriesMatrix(directory, meta)
+
+
+def kpi_thresholds(matrix: SeriesMatrix, rows: np.ndarray = None, quantiles=(0.5, 0.9, 0.95)) -> pd.DataFrame:
+    """每个KPI在全部序列、全部时间上的分位数阈值，索引为 kpi_name，列为 P50/P90/P95"""
+    rows = np.arange(len(matrix)) if rows is None else np.asarray(rows)
+    names = pd.Series(np.asarray(matrix.kpi_name)[rows])
+    result = {}
+    for kpi, members in names.groupby(names, sort=False).groups.items():
+        block = np.asarray(matrix.values[rows[members.to_numpy()]]).ravel()
+        block = block[~np.isnan(block)]
+        if len(block):
+            result[kpi] = np.quantile(block.astype(np.float64), quantiles)
+    columns = [f"P{round(q * 100)}" for q in quantiles]
+    thresholds = pd.DataFrame.from_dict(result, orient='index', columns=columns)
+    thresholds.index.name = 'kpi_name'
+    return thresholds
+
+
+def window_stats(matrix: SeriesMatrix, start_ts, end_ts, rows: np.ndarray = None) -> pd.DataFrame:
+    """窗口内每个序列的均值、最大值、点数和首个有值的列（窗口内无数据的序列不返回）"""
+    rows = np.arange(len(matrix)) if rows is None else np.asarray(rows)
+    block = np.asarray(matrix.values[rows, matrix.columns(start_ts, end_ts)], dtype=np.float64)
+    if block.shape[1] == 0:
+        block = np.full((len(rows), 1), np.nan)
+    present = ~np.isnan(block)
+    count = present.sum(axis=1)
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)
+        mean = np.nanmean(block, axis=1)
+        peak = np.nanmax(block, axis=1)
+    keep = count > 0
+    return pd.DataFrame({
+        'row': rows[keep],
+        'cmdb_id': np.asarray(matrix.cmdb_id)[rows[keep]].astype(object),
+        'kpi_name': np.asarray(matrix.kpi_name)[rows[keep]].astype(object),
+        'mean': mean[keep],
+        'max': peak[keep],
+        'count': count[keep],
+        'first': present.argmax(axis=1)[keep],
+    })
+
+
+def window_anomalies(matrix: SeriesMatrix, thresholds: pd.DataFrame, start_ts, end_ts, rows: np.ndarray = None,
+                     min_deviation: float = 0.5) -> pd.DataFrame:
+    """
+    窗口均值超过所在KPI的P95且偏离超过 min_deviation 的序列
+
+    与 analyze_container.detect_container_anomalies 的规则相同；按偏离程度降序，
+    偏离相同时按 (组件在窗口内首次出现, 序列编号) 排序。
+    """
+    stats = window_stats(matrix, start_ts, end_ts, rows)
+    first_seen = stats.groupby('cmdb_id', sort=False)['first'].transform('min')
+    stats = stats.iloc[np.lexsort((stats['row'].to_numpy(), first_seen.to_numpy()))]
+    stats = stats.join(thresholds['P95'], on='kpi_name', how='inner')
+    stats = stats[stats['mean'] > stats['P95']]
+    stats = stats.assign(deviation=(stats['mean'] - stats['P95']) / stats['P95'])
+    stats = stats[stats['deviation'] > min_deviation]
+    stats = stats.sort_values('deviation', ascending=False, kind='stable')
+    return pd.DataFrame({
+        'cmdb_id': stats['cmdb_id'],
+        'kpi_name': stats['kpi_name'],
+        'value': stats['mean'],
+        'max': stats['max'],
+        'threshold': stats['P95'],
+        'deviation': stats['deviation'],
+    }).reset_index(drop=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Series Matrix Store for OpenRCA')
+    parser.add_argument('--build', type=str, help='Build (or refresh) the matrix for a long-format metric file')
+    parser.add_argument('--info', type=str, help='Show matrix metadata for a metric file')
+    parser.add_argument('--clear', type=str, help='Remove the matrix for a metric file')
+    parser.add_argument('--step', type=int, help='Grid step in the file time unit (default: most common interval)')
+
+    args = parser.parse_args()
+
+    target = args.build or args.info or args.clear
+    if target and not Path(target).exists():
+        print(f"错误: 文件不存在 {target}")
+        sys.exit(1)
+
+    if args.build:
+        try:
+            matrix = open_matrix(args.build, args.step)
+        except ValueError as e:
+            print(f"错误: {e}")
+            sys.exit(1)
+        meta = matrix.meta
+        print(f"矩阵目录: {matrix.directory}")
+        print(f"序列: {meta['series']:,}, 时间桶: {meta['bins']:,} (步长 {meta['step']}), "
+              f"行数: {meta['rows']:,}, 同桶合并: {meta['merged']:,}")
+        print(f"矩阵大小: {matrix.values.nbytes / 1024 / 1024:.1f} MB")
+    elif args.info:
+        directory = matrix_dir(args.info)
+        meta = _read_meta(directory)
+        if meta is None:
+            print(f"尚未构建矩阵: {args.info}")
+        else:
+            fresh = _is_fresh(meta, Path(args.info).resolve(), None)
+            print(f"矩阵目录: {directory}")
+            print(f"状态: {'有效' if fresh else '已过期'}")
+            print(json.dumps(meta, indent=2, ensure_ascii=False))
+    elif args.clear:
+        shutil.rmtree(matrix_dir(args.clear), ignore_errors=True)
+        print(f"已清除矩阵: {args.clear}")
+    else:
+        parser.print_help()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,432 @@
+"""
+Streaming Sketches for OpenRCA
+流式概要结构 - 在固定内存内对任意大的数据流做去重计数、分位数、随机抽样和高频项统计
+
+所有结构都按数据块批量更新（numpy向量化），并且可以合并：对文件的不同分块或不同文件
+分别建立概要后 merge，结果与顺序处理整个数据流等价（在各自的误差范围内）。
+
+    HyperLogLog    去重计数，2^p 个寄存器，相对误差约 1.04 / sqrt(2^p)（p=14 时约0.8%）
+    TDigest        分位数，按 k1 尺度函数合并质心，两端精度高
+    DDSketch       分位数，对数分桶，相对误差不超过 alpha；合并为桶计数相加，与合并顺序无关
+    Reservoir      bottom-k 随机抽样，每行赋予随机优先级，保留优先级最小的 k 行
+    HeavyHitters   Misra-Gries 高频项，k 个计数器，计数为下界，误差不超过 error
+
+    from common.sketches import ColumnProfile
+    profile = ColumnProfile()
+    for chunk in pd.read_csv(path, chunksize=100_000):
+        profile.add(chunk['cmdb_id'])
+    profile.distinct(), profile.top(10)
+"""
+
+import math
+
+import numpy as np
+import pandas as pd
+
+
+def hash_values(values: pd.Series) -> np.ndarray:
+    """
+    64位哈希；数值统一按 float64 哈希，使不同分块推断出的 int/float 类型得到相同结果
+    """
+    values = values.dropna()
+    if pd.api.types.is_numeric_dtype(values) and not pd.api.types.is_bool_dtype(values):
+        return pd.util.hash_array(values.to_numpy(dtype=np.float64))
+    return pd.util.hash_array(values.astype(str).to_numpy(dtype=object))
+
+
+class HyperLogLog:
+    """HyperLogLog 去重计数"""
+
+    def __init__(self, p: int = 14):
+        self.p = p
+        self.registers = np.zeros(1 << p, dtype=np.uint8)
+
+    def add_hashes(self, hashes: np.ndarray):
+        if len(hashes) == 0:
+            return
+        low_bits = 64 - self.p
+        index = (hashes >> np.uint64(low_bits)).astype(np.intp)
+        rest = hashes & np.uint64((1 << low_bits) - 1)
+        # rest < 2^50，转换为 float64 精确，frexp 的指数即有效位数
+        bit_length = np.frexp(rest.astype(np.float64))[1]
+        rank = (low_bits - bit_length + 1).astype(np.uint8)
+        np.maximum.at(self.registers, index, rank)
+
+    def add(self, values: pd.Series):
+        self.add_hashes(hash_values(values))
+
+    def merge(self, other: 'HyperLogLog'):
+        if other.p != self.p:
+            raise ValueError(f"HyperLogLog 精度不一致: {self.p} != {other.p}")
+        np.maximum(self.registers, other.registers, out=self.registers)
+
+    def estimate(self) -> int:
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        raw = alpha * m * m / np.sum(np.ldexp(1.0, -self.registers.astype(np.int32)))
+        zeros = int(np.count_nonzero(self.registers == 0))
+        if raw <= 2.5 * m and zeros:
+            return round(m * math.log(m / zeros))  # 小基数时用线性计数
+        return round(raw)
+
+
+class TDigest:
+    """
+    合并式 t-digest
+
+    新数据先进入缓冲区，满后与已有质心一起排序，按 k1 尺度函数 k(q) = δ/π · asin(2q-1)
+    把落在同一整数 k 区间的点合并为一个质心，质心数约为 δ。
+    """
+
+    def __init__(self, compression: float = 200, buffer_size: int = 50_000):
+        self.compression = compression
+        self.buffer_size = buffer_size
+        self.means = np.array([], dtype=np.float64)
+        self.weights = np.array([], dtype=np.float64)
+        self._buffer = []
+        self._buffered = 0
+        self.count = 0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def add(self, values):
+        values = np.asarray(values, dtype=np.float64)
+        values = values[np.isfinite(values)]
+        if len(values) == 0:
+            return
+        self.count += len(values)
+        self.min = min(self.min, float(values.min()))
+        self.max = max(self.max, float(values.max()))
+        self._buffer.append(values)
+        self._buffered += len(values)
+        if self._buffered >= self.buffer_size:
+            self._compress()
+
+    @property
+    def buffered(self) -> int:
+        return self._buffered
+
+    def flush(self):
+        """把缓冲区并入质心（缓冲区较多时用于及时释放内存）"""
+        self._compress()
+
+    def merge(self, other: 'TDigest'):
+        other._compress()
+        if other.count == 0:
+            return
+        self.count += other.count
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self._compress(other.means, other.weights)
+
+    def _compress(self, extra_means=None, extra_weights=None):
+        if not self._buffer and extra_means is None:
+            return
+        parts_m = [self.means] + self._buffer
+        parts_w = [self.weights] + [np.ones(len(b)) for b in self._buffer]
+        if extra_means is not None:
+            parts_m.append(extra_means)
+            parts_w.append(extra_weights)
+        self._buffer, self._buffered = [], 0
+
+        means = np.concatenate(parts_m)
+        weights = np.concatenate(parts_w)
+        order = np.argsort(means, kind='stable')
+        means, weights = means[order], weights[order]
+
+        total = weights.sum()
+        q_mid = (np.cumsum(weights) - weights / 2) / total
+        cluster = np.floor(self.compression / math.pi * np.arcsin(2 * q_mid - 1)).astype(np.int64)
+        starts = np.flatnonzero(np.concatenate(([True], cluster[1:] != cluster[:-1])))
+        merged_w = np.add.reduceat(weights, starts)
+        self.means = np.add.reduceat(means * weights, starts) / merged_w
+        self.weights = merged_w
+
+    def to_state(self) -> dict:
+        """可 JSON 序列化的状态（先合并缓冲区）"""
+        self._compress()
+        return {
+            'compression': self.compression, 'count': self.count, 'min': self.min, 'max': self.max,
+            'means': self.means.tolist(), 'weights': self.weights.tolist(),
+        }
+
+    @classmethod
+    def from_state(cls, state: dict) -> 'TDigest':
+        digest = cls(state['compression'])
+        digest.count = state['count']
+        digest.min = state['min']
+        digest.max = state['max']
+        digest.means = np.asarray(state['means'], dtype=np.float64)
+        digest.weights = np.asarray(state['weights'], dtype=np.float64)
+        return digest
+
+    def quantile(self, q: float) -> float:
+        self._compress()
+        if self.count == 0:
+            return math.nan
+        total = self.weights.sum()
+        centers = np.cumsum(self.weights) - self.weights / 2
+        xp = np.concatenate(([0.0], centers, [total]))
+        fp = np.concatenate(([self.min], self.means, [self.max]))
+        return float(np.interp(q * total, xp, fp))
+
+
+class DDSketch:
+    """
+    DDSketch 分位数（相对误差保证）
+
+    正值 x 落入桶 i = ceil(log_γ x)，γ = (1+α)/(1-α)；桶 i 的代表值 2γ^i/(γ+1) 与桶内任意值的
+    相对误差不超过 α。合并即对应桶的计数相加，结果与顺序处理整个数据流完全相同。
+    非正值（如耗时为 0 的span）单独计数，取值为 0。桶数超过 max_bins 时把最低的桶并入相邻桶，
+    只影响最低端的分位数。
+    """
+
+    def __init__(self, alpha: float = 0.01, max_bins: int = 2048):
+        self.alpha = alpha
+        self.max_bins = max_bins
+        self.gamma = (1 + alpha) / (1 - alpha)
+        self._log_gamma = math.log(self.gamma)
+        self.offset = 0
+        self.bins = np.zeros(0, dtype=np.int64)
+        self.zero_count = 0
+        self.count = 0
+        self.sum = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def index_of(self, values) -> np.ndarray:
+        """正值所在的桶号"""
+        return np.ceil(np.log(np.asarray(values, dtype=np.float64)) / self._log_gamma).astype(np.int64)
+
+    def value_of(self, index) -> np.ndarray:
+        """桶的代表值"""
+        return 2 * np.power(self.gamma, np.asarray(index, dtype=np.float64)) / (self.gamma + 1)
+
+    def add(self, values):
+        values = np.asarray(values, dtype=np.float64)
+        values = values[np.isfinite(values)]
+        if len(values) == 0:
+            return
+        self.count += len(values)
+        self.sum += float(values.sum())
+        self.min = min(self.min, float(values.min()))
+        self.max = max(self.max, float(values.max()))
+        positive = values[values > 0]
+        self.zero_count += len(values) - len(positive)
+        if len(positive):
+            index = self.index_of(positive)
+            lo = int(index.min())
+            self.add_counts(np.arange(lo, int(index.max()) + 1), np.bincount(index - lo))
+
+    def add_counts(self, index: np.ndarray, counts: np.ndarray):
+        """按桶号加入计数（index 为递增的桶号）；只更新桶，不更新 count/min/max"""
+        if len(index) == 0:
+            return
+        lo = min(int(index[0]), self.offset) if len(self.bins) else int(index[0])
+        hi = max(int(index[-1]), self.offset + len(self.bins) - 1) if len(self.bins) else int(index[-1])
+        bins = np.zeros(hi - lo + 1, dtype=np.int64)
+        bins[self.offset - lo:self.offset - lo + len(self.bins)] = self.bins
+        np.add.at(bins, np.asarray(index) - lo, counts)
+        if len(bins) > self.max_bins:
+            fold = len(bins) - self.max_bins
+            bins[fold] += bins[:fold].sum()
+            bins, lo = bins[fold:], lo + fold
+        self.bins, self.offset = bins, lo
+
+    def merge(self, other: 'DDSketch'):
+        if other.alpha != self.alpha:
+            raise ValueError(f"DDSketch 精度不一致: {self.alpha} != {other.alpha}")
+        if other.count == 0:
+            return
+        self.add_counts(other.offset + np.arange(len(other.bins)), other.bins)
+        self.zero_count += other.zero_count
+        self.count += other.count
+        self.sum += other.sum
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    def quantile(self, q: float) -> float:
+        """第 floor(q·(n-1)) 小的值的近似（相对误差不超过 alpha）"""
+        if self.count == 0:
+            return math.nan
+        rank = math.floor(q * (self.count - 1))
+        if rank < self.zero_count:
+            return 0.0
+        position = int(np.searchsorted(np.cumsum(self.bins), rank - self.zero_count, side='right'))
+        value = float(self.value_of(self.offset + position))
+        return min(max(value, self.min), self.max)
+
+    def to_state(self) -> dict:
+        """可 JSON 序列化的状态"""
+        return {
+            'alpha': self.alpha, 'max_bins': self.max_bins, 'offset': self.offset, 'bins': self.bins.tolist(),
+            'zero_count': self.zero_count, 'count': self.count, 'sum': self.sum, 'min': self.min, 'max': self.max,
+        }
+
+    @classmethod
+    def from_state(cls, state: dict) -> 'DDSketch':
+        sketch = cls(state['alpha'], state['max_bins'])
+        sketch.offset = state['offset']
+        sketch.bins = np.asarray(state['bins'], dtype=np.int64)
+        for key in ('zero_count', 'count', 'sum', 'min', 'max'):
+            setattr(sketch, key, state[key])
+        return sketch
+
+
+class Reservoir:
+    """bottom-k 均匀抽样：每行一个随机优先级，保留最小的 k 个；两个样本合并后再取最小的 k 个仍是均匀样本"""
+
+    def __init__(self, k: int = 10, seed: int | None = None):
+        self.k = k
+        self.rng = np.random.default_rng(seed)
+        self.sample = None
+        self.priority = np.array([], dtype=np.float64)
+        self.seen = 0
+
+    def add(self, df: pd.DataFrame):
+        priority = self.rng.random(len(df))
+        rows = df.assign(_row=np.arange(self.seen, self.seen + len(df)))
+        self.seen += len(df)
+        if len(df) > self.k:
+            keep = np.argpartition(priority, self.k)[:self.k]
+            rows, priority = rows.iloc[keep], priority[keep]
+        self._keep(rows, priority)
+
+    def merge(self, other: 'Reservoir'):
+        if other.sample is not None:
+            self._keep(other.sample, other.priority)
+        self.seen += other.seen
+
+    def _keep(self, rows: pd.DataFrame, priority: np.ndarray):
+        if self.sample is not None:
+            rows = pd.concat([self.sample, rows], ignore_index=True)
+            priority = np.concatenate([self.priority, priority])
+        keep = np.argsort(priority, kind='stable')[:self.k]
+        self.sample = rows.iloc[keep].reset_index(drop=True)
+        self.priority = priority[keep]
+
+    def rows(self) -> pd.DataFrame:
+        """按在数据流中出现的顺序返回样本"""
+        if self.sample is None:
+            return pd.DataFrame()
+        return self.sample.sort_values('_row').drop(columns='_row').reset_index(drop=True)
+
+
+class HeavyHitters:
+    """
+    Misra-Gries 高频项（可合并版本）
+
+    每块先精确计数再与已有计数器相加；计数器超过 k 个时全部减去第 k+1 大的计数并丢弃非正项。
+    保留的计数是真实次数的下界，少计的次数不超过 error（从未超过 k 个不同值时计数是精确的）。
+    """
+
+    def __init__(self, k: int = 100):
+        self.k = k
+        self.counts = pd.Series(dtype=np.int64)
+        self.total = 0
+        self.error = 0
+
+    def add(self, values: pd.Series):
+        self.add_counts(values.dropna().value_counts(sort=False))
+
+    def add_counts(self, counts: pd.Series):
+        """加入已经计数好的一批值（索引为值，取值为次数）"""
+        self.total += int(counts.sum())
+        self._combine(counts)
+
+    def merge(self, other: 'HeavyHitters'):
+        self.total += other.total
+        self.error += other.error
+        self._combine(other.counts)
+
+    def _combine(self, counts: pd.Series):
+        if len(counts) == 0:
+            return
+        counts = counts.rename_axis(None).astype(np.int64)
+        merged = counts if len(self.counts) == 0 else self.counts.add(counts, fill_value=0).astype(np.int64)
+        if len(merged) > self.k:
+            threshold = int(np.partition(merged.to_numpy(), len(merged) - self.k - 1)[len(merged) - self.k - 1])
+            merged = merged - threshold
+            merged = merged[merged > 0]
+            self.error += threshold
+        self.counts = merged
+
+    @property
+    def exact(self) -> bool:
+        return self.error == 0
+
+    def top(self, n: int = 10) -> pd.Series:
+        return self.counts.sort_values(ascending=False, kind='stable').head(n)
+
+
+class ColumnProfile:
+    """单列的流式画像：行数、缺失数、去重数、数值分位数和高频项"""
+
+    def __init__(self, p: int = 14, compression: float = 200, top_k: int = 100):
+        self.rows = 0
+        self.nulls = 0
+        self.numeric_rows = 0
+        self.sum = 0.0
+        self.sum_sq = 0.0
+        self.dtypes = set()
+        self.hll = HyperLogLog(p)
+        self.digest = TDigest(compression)
+        self.heavy = HeavyHitters(top_k)
+
+    def add(self, values: pd.Series):
+        self.rows += len(values)
+        self.nulls += int(values.isna().sum())
+        self.dtypes.add(str(values.dtype))
+        # 每块只计数一次：高频项使用计数，HyperLogLog 只需哈希去重后的值
+        counts = values.dropna().value_counts(sort=False)
+        counts = counts[counts > 0]  # category 列会列出未出现的类别
+        self.heavy.add_counts(counts)
+        self.hll.add(counts.index.to_series())
+        if pd.api.types.is_numeric_dtype(values) and not pd.api.types.is_bool_dtype(values):
+            numeric = values.dropna().to_numpy(dtype=np.float64)
+            self.numeric_rows += len(numeric)
+            self.sum += float(numeric.sum())
+            self.sum_sq += float(np.square(numeric).sum())
+            self.digest.add(numeric)
+
+    def merge(self, other: 'ColumnProfile'):
+        self.rows += other.rows
+        self.nulls += other.nulls
+        self.numeric_rows += other.numeric_rows
+        self.sum += other.sum
+        self.sum_sq += other.sum_sq
+        self.dtypes |= other.dtypes
+        self.hll.merge(other.hll)
+        self.digest.merge(other.digest)
+        self.heavy.merge(other.heavy)
+
+    @property
+    def is_numeric(self) -> bool:
+        """所有非空值都是数值时视为数值列"""
+        return self.numeric_rows > 0 and self.numeric_rows == self.rows - self.nulls
+
+    @property
+    def distinct_exact(self) -> bool:
+        """不同取值从未超过高频项容量时，高频项就是完整的计数表，去重数是精确的"""
+        return self.heavy.exact
+
+    def distinct(self) -> int:
+        """去重数：distinct_exact 时为精确值，否则为 HyperLogLog 估计（不超过非空行数）"""
+        if self.distinct_exact:
+            return len(self.heavy.counts)
+        return min(self.hll.estimate(), self.rows - self.nulls)
+
+    def describe(self) -> dict:
+        """与 DataFrame.describe() 对应的统计量，分位数为近似值"""
+        n = self.numeric_rows
+        mean = self.sum / n if n else math.nan
+        var = (self.sum_sq - n * mean * mean) / (n - 1) if n > 1 else math.nan
+        stats = {'count': n, 'mean': mean, 'std': math.sqrt(max(var, 0.0)) if n > 1 else math.nan,
+                 'min': self.digest.min if n else math.nan}
+        for q in (0.25, 0.5, 0.75):
+            stats[f"{q:.0%}"] = self.digest.quantile(q)
+        stats['max'] = self.digest.max if n else math.nan
+        return stats
+
+    def top(self, n: int = 10) -> pd.Series:
+        return self.heavy.top(n)
@@ -0,0 +1,274 @@
+"""
+Span Tree Engine for OpenRCA
+调用链索引引擎 - 一次建立 trace_id -> span区间 的索引，向量化重建父子关系
+
+建立索引时对 (trace, timestamp) 排序并记录每个trace的起止偏移，查询单个trace只需一次切片，
+不再对整表做布尔掩码。父子关系通过 (trace, span_id) 整数键的二分查找一次性解析，
+子节点以CSR数组保存。所有trace的 self-time、关键路径和最深错误span在数组上批量计算。
+
+    from common.span_tree import SpanIndex
+    index = SpanIndex(df)                       # market: span_id / parent_span / status_code
+    summary = index.trace_summary()             # 每个trace一行
+    spans = index.trace_spans('9451fd8f...')    # 单个trace，按调用树深度优先排序
+"""
+
+import numpy as np
+import pandas as pd
+
+
+def resolve_parents(trace_codes: np.ndarray, spans: pd.Series, parents: pd.Series) -> np.ndarray:
+    """
+    把 parent_span 解析为同一trace内父span的行号，找不到父span（根或孤儿）时为 -1
+
+    trace_codes 为每行的trace整数编码（pd.factorize 的结果），行顺序任意。
+    """
+    n = len(spans)
+    if n == 0:
+        return np.array([], dtype=np.int64)
+    codes, uniques = pd.factorize(pd.concat([spans, parents], ignore_index=True), sort=False)
+    span_codes, parent_codes = codes[:n], codes[n:]
+    width = np.int64(len(uniques) + 1)
+
+    trace_keys = np.asarray(trace_codes, dtype=np.int64) * width
+    span_keys = trace_keys + span_codes
+    parent_keys = trace_keys + parent_codes
+
+    key_order = np.argsort(span_keys, kind='stable')
+    sorted_keys = span_keys[key_order]
+    pos = np.minimum(np.searchsorted(sorted_keys, parent_keys, side='left'), n - 1)
+    found = (parent_codes >= 0) & (sorted_keys[pos] == parent_keys)
+    parent = np.where(found, key_order[pos], -1)
+    parent[parent == np.arange(n)] = -1  # 自引用视为根
+    return parent
+
+
+class SpanIndex:
+    """
+    基于数组的span树索引
+
+    列名可配置以适配不同场景（bank 为 parent_id，且没有 status_code）。
+    duration_scale 把 duration 换算为 timestamp 的单位，用于计算span结束时间。
+    """
+
+    def __init__(self, df: pd.DataFrame, trace_col: str = 'trace_id', span_col: str = 'span_id',
+                 parent_col: str = 'parent_span', time_col: str = 'timestamp', duration_col: str = 'duration',
+                 status_col: str = 'status_code', duration_scale: float = 1.0):
+        self.columns = {
+            'trace': trace_col, 'span': span_col, 'parent': parent_col,
+            'time': time_col, 'duration': duration_col, 'status': status_col,
+        }
+
+        trace_codes, self.trace_ids = pd.factorize(df[trace_col], sort=False)
+        timestamps = df[time_col].to_numpy(dtype=np.int64)
+
+        # 按 (trace, timestamp) 排序，每个trace占据连续区间
+        order = np.lexsort((timestamps, trace_codes))
+        order = order[trace_codes[order] >= 0]
+        self.df = df.iloc[order].reset_index(drop=True)
+        self.trace = trace_codes[order]
+        self.timestamp = timestamps[order]
+        self.duration = self.df[duration_col].to_numpy(dtype=np.float64, na_value=0.0)
+        self.end = self.timestamp + self.duration * duration_scale
+        if status_col and status_col in self.df.columns:
+            self.error = self.df[status_col].fillna(0).to_numpy() != 0
+        else:
+            self.error = np.zeros(len(self.df), dtype=bool)
+
+        n_traces = len(self.trace_ids)
+        self.offsets = np.searchsorted(self.trace, np.arange(n_traces + 1), side='left')
+
+        self.parent = resolve_parents(self.trace, self.df[span_col], self.df[parent_col])
+        self._build_children()
+        self.depth = self._compute_depth()
+        self.self_time = self._compute_self_time()
+        self.critical_child = self._compute_critical_child()
+        self.root = self._compute_roots()
+
+    def __len__(self):
+        return len(self.df)
+
+    @property
+    def n_traces(self) -> int:
+        return len(self.trace_ids)
+
+    def _build_children(self):
+        """CSR 形式的子节点表：child_rows[child_offsets[i]:child_offsets[i+1]] 为行 i 的子节点"""
+        n = len(self.df)
+        has_parent = self.parent >= 0
+        child_rows = np.flatnonzero(has_parent)
+        child_rows = child_rows[np.argsort(self.parent[child_rows], kind='stable')]
+        counts = np.bincount(self.parent[has_parent], minlength=n)
+        self.child_rows = child_rows
+        self.child_offsets = np.concatenate(([0], np.cumsum(counts)))
+
+    def _gather_children(self, rows: np.ndarray) -> np.ndarray:
+        """向量化地取出一组节点的全部子节点"""
+        starts = self.child_offsets[rows]
+        lengths = self.child_offsets[rows + 1] - starts
+        idx = np.repeat(starts - np.cumsum(lengths) + lengths, lengths) + np.arange(lengths.sum())
+        return self.child_rows[idx]
+
+    def _compute_depth(self) -> np.ndarray:
+        """从根节点逐层向下传播深度，环路中的节点深度为 -1"""
+        depth = np.full(len(self.df), -1, dtype=np.int32)
+        level = np.flatnonzero(self.parent < 0)
+        current = 0
+        while len(level):
+            depth[level] = current
+            level = self._gather_children(level)
+            level = level[depth[level] < 0]
+            current += 1
+        return depth
+
+    def _compute_self_time(self) -> np.ndarray:
+        """self-time = 自身耗时 - 直接子节点耗时之和（下限为0）"""
+        has_parent = self.parent >= 0
+        child_total = np.bincount(self.parent[has_parent], weights=self.duration[has_parent],
+                                  minlength=len(self.df))
+        return np.maximum(self.duration - child_total, 0.0)
+
+    def _compute_critical_child(self) -> np.ndarray:
+        """每个节点的关键子节点：最晚结束的直接子节点，叶子节点为 -1"""
+        critical = np.full(len(self.df), -1, dtype=np.int64)
+        rows = self.child_rows
+        if len(rows) == 0:
+            return critical
+        parents = self.parent[rows]
+        order = np.lexsort((self.duration[rows], self.end[rows], parents))
+        rows, parents = rows[order], parents[order]
+        last = np.flatnonzero(np.append(parents[1:] != parents[:-1], True))
+        critical[parents[last]] = rows[last]
+        return critical
+
+    def _compute_roots(self) -> np.ndarray:
+        """每个trace的根span行号：无父节点中耗时最长者，trace内没有根时为 -1"""
+        root = np.full(self.n_traces, -1, dtype=np.int64)
+        candidates = np.flatnonzero(self.parent < 0)
+        if len(candidates):
+            order = np.lexsort((self.duration[candidates], self.trace[candidates]))
+            candidates = candidates[order]
+            traces = self.trace[candidates]
+            last = np.flatnonzero(np.append(traces[1:] != traces[:-1], True))
+            root[traces[last]] = candidates[last]
+        return root
+
+    def trace_rows(self, trace_id: str) -> np.ndarray:
+        """单个trace的行号区间，未找到时为空"""
+        loc = self.trace_ids.get_indexer([trace_id])[0]
+        if loc < 0:
+            return np.array([], dtype=np.int64)
+        return np.arange(self.offsets[loc], self.offsets[loc + 1])
+
+    def critical_paths(self) -> pd.DataFrame:
+        """所有trace的关键路径长表：trace, step, row（沿关键子节点逐层并行前进）"""
+        roots = self.root
+        traces = np.flatnonzero(roots >= 0)
+        current = roots[traces]
+        parts = []
+        step = 0
+        visited = np.zeros(len(self.df), dtype=bool)
+        while len(current):
+            visited[current] = True
+            parts.append(pd.DataFrame({'trace': traces, 'step': step, 'row': current}))
+            nxt = self.critical_child[current]
+            keep = nxt >= 0
+            keep[keep] &= ~visited[nxt[keep]]
+            traces, current = traces[keep], nxt[keep]
+            step += 1
+        if not parts:
+            return pd.DataFrame({'trace': [], 'step': [], 'row': []}, dtype=np.int64)
+        return pd.concat(parts, ignore_index=True).sort_values(['trace', 'step'], ignore_index=True)
+
+    def deepest_errors(self) -> np.ndarray:
+        """每个trace中深度最大的错误span行号（同深度取最晚开始），无错误时为 -1"""
+        deepest = np.full(self.n_traces, -1, dtype=np.int64)
+        rows = np.flatnonzero(self.error)
+        if len(rows):
+            order = np.lexsort((self.timestamp[rows], self.depth[rows], self.trace[rows]))
+            rows = rows[order]
+            traces = self.trace[rows]
+            last = np.flatnonzero(np.append(traces[1:] != traces[:-1], True))
+            deepest[traces[last]] = rows[last]
+        return deepest
+
+    def trace_summary(self, component_col: str = 'cmdb_id') -> pd.DataFrame:
+        """
+        每个trace一行：span数、错误数、根耗时、关键路径、关键路径上self-time最大的span、最深错误span
+        """
+        n_traces = self.n_traces
+        components = self.df[component_col].astype(str).to_numpy() if component_col in self.df.columns else None
+
+        roots = self.root
+        spans = np.diff(self.offsets)
+        errors = np.bincount(self.trace, weights=self.error, minlength=n_traces).astype(np.int64)
+        max_depth = np.full(n_traces, -1, dtype=np.int64)
+        np.maximum.at(max_depth, self.trace, self.depth)
+
+        summary = pd.DataFrame({
+            'trace_id': self.trace_ids,
+            'spans': spans,
+            'error_spans': errors,
+            'depth': max_depth + 1,
+            'root': np.where(roots >= 0, components[np.maximum(roots, 0)], None) if components is not None else None,
+            'duration': np.where(roots >= 0, self.duration[np.maximum(roots, 0)], np.nan),
+            'start': np.where(roots >= 0, self.timestamp[np.maximum(roots, 0)], self.timestamp[self.offsets[:-1]]),
+        })
+
+        paths = self.critical_paths()
+        if len(paths) and components is not None:
+            paths['component'] = components[paths['row'].to_numpy()]
+
+            # 按步拼接路径字符串：循环次数为最大路径长度，而不是trace数
+            critical_path = np.full(n_traces, None, dtype=object)
+            for step, part in paths.groupby('step', sort=True):
+                traces = part['trace'].to_numpy()
+                names = part['component'].to_numpy(dtype=object)
+                critical_path[traces] = names if step == 0 else critical_path[traces] + ' -> ' + names
+            summary['critical_path'] = critical_path
+
+            paths['self_time'] = self.self_time[paths['row'].to_numpy()]
+            hottest = paths.sort_values(['trace', 'self_time'], kind='stable').groupby('trace').tail(1)
+            summary['hotspot'] = pd.Series(hottest['component'].to_numpy(), index=hottest['trace']).reindex(
+                np.arange(n_traces)).to_numpy()
+            summary['hotspot_self_time'] = pd.Series(hottest['self_time'].to_numpy(), index=hottest['trace']).reindex(
+                np.arange(n_traces)).to_numpy()
+
+        deepest = self.deepest_errors()
+        has_error = deepest >= 0
+        if components is not None:
+            summary['deepest_error'] = np.where(has_error, components[np.maximum(deepest, 0)], None)
+        summary['deepest_error_depth'] = np.where(has_error, self.depth[np.maximum(deepest, 0)], -1)
+        return summary
+
+    def trace_spans(self, trace_id: str) -> pd.DataFrame:
+        """单个trace的span，按调用树深度优先排序，附带 depth/self_time/critical 列"""
+        rows = self.trace_rows(trace_id)
+        if len(rows) == 0:
+            return self.df.iloc[[]]
+
+        lo = rows[0]
+        critical = set()
+        node = self.root[self.trace[lo]]
+        while node >= 0 and node not in critical:
+            critical.add(int(node))
+            node = self.critical_child[node]
+
+        # 单个trace规模很小，用显式栈做深度优先遍历；找不到根的span（孤儿/环）追加在末尾
+        ordered = []
+        seen = set()
+        stack = list(rows[self.parent[rows] < 0][::-1])
+        while stack:
+            row = int(stack.pop())
+            if row in seen:
+                continue
+            seen.add(row)
+            ordered.append(row)
+            children = self.child_rows[self.child_offsets[row]:self.child_offsets[row + 1]]
+            stack.extend(children[np.argsort(self.timestamp[children], kind='stable')][::-1])
+        ordered.extend(int(r) for r in rows if int(r) not in seen)
+
+        result = self.df.iloc[ordered].copy()
+        result.insert(0, 'depth', self.depth[ordered])
+        result['self_time'] = self.self_time[ordered]
+        result['critical'] = [row in critical for row in ordered]
+        return result
@@ -0,0 +1,487 @@
+#!/usr/bin/env python3
+"""
+Telemetry Cache for OpenRCA
+遥测数据列式缓存 - 将CSV一次性转换为按小时分区的Parquet缓存
+
+首次读取时按块解析CSV，按小时写入压缩的Parquet分区；之后的查询只读取
+所需的列和与时间窗口相交的小时分区。源文件的 mtime 或大小变化时自动重建。
+
+Usage:
+    python telemetry_cache.py --build metric_container.csv
+    python telemetry_cache.py --info trace_span.csv
+
+    # 在分析脚本中
+    from common.telemetry_cache import load_telemetry
+    df = load_telemetry('trace_span.csv', columns=['timestamp', 'cmdb_id'],
+                        start_ts=1647738000000, end_ts=1647739800000)
+"""
+
+import argparse
+import atexit
+import hashlib
+import json
+import os
+import re
+import shutil
+import sys
+import tempfile
+from collections import OrderedDict
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+    import pyarrow.fs as pafs
+    import pyarrow.parquet as pq
+except ImportError:  # pyarrow 不可用时退化为直接读取CSV
+    pa = None
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from common.output import notice
+from common.schema import conform_frame, schema_dtypes
+from common.time_utils import unit_scale
+
+CACHE_VERSION = 2
+CHUNK_ROWS = 1_000_000
+
+# 进程内的数据帧LRU（常驻服务使用），预算为0时关闭
+_MEMORY_BUDGET = 0
+_FRAMES = OrderedDict()
+
+# 时间列名（按优先级），telecom 的 metric_app.csv 使用 startTime
+TIME_COLUMNS = ['timestamp', 'startTime']
+
+# 规格中未登记的文件（common.schema 找不到匹配模式）按字段名确定类型
+# 未列出的字段按字符串处理；整数列使用可空类型，避免缺失值导致解析失败
+COLUMN_DTYPES = {
+    'timestamp': 'int64',
+    'startTime': 'int64',
+    'value': 'float64',
+    'rr': 'float64',
+    'sr': 'float64',
+    'mrt': 'float64',
+    'count': 'Int64',
+    'cnt': 'Int64',
+    'duration': 'Int64',
+    'status_code': 'Int64',
+}
+
+STRING_COLUMNS = {
+    'cmdb_id', 'kpi_name', 'service', 'span_id', 'trace_id', 'type',
+    'operation_name', 'parent_span', 'parent_id', 'log_id', 'log_name', 'tc',
+}
+
+# 日志文件的 value 字段是日志内容而非指标值
+LOG_MARKER_COLUMNS = {'log_id', 'log_name'}
+
+# 读取和分析遥测文件时的预期错误：文件缺失或不可读、内容无法解析（含 pandas/pyarrow 的解析错误）、
+# 缺少所需字段、内存不足。批量执行时这些错误只记为单个任务失败，其他异常按程序错误抛出
+DATA_ERRORS = (OSError, ValueError, KeyError, MemoryError)
+
+
+def _cache_root(path: Path) -> Path:
+    """缓存根目录，可通过 OPENRCA_CACHE_DIR 覆盖"""
+    root = os.environ.get('OPENRCA_CACHE_DIR')
+    if root:
+        return Path(root)
+    return path.parent / '.openrca_cache'
+
+
+def cache_dir_for(file_path: str) -> Path:
+    """返回源文件对应的缓存目录"""
+    path = Path(file_path).resolve()
+    digest = hashlib.md5(str(path).encode()).hexdigest()[:8]
+    return _cache_root(path) / f"{path.stem}-{digest}"
+
+
+def sidecar_path(file_path: str, suffix: str) -> Path:
+    """返回与缓存目录并列的旁路文件路径（如时间索引），不随缓存重建而删除"""
+    cache_dir = cache_dir_for(file_path)
+    return cache_dir.with_name(f"{cache_dir.name}.{suffix}")
+
+
+def source_stat(path: Path) -> dict:
+    st = path.stat()
+    return {'mtime_ns': st.st_mtime_ns, 'size': st.st_size}
+
+
+def read_header(path: Path) -> list:
+    return list(pd.read_csv(path, nrows=0).columns)
+
+
+def time_column(columns: list):
+    for col in TIME_COLUMNS:
+        if col in columns:
+            return col
+    return None
+
+
+def column_dtypes(columns: list, float32: bool = False) -> dict:
+    """
+    根据文件表头确定每列的读取类型
+
+    规格中登记的文件使用模式注册表的紧凑类型（category / Int32），其余按字段名确定。
+    float32 只用于内存受限模式。
+    """
+    registered = schema_dtypes('', columns, float32)
+    if registered is not None:
+        return registered
+    is_log = bool(LOG_MARKER_COLUMNS & set(columns))
+    dtypes = {}
+    for col in columns:
+        if col == 'value' and is_log:
+            dtypes[col] = 'str'
+        else:
+            dtypes[col] = COLUMN_DTYPES.get(col, 'str')
+    return dtypes
+
+
+def _cacheable(columns: list) -> bool:
+    """只缓存规格中已知字段的文件，未知文件无法保证各分块类型一致"""
+    if pa is None or time_column(columns) is None:
+        return False
+    if schema_dtypes('', columns) is not None:
+        return True
+    return all(col in COLUMN_DTYPES or col in STRING_COLUMNS for col in columns)
+
+
+def _arrow_schema(dtypes: dict):
+    fields = []
+    for col, dtype in dtypes.items():
+        if dtype in ('int64', 'Int64'):
+            fields.append(pa.field(col, pa.int64()))
+        elif dtype == 'Int32':
+            fields.append(pa.field(col, pa.int32()))
+        elif dtype in ('float64', 'float32'):
+            fields.append(pa.field(col, pa.float64() if dtype == 'float64' else pa.float32()))
+        elif dtype == 'category':
+            fields.append(pa.field(col, pa.dictionary(pa.int32(), pa.string())))
+        else:
+            fields.append(pa.field(col, pa.string()))
+    return pa.schema(fields)
+
+
+def _read_meta(cache_dir: Path):
+    meta_path = cache_dir / '_meta.json'
+    if not meta_path.exists():
+        return None
+    try:
+        return json.loads(meta_path.read_text())
+    except (OSError, ValueError):
+        return None
+
+
+def _is_fresh(meta, path: Path) -> bool:
+    return (
+        meta is not None
+        and meta.get('version') == CACHE_VERSION
+        and meta.get('source') == source_stat(path)
+    )
+
+
+def build_cache(file_path: str) -> dict:
+    """解析CSV并写入按小时分区的Parquet缓存，返回元数据"""
+    path = Path(file_path).resolve()
+    columns = read_header(path)
+    time_col = time_column(columns)
+    dtypes = column_dtypes(columns)
+    schema = _arrow_schema(dtypes)
+
+    cache_dir = cache_dir_for(file_path)
+    tmp_dir = cache_dir.with_name(cache_dir.name + f".tmp{os.getpid()}")
+
+    notice(f"构建列式缓存: {path.name} -> {cache_dir}")
+
+    source = source_stat(path)
+    writers = {}
+    scale = None
+    rows = 0
+    try:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        tmp_dir.mkdir(parents=True)
+        for chunk in pd.read_csv(path, dtype=dtypes, chunksize=CHUNK_ROWS):
+            if scale is None:
+                scale = unit_scale(chunk[time_col].max())
+            hours = chunk[time_col] // (3600 * scale)
+            for hour, part in chunk.groupby(hours, sort=False):
+                writer = writers.get(hour)
+                if writer is None:
+                    writer = pq.ParquetWriter(tmp_dir / f"hour={hour}.parquet", schema, compression='zstd')
+                    writers[hour] = writer
+                writer.write_table(pa.Table.from_pandas(part, schema=schema, preserve_index=False))
+            rows += len(chunk)
+        for writer in writers.values():
+            writer.close()
+
+        meta = {
+            'version': CACHE_VERSION,
+            'source': source,
+            'columns': columns,
+            'time_column': time_col,
+            'unit_scale': scale or 1,
+            'hours': sorted(int(h) for h in writers),
+            'rows': rows,
+        }
+        (tmp_dir / '_meta.json').write_text(json.dumps(meta))
+
+        shutil.rmtree(cache_dir, ignore_errors=True)
+        os.replace(tmp_dir, cache_dir)
+    except BaseException:
+        for writer in writers.values():
+            writer.close()
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+    return meta
+
+
+def cache_unwritable(target: Path, error: OSError, fallback: str = '本次不使用缓存'):
+    """缓存或旁路文件无法写入（数据目录只读、缓存目录无法创建等）时提示一行，由调用方退回不使用缓存的路径"""
+    notice(f"无法写入 {target}（{error.strerror or error}），{fallback}")
+
+
+def write_sidecar_dir(directory: Path, write) -> Path:
+    """
+    原子地写入旁路目录：write(目录) 写入临时目录后替换 directory，返回实际使用的目录
+
+    无法写入时（OSError）提示一行，改为写入本进程的临时目录，进程退出时删除。
+    """
+    tmp_dir = directory.with_name(directory.name + f".tmp{os.getpid()}")
+    try:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        tmp_dir.mkdir(parents=True)
+        write(tmp_dir)
+        shutil.rmtree(directory, ignore_errors=True)
+        os.replace(tmp_dir, directory)
+        return directory
+    except OSError as e:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        cache_unwritable(directory, e, '本次使用临时目录')
+    except BaseException:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+    scratch = Path(tempfile.mkdtemp(prefix=f"{directory.name}."))
+    atexit.register(shutil.rmtree, scratch, True)
+    write(scratch)
+    return scratch
+
+
+def ensure_cache(file_path: str):
+    """返回最新的缓存元数据，源文件变化时重建；文件不可缓存或缓存无法写入时返回 None"""
+    path = Path(file_path).resolve()
+    if not _cacheable(read_header(path)):
+        return None
+    meta = _read_meta(cache_dir_for(file_path))
+    if not _is_fresh(meta, path):
+        try:
+            meta = build_cache(file_path)
+        except OSError as e:
+            cache_unwritable(cache_dir_for(file_path), e, '直接读取CSV')
+            return None
+    return meta
+
+
+def _load_csv(file_path: str, columns, start_ts, end_ts) -> pd.DataFrame:
+    """无缓存时的读取路径，带时间窗口时通过时间索引只读取对应的字节区间"""
+    header = read_header(Path(file_path))
+    if (start_ts is not None or end_ts is not None) and time_column(header) is not None:
+        # 延迟导入：ts_index 依赖本模块
+        from common.ts_index import read_time_range
+        return read_time_range(file_path, start_ts, end_ts, usecols=columns)
+
+    usecols = list(columns) if columns is not None else None
+    return pd.read_csv(file_path, usecols=usecols, dtype=column_dtypes(header))[usecols or header]
+
+
+def _load_csv_conformed(file_path: str, columns, start_ts, end_ts) -> pd.DataFrame:
+    header = read_header(Path(file_path))
+    return conform_frame(_load_csv(file_path, columns, start_ts, end_ts), column_dtypes(header))
+
+
+def parse_size(text: str) -> int:
+    """解析 512M / 8G / 1.5GB 形式的字节数"""
+    match = re.fullmatch(r'\s*([\d.]+)\s*([KMGT]?)B?\s*', str(text), re.IGNORECASE)
+    if not match:
+        raise ValueError(f"无法解析大小: {text}")
+    power = ' KMGT'.index(match.group(2).upper() or ' ')
+    return int(float(match.group(1)) * 1024 ** power)
+
+
+def set_memory_budget(budget_bytes: int):
+    """设置进程内数据帧LRU的内存上限，0 表示关闭并清空"""
+    global _MEMORY_BUDGET
+    _MEMORY_BUDGET = int(budget_bytes)
+    _evict(0)
+
+
+def memory_stats() -> dict:
+    """返回进程内LRU的使用情况"""
+    return {
+        'budget': _MEMORY_BUDGET,
+        'used': sum(entry['bytes'] for entry in _FRAMES.values()),
+        'files': [
+            {'file': key[0], 'rows': len(entry['frame']), 'bytes': entry['bytes']}
+            for key, entry in _FRAMES.items() if entry['frame'] is not None
+        ],
+    }
+
+
+def _evict(incoming: int):
+    used = sum(entry['bytes'] for entry in _FRAMES.values())
+    while _FRAMES and used + incoming > _MEMORY_BUDGET:
+        _, entry = _FRAMES.popitem(last=False)
+        used -= entry['bytes']
+
+
+def _estimate_resident_bytes(path: Path) -> int:
+    """
+    不读取整个文件估算完整数据帧的内存占用
+
+    按开头若干行的每行占用乘以行数；缓存元数据有效时使用其中的精确行数，否则按文件大小推算。
+    """
+    from common.chunked import estimate_frame_bytes, estimate_rows  # chunked 导入本模块，在此延迟导入
+    estimate = estimate_frame_bytes(str(path))
+    meta = _read_meta(cache_dir_for(str(path)))
+    if estimate and _is_fresh(meta, path):
+        estimate = estimate * meta['rows'] // max(estimate_rows(str(path)), 1)
+    return estimate
+
+
+def _resident_frame(file_path: str, use_cache: bool):
+    """
+    返回常驻内存的完整数据帧（按时间稳定排序），超出预算的文件返回 None
+
+    源文件变化时重新加载；加载前先估算占用，超出预算的文件不读取，并被记住以免重复估算。
+    """
+    path = Path(file_path).resolve()
+    key = (str(path), use_cache)
+    stat = source_stat(path)
+    entry = _FRAMES.get(key)
+    if entry is not None and entry['source'] == stat:
+        _FRAMES.move_to_end(key)
+        return entry
+    _FRAMES.pop(key, None)
+
+    over_budget = {'source': stat, 'frame': None, 'time_column': None, 'bytes': 0}
+    if _estimate_resident_bytes(path) > _MEMORY_BUDGET:
+        _FRAMES[key] = over_budget
+        return over_budget
+
+    frame = _load_file(file_path, None, None, None, use_cache)
+    time_col = time_column(list(frame.columns))
+    if time_col is not None:
+        frame = frame.sort_values(time_col, kind='stable', ignore_index=True)
+    size = int(frame.memory_usage(deep=True).sum())
+    if size > _MEMORY_BUDGET:
+        entry = over_budget
+    else:
+        _evict(size)
+        entry = {'source': stat, 'frame': frame, 'time_column': time_col, 'bytes': size}
+    _FRAMES[key] = entry
+    return entry
+
+
+def _slice_resident(entry: dict, columns, start_ts, end_ts) -> pd.DataFrame:
+    frame = entry['frame']
+    time_col = entry['time_column']
+    if time_col is not None and (start_ts is not None or end_ts is not None):
+        ts = frame[time_col].to_numpy()
+        lo = 0 if start_ts is None else int(np.searchsorted(ts, start_ts, side='left'))
+        hi = len(ts) if end_ts is None else int(np.searchsorted(ts, end_ts, side='right'))
+        frame = frame.iloc[lo:hi]
+    if columns is not None:
+        frame = frame[list(columns)]
+    return frame.copy(deep=False)
+
+
+def load_telemetry(file_path: str, columns=None, start_ts=None, end_ts=None,
+                   use_cache: bool = True) -> pd.DataFrame:
+    """
+    读取遥测文件，只返回所需的列和时间范围
+
+    start_ts/end_ts 使用文件自身的时间戳单位（闭区间），为 None 时不过滤。
+    设置了内存预算（常驻服务）时，优先从进程内LRU切片返回。
+    """
+    if _MEMORY_BUDGET > 0:
+        entry = _resident_frame(file_path, use_cache)
+        if entry['frame'] is not None:
+            return _slice_resident(entry, columns, start_ts, end_ts)
+    return _load_file(file_path, columns, start_ts, end_ts, use_cache)
+
+
+def _load_file(file_path: str, columns, start_ts, end_ts, use_cache: bool) -> pd.DataFrame:
+    """从列式缓存或CSV读取"""
+    if not use_cache or os.environ.get('OPENRCA_NO_CACHE'):
+        return _load_csv_conformed(file_path, columns, start_ts, end_ts)
+
+    meta = ensure_cache(file_path)
+    if meta is None:
+        return _load_csv_conformed(file_path, columns, start_ts, end_ts)
+
+    time_col = meta['time_column']
+    scale = 3600 * meta['unit_scale']
+    hours = [
+        h for h in meta['hours']
+        if (start_ts is None or h >= start_ts // scale) and (end_ts is None or h <= end_ts // scale)
+    ]
+    read_cols = list(columns) if columns is not None else list(meta['columns'])
+    if not hours:
+        dtypes = column_dtypes(meta['columns'])
+        return pd.DataFrame({col: pd.Series(dtype=dtypes[col]) for col in read_cols})
+
+    cache_dir = cache_dir_for(file_path)
+    # 分区文件以内存映射方式读取：解码直接读页缓存，不再先拷贝到堆上的读缓冲区
+    dataset = ds.dataset([str(cache_dir / f"hour={h}.parquet") for h in hours], format='parquet',
+                         filesystem=pafs.LocalFileSystem(use_mmap=True))
+
+    expr = None
+    if start_ts is not None:
+        expr = ds.field(time_col) >= start_ts
+    if end_ts is not None:
+        upper = ds.field(time_col) <= end_ts
+        expr = upper if expr is None else expr & upper
+
+    table = dataset.to_table(columns=read_cols, filter=expr)
+    return conform_frame(table.to_pandas(), column_dtypes(meta['columns']))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Telemetry Cache for OpenRCA')
+    parser.add_argument('--build', type=str, help='Build (or refresh) cache for a CSV file')
+    parser.add_argument('--info', type=str, help='Show cache metadata for a CSV file')
+    parser.add_argument('--clear', type=str, help='Remove cache for a CSV file')
+
+    args = parser.parse_args()
+
+    target = args.build or args.info or args.clear
+    if target and not Path(target).exists():
+        print(f"错误: 文件不存在 {target}")
+        sys.exit(1)
+
+    if args.build:
+        meta = ensure_cache(args.build)
+        if meta is None:
+            print(f"文件不可缓存（pyarrow未安装、包含未知字段或缓存目录不可写）: {args.build}")
+        else:
+            print(f"缓存目录: {cache_dir_for(args.build)}")
+            print(f"行数: {meta['rows']:,}, 小时分区: {len(meta['hours'])}")
+    elif args.info:
+        meta = _read_meta(cache_dir_for(args.info))
+        if meta is None:
+            print(f"尚未构建缓存: {args.info}")
+        else:
+            fresh = _is_fresh(meta, Path(args.info).resolve())
+            print(f"缓存目录: {cache_dir_for(args.info)}")
+            print(f"状态: {'有效' if fresh else '已过期'}")
+            print(json.dumps(meta, indent=2, ensure_ascii=False))
+    elif args.clear:
+        shutil.rmtree(cache_dir_for(args.clear), ignore_errors=True)
+        print(f"已清除缓存: {args.clear}")
+    else:
+        parser.print_help()
+
+
+if __name__ == '__main__':
+    main()
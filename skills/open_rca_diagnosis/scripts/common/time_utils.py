@@ -1,25 +1,171 @@
 #!/usr/bin/env python3
 """
 Time Converter for OpenRCA
-时间转换工具 - 支持不同时间格式转换
+时间转换工具 - 支持不同时间格式转换，以及整列时间戳的向量化单位统一
+
+各数据源的时间单位不同：market 指标和日志为秒，trace 和 telecom 全部文件为毫秒
+（telecom metric_app.csv 的时间列为 startTime）。分析脚本中统一用本模块：
+
+    from common.time_utils import file_time_unit, parse_time, to_epoch_ms, window_bounds
+    start_ts = parse_time('2022-03-20 09:00:00')               # 秒级时间戳
+    lo, hi = window_bounds(start_ts, end_ts, file_time_unit('trace_span.csv'))
+    ms = to_epoch_ms(df['timestamp'])                            # 整列 -> int64 毫秒
+
+单位判断：已登记的文件按规格（specs/*_spec.md 字段表的单位/描述），其余按量级
+（秒级时间戳约10位，毫秒13位，微秒16位，纳秒19位）。
 
 Usage:
     python time_utils.py --to-timestamp "2022-03-20 09:00:00"
     python time_utils.py --to-datetime 1647781200
     python time_utils.py --range "2022-03-20 09:00:00" "2022-03-20 09:30:00"
+    python time_utils.py --file-unit trace_span.csv
 """
 
 import argparse
 from datetime import datetime
-import pytz
+from functools import cache
+from pathlib import Path
 import sys
 
+import numpy as np
+import pandas as pd
+import pytz
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from common.schema import TIME_COLUMNS, schema_time_unit
+
+DEFAULT_TIMEZONE = 'Asia/Shanghai'
+DATETIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+# 每秒的刻度数
+UNIT_SCALES = {'s': 1, 'ms': 1000, 'us': 10**6, 'ns': 10**9}
+
+# 按量级判断单位：不超过上界即为该单位
+UNIT_LIMITS = [(10**11, 's'), (10**14, 'ms'), (10**17, 'us')]
+
+
+@cache
+def zone(name: str = DEFAULT_TIMEZONE):
+    """按名称缓存的时区对象"""
+    return pytz.timezone(name)
+
+
+def unit_of(ts) -> str:
+    """单个时间戳的单位（按量级）；None 和空值按秒处理"""
+    if ts is None or pd.isna(ts):
+        return 's'
+    for limit, unit in UNIT_LIMITS:
+        if abs(ts) <= limit:
+            return unit
+    return 'ns'
+
+
+def unit_scale(ts) -> int:
+    """时间戳单位每秒的刻度数：秒级为1，毫秒级为1000"""
+    return UNIT_SCALES[unit_of(ts)]
+
+
+def detect_unit(values) -> str:
+    """整列时间戳的单位，按绝对值最大的有效值判断；空列按秒处理"""
+    values = np.asarray(values)
+    if values.dtype.kind == 'f':
+        values = values[np.isfinite(values)]
+    if len(values) == 0:
+        return 's'
+    return unit_of(max(abs(int(values.max())), abs(int(values.min()))))
+
+
+def file_time_unit(file_path: str, column: str | None = None):
+    """
+    数据文件时间列的单位：已登记的文件按规格，其余按第一行的量级判断
+
+    没有时间列或文件没有数据行时返回 None。
+    """
+    first = pd.read_csv(file_path, nrows=1)
+    header = list(first.columns)
+    if column is None:
+        column = next((col for col in header if col in TIME_COLUMNS), None)
+    if column not in header or len(first) == 0:
+        return None
+    return schema_time_unit(Path(file_path).name, header) or unit_of(int(first[column].iloc[0]))
 
-def datetime_to_timestamp(dt_str: str, timezone: str = 'Asia/Shanghai') -> tuple:
+
+def to_epoch_ms(values, unit: str | None = None, tz=None) -> np.ndarray:
+    """
+    整列时间戳转为 int64 毫秒，一次 NumPy 运算完成
+
+    数值列按 unit 换算（None 时按量级判断）；datetime64 列直接换算；
+    字符串列按 DATETIME_FORMAT 解析，无时区信息的按 tz（默认北京时间）本地化。
+    """
+    if isinstance(values, (pd.Series, pd.Index)):
+        if isinstance(values.dtype, pd.DatetimeTZDtype):
+            values = values.dt.tz_convert('UTC').dt.tz_localize(None) if isinstance(values, pd.Series) \
+                else values.tz_convert('UTC').tz_localize(None)
+        values = values.to_numpy()
+    values = np.asarray(values)
+    if values.dtype.kind == 'M':
+        return values.astype('datetime64[ms]').astype(np.int64)
+    if values.dtype.kind in 'OUST':
+        parsed = pd.to_datetime(pd.Series(values), format=DATETIME_FORMAT)
+        parsed = parsed.dt.tz_localize(tz or zone()).dt.tz_convert('UTC').dt.tz_localize(None)
+        return parsed.to_numpy().astype('datetime64[ms]').astype(np.int64)
+    unit = unit or detect_unit(values)
+    scale = UNIT_SCALES[unit]
+    if values.dtype.kind == 'f':
+        return np.floor(values * (1000 / scale)).astype(np.int64)
+    values = values.astype(np.int64, copy=False)
+    if scale >= 1000:
+        return values // (scale // 1000)
+    return values * (1000 // scale)
+
+
+def to_datetime64(values, unit: str | None = None, tz=None) -> np.ndarray:
+    """整列时间戳转为 datetime64[ms]（UTC）"""
+    return to_epoch_ms(values, unit, tz).astype('datetime64[ms]')
+
+
+def from_epoch_ms(values, unit: str) -> np.ndarray:
+    """int64 毫秒换算回指定单位（秒级向下取整）"""
+    values = np.asarray(values, dtype=np.int64)
+    scale = UNIT_SCALES[unit]
+    if scale >= 1000:
+        return values * (scale // 1000)
+    return values // (1000 // scale)
+
+
+def parse_datetime(value: str, tz=None) -> datetime:
+    """解析 YYYY-MM-DD HH:MM:SS 为带时区的时间（默认北京时间）"""
+    return (tz or zone()).localize(datetime.strptime(value.strip(), DATETIME_FORMAT))
+
+
+def parse_time(value: str, tz=None) -> int:
+    """解析秒级时间戳或 YYYY-MM-DD HH:MM:SS（按 tz 本地化），返回秒级时间戳"""
+    value = value.strip()
+    if value.isdigit():
+        return int(value)
+    return int(parse_datetime(value, tz).timestamp())
+
+
+def window_bounds(start_ts: int, end_ts: int, unit: str = 's') -> tuple:
+    """
+    秒级时间窗口换算为数据单位下的闭区间（毫秒级等放大到整秒的末尾）
+
+    所有脚本的时间窗口都是闭区间 [start, end]，两端的时间点都计入。按分钟（或时间桶）聚合的数据
+    计入与闭区间相交的每个整分钟，因此与整分钟对齐的 end 包含它所在的那一分钟。
+    """
+    scale = UNIT_SCALES[unit or 's']
+    return start_ts * scale, end_ts * scale + scale - 1
+
+
+def format_timestamp(ts, tz=None, unit: str | None = None) -> str:
+    """任意单位的时间戳格式化为 YYYY-MM-DD HH:MM:SS（unit 为 None 时按量级判断）"""
+    seconds = ts / UNIT_SCALES[unit or unit_of(ts)]
+    return datetime.fromtimestamp(seconds, tz or zone()).strftime(DATETIME_FORMAT)
+
+
+def datetime_to_timestamp(dt_str: str, timezone: str = DEFAULT_TIMEZONE) -> tuple:
     """日期时间字符串转时间戳"""
-    tz = pytz.timezone(timezone)
-    dt = datetime.strptime(dt_str, '%Y-%m-%d %H:%M:%S')
-    dt = tz.localize(dt)
+    dt = parse_datetime(dt_str, zone(timezone))
     
     ts_seconds = int(dt.timestamp())
     ts_milliseconds = int(dt.timestamp() * 1000)
@@ -27,15 +173,9 @@ def datetime_to_timestamp(dt_str: str, timezone: str = 'Asia/Shanghai') -> tuple
     return ts_seconds, ts_milliseconds, dt
 
 
-def timestamp_to_datetime(ts: int, timezone: str = 'Asia/Shanghai', unit: str = 's') -> str:
+def timestamp_to_datetime(ts: int, timezone: str = DEFAULT_TIMEZONE, unit: str = 's') -> str:
     """时间戳转日期时间字符串"""
-    tz = pytz.timezone(timezone)
-    
-    if unit == 'ms':
-        ts = ts / 1000
-    
-    dt = datetime.fromtimestamp(ts, tz=tz)
-    return dt.strftime('%Y-%m-%d %H:%M:%S')
+    return format_timestamp(ts, zone(timezone), unit)
 
 
 def main():
@@ -43,8 +183,9 @@ def main():
     parser.add_argument('--to-timestamp', type=str, help='Convert datetime to timestamp')
     parser.add_argument('--to-datetime', type=int, help='Convert timestamp to datetime')
     parser.add_argument('--range', type=str, nargs=2, help='Convert time range to timestamps')
-    parser.add_argument('--unit', type=str, default='s', choices=['s', 'ms'], help='Timestamp unit')
-    parser.add_argument('--timezone', type=str, default='Asia/Shanghai', help='Timezone')
+    parser.add_argument('--file-unit', type=str, help='Detect the timestamp unit of a telemetry file')
+    parser.add_argument('--unit', type=str, default='s', choices=list(UNIT_SCALES), help='Timestamp unit')
+    parser.add_argument('--timezone', type=str, default=DEFAULT_TIMEZONE, help='Timezone')
     
     args = parser.parse_args()
     
@@ -78,6 +219,11 @@ def main():
         print(f"\n过滤条件(--filters):")
         print(f'  "timestamp>={start_s},timestamp<={end_s}"')
     
+    elif args.file_unit:
+        unit = file_time_unit(args.file_unit)
+        print(f"文件: {args.file_unit}")
+        print(f"时间戳单位: {unit or '未知（无时间列或文件为空）'}")
+    
     else:
         parser.print_help()
 
@@ -0,0 +1,293 @@
+"""
+Trace Dependency Graph for OpenRCA
+服务依赖图 - 由 trace_span 构建按时间桶聚合的 caller -> callee 边表，并计算故障传播得分
+
+子span通过 parent_span/span_id 一次向量化关联到父span（common.span_tree.resolve_parents），
+得到每个时间桶内每条调用边的调用数、错误数和 P50/P95 耗时。根span记为来自 <root> 的调用。
+
+边表保存在数据文件旁（sidecar，npz格式），记录已覆盖的时间桶区间。请求新的时间窗口时只读取
+尚未覆盖的部分并追加，不会对整个文件重做关联；源文件变化时整体失效。
+
+    from common.trace_graph import load_edges, aggregate_edges, propagation_scores
+    edges = load_edges('trace_span.csv', start_ms, end_ms)
+    graph = aggregate_edges(edges)
+    ranking = propagation_scores(edges)
+"""
+
+import os
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from common.span_tree import resolve_parents
+from common.telemetry_cache import cache_unwritable, load_telemetry, sidecar_path, source_stat
+from common.time_utils import unit_scale
+
+EDGES_VERSION = 1
+DEFAULT_BUCKET_SECONDS = 60
+
+# 父span可能早于窗口起点开始，增量计算时向前多读取的时长（秒）
+PARENT_MARGIN_SECONDS = 60
+
+ROOT_CALLER = '<root>'
+
+SPAN_COLUMNS = ['timestamp', 'cmdb_id', 'trace_id', 'span_id', 'parent_span', 'duration', 'status_code']
+EDGE_COLUMNS = ['bucket', 'caller', 'callee', 'calls', 'errors', 'p50', 'p95']
+
+
+def edges_path(file_path: str, bucket_seconds: int) -> Path:
+    return sidecar_path(file_path, f"edges-{bucket_seconds}s.npz")
+
+
+def compute_edges(df: pd.DataFrame, bucket: int) -> pd.DataFrame:
+    """
+    由span构建每个时间桶的调用边表
+
+    bucket 为时间桶宽度（与 timestamp 同单位），子span按自身 timestamp 归入时间桶。
+    """
+    if len(df) == 0:
+        return pd.DataFrame({col: pd.Series(dtype=dtype) for col, dtype in
+                             zip(EDGE_COLUMNS, ['int64', object, object, 'int64', 'int64', 'float64', 'float64'])})
+
+    trace_codes, _ = pd.factorize(df['trace_id'], sort=False)
+    parent = resolve_parents(trace_codes, df['span_id'], df['parent_span'])
+
+    callee = df['cmdb_id'].astype(str).to_numpy(dtype=object)
+    caller = np.where(parent >= 0, callee[np.maximum(parent, 0)], ROOT_CALLER)
+    has_parent_ref = df['parent_span'].notna().to_numpy()
+    keep = (parent >= 0) | ~has_parent_ref  # 父span不在数据中的孤儿span无法确定调用方
+
+    spans = pd.DataFrame({
+        'bucket': df['timestamp'].to_numpy(dtype=np.int64) // bucket * bucket,
+        'caller': caller,
+        'callee': callee,
+        'error': df['status_code'].fillna(0).to_numpy() != 0,
+        'duration': df['duration'].to_numpy(dtype=np.float64, na_value=np.nan),
+    })[keep]
+
+    grouped = spans.groupby(['bucket', 'caller', 'callee'], sort=True)
+    edges = grouped.agg(calls=('error', 'size'), errors=('error', 'sum'))
+    quantiles = grouped['duration'].quantile([0.5, 0.95]).unstack()
+    edges['p50'] = quantiles[0.5]
+    edges['p95'] = quantiles[0.95]
+    return edges.reset_index().astype({'calls': 'int64', 'errors': 'int64'})
+
+
+def _missing_intervals(covered: list, lo: int, hi: int) -> list:
+    """[lo, hi) 中未被已覆盖区间包含的部分"""
+    missing = []
+    cursor = lo
+    for start, end in sorted(covered):
+        if end <= cursor:
+            continue
+        if start >= hi:
+            break
+        if start > cursor:
+            missing.append((cursor, start))
+        cursor = max(cursor, end)
+    if cursor < hi:
+        missing.append((cursor, hi))
+    return missing
+
+
+def _merge_intervals(intervals: list) -> list:
+    merged = []
+    for start, end in sorted(intervals):
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return merged
+
+
+def _read_store(path: Path, stat: dict):
+    """读取边表缓存，版本或源文件不匹配时返回 None"""
+    if not path.exists():
+        return None
+    try:
+        with np.load(path) as data:
+            if int(data['version']) != EDGES_VERSION or int(data['mtime_ns']) != stat['mtime_ns'] \
+                    or int(data['size']) != stat['size']:
+                return None
+            pods = data['pods'].astype(object)
+            edges = pd.DataFrame({
+                'bucket': data['bucket'],
+                'caller': pods[data['caller']],
+                'callee': pods[data['callee']],
+                'calls': data['calls'],
+                'errors': data['errors'],
+                'p50': data['p50'],
+                'p95': data['p95'],
+            })
+            covered = [list(map(int, pair)) for pair in data['covered']]
+    except (OSError, ValueError, KeyError):
+        return None
+    return edges, covered
+
+
+def _write_store(path: Path, stat: dict, edges: pd.DataFrame, covered: list):
+    codes, pods = pd.factorize(pd.concat([edges['caller'], edges['callee']], ignore_index=True), sort=False)
+    n = len(edges)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(path.name + f".tmp{os.getpid()}.npz")
+    try:
+        np.savez(
+            tmp,
+            version=EDGES_VERSION,
+            mtime_ns=stat['mtime_ns'],
+            size=stat['size'],
+            pods=np.asarray(pods, dtype=str),
+            bucket=edges['bucket'].to_numpy(dtype=np.int64),
+            caller=codes[:n].astype(np.int32),
+            callee=codes[n:].astype(np.int32),
+            calls=edges['calls'].to_numpy(dtype=np.int64),
+            errors=edges['errors'].to_numpy(dtype=np.int64),
+            p50=edges['p50'].to_numpy(dtype=np.float64),
+            p95=edges['p95'].to_numpy(dtype=np.float64),
+            covered=np.asarray(covered, dtype=np.int64).reshape(-1, 2),
+        )
+        tmp.replace(path)
+    except OSError:
+        if tmp.exists():
+            tmp.unlink()
+        raise
+
+
+def load_edges(file_path: str, start_ts: int | None = None, end_ts: int | None = None,
+               bucket_seconds: int = DEFAULT_BUCKET_SECONDS, use_cache: bool = True) -> pd.DataFrame:
+    """
+    返回 [start_ts, end_ts] 窗口内的边表（窗口按时间桶向外对齐）
+
+    已缓存的时间桶直接返回，未覆盖的部分读取对应时间段的span计算后追加到缓存。
+    不指定时间范围时计算整个文件。
+    """
+    if start_ts is None or end_ts is None:
+        # 未指定的边界取文件的实际时间范围，只需读取时间戳列
+        ts = load_telemetry(file_path, columns=['timestamp'], start_ts=start_ts, end_ts=end_ts,
+                            use_cache=use_cache)['timestamp']
+        if len(ts) == 0:
+            return compute_edges(ts.to_frame(), 1)
+        start_ts = int(ts.min()) if start_ts is None else start_ts
+        end_ts = int(ts.max()) if end_ts is None else end_ts
+
+    path = edges_path(file_path, bucket_seconds)
+    stat = source_stat(Path(file_path))
+    store = _read_store(path, stat) if use_cache else None
+    edges, covered = store if store is not None else (None, [])
+
+    scale = unit_scale(end_ts)
+    bucket = bucket_seconds * scale
+    lo, hi = _bucket_range(start_ts, end_ts, bucket_seconds)
+
+    missing = _missing_intervals(covered, lo, hi)
+    if missing:
+        parts = [edges] if edges is not None else []
+        for start, end in missing:
+            df = load_telemetry(file_path, columns=SPAN_COLUMNS, start_ts=start - PARENT_MARGIN_SECONDS * scale,
+                                end_ts=end - 1, use_cache=use_cache)
+            new = compute_edges(df, bucket)
+            parts.append(new[(new['bucket'] >= start) & (new['bucket'] < end)])
+        edges = pd.concat(parts, ignore_index=True).sort_values(['bucket', 'caller', 'callee'], ignore_index=True)
+        covered = _merge_intervals(covered + [[start, end] for start, end in missing])
+        if use_cache:
+            try:
+                _write_store(path, stat, edges, covered)
+            except OSError as e:
+                cache_unwritable(path, e)
+
+    return window_edges(edges, start_ts, end_ts, bucket_seconds)
+
+
+def _bucket_range(start_ts: int, end_ts: int, bucket_seconds: int) -> tuple:
+    """窗口向外对齐到时间桶后的 [lo, hi)"""
+    bucket = bucket_seconds * unit_scale(end_ts)
+    return start_ts // bucket * bucket, end_ts // bucket * bucket + bucket
+
+
+def window_edges(edges: pd.DataFrame, start_ts: int, end_ts: int,
+                 bucket_seconds: int = DEFAULT_BUCKET_SECONDS) -> pd.DataFrame:
+    """从覆盖更大时间范围的边表中取出 [start_ts, end_ts] 窗口的部分，时间桶的对齐与 load_edges 相同"""
+    lo, hi = _bucket_range(start_ts, end_ts, bucket_seconds)
+    return edges[(edges['bucket'] >= lo) & (edges['bucket'] < hi)].reset_index(drop=True)
+
+
+def aggregate_edges(edges: pd.DataFrame) -> pd.DataFrame:
+    """
+    把多个时间桶的边合并为窗口级的依赖图
+
+    P50 为各桶P50按调用数加权的平均，P95 取各桶P95的最大值（偏保守）。
+    """
+    weighted = edges.assign(p50_weighted=edges['p50'] * edges['calls'])
+    graph = weighted.groupby(['caller', 'callee'], sort=False).agg(
+        calls=('calls', 'sum'),
+        errors=('errors', 'sum'),
+        p50_weighted=('p50_weighted', 'sum'),
+        p95=('p95', 'max'),
+    ).reset_index()
+    graph['p50'] = graph['p50_weighted'] / graph['calls']
+    graph['error_rate'] = graph['errors'] / graph['calls']
+    graph = graph[['caller', 'callee', 'calls', 'errors', 'error_rate', 'p50', 'p95']]
+    return graph.sort_values(['errors', 'calls'], ascending=False, kind='stable', ignore_index=True)
+
+
+def propagation_scores(edges: pd.DataFrame, by: list | None = None) -> pd.DataFrame:
+    """
+    对每个pod计算故障传播得分，得分高表示错误从该pod开始向上游传播
+
+    in_error_rate:  调用该pod的请求中出错的比例
+    out_error_rate: 该pod调用下游时下游出错的比例（错误来自更下游时与 in_error_rate 接近）
+    own_error_rate: max(in_error_rate - out_error_rate, 0)，无法由下游解释的错误比例
+    score = own_error_rate * log1p(in_errors)
+    first_error:    该pod首次出现错误的时间桶
+
+    by 为额外的分组列（如 window_scores 的 window）时，每组独立计算，结果按组排列。
+    """
+    by = list(by or [])
+    edges = edges[edges['caller'] != edges['callee']]
+
+    incoming = edges.groupby(by + ['callee'], sort=False).agg(in_calls=('calls', 'sum'), in_errors=('errors', 'sum'))
+    outgoing = edges.groupby(by + ['caller'], sort=False).agg(out_calls=('calls', 'sum'), out_errors=('errors', 'sum'))
+    failing = edges[edges['errors'] > 0]
+    callers = failing[failing['caller'] != ROOT_CALLER].groupby(by + ['callee'], sort=False)['caller'].nunique()
+    first_error = failing.groupby(by + ['callee'], sort=False)['bucket'].min()
+
+    outgoing.index.names = incoming.index.names
+    pods = incoming.join(outgoing, how='outer')
+    pods = pods[pods.index.get_level_values(-1) != ROOT_CALLER]
+    pods = pods.fillna(0).astype('int64')
+    pods['in_error_rate'] = np.where(pods['in_calls'] > 0, pods['in_errors'] / pods['in_calls'].clip(lower=1), 0.0)
+    pods['out_error_rate'] = np.where(pods['out_calls'] > 0, pods['out_errors'] / pods['out_calls'].clip(lower=1), 0.0)
+    pods['failing_callers'] = callers.reindex(pods.index).fillna(0).astype('int64')
+    pods['first_error'] = first_error.reindex(pods.index).astype('Int64')
+    pods['own_error_rate'] = (pods['in_error_rate'] - pods['out_error_rate']).clip(lower=0.0)
+    pods['score'] = pods['own_error_rate'] * np.log1p(pods['in_errors'])
+
+    pods = pods.rename_axis(by + ['cmdb_id']).reset_index()
+    return pods.sort_values(by + ['score', 'in_errors'], ascending=[True] * len(by) + [False, False],
+                            kind='stable', ignore_index=True)
+
+
+def window_scores(edges: pd.DataFrame, windows: list, bucket_seconds: int = DEFAULT_BUCKET_SECONDS) -> list:
+    """
+    多个 [start_ts, end_ts] 窗口各自的 propagation_scores
+
+    每个窗口在按时间桶排序的边表上二分定位，展开后按 (窗口, pod) 一次分组计算；
+    结果与逐个窗口 propagation_scores(window_edges(...)) 相同。
+    """
+    buckets = edges['bucket'].to_numpy()
+    order = np.argsort(buckets, kind='stable')
+    sorted_buckets = buckets[order]
+    bounds = np.array([_bucket_range(start_ts, end_ts, bucket_seconds) for start_ts, end_ts in windows],
+                      dtype=np.int64).reshape(-1, 2)
+    lo = np.searchsorted(sorted_buckets, bounds[:, 0], side='left')
+    hi = np.searchsorted(sorted_buckets, bounds[:, 1], side='left')
+    lengths = np.maximum(hi - lo, 0)
+
+    offsets = np.repeat(lo - np.cumsum(lengths) + lengths, lengths) + np.arange(lengths.sum())
+    expanded = edges.iloc[order[offsets]].assign(window=np.repeat(np.arange(len(windows)), lengths))
+    scores = propagation_scores(expanded, by=['window'])
+    parts = {window: part.drop(columns='window').reset_index(drop=True)
+             for window, part in scores.groupby('window', sort=False)}
+    empty = scores.drop(columns='window').iloc[:0]
+    return [parts.get(i, empty) for i in range(len(windows))]
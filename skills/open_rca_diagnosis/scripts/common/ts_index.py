@@ -0,0 +1,274 @@
+#!/usr/bin/env python3
+"""
+Timestamp Seek Index for OpenRCA
+时间戳定位索引 - 按分钟记录CSV中的字节偏移，时间窗口查询只读取对应字节区间
+
+索引在一次流式扫描中建立：按块读取原始字节，用引号奇偶性向量化地识别记录边界
+（兼容引号内换行的日志内容），并记录每分钟记录的最小起始偏移和最大结束偏移。
+OpenRCA 遥测数据基本按时间排序，因此查询窗口通常只对应文件中很小的一段；
+若文件乱序导致覆盖区间过大，则退化为分块读取并逐块过滤。
+秒级（metric/log）和毫秒级（trace）时间戳按数量级自动识别。
+
+Usage:
+    python ts_index.py --build log_service.csv
+    python ts_index.py --file trace_span.csv --time-range "1647738000000,1647739800000"
+"""
+
+import argparse
+import io
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from common.output import notice
+from common.telemetry_cache import cache_unwritable, column_dtypes, read_header, sidecar_path, source_stat, time_column
+from common.time_utils import unit_scale
+
+INDEX_VERSION = 1
+BLOCK_BYTES = 16 * 1024 * 1024
+CHUNK_ROWS = 1_000_000
+
+# 查询覆盖的字节区间超过文件的该比例时，认为文件乱序，改为分块过滤
+MAX_SPAN_RATIO = 0.5
+
+QUOTE = ord('"')
+NEWLINE = ord('\n')
+
+
+def index_path(file_path: str) -> Path:
+    """索引文件路径"""
+    return sidecar_path(file_path, 'tsidx.npz')
+
+
+def iter_records(file_path: str, usecols: list, block_bytes: int = BLOCK_BYTES):
+    """
+    流式扫描CSV，按块产出 (记录起始偏移, 记录结束偏移, 指定列DataFrame)
+
+    偏移为文件内的绝对字节位置；引号内的换行不视为记录边界。
+    """
+    path = Path(file_path)
+    header = read_header(path)
+    col_idx = [header.index(col) for col in usecols]
+    dtypes = {header.index(col): dtype for col, dtype in column_dtypes(header).items() if col in usecols}
+
+    with open(path, 'rb') as f:
+        header_line = f.readline()
+        base = len(header_line)
+        leftover = b''
+        while True:
+            data = f.read(block_bytes)
+            block = leftover + data
+            if not block:
+                break
+            arr = np.frombuffer(block, dtype=np.uint8)
+            newlines = np.flatnonzero(arr == NEWLINE)
+            is_quote = arr == QUOTE
+            if is_quote.any():
+                # 换行之前引号数为偶数时才是记录边界；只需奇偶性，uint8 累加溢出不影响结果
+                quotes = np.cumsum(is_quote, dtype=np.uint8)
+                ends = newlines[(quotes[newlines] & 1) == 0] + 1
+                del quotes
+            else:
+                ends = newlines + 1
+            del is_quote
+            if not data and (len(ends) == 0 or ends[-1] != len(block)):
+                # 文件末尾没有换行符
+                ends = np.append(ends, len(block))
+            if len(ends) == 0:
+                leftover = block
+                continue
+
+            cut = int(ends[-1])
+            starts = np.concatenate(([0], ends[:-1]))
+            frame = pd.read_csv(
+                io.BytesIO(block[:cut]), header=None, usecols=col_idx, dtype=dtypes,
+                skip_blank_lines=False,
+            )
+            frame.columns = [header[i] for i in sorted(col_idx)]
+            yield starts + base, ends + base, frame
+
+            base += cut
+            leftover = block[cut:]
+            if not data:
+                break
+
+
+def build_index(file_path: str) -> dict:
+    """扫描文件并写入分钟级偏移索引"""
+    path = Path(file_path)
+    time_col = time_column(read_header(path))
+    if time_col is None:
+        raise ValueError(f"文件缺少时间列: {file_path}")
+
+    notice(f"构建时间索引: {path.name}")
+
+    stat = source_stat(path)
+    parts = []
+    scale = None
+    records = 0
+    disorder = 0
+    running_max = None
+    for starts, ends, frame in iter_records(file_path, [time_col]):
+        ts = frame[time_col].to_numpy()
+        valid = ~pd.isna(ts)
+        starts, ends, ts = starts[valid], ends[valid], ts[valid].astype(np.int64)
+        if len(ts) == 0:
+            continue
+        if scale is None:
+            scale = unit_scale(ts.max())
+        minutes = ts // (60 * scale)
+
+        # 统计落后于此前最大分钟的记录数，用于判断排序程度
+        prefix_max = np.maximum.accumulate(minutes)
+        if running_max is not None:
+            prefix_max = np.maximum(prefix_max, running_max)
+        disorder += int(np.count_nonzero(minutes < prefix_max))
+        running_max = int(prefix_max[-1])
+        records += len(ts)
+
+        part = pd.DataFrame({'minute': minutes, 'start': starts, 'end': ends})
+        parts.append(part.groupby('minute').agg(start=('start', 'min'), end=('end', 'max')))
+
+    if parts:
+        merged = pd.concat(parts).groupby(level=0).agg(start=('start', 'min'), end=('end', 'max'))
+    else:
+        merged = pd.DataFrame({'start': [], 'end': []}, index=pd.Index([], name='minute'))
+
+    index = {
+        'version': np.int64(INDEX_VERSION),
+        'mtime_ns': np.int64(stat['mtime_ns']),
+        'size': np.int64(stat['size']),
+        'unit_scale': np.int64(scale or 1),
+        'records': np.int64(records),
+        'disorder': np.int64(disorder),
+        'minutes': merged.index.to_numpy(dtype=np.int64),
+        'starts': merged['start'].to_numpy(dtype=np.int64),
+        'ends': merged['end'].to_numpy(dtype=np.int64),
+    }
+    out = index_path(file_path)
+    tmp = out.with_name(out.name + '.tmp.npz')
+    try:
+        out.parent.mkdir(parents=True, exist_ok=True)
+        np.savez(tmp, **index)
+        tmp.replace(out)
+    except OSError as e:
+        # 索引只在本次使用
+        if tmp.exists():
+            tmp.unlink()
+        cache_unwritable(out, e, '本次在内存中使用时间索引')
+    return index
+
+
+def load_index(file_path: str) -> dict:
+    """读取索引，文件变化或索引不存在时重建"""
+    path = index_path(file_path)
+    stat = source_stat(Path(file_path))
+    if path.exists():
+        with np.load(path) as data:
+            index = {key: data[key] for key in data.files}
+        if (
+            int(index['version']) == INDEX_VERSION
+            and int(index['mtime_ns']) == stat['mtime_ns']
+            and int(index['size']) == stat['size']
+        ):
+            return index
+    return build_index(file_path)
+
+
+def byte_range(index: dict, start_ts=None, end_ts=None):
+    """返回覆盖时间窗口内所有记录的字节区间 (lo, hi)，窗口内无数据时返回 None"""
+    scale = 60 * int(index['unit_scale'])
+    minutes = index['minutes']
+    mask = np.ones(len(minutes), dtype=bool)
+    if start_ts is not None:
+        mask &= minutes >= start_ts // scale
+    if end_ts is not None:
+        mask &= minutes <= end_ts // scale
+    if not mask.any():
+        return None
+    return int(index['starts'][mask].min()), int(index['ends'][mask].max())
+
+
+def _filter(df: pd.DataFrame, time_col: str, start_ts, end_ts) -> pd.DataFrame:
+    if start_ts is not None:
+        df = df[df[time_col] >= start_ts]
+    if end_ts is not None:
+        df = df[df[time_col] <= end_ts]
+    return df
+
+
+def read_time_range(file_path: str, start_ts=None, end_ts=None, usecols=None) -> pd.DataFrame:
+    """
+    读取时间窗口内的记录（闭区间，单位与文件一致）
+
+    usecols 为 None 时返回全部列；时间列总会被读取用于精确过滤。
+    """
+    path = Path(file_path)
+    header = read_header(path)
+    time_col = time_column(header)
+    columns = list(header) if usecols is None else list(usecols)
+    read_cols = columns if time_col in columns else columns + [time_col]
+    dtypes = {col: dtype for col, dtype in column_dtypes(header).items() if col in read_cols}
+
+    index = load_index(file_path)
+    span = byte_range(index, start_ts, end_ts)
+    if span is None:
+        return pd.DataFrame({col: pd.Series(dtype=dtypes[col]) for col in columns})
+
+    lo, hi = span
+    if hi - lo > MAX_SPAN_RATIO * int(index['size']):
+        # 乱序文件：分块读取并逐块过滤，内存只与窗口内数据量相关
+        chunks = [
+            _filter(chunk, time_col, start_ts, end_ts)
+            for chunk in pd.read_csv(path, usecols=read_cols, dtype=dtypes, chunksize=CHUNK_ROWS)
+        ]
+        df = pd.concat(chunks, ignore_index=True)
+    else:
+        with open(path, 'rb') as f:
+            header_line = f.readline()
+            f.seek(lo)
+            data = f.read(hi - lo)
+        df = pd.read_csv(io.BytesIO(header_line + data), usecols=read_cols, dtype=dtypes)
+        df = _filter(df, time_col, start_ts, end_ts)
+
+    return df[columns].reset_index(drop=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Timestamp Seek Index for OpenRCA')
+    parser.add_argument('--build', type=str, help='Build (or refresh) index for a CSV file')
+    parser.add_argument('--file', type=str, help='CSV file to query')
+    parser.add_argument('--time-range', type=str, help='Time range (start,end) in the file unit')
+
+    args = parser.parse_args()
+
+    target = args.build or args.file
+    if target and not Path(target).exists():
+        print(f"错误: 文件不存在 {target}")
+        sys.exit(1)
+
+    if args.build:
+        index = build_index(args.build)
+        records = int(index['records'])
+        print(f"索引文件: {index_path(args.build)}")
+        print(f"记录数: {records:,}, 分钟数: {len(index['minutes'])}")
+        print(f"时间戳单位: {'毫秒' if int(index['unit_scale']) == 1000 else '秒'}")
+        print(f"乱序记录: {int(index['disorder']):,} ({int(index['disorder']) / max(records, 1) * 100:.2f}%)")
+    elif args.file and args.time_range:
+        start, end = map(int, args.time_range.split(','))
+        index = load_index(args.file)
+        span = byte_range(index, start, end)
+        df = read_time_range(args.file, start, end)
+        if span is not None:
+            lo, hi = span
+            print(f"读取字节区间: {lo:,} ~ {hi:,} ({(hi - lo) / max(int(index['size']), 1) * 100:.2f}% of file)")
+        print(f"时间窗口内记录数: {len(df):,}")
+    else:
+        parser.print_help()
+
+
+if __name__ == '__main__':
+    main()
@@ -5,15 +5,47 @@ Container Analyzer for OpenRCA - 容器资源指标分析工具
 
 Usage:
     python analyze_container.py --file metric_container.csv --start "2022-03-20 09:00:00" --end "2022-03-20 09:30:00" --component shippingservice
+
+    # 内存受限：估算占用超过上限时按块扫描，阈值为 t-digest 近似值
+    python analyze_container.py --file metric_container.csv --start ... --end ... --max-memory 2G
+
+    # 矩阵存储：首次运行把长表转换为 (序列 × 时间) float32 矩阵，之后内存映射打开，阈值和窗口均值为矩阵归约
+    python analyze_container.py --file metric_container.csv --start ... --end ... --matrix
+
+    # 变点检测：在矩阵上对全天所有容器KPI序列做分段，输出每条序列的变化起点、幅度和方向，按最早起点排序组件
+    python analyze_container.py --file metric_container.csv --changepoint
+    python analyze_container.py --file metric_container.csv --changepoint --start ... --end ...   # 只在范围内找起点
+
+    # 在线跟踪：持续读取新追加的数据，容器KPI的 EWMA 均值越过阈值时立即输出（状态写入检查点）
+    python analyze_container.py --file metric_container.csv --follow --component shippingservice
 """
 
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from common.rca_client import add_server_argument, forward_early, forward_if_requested
+
+if __name__ == '__main__':
+    forward_early('analyze_container')  # --server: 在导入 pandas 之前转发给常驻服务
+
 import argparse
 import pandas as pd
 import numpy as np
 from datetime import datetime
-import pytz
-import sys
-from pathlib import Path
+
+from common.changepoint import (DEFAULT_MIN_CHANGE, DEFAULT_MIN_SCORE, changepoint_result, emit_changepoints,
+                                print_changepoints)
+from common.chunked import GroupedQuantiles, fits_in_memory, iter_chunks
+from common.follow import DEFAULT_ALPHA, DEFAULT_INTERVAL, LONG_COLUMNS, StreamDetector, checkpoint_path, follow
+from common.output import add_format_arguments, check_format_arguments, structured_output
+from common.profiling import add_profile_arguments, check_profile_arguments, profile_session, stage
+from common.series_store import kpi_thresholds, open_matrix, window_anomalies
+from common.telemetry_cache import load_telemetry, parse_size
+from common.time_utils import parse_datetime, unit_of, window_bounds, zone
+
+
+CONTAINER_COLUMNS = ['timestamp', 'cmdb_id', 'kpi_name', 'value']
 
 
 # 资源类型关键词映射
@@ -25,6 +57,15 @@ RESOURCE_KEYWORDS = {
     'network': ['network', 'net', 'tcp', 'packet']
 }
 
+# 资源类型 -> 候选根因原因（specs/market_spec.md）
+RESOURCE_REASONS = {
+    'cpu': 'container CPU load',
+    'memory': 'container memory load',
+    'disk_read': 'container read I/O load',
+    'disk_write': 'container write I/O load',
+    'network': 'container network issue',
+}
+
 
 def classify_kpi(kpi_name: str) -> str:
     """分类KPI类型"""
@@ -35,170 +76,432 @@ def classify_kpi(kpi_name: str) -> str:
     return 'other'
 
 
-def analyze_container_metrics(file_path: str, start_dt: datetime, end_dt: datetime, component_filter: str = None):
-    """分析容器层指标"""
-    tz = pytz.timezone('Asia/Shanghai')
-    start_ts = int(start_dt.timestamp())
-    end_ts = int(end_dt.timestamp())
-    
-    df = pd.read_csv(file_path)
-    
-    print(f"{'='*70}")
-    print(f"容器层资源指标分析报告")
-    print(f"{'='*70}")
-    print(f"数据文件: {file_path}")
-    print(f"总数据量: {len(df)} 条")
-    print(f"时间范围: {start_dt} ~ {end_dt}")
-    print(f"分析时间: {datetime.now(tz).strftime('%Y-%m-%d %H:%M:%S')}")
+def classify_kpis(kpi_names: pd.Series) -> pd.Series:
+    """按唯一KPI名分类后映射回每一行"""
+    unique = pd.Series(kpi_names.dropna().unique())
+    mapping = dict(zip(unique, unique.map(classify_kpi)))
+    return kpi_names.map(mapping)
+
+
+def filter_components(df: pd.DataFrame, component_filter: str) -> pd.DataFrame:
+    """按组件名过滤（大小写不敏感的正则），只在唯一的 cmdb_id 上匹配"""
+    ids = pd.Series(df['cmdb_id'].dropna().unique())
+    matched = ids[ids.str.contains(component_filter, case=False, na=False)]
+    return df[df['cmdb_id'].isin(matched)]
+
+
+def compute_kpi_thresholds(df: pd.DataFrame) -> pd.DataFrame:
+    """一次分组计算每个KPI的全局分位数阈值，索引为 kpi_name，列为 P50/P90/P95"""
+    values = df.dropna(subset=['value'])
+    thresholds = values.groupby('kpi_name', sort=False, observed=True)['value'].quantile([0.5, 0.9, 0.95]).unstack()
+    thresholds.columns = ['P50', 'P90', 'P95']
+    return thresholds
+
+
+def scan_container_chunks(file_path: str, max_memory: int, component_filter: str | None = None) -> dict:
+    """
+    内存受限模式：按块扫描整个文件，只保留组件、KPI 和每个KPI一个 t-digest
+
+    返回总行数、组件和KPI（按首次出现顺序）以及与 compute_kpi_thresholds 同格式的近似阈值。
+    """
+    rows = 0
+    components = {}
+    kpis = {}
+    digests = GroupedQuantiles()
+    for chunk in iter_chunks(file_path, CONTAINER_COLUMNS, max_memory=max_memory):
+        rows += len(chunk)
+        if component_filter:
+            chunk = filter_components(chunk, component_filter)
+        components.update(dict.fromkeys(chunk['cmdb_id'].unique()))
+        kpis.update(dict.fromkeys(chunk['kpi_name'].dropna().unique()))
+        digests.add(chunk['kpi_name'], chunk['value'])
+    thresholds = digests.quantiles([0.5, 0.9, 0.95])
+    thresholds.columns = ['P50', 'P90', 'P95']
+    thresholds.index.name = 'kpi_name'
+    return {'rows': rows, 'components': list(components), 'kpis': list(kpis), 'thresholds': thresholds}
+
+
+def detect_container_anomalies(filtered: pd.DataFrame, thresholds: pd.DataFrame,
+                               min_deviation: float = 0.5) -> list:
+    """
+    检测窗口均值超过全局P95且偏离超过 min_deviation 的容器KPI
+
+    返回按偏离程度降序的异常列表；偏离相同时保持 (容器首次出现, KPI首次出现) 的顺序。
+    """
+    stats = filtered.groupby(['cmdb_id', 'kpi_name'], sort=False, observed=True)['value'].agg(['mean', 'max', 'count'])
+    stats = stats[stats['count'] > 0].reset_index()
+
+    # 容器按窗口内首次出现排序，同一容器内保持KPI首次出现的顺序
+    container_order = {cmdb_id: i for i, cmdb_id in enumerate(filtered['cmdb_id'].dropna().unique())}
+    stats = stats.iloc[np.argsort(stats['cmdb_id'].map(container_order).to_numpy(dtype=np.int64), kind='stable')]
+
+    stats = stats.join(thresholds['P95'], on='kpi_name', how='inner')
+    stats = stats[stats['mean'] > stats['P95']]
+    stats['deviation'] = (stats['mean'] - stats['P95']) / stats['P95']
+    stats = stats[stats['deviation'] > min_deviation]
+    stats = stats.sort_values('deviation', ascending=False, kind='stable')
+
+    result = pd.DataFrame({
+        'cmdb_id': stats['cmdb_id'],
+        'kpi_name': stats['kpi_name'],
+        'resource_type': classify_kpis(stats['kpi_name']),
+        'value': stats['mean'],
+        'max': stats['max'],
+        'threshold': stats['P95'],
+        'deviation': stats['deviation'],
+    })
+    return result.to_dict('records')
+
+
+def container_matrix_result(file_path: str, start_ts: int, end_ts: int, component_filter: str | None = None,
+                            use_cache: bool = True) -> dict:
+    """
+    在 (序列 × 时间) 矩阵上完成单窗口分析，结果格式与 container_window_result 相同
+
+    窗口数据量为窗口内有值的时间桶数；数值为 float32，同一桶内的多个点取均值。
+    """
+    with stage('load', file=file_path, matrix=True) as span:
+        matrix = open_matrix(file_path, use_cache=use_cache)
+        rows = matrix.rows(component_filter)
+        span.rows = matrix.meta['rows']
+    window = matrix.columns(start_ts, end_ts)
+    with stage('filter') as span:
+        window_rows = int((~np.isnan(matrix.values[rows, window])).sum())
+        span.rows = window_rows
+    with stage('threshold') as span:
+        thresholds = kpi_thresholds(matrix, rows) if window_rows else None
+        span.rows = len(rows)
+    with stage('detect') as span:
+        anomalies = []
+        if window_rows:
+            found = window_anomalies(matrix, thresholds, start_ts, end_ts, rows)
+            found.insert(2, 'resource_type', classify_kpis(found['kpi_name']))
+            anomalies = found.to_dict('records')
+        span.rows = window_rows
+        span.set(anomalies=len(anomalies))
+    series = matrix.series.iloc[rows]
+    return {
+        'rows': matrix.meta['rows'],
+        'chunked': False,
+        'components': series['cmdb_id'].nunique(),
+        'kpi_types': pd.Series(series['kpi_name'].unique()).map(classify_kpi).value_counts().sort_index(),
+        'window_rows': window_rows,
+        'thresholds': thresholds,
+        'anomalies': anomalies,
+    }
+
+
+def container_window_result(file_path: str, start_ts: int, end_ts: int, component_filter: str | None = None,
+                            use_cache: bool = True, max_memory: int | None = None, matrix: bool = False) -> dict:
+    """
+    单窗口分析的结构化结果：组件和KPI统计、每个KPI的全局阈值、窗口内数据量和异常容器KPI
+
+    设置 max_memory 且整体加载会超过上限时按块扫描，只加载窗口内的数据；
+    matrix 为 True 时改用矩阵存储（common.series_store）。
+    """
+    if matrix:
+        return container_matrix_result(file_path, start_ts, end_ts, component_filter, use_cache)
+    chunked = bool(max_memory) and not fits_in_memory(file_path, CONTAINER_COLUMNS, max_memory)
+    if chunked:
+        with stage('threshold', chunked=True) as span:
+            scan = scan_container_chunks(file_path, max_memory, component_filter)
+            span.rows = scan['rows']
+        rows, components, kpis, thresholds = scan['rows'], scan['components'], scan['kpis'], scan['thresholds']
+        with stage('load', file=file_path) as span:
+            filtered = load_telemetry(file_path, columns=CONTAINER_COLUMNS, start_ts=start_ts, end_ts=end_ts,
+                                      use_cache=use_cache)
+            if component_filter:
+                filtered = filter_components(filtered, component_filter)
+            span.rows = len(filtered)
+    else:
+        with stage('load', file=file_path) as span:
+            df = load_telemetry(file_path, columns=CONTAINER_COLUMNS, use_cache=use_cache)
+            rows = len(df)
+            if component_filter:
+                df = filter_components(df, component_filter)
+            components, kpis = df['cmdb_id'].unique(), df['kpi_name'].dropna().unique()
+            span.rows = rows
+        with stage('filter') as span:
+            filtered = df[(df['timestamp'] >= start_ts) & (df['timestamp'] <= end_ts)]
+            span.rows = len(filtered)
+        with stage('threshold') as span:
+            thresholds = compute_kpi_thresholds(df) if len(filtered) else None
+            span.rows = len(df) if len(filtered) else 0
+    with stage('detect') as span:
+        anomalies = detect_container_anomalies(filtered, thresholds) if len(filtered) else []
+        span.rows = len(filtered)
+        span.set(anomalies=len(anomalies))
+    return {
+        'rows': rows,
+        'chunked': chunked,
+        'components': len(components),
+        'kpi_types': pd.Series(kpis).map(classify_kpi).value_counts().sort_index(),
+        'window_rows': len(filtered),
+        'thresholds': thresholds,
+        'anomalies': anomalies,
+    }
+
+
+def analyze_container_metrics(file_path: str, start_dt: datetime, end_dt: datetime, component_filter: str | None = None,
+                              use_cache: bool = True, max_memory: int | None = None, matrix: bool = False):
+    """分析容器层指标；设置 max_memory 且整体加载会超过上限时按块扫描"""
+    tz = zone()
+    result = container_window_result(file_path, int(start_dt.timestamp()), int(end_dt.timestamp()),
+                                     component_filter, use_cache, max_memory, matrix)
+    with stage('report'):
+        print(f"{'='*70}")
+        print(f"容器层资源指标分析报告")
+        print(f"{'='*70}")
+        print(f"数据文件: {file_path}")
+        print(f"总数据量: {result['rows']} 条")
+        print(f"时间范围: {start_dt} ~ {end_dt}")
+        print(f"分析时间: {datetime.now(tz).strftime('%Y-%m-%d %H:%M:%S')}")
+        if result['chunked']:
+            print(f"读取模式: 分块扫描（预计占用超过 {max_memory / 1024 / 1024:.1f} MB，阈值为 t-digest 近似值）")
+        elif matrix:
+            print("读取模式: 矩阵存储（float32，窗口数据量为有值的时间桶数）")
     
-    df['resource_type'] = df['kpi_name'].apply(classify_kpi)
+        if component_filter:
+            print(f"组件过滤: {component_filter}")
     
-    if component_filter:
-        df = df[df['cmdb_id'].str.contains(component_filter, case=False, na=False)]
-        print(f"组件过滤: {component_filter}")
+        print(f"\n{'#'*70}")
+        print(f"# 第一步：统计组件和KPI")
+        print(f"{'#'*70}")
     
-    print(f"\n{'#'*70}")
-    print(f"# 第一步：统计组件和KPI")
-    print(f"{'#'*70}")
+        print(f"容器数量: {result['components']}")
     
-    components = df['cmdb_id'].unique()
-    print(f"容器数量: {len(components)}")
+        print(f"\n资源类型统计:")
+        for res_type, count in result['kpi_types'].items():
+            print(f"  {res_type}: {count} 个KPI")
     
-    kpi_types = df.groupby('resource_type')['kpi_name'].nunique()
-    print(f"\n资源类型统计:")
-    for res_type, count in kpi_types.items():
-        print(f"  {res_type}: {count} 个KPI")
+        print(f"\n{'#'*70}")
+        print(f"# 第二步：过滤故障时间窗口")
+        print(f"{'#'*70}")
     
-    print(f"\n{'#'*70}")
-    print(f"# 第二步：过滤故障时间窗口")
-    print(f"{'#'*70}")
+        print(f"时间窗口内数据: {result['window_rows']} 条")
     
-    filtered = df[(df['timestamp'] >= start_ts) & (df['timestamp'] <= end_ts)]
-    print(f"时间窗口内数据: {len(filtered)} 条")
+        if result['window_rows'] == 0:
+            print(f"警告: 指定时间范围内无数据！")
+            return
     
-    if len(filtered) == 0:
-        print(f"警告: 指定时间范围内无数据！")
-        return
+        print(f"\n{'#'*70}")
+        print(f"# 第三步：计算每个KPI的全局阈值")
+        print(f"{'#'*70}")
     
-    print(f"\n{'#'*70}")
-    print(f"# 第三步：计算每个KPI的全局阈值")
-    print(f"{'#'*70}")
+        print(f"计算了 {len(result['thresholds'])} 个KPI的阈值")
     
-    thresholds = {}
-    for kpi_name in df['kpi_name'].unique():
-        kpi_data = df[df['kpi_name'] == kpi_name]['value'].dropna()
-        if len(kpi_data) > 0:
-            thresholds[kpi_name] = {
-                'P95': np.percentile(kpi_data, 95),
-                'P90': np.percentile(kpi_data, 90),
-                'P50': np.percentile(kpi_data, 50)
-            }
+        print(f"\n{'#'*70}")
+        print(f"# 第四步：检测异常容器")
+        print(f"{'#'*70}")
     
-    print(f"计算了 {len(thresholds)} 个KPI的阈值")
+        anomalies = result['anomalies']
     
-    print(f"\n{'#'*70}")
-    print(f"# 第四步：检测异常容器")
-    print(f"{'#'*70}")
+        if not anomalies:
+            print(f"未检测到明显的容器资源异常（偏离>50%）")
+        else:
+            print(f"\n检测到 {len(anomalies)} 个容器资源异常：\n")
+        
+            for i, a in enumerate(anomalies[:15], 1):
+                print(f"{i}. [{a['cmdb_id']}] {a['resource_type']}")
+                print(f"   KPI: {a['kpi_name'][:50]}...")
+                print(f"   均值={a['value']:.2f}, 阈值(P95)={a['threshold']:.2f}, 最大={a['max']:.2f}")
+                print(f"   偏离程度: {a['deviation']*100:.1f}%")
+                print()
     
-    anomalies = []
+        print(f"{'#'*70}")
+        print(f"# 第五步：结论与建议")
+        print(f"{'#'*70}")
     
-    for cmdb_id in filtered['cmdb_id'].unique():
-        container_data = filtered[filtered['cmdb_id'] == cmdb_id]
-        
-        for kpi_name in container_data['kpi_name'].unique():
-            if kpi_name not in thresholds:
-                continue
-            
-            kpi_data = container_data[container_data['kpi_name'] == kpi_name]['value'].dropna()
-            if len(kpi_data) == 0:
-                continue
-            
-            mean_val = kpi_data.mean()
-            max_val = kpi_data.max()
-            threshold_p95 = thresholds[kpi_name]['P95']
-            
-            if mean_val > threshold_p95:
-                deviation = (mean_val - threshold_p95) / threshold_p95
-                
-                if deviation > 0.5:
-                    resource_type = classify_kpi(kpi_name)
-                    anomalies.append({
-                        'cmdb_id': cmdb_id,
-                        'kpi_name': kpi_name,
-                        'resource_type': resource_type,
-                        'value': mean_val,
-                        'max': max_val,
-                        'threshold': threshold_p95,
-                        'deviation': deviation
-                    })
-    
-    if not anomalies:
-        print(f"未检测到明显的容器资源异常（偏离>50%）")
-    else:
-        anomalies.sort(key=lambda x: x['deviation'], reverse=True)
+        if anomalies:
+            resource_counts = {}
+            for a in anomalies:
+                res = a['resource_type']
+                cmdb = a['cmdb_id']
+                key = f"{cmdb}:{res}"
+                resource_counts[key] = resource_counts.get(key, 0) + 1
         
-        print(f"\n检测到 {len(anomalies)} 个容器资源异常：\n")
+            sorted_resources = sorted(resource_counts.items(), key=lambda x: x[1], reverse=True)
         
-        for i, a in enumerate(anomalies[:15], 1):
-            print(f"{i}. [{a['cmdb_id']}] {a['resource_type']}")
-            print(f"   KPI: {a['kpi_name'][:50]}...")
-            print(f"   均值={a['value']:.2f}, 阈值(P95)={a['threshold']:.2f}, 最大={a['max']:.2f}")
-            print(f"   偏离程度: {a['deviation']*100:.1f}%")
-            print()
-    
-    print(f"{'#'*70}")
-    print(f"# 第五步：结论与建议")
-    print(f"{'#'*70}")
-    
-    if anomalies:
-        resource_counts = {}
-        for a in anomalies:
-            res = a['resource_type']
-            cmdb = a['cmdb_id']
-            key = f"{cmdb}:{res}"
-            resource_counts[key] = resource_counts.get(key, 0) + 1
+            print(f"\n异常组件分布:")
+            for key, count in sorted_resources[:5]:
+                print(f"  {key}: {count} 个异常KPI")
         
-        sorted_resources = sorted(resource_counts.items(), key=lambda x: x[1], reverse=True)
+            top = anomalies[0]
+            print(f"\n最显著异常: {top['cmdb_id']}")
+            print(f"资源类型: {top['resource_type']}")
+            print(f"偏离阈值: {top['deviation']*100:.1f}%")
         
-        print(f"\n异常组件分布:")
-        for key, count in sorted_resources[:5]:
-            print(f"  {key}: {count} 个异常KPI")
-        
-        top = anomalies[0]
-        print(f"\n最显著异常: {top['cmdb_id']}")
-        print(f"资源类型: {top['resource_type']}")
-        print(f"偏离阈值: {top['deviation']*100:.1f}%")
-        
-        reason_mapping = {
-            'cpu': 'container CPU load',
-            'memory': 'container memory load',
-            'disk_read': 'container read I/O load',
-            'disk_write': 'container write I/O load',
-            'network': 'container network issue'
-        }
-        print(f"可能原因: {reason_mapping.get(top['resource_type'], '未知资源问题')}")
-    else:
-        print(f"\n建议: 检查服务层业务指标或链路追踪")
+            print(f"可能原因: {RESOURCE_REASONS.get(top['resource_type'], '未知资源问题')}")
+        else:
+            print(f"\n建议: 检查服务层业务指标或链路追踪")
+
+
+def emit_container_metrics(out, file_path: str, start_ts: int, end_ts: int, component_filter: str | None = None,
+                           use_cache: bool = True, max_memory: int | None = None, matrix: bool = False):
+    """--format json|arrow：概要、资源类型计数、异常容器KPI及其所在KPI的阈值"""
+    result = container_window_result(file_path, start_ts, end_ts, component_filter, use_cache, max_memory, matrix)
+    anomalies = result['anomalies']
+    thresholds = result['thresholds']
+    with stage('report', format=out.fmt):
+        out.record('summary', file=file_path, rows=result['rows'], start=start_ts, end=end_ts,
+                   component=component_filter, components=result['components'], kpis=int(result['kpi_types'].sum()),
+                   window_rows=result['window_rows'], thresholds=0 if thresholds is None else len(thresholds),
+                   anomalies=len(anomalies), chunked=result['chunked'])
+        out.table('resource_types', result['kpi_types'].rename_axis('resource_type').rename('kpis'))
+        out.table('anomalies', anomalies)
+        if anomalies:
+            # 全部KPI的阈值可达数千行，只输出出现异常的KPI
+            kpis = list(dict.fromkeys(a['kpi_name'] for a in anomalies))
+            out.table('thresholds', thresholds.loc[kpis].rename_axis('kpi_name').reset_index())
+
+
+def container_changepoints(file_path: str, start_ts: int | None = None, end_ts: int | None = None, component_filter: str | None = None,
+                           use_cache: bool = True, min_score: float = DEFAULT_MIN_SCORE,
+                           min_change: float = DEFAULT_MIN_CHANGE) -> dict:
+    """
+    在矩阵存储上检测所有容器KPI序列的变化起点（common.changepoint）
+
+    start_ts/end_ts 为秒级，只限定起点所在的范围，分段始终使用全天数据。
+    """
+    with stage('load', file=file_path, matrix=True) as span:
+        matrix = open_matrix(file_path, use_cache=use_cache)
+        rows = matrix.rows(component_filter)
+        span.rows = matrix.meta['rows']
+    unit = unit_of(matrix.t0) if matrix.meta['rows'] else 's'
+    lo, hi = window_bounds(start_ts, end_ts, unit) if start_ts is not None else (None, None)
+    values = matrix.values if len(rows) == len(matrix) else matrix.values[rows]
+    result = changepoint_result(values, matrix.times, matrix.series.iloc[rows].reset_index(drop=True), lo, hi,
+                                min_score, min_change, rows=matrix.meta['rows'])
+    result['unit'] = unit
+    return result
+
+
+def analyze_container_changepoints(file_path: str, start_ts: int | None = None, end_ts: int | None = None,
+                                   component_filter: str | None = None, use_cache: bool = True,
+                                   min_score: float = DEFAULT_MIN_SCORE, min_change: float = DEFAULT_MIN_CHANGE):
+    """变点检测的文本报告"""
+    result = container_changepoints(file_path, start_ts, end_ts, component_filter, use_cache, min_score, min_change)
+    with stage('report'):
+        print_changepoints('容器层指标变点检测报告', file_path, result, zone(), result['unit'],
+                           filters={'组件过滤': component_filter})
 
 
-def main():
+def emit_container_changepoints(out, file_path: str, start_ts: int | None = None, end_ts: int | None = None,
+                                component_filter: str | None = None, use_cache: bool = True,
+                                min_score: float = DEFAULT_MIN_SCORE, min_change: float = DEFAULT_MIN_CHANGE):
+    """--format json|arrow：概要、按最早起点排序的组件和每条序列的起点"""
+    result = container_changepoints(file_path, start_ts, end_ts, component_filter, use_cache, min_score, min_change)
+    with stage('report', format=out.fmt):
+        emit_changepoints(out, result, file=file_path, component=component_filter)
+
+
+def follow_container_metrics(file_path: str, component_filter: str | None = None, alpha: float = DEFAULT_ALPHA,
+                             interval: float = DEFAULT_INTERVAL, checkpoint: str | None = None, min_deviation: float = 0.5,
+                             on_event=None):
+    """在线跟踪容器层指标：与批量分析相同的 P95 + 偏离规则，窗口均值换成每个容器KPI的 EWMA 均值"""
+    def to_long(frame: pd.DataFrame) -> pd.DataFrame:
+        if component_filter:
+            frame = filter_components(frame, component_filter)
+        return frame.rename(columns={'cmdb_id': 'component', 'kpi_name': 'kpi'})[LONG_COLUMNS]
+
+    config = {'analyzer': 'container', 'component': component_filter, 'alpha': alpha, 'min_deviation': min_deviation}
+    path = Path(checkpoint) if checkpoint else checkpoint_path(file_path, 'follow_container.json')
+
+    print(f"{'='*70}")
+    print("容器层资源指标在线跟踪")
+    print(f"{'='*70}")
+    print(f"数据文件: {file_path}")
+    if component_filter:
+        print(f"组件过滤: {component_filter}")
+    print(f"规则: EWMA均值(alpha={alpha}) > 全局P95 且偏离 > {min_deviation*100:.0f}%")
+    print(f"检查点: {path}", flush=True)
+
+    detector = StreamDetector(min_deviation=min_deviation, alpha=alpha)
+    follow(file_path, detector, to_long, path, config, interval=interval, on_event=on_event)
+
+
+def main(argv=None):
     parser = argparse.ArgumentParser(description='Container Analyzer for OpenRCA')
     parser.add_argument('--file', type=str, required=True, help='Container metric file path')
-    parser.add_argument('--start', type=str, required=True, help='Start time (YYYY-MM-DD HH:MM:SS)')
-    parser.add_argument('--end', type=str, required=True, help='End time (YYYY-MM-DD HH:MM:SS)')
+    parser.add_argument('--start', type=str, help='Start time (YYYY-MM-DD HH:MM:SS)')
+    parser.add_argument('--end', type=str, help='End time (YYYY-MM-DD HH:MM:SS)')
     parser.add_argument('--component', type=str, help='Filter by component name (e.g., shippingservice)')
+    parser.add_argument('--no-cache', action='store_true', help='Read the CSV directly instead of the columnar cache')
+    parser.add_argument('--max-memory', type=str,
+                        help='Memory ceiling, e.g. 2G; files estimated not to fit are scanned in chunks')
+    parser.add_argument('--matrix', action='store_true',
+                        help='Use the memory-mapped series x time matrix store (float32) instead of row scans')
+    parser.add_argument('--changepoint', action='store_true',
+                        help='Find the onset, magnitude and direction of changes in every series of the day '
+                             '(--start/--end optionally limit where onsets are reported)')
+    parser.add_argument('--min-score', type=float, default=DEFAULT_MIN_SCORE,
+                        help='Changepoint: minimum CUSUM score (mean shift in noise standard deviations)')
+    parser.add_argument('--min-change', type=float, default=DEFAULT_MIN_CHANGE,
+                        help='Changepoint: minimum change relative to the mean before the onset')
+    parser.add_argument('--follow', action='store_true', help='Tail the file and report anomalies as samples arrive')
+    parser.add_argument('--interval', type=float, default=DEFAULT_INTERVAL, help='Follow mode: poll interval in seconds')
+    parser.add_argument('--alpha', type=float, default=DEFAULT_ALPHA, help='Follow mode: EWMA smoothing factor')
+    parser.add_argument('--checkpoint', type=str, help='Follow mode: checkpoint file (default: next to the cache)')
+    add_format_arguments(parser)
+    add_profile_arguments(parser)
+    add_server_argument(parser)
     
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
+    forward_if_requested(args, 'analyze_container', argv)
+    check_format_arguments(parser, args)
+    check_profile_arguments(parser, args)
     
+    with profile_session(args, 'analyze_container'):
+        run(parser, args)
+
+
+def run(parser, args):
+    """按参数执行单窗口分析或在线跟踪"""
     if not Path(args.file).exists():
         print(f"错误: 文件不存在 {args.file}")
         sys.exit(1)
     
-    tz = pytz.timezone('Asia/Shanghai')
-    start_dt = tz.localize(datetime.strptime(args.start, '%Y-%m-%d %H:%M:%S'))
-    end_dt = tz.localize(datetime.strptime(args.end, '%Y-%m-%d %H:%M:%S'))
+    if args.follow:
+        if args.format != 'text':
+            with structured_output(args.format, args.max_rows) as out:
+                follow_container_metrics(args.file, args.component, args.alpha, args.interval, args.checkpoint,
+                                         on_event=lambda event: out.record('event', **event))
+            return
+        follow_container_metrics(args.file, args.component, args.alpha, args.interval, args.checkpoint)
+        return
+    
+    tz = zone()
+    if args.changepoint:
+        if args.max_memory:
+            parser.error('--changepoint and --max-memory cannot be combined')
+        if bool(args.start) != bool(args.end):
+            parser.error('--start and --end must be given together')
+        start_ts = int(parse_datetime(args.start, tz).timestamp()) if args.start else None
+        end_ts = int(parse_datetime(args.end, tz).timestamp()) if args.end else None
+        options = {'component_filter': args.component, 'use_cache': not args.no_cache, 'min_score': args.min_score,
+                   'min_change': args.min_change}
+        if args.format != 'text':
+            with structured_output(args.format, args.max_rows) as out:
+                emit_container_changepoints(out, args.file, start_ts, end_ts, **options)
+            return
+        analyze_container_changepoints(args.file, start_ts, end_ts, **options)
+        return
+    
+    if not args.start or not args.end:
+        parser.error('--start and --end are required unless --follow or --changepoint is given')
+    if args.matrix and args.max_memory:
+        parser.error('--matrix and --max-memory cannot be combined')
     
-    analyze_container_metrics(args.file, start_dt, end_dt, args.component)
+    start_dt, end_dt = parse_datetime(args.start, tz), parse_datetime(args.end, tz)
+    
+    max_memory = parse_size(args.max_memory) if args.max_memory else None
+    if args.format != 'text':
+        with structured_output(args.format, args.max_rows) as out:
+            emit_container_metrics(out, args.file, int(start_dt.timestamp()), int(end_dt.timestamp()), args.component,
+                                   use_cache=not args.no_cache, max_memory=max_memory, matrix=args.matrix)
+        return
+    analyze_container_metrics(args.file, start_dt, end_dt, args.component, use_cache=not args.no_cache,
+                              max_memory=max_memory, matrix=args.matrix)
 
 
 if __name__ == '__main__':
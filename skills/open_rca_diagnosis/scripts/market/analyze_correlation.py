@@ -0,0 +1,310 @@
+#!/usr/bin/env python3
+"""
+Cross-layer Correlation Analyzer for OpenRCA - 跨层滞后相关分析工具
+把异常的服务层KPI（rr/sr/mrt）与容器、节点、网格指标对齐到同一时间网格，
+批量计算滞后相关和领先得分，给出每个异常服务KPI最可能的底层原因
+
+Usage:
+    python analyze_correlation.py --data-dir cloudbed-1/telemetry/2022_03_20 --start "2022-03-20 09:00:00" --end "2022-03-20 09:30:00"
+
+    # 指定文件和目标服务（不指定时取窗口内异常的服务KPI）
+    python analyze_correlation.py --service-file metric_service.csv --container-file metric_container.csv \\
+        --node-file metric_node.csv --start ... --end ... --service checkoutservice-grpc:mrt
+
+    # 时间网格和预算：60秒一桶，最多领先10桶，候选序列按变化幅度依次计算，最多5秒
+    python analyze_correlation.py --data-dir ... --start ... --end ... --step 60 --max-lag 10 --budget 5
+"""
+
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from common.rca_client import add_server_argument, forward_early, forward_if_requested
+
+if __name__ == '__main__':
+    forward_early('analyze_correlation')  # --server: 在导入 pandas 之前转发给常驻服务
+
+import argparse
+
+import pandas as pd
+
+from common.correlation import (
+    DEFAULT_BUDGET,
+    DEFAULT_CONTEXT,
+    DEFAULT_MAX_LAG,
+    DEFAULT_STEP,
+    DEFAULT_TOP,
+    align_series,
+    grid_bins,
+    rank_causes,
+    service_long,
+)
+from common.output import add_format_arguments, check_format_arguments, structured_output, write_table
+from common.profiling import add_profile_arguments, check_profile_arguments, profile_session, stage
+from common.telemetry_cache import load_telemetry
+from common.time_utils import (
+    file_time_unit,
+    format_timestamp,
+    from_epoch_ms,
+    parse_time,
+    to_epoch_ms,
+    window_bounds,
+    zone,
+)
+from market.analyze_metric import (
+    ABOVE_KPIS,
+    BELOW_KPIS,
+    SERVICE_COLUMNS,
+    compute_service_thresholds,
+    detect_service_anomalies,
+)
+
+# 候选原因所在的层：层名 -> 指标文件
+CANDIDATE_FILES = {
+    'container': 'metric_container.csv',
+    'node': 'metric_node.csv',
+    'mesh': 'metric_mesh.csv',
+}
+
+LONG_COLUMNS = ['timestamp', 'cmdb_id', 'kpi_name', 'value']
+
+KPIS = BELOW_KPIS + ABOVE_KPIS
+
+
+def locate_metric_files(data_dir: str | None = None, overrides: dict | None = None) -> dict:
+    """层名（service/container/node/mesh） -> 文件路径；在 data_dir/metric/ 或 data_dir 中查找，显式指定的优先"""
+    names = dict(service='metric_service.csv', **CANDIDATE_FILES)
+    files = {}
+    if data_dir:
+        root = Path(data_dir)
+        for layer, name in names.items():
+            for candidate in (root / 'metric' / name, root / name):
+                if candidate.exists() and layer not in files:
+                    files[layer] = str(candidate)
+    for layer, path in (overrides or {}).items():
+        if path:
+            files[layer] = path
+    return files
+
+
+def in_seconds(df: pd.DataFrame, unit: str) -> pd.DataFrame:
+    """时间列统一为秒级，使各层对齐到同一网格"""
+    if unit in (None, 's'):
+        return df
+    return df.assign(timestamp=from_epoch_ms(to_epoch_ms(df['timestamp'], unit), 's'))
+
+
+def parse_targets(value: str) -> list:
+    """'svc-grpc' 或 'svc-grpc:mrt'，逗号分隔；只给服务名时取全部KPI"""
+    targets = []
+    for item in value.split(','):
+        item = item.strip()
+        if not item:
+            continue
+        service, _, kpi = item.partition(':')
+        targets += [(service, kpi)] if kpi else [(service, k) for k in KPIS]
+    return targets
+
+
+def anomalous_targets(df: pd.DataFrame, start_ts: int, end_ts: int) -> list:
+    """窗口内异常的 (服务, KPI)，按偏离程度降序"""
+    filtered = df[(df['timestamp'] >= start_ts) & (df['timestamp'] <= end_ts)]
+    if len(filtered) == 0:
+        return []
+    anomalies = detect_service_anomalies(filtered, compute_service_thresholds(df))
+    return list(dict.fromkeys((a['service'], a['kpi']) for a in anomalies))
+
+
+def correlate_frames(service: pd.DataFrame, layers: dict, start_ts: int, end_ts: int, targets: list | None = None,
+                     step: int = DEFAULT_STEP, max_lag: int = DEFAULT_MAX_LAG, context: int = DEFAULT_CONTEXT,
+                     top: int = DEFAULT_TOP, budget: float = DEFAULT_BUDGET) -> dict:
+    """
+    已加载（秒级时间戳）的服务层宽表与各层长表上的跨层相关
+
+    网格覆盖 [start_ts - context, end_ts]，窗口前的 context 秒作为变化的对照。
+    """
+    lo, hi = start_ts - context, end_ts
+    with stage('detect') as span:
+        targets = targets if targets is not None else anomalous_targets(service, start_ts, end_ts)
+        span.rows = len(service)
+        span.set(targets=len(targets))
+
+    with stage('align') as span:
+        wanted = pd.DataFrame(targets, columns=['service', 'kpi'])
+        long = service_long(service[service['service'].isin(wanted['service'])], KPIS)
+        long = long.merge(wanted, on=['service', 'kpi'])
+        target_series = align_series(long, ['service', 'kpi'], 'value', lo, hi, step)
+        aligned = {layer: align_series(df, ['cmdb_id', 'kpi_name'], 'value', lo, hi, step)
+                   for layer, df in layers.items()}
+        span.rows = len(long) + sum(len(df) for df in layers.values())
+
+    with stage('correlate') as span:
+        ranked = rank_causes(target_series, aligned, start_ts, end_ts, max_lag, top, budget)
+        span.rows = ranked['processed']
+
+    return {
+        'targets': targets,
+        'aligned_targets': len(target_series),
+        'series': {layer: len(series) for layer, series in aligned.items()},
+        'bins': grid_bins(lo, hi, step),
+        **ranked,
+    }
+
+
+def correlation_result(files: dict, start_ts: int, end_ts: int, targets: list | None = None, step: int = DEFAULT_STEP,
+                       max_lag: int = DEFAULT_MAX_LAG, context: int = DEFAULT_CONTEXT, top: int = DEFAULT_TOP,
+                       budget: float = DEFAULT_BUDGET, use_cache: bool = True) -> dict:
+    """读取服务层（全天，用于阈值）和各候选层（只读网格范围）后计算跨层相关"""
+    with stage('load', file=files['service']) as span:
+        service = in_seconds(load_telemetry(files['service'], columns=SERVICE_COLUMNS, use_cache=use_cache),
+                             file_time_unit(files['service']))
+        layers = {}
+        for layer in CANDIDATE_FILES:
+            if layer not in files:
+                continue
+            unit = file_time_unit(files[layer])
+            lo, hi = window_bounds(start_ts - context, end_ts, unit)
+            df = load_telemetry(files[layer], columns=LONG_COLUMNS, start_ts=lo, end_ts=hi, use_cache=use_cache)
+            layers[layer] = in_seconds(df, unit)
+        span.rows = len(service) + sum(len(df) for df in layers.values())
+    result = correlate_frames(service, layers, start_ts, end_ts, targets, step, max_lag, context, top, budget)
+    result['rows'] = {'service': len(service), **{layer: len(df) for layer, df in layers.items()}}
+    return result
+
+
+def analyze_correlation(files: dict, start_ts: int, end_ts: int, targets: list | None = None, step: int = DEFAULT_STEP,
+                        max_lag: int = DEFAULT_MAX_LAG, context: int = DEFAULT_CONTEXT, top: int = DEFAULT_TOP,
+                        budget: float = DEFAULT_BUDGET, output: str | None = None, use_cache: bool = True):
+    """文本报告：异常服务KPI、各层序列数和每个服务KPI的候选原因"""
+    result = correlation_result(files, start_ts, end_ts, targets, step, max_lag, context, top, budget, use_cache)
+    with stage('report'):
+        print(f"{'='*70}")
+        print("跨层滞后相关分析报告")
+        print(f"{'='*70}")
+        for layer, path in files.items():
+            print(f"{layer:<10} {path} ({result['rows'].get(layer, 0)} 条)")
+        print(f"时间范围: {format_timestamp(start_ts, unit='s')} ~ {format_timestamp(end_ts, unit='s')}")
+        print(f"时间网格: {step}s × {result['bins']} 桶（含窗口前 {context}s 对照），最大滞后 {max_lag} 桶")
+
+        print(f"\n{'#'*70}")
+        print("# 第一步：确定目标服务KPI")
+        print(f"{'#'*70}")
+        if not result['targets']:
+            print("窗口内没有异常的服务KPI，可用 --service 指定目标")
+            return
+        for service, kpi in result['targets']:
+            print(f"  {service} {kpi}")
+
+        print(f"\n{'#'*70}")
+        print("# 第二步：对齐候选序列")
+        print(f"{'#'*70}")
+        print(f"目标序列: {result['aligned_targets']} 条")
+        for layer, count in result['series'].items():
+            print(f"  {layer}: {count} 条序列")
+
+        print(f"\n{'#'*70}")
+        print("# 第三步：滞后相关与领先得分")
+        print(f"{'#'*70}")
+        if result['aligned_targets'] == 0:
+            print("窗口内没有目标序列（没有异常的服务KPI或目标KPI没有数据），不计算相关")
+        else:
+            coverage = f"{result['processed']}/{result['candidates']}"
+            note = '（超过时间预算，按变化幅度只计算了前一部分）' if result['truncated'] else ''
+            print(f"计算 {coverage} 条候选序列, 耗时 {result['seconds']:.2f}s{note}")
+
+        print(f"\n{'#'*70}")
+        print(f"# 第四步：候选原因（每个服务KPI前 {top} 个）")
+        print(f"{'#'*70}")
+        causes = result['causes']
+        if len(causes) == 0:
+            print("没有可计算相关的序列")
+        for (service, kpi), group in causes.groupby(['target', 'kpi'], sort=False):
+            print(f"\n[{service}] {kpi}:")
+            for i, row in enumerate(group.itertuples(index=False), 1):
+                print(f"  {i}. [{row.layer}] {row.cmdb_id} {row.kpi_name}  r={row.corr:+.2f}  "
+                      f"领先={row.lag}s  lead={row.lead:+.2f}  变化={row.change:.1f}σ  得分={row.score:.2f}")
+
+        if output:
+            write_table(causes, output)
+            print(f"\n结果已保存到: {output}")
+
+
+def emit_correlation(out, files: dict, start_ts: int, end_ts: int, targets: list | None = None, step: int = DEFAULT_STEP,
+                     max_lag: int = DEFAULT_MAX_LAG, context: int = DEFAULT_CONTEXT, top: int = DEFAULT_TOP,
+                     budget: float = DEFAULT_BUDGET, output: str | None = None, use_cache: bool = True):
+    """--format json|arrow：概要、目标服务KPI和候选原因"""
+    result = correlation_result(files, start_ts, end_ts, targets, step, max_lag, context, top, budget, use_cache)
+    with stage('report', format=out.fmt):
+        out.record('summary', files=files, start=start_ts, end=end_ts, step=step, max_lag=max_lag, context=context,
+                   bins=result['bins'], rows=result['rows'], series=result['series'],
+                   candidates=result['candidates'], processed=result['processed'], truncated=result['truncated'],
+                   seconds=result['seconds'])
+        out.table('targets', pd.DataFrame(result['targets'], columns=['service', 'kpi']))
+        out.table('causes', result['causes'])
+        if output:
+            write_table(result['causes'], output)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Cross-layer Correlation Analyzer for OpenRCA')
+    parser.add_argument('--data-dir', type=str, help='Telemetry directory of one date (metric/ or the files directly)')
+    parser.add_argument('--service-file', type=str, help='Service metric file (overrides --data-dir)')
+    parser.add_argument('--container-file', type=str, help='Container metric file (overrides --data-dir)')
+    parser.add_argument('--node-file', type=str, help='Node metric file (overrides --data-dir)')
+    parser.add_argument('--mesh-file', type=str, help='Service mesh metric file (overrides --data-dir)')
+    parser.add_argument('--start', type=str, required=True, help='Start time (YYYY-MM-DD HH:MM:SS or epoch seconds)')
+    parser.add_argument('--end', type=str, required=True, help='End time (YYYY-MM-DD HH:MM:SS or epoch seconds)')
+    parser.add_argument('--service', type=str,
+                        help='Target service KPIs, e.g. checkoutservice-grpc:mrt,cartservice-grpc (default: anomalous)')
+    parser.add_argument('--step', type=int, default=DEFAULT_STEP, help='Grid step in seconds')
+    parser.add_argument('--max-lag', type=int, default=DEFAULT_MAX_LAG, help='Largest lead tested, in grid steps')
+    parser.add_argument('--context', type=int, default=DEFAULT_CONTEXT,
+                        help='Seconds before the window included as the baseline')
+    parser.add_argument('--top', type=int, default=DEFAULT_TOP, help='Candidate causes per service KPI')
+    parser.add_argument('--budget', type=float, default=DEFAULT_BUDGET,
+                        help='Seconds to spend on correlation; the most changed series are computed first')
+    parser.add_argument('--output', type=str, help='Output file path (.csv, .parquet or .arrow/.ipc/.feather)')
+    parser.add_argument('--no-cache', action='store_true', help='Read the CSV directly instead of the columnar cache')
+    add_format_arguments(parser)
+    add_profile_arguments(parser)
+    add_server_argument(parser)
+
+    args = parser.parse_args(argv)
+    forward_if_requested(args, 'analyze_correlation', argv)
+    check_format_arguments(parser, args)
+    check_profile_arguments(parser, args)
+
+    with profile_session(args, 'analyze_correlation'):
+        run(parser, args)
+
+
+def run(parser, args):
+    """定位指标文件并输出跨层相关结果"""
+    files = locate_metric_files(args.data_dir, {
+        'service': args.service_file, 'container': args.container_file,
+        'node': args.node_file, 'mesh': args.mesh_file,
+    })
+    missing = [path for path in files.values() if not Path(path).exists()]
+    if missing:
+        print(f"错误: 文件不存在 {', '.join(missing)}")
+        sys.exit(1)
+    if 'service' not in files or len(files) < 2:
+        parser.error('need metric_service.csv and at least one of the container/node/mesh metric files')
+    if args.step <= 0 or args.max_lag < 0:
+        parser.error('--step must be positive and --max-lag non-negative')
+
+    tz = zone()
+    start_ts, end_ts = parse_time(args.start, tz), parse_time(args.end, tz)
+    targets = parse_targets(args.service) if args.service else None
+    options = {'targets': targets, 'step': args.step, 'max_lag': args.max_lag, 'context': args.context, 'top': args.top,
+               'budget': args.budget, 'output': args.output, 'use_cache': not args.no_cache}
+
+    if args.format != 'text':
+        with structured_output(args.format, args.max_rows) as out:
+            emit_correlation(out, files, start_ts, end_ts, **options)
+        return
+    analyze_correlation(files, start_ts, end_ts, **options)
+
+
+if __name__ == '__main__':
+    main()
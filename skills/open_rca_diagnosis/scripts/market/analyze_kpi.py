@@ -0,0 +1,319 @@
+#!/usr/bin/env python3
+"""
+Long-format KPI Analyzer for OpenRCA - 长表指标通用分析工具
+适用于 metric_node / metric_mesh / metric_runtime / metric_container 等 timestamp,cmdb_id,kpi_name,value 长表：
+在 (序列 × 时间网格) 矩阵上计算每个KPI的全局阈值，检测窗口均值偏离阈值的序列
+
+Usage:
+    python analyze_kpi.py --file metric_node.csv --start "2022-03-20 09:00:00" --end "2022-03-20 09:30:00"
+
+    # 按组件和KPI过滤（大小写不敏感的正则）
+    python analyze_kpi.py --file metric_mesh.csv --start ... --end ... --component cartservice --kpi duration
+
+    # 指定时间网格步长（默认取最常见的采样间隔）
+    python analyze_kpi.py --file metric_runtime.csv --start ... --end ... --step 60
+
+    # 变点检测：全天所有序列的变化起点、幅度和方向，按最早起点排序组件（--start/--end 可选，只限定起点范围）
+    python analyze_kpi.py --file metric_node.csv --changepoint
+"""
+
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from common.rca_client import add_server_argument, forward_early, forward_if_requested
+
+if __name__ == '__main__':
+    forward_early('analyze_kpi')  # --server: 在导入 pandas 之前转发给常驻服务
+
+import argparse
+import re
+from datetime import datetime
+
+from common.changepoint import (
+    DEFAULT_MIN_CHANGE,
+    DEFAULT_MIN_SCORE,
+    changepoint_result,
+    emit_changepoints,
+    print_changepoints,
+)
+from common.output import add_format_arguments, check_format_arguments, structured_output
+from common.profiling import add_profile_arguments, check_profile_arguments, profile_session, stage
+from common.series_store import kpi_thresholds, open_matrix, window_anomalies
+from common.time_utils import format_timestamp, parse_time, unit_of, window_bounds, zone
+from market.analyze_container import RESOURCE_REASONS, classify_kpi
+
+# 节点KPI资源类型关键词（按顺序匹配，disk.pct_usage 先于 cpu 等通用词）
+NODE_KEYWORDS = {
+    'disk_space': ['disk.pct_usage', 'disk.used', 'disk.free', 'fs.'],
+    'disk_read': ['io.r_', 'read'],
+    'disk_write': ['io.w_', 'write'],
+    'cpu': ['cpu', 'load'],
+    'memory': ['mem'],
+    'network': ['net', 'tcp'],
+}
+
+# 资源类型 -> 候选根因原因（specs/market_spec.md）
+NODE_REASONS = {
+    'cpu': 'node CPU load',
+    'memory': 'node memory consumption',
+    'disk_read': 'node disk read I/O consumption',
+    'disk_write': 'node disk write I/O consumption',
+    'disk_space': 'node disk space consumption',
+}
+
+
+def layer_of(file_path: str) -> str:
+    """按文件名判断指标所在的层：container/node/mesh/runtime，其余为 other"""
+    match = re.search(r'metric_(container|node|mesh|runtime)', Path(file_path).name)
+    return match.group(1) if match else 'other'
+
+
+def classify_node_kpi(kpi_name: str) -> str:
+    kpi_lower = kpi_name.lower()
+    for res_type, keywords in NODE_KEYWORDS.items():
+        if any(kw in kpi_lower for kw in keywords):
+            return res_type
+    return 'other'
+
+
+def kpi_reason(layer: str, kpi_name: str):
+    """(资源类型, 候选根因原因)；网格和运行时指标没有对应的原因"""
+    if layer == 'container':
+        res_type = classify_kpi(kpi_name)
+        return res_type, RESOURCE_REASONS.get(res_type)
+    if layer == 'node':
+        res_type = classify_node_kpi(kpi_name)
+        return res_type, NODE_REASONS.get(res_type)
+    return 'other', None
+
+
+def kpi_window_result(file_path: str, start_ts: int, end_ts: int, component_filter: str | None = None,
+                      kpi_filter: str | None = None, step: int | None = None, min_deviation: float = 0.5,
+                      use_cache: bool = True) -> dict:
+    """
+    单窗口分析的结构化结果：矩阵概况、每个KPI的全局阈值和偏离阈值的序列
+
+    start_ts/end_ts 为秒级，按文件自身的时间单位换算；step 使用文件的时间单位。
+    """
+    layer = layer_of(file_path)
+    with stage('open', file=file_path) as span:
+        matrix = open_matrix(file_path, step, use_cache)
+        rows = matrix.rows(component_filter, kpi_filter)
+        span.rows = matrix.meta['rows']
+        span.set(series=len(matrix), bins=matrix.n_bins)
+    unit = unit_of(matrix.t0) if matrix.meta['rows'] else 's'
+    lo, hi = window_bounds(start_ts, end_ts, unit)
+    window = matrix.columns(lo, hi)
+    with stage('threshold') as span:
+        thresholds = kpi_thresholds(matrix, rows)
+        span.rows = len(rows)
+    with stage('detect') as span:
+        anomalies = window_anomalies(matrix, thresholds, lo, hi, rows, min_deviation)
+        reasons = [kpi_reason(layer, kpi) for kpi in anomalies['kpi_name']]
+        anomalies.insert(2, 'resource_type', [res_type for res_type, _ in reasons])
+        anomalies['reason'] = [reason for _, reason in reasons]
+        span.rows = len(rows) * (window.stop - window.start)
+        span.set(anomalies=len(anomalies))
+    return {
+        'layer': layer,
+        'meta': matrix.meta,
+        'series': len(rows),
+        'components': matrix.series['cmdb_id'].iloc[rows].nunique(),
+        'kpis': len(thresholds),
+        'window_bins': window.stop - window.start,
+        'thresholds': thresholds,
+        'anomalies': anomalies,
+    }
+
+
+def analyze_kpis(file_path: str, start_ts: int, end_ts: int, component_filter: str | None = None, kpi_filter: str | None = None,
+                 step: int | None = None, min_deviation: float = 0.5, top: int = 15, use_cache: bool = True):
+    """分析长表指标：打开矩阵 + 计算阈值 + 检测窗口内偏离阈值的序列"""
+    tz = zone()
+    result = kpi_window_result(file_path, start_ts, end_ts, component_filter, kpi_filter, step, min_deviation,
+                               use_cache)
+    meta = result['meta']
+    with stage('report'):
+        print(f"{'='*70}")
+        print(f"长表指标分析报告 ({result['layer']})")
+        print(f"{'='*70}")
+        print(f"数据文件: {file_path}")
+        print(f"总数据量: {meta['rows']} 条")
+        print(f"时间范围: {format_timestamp(start_ts, tz, 's')} ~ {format_timestamp(end_ts, tz, 's')}")
+        print(f"分析时间: {datetime.now(tz).strftime('%Y-%m-%d %H:%M:%S')}")
+        if component_filter:
+            print(f"组件过滤: {component_filter}")
+        if kpi_filter:
+            print(f"KPI过滤: {kpi_filter}")
+
+        print(f"\n{'#'*70}")
+        print("# 第一步：打开指标矩阵")
+        print(f"{'#'*70}")
+        print(f"序列: {meta['series']} 条, 时间桶: {meta['bins']} 个 (步长 {meta['step']})")
+        if meta['merged']:
+            print(f"同一桶内合并的数据点: {meta['merged']} 条")
+        print(f"过滤后: {result['series']} 条序列, {result['components']} 个组件, {result['kpis']} 个KPI")
+        print(f"时间窗口内: {result['window_bins']} 个时间桶")
+
+        if result['window_bins'] == 0 or result['series'] == 0:
+            print("警告: 指定时间范围内无数据！")
+            return
+
+        print(f"\n{'#'*70}")
+        print("# 第二步：计算每个KPI的全局阈值")
+        print(f"{'#'*70}")
+        print(f"计算了 {result['kpis']} 个KPI的阈值")
+
+        print(f"\n{'#'*70}")
+        print("# 第三步：检测异常序列")
+        print(f"{'#'*70}")
+        anomalies = result['anomalies']
+        if len(anomalies) == 0:
+            print(f"未检测到明显的指标异常（偏离>{min_deviation*100:.0f}%）")
+        else:
+            print(f"\n检测到 {len(anomalies)} 个指标异常：\n")
+            for i, a in enumerate(anomalies.head(top).itertuples(index=False), 1):
+                print(f"{i}. [{a.cmdb_id}] {a.resource_type}")
+                print(f"   KPI: {a.kpi_name}")
+                print(f"   均值={a.value:.2f}, 阈值(P95)={a.threshold:.2f}, 最大={a.max:.2f}")
+                print(f"   偏离程度: {a.deviation*100:.1f}%")
+                print()
+
+        print(f"{'#'*70}")
+        print("# 第四步：结论与建议")
+        print(f"{'#'*70}")
+        if len(anomalies):
+            counts = anomalies.groupby('cmdb_id', sort=False).size().sort_values(ascending=False, kind='stable')
+            print("\n异常组件分布:")
+            for cmdb_id, count in counts.head(5).items():
+                print(f"  {cmdb_id}: {count} 个异常KPI")
+
+            first = anomalies.iloc[0]
+            print(f"\n最显著异常: {first['cmdb_id']}")
+            print(f"KPI: {first['kpi_name']} ({first['resource_type']})")
+            print(f"偏离阈值: {first['deviation']*100:.1f}%")
+            if first['reason']:
+                print(f"可能原因: {first['reason']}")
+        else:
+            print("\n建议: 检查服务层业务指标或容器层资源指标")
+
+
+def emit_kpis(out, file_path: str, start_ts: int, end_ts: int, component_filter: str | None = None, kpi_filter: str | None = None,
+              step: int | None = None, min_deviation: float = 0.5, top: int = 15, use_cache: bool = True):
+    """--format json|arrow：概要、异常序列及其所在KPI的阈值"""
+    result = kpi_window_result(file_path, start_ts, end_ts, component_filter, kpi_filter, step, min_deviation,
+                               use_cache)
+    meta = result['meta']
+    anomalies = result['anomalies']
+    with stage('report', format=out.fmt):
+        out.record('summary', file=file_path, layer=result['layer'], rows=meta['rows'], start=start_ts, end=end_ts,
+                   component=component_filter, kpi=kpi_filter, step=meta['step'], bins=meta['bins'],
+                   series=result['series'], components=result['components'], kpis=result['kpis'],
+                   window_bins=result['window_bins'], anomalies=len(anomalies))
+        out.table('anomalies', anomalies)
+        if len(anomalies):
+            kpis = list(dict.fromkeys(anomalies['kpi_name']))
+            out.table('thresholds', result['thresholds'].loc[kpis].reset_index())
+
+
+def kpi_changepoints(file_path: str, start_ts: int | None = None, end_ts: int | None = None, component_filter: str | None = None,
+                     kpi_filter: str | None = None, step: int | None = None, min_score: float = DEFAULT_MIN_SCORE,
+                     min_change: float = DEFAULT_MIN_CHANGE, use_cache: bool = True) -> dict:
+    """在矩阵上检测所有序列的变化起点；start_ts/end_ts 为秒级，只限定起点所在的范围"""
+    with stage('open', file=file_path) as span:
+        matrix = open_matrix(file_path, step, use_cache)
+        rows = matrix.rows(component_filter, kpi_filter)
+        span.rows = matrix.meta['rows']
+        span.set(series=len(matrix), bins=matrix.n_bins)
+    unit = unit_of(matrix.t0) if matrix.meta['rows'] else 's'
+    lo, hi = window_bounds(start_ts, end_ts, unit) if start_ts is not None else (None, None)
+    values = matrix.values if len(rows) == len(matrix) else matrix.values[rows]
+    result = changepoint_result(values, matrix.times, matrix.series.iloc[rows].reset_index(drop=True), lo, hi,
+                                min_score, min_change, rows=matrix.meta['rows'])
+    result.update(layer=layer_of(file_path), unit=unit, step=matrix.meta['step'])
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Long-format KPI Analyzer for OpenRCA')
+    parser.add_argument('--file', type=str, required=True,
+                        help='Long-format metric file (timestamp,cmdb_id,kpi_name,value), e.g. metric_node.csv')
+    parser.add_argument('--start', type=str, help='Start time (YYYY-MM-DD HH:MM:SS or epoch seconds)')
+    parser.add_argument('--end', type=str, help='End time (YYYY-MM-DD HH:MM:SS or epoch seconds)')
+    parser.add_argument('--component', type=str, help='Filter by component name (e.g., node-3)')
+    parser.add_argument('--kpi', type=str, help='Filter by KPI name (e.g., cpu)')
+    parser.add_argument('--step', type=int, help='Grid step in the file time unit (default: most common interval)')
+    parser.add_argument('--min-deviation', type=float, default=0.5,
+                        help='Report series whose window mean exceeds P95 by more than this fraction')
+    parser.add_argument('--changepoint', action='store_true',
+                        help='Find the onset, magnitude and direction of changes in every series of the day '
+                             '(--start/--end optionally limit where onsets are reported)')
+    parser.add_argument('--min-score', type=float, default=DEFAULT_MIN_SCORE,
+                        help='Changepoint: minimum CUSUM score (mean shift in noise standard deviations)')
+    parser.add_argument('--min-change', type=float, default=DEFAULT_MIN_CHANGE,
+                        help='Changepoint: minimum change relative to the mean before the onset')
+    parser.add_argument('--top', type=int, default=15, help='Anomalies shown in the text report')
+    parser.add_argument('--no-cache', action='store_true', help='Read the CSV directly instead of the columnar cache')
+    add_format_arguments(parser)
+    add_profile_arguments(parser)
+    add_server_argument(parser)
+
+    args = parser.parse_args(argv)
+    forward_if_requested(args, 'analyze_kpi', argv)
+    check_format_arguments(parser, args)
+    check_profile_arguments(parser, args)
+
+    with profile_session(args, 'analyze_kpi'):
+        run(parser, args)
+
+
+def run(parser, args):
+    """打开矩阵并输出单窗口分析结果"""
+    if not Path(args.file).exists():
+        print(f"错误: 文件不存在 {args.file}")
+        sys.exit(1)
+    if args.step is not None and args.step <= 0:
+        parser.error('--step must be positive')
+
+    tz = zone()
+    if args.changepoint:
+        if bool(args.start) != bool(args.end):
+            parser.error('--start and --end must be given together')
+        start_ts = parse_time(args.start, tz) if args.start else None
+        end_ts = parse_time(args.end, tz) if args.end else None
+        try:
+            result = kpi_changepoints(args.file, start_ts, end_ts, args.component, args.kpi, args.step,
+                                      args.min_score, args.min_change, use_cache=not args.no_cache)
+        except ValueError as e:
+            print(f"错误: {e}")
+            sys.exit(1)
+        if args.format != 'text':
+            with structured_output(args.format, args.max_rows) as out, stage('report', format=out.fmt):
+                emit_changepoints(out, result, file=args.file, layer=result['layer'], component=args.component,
+                                  kpi=args.kpi, step=result['step'])
+            return
+        with stage('report'):
+            print_changepoints(f"长表指标变点检测报告 ({result['layer']})", args.file, result, tz, result['unit'],
+                               args.top, filters={'组件过滤': args.component, 'KPI过滤': args.kpi})
+        return
+    if not args.start or not args.end:
+        parser.error('--start and --end are required unless --changepoint is given')
+
+    start_ts, end_ts = parse_time(args.start, tz), parse_time(args.end, tz)
+    options = {'component_filter': args.component, 'kpi_filter': args.kpi, 'step': args.step,
+               'min_deviation': args.min_deviation, 'top': args.top, 'use_cache': not args.no_cache}
+
+    try:
+        if args.format != 'text':
+            with structured_output(args.format, args.max_rows) as out:
+                emit_kpis(out, args.file, start_ts, end_ts, **options)
+            return
+        analyze_kpis(args.file, start_ts, end_ts, **options)
+    except ValueError as e:
+        print(f"错误: {e}")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -15,13 +15,33 @@ Examples:
     
     # 按组件统计日志
     python analyze_log.py --file log_service.csv --by-component
+    
+    # 挖掘日志模板，找出在某个组件上突增的模板
+    python analyze_log.py --file log_service.csv --time-range "1647781200,1647784800" --templates
 """
 
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from common.rca_client import add_server_argument, forward_early, forward_if_requested
+
+if __name__ == '__main__':
+    forward_early('analyze_log')  # --server: 在导入 pandas 之前转发给常驻服务
+
 import argparse
 import pandas as pd
-import sys
 import re
-from pathlib import Path
+
+from common.arrow_text import match_mask, truncate
+from common.log_index import search as search_indexed
+from common.log_templates import TemplateMiner, burst_scores, file_counts, state_path, window_counts
+from common.output import add_format_arguments, check_format_arguments, structured_output, write_table
+from common.profiling import add_profile_arguments, check_profile_arguments, profile_session, stage
+from common.telemetry_cache import load_telemetry
+
+
+ERROR_PATTERNS = ['error', 'exception', 'fail', 'critical', 'fatal', 'timeout']
 
 
 def search_logs(df: pd.DataFrame, pattern: str, case_sensitive: bool = False) -> pd.DataFrame:
@@ -31,98 +51,181 @@ def search_logs(df: pd.DataFrame, pattern: str, case_sensitive: bool = False) ->
         return pd.DataFrame()
     
     flags = 0 if case_sensitive else re.IGNORECASE
-    mask = df['value'].str.contains(pattern, regex=True, flags=flags, na=False)
-    return df[mask]
+    return df[match_mask(df['value'], pattern, flags)]
 
 
 def analyze_errors(df: pd.DataFrame) -> pd.DataFrame:
     """分析错误日志"""
-    error_patterns = ['error', 'exception', 'fail', 'critical', 'fatal', 'timeout']
-    pattern = '|'.join(error_patterns)
+    pattern = '|'.join(ERROR_PATTERNS)
     return search_logs(df, pattern, case_sensitive=False)
 
 
+def filter_component(df: pd.DataFrame, component: str) -> pd.DataFrame:
+    """按组件名过滤（正则，不区分大小写）"""
+    return df[match_mask(df['cmdb_id'], component, re.IGNORECASE)]
+
+
+def print_samples(df: pd.DataFrame, top: int, width: int = 100):
+    """输出前 top 条示例日志，日志内容截断为 width 个字符"""
+    head = df.head(top)
+    timestamps = head['timestamp'].tolist() if 'timestamp' in head.columns else ['N/A'] * len(head)
+    components = head['cmdb_id'].tolist() if 'cmdb_id' in head.columns else ['N/A'] * len(head)
+    values = truncate(head['value'], width) if 'value' in head.columns else [''] * len(head)
+    for ts, comp, value in zip(timestamps, components, values):
+        print(f"  [{ts}] {comp}: {value}...")
+
+
 def analyze_by_component(df: pd.DataFrame) -> pd.DataFrame:
     """按组件统计日志"""
     if 'cmdb_id' not in df.columns:
         print("错误: 缺少 'cmdb_id' 列")
         return pd.DataFrame()
     
-    stats = df.groupby('cmdb_id').size().reset_index(name='log_count')
+    stats = df.groupby('cmdb_id', observed=True).size().reset_index(name='log_count')
     stats = stats.sort_values('log_count', ascending=False)
     return stats
 
 
-def main():
-    parser = argparse.ArgumentParser(description='Log Analysis Tool for OpenRCA')
-    parser.add_argument('--file', type=str, required=True, help='Log CSV file path')
-    parser.add_argument('--time-range', type=str, help='Time range (start_ts,end_ts)')
-    parser.add_argument('--errors', action='store_true', help='Find error logs')
-    parser.add_argument('--search', type=str, help='Search pattern (regex)')
-    parser.add_argument('--by-component', action='store_true', help='Group by component')
-    parser.add_argument('--component', type=str, help='Filter by component name')
-    parser.add_argument('--top', type=int, default=10, help='Top N results')
-    parser.add_argument('--output', type=str, help='Output file path')
+def mine_templates(file_path: str, component: str | None = None, state_file: str | None = None, use_cache: bool = True):
+    """加载模板状态、取整个文件的计数表（突增基线）并保存状态，返回 (计数表, 分钟数, 模板挖掘器, 已学习模板数)"""
+    path = Path(state_file) if state_file else state_path(file_path)
+    miner = TemplateMiner.load(path)
+    known = len(miner.templates)
+    with stage('mine', file=file_path) as span:
+        counts, n_minutes = file_counts(file_path, miner, use_cache)
+        if component:
+            counts = counts[match_mask(counts['cmdb_id'], component, re.IGNORECASE)]
+        span.rows = int(counts['count'].sum())
+        span.set(templates=len(miner.templates))
+    miner.save(path)
+    return counts, n_minutes, miner, known
+
+
+def analyze_templates(file_path: str, start: int, end: int, component: str | None = None, top_n: int = 10,
+                      output: str | None = None, state_file: str | None = None, use_cache: bool = True):
+    """日志模板挖掘：按 模板 × 组件 × 分钟 计数，找出窗口内相对全天基线突增的模板"""
+    counts, n_minutes, miner, known = mine_templates(file_path, component, state_file, use_cache)
+    window = window_counts(counts, start, end)
     
-    args = parser.parse_args()
+    print(f"日志数: {window['count'].sum()} 条")
+    if start is not None and end is not None:
+        print(f"时间范围过滤: {start} ~ {end}")
+    print(f"模板数: {window['template_id'].nunique()} (已学习 {known}, 新增 {miner.created})")
     
-    path = Path(args.file)
-    if not path.exists():
-        print(f"错误: 文件不存在 {args.file}")
-        sys.exit(1)
+    if len(window) == 0:
+        return
     
-    df = pd.read_csv(args.file)
-    print(f"加载日志数据: {len(df)} 条")
+    print(f"\n{'='*60}")
+    print(f"模板分布 (前{top_n}):")
+    print(f"{'='*60}")
+    totals = window.groupby('template_id')['count'].sum().sort_values(ascending=False).head(top_n)
+    for template_id, count in totals.items():
+        print(f"  [{template_id}] {count:>8}  {miner.template(template_id)[:100]}")
+    
+    print(f"\n{'='*60}")
+    print(f"突增模板 (按组件, 前{top_n}, 基线为全天每分钟计数):")
+    print(f"{'='*60}")
+    with stage('detect') as span:
+        bursts = burst_scores(counts, n_minutes, start, end).head(top_n)
+        span.rows = len(counts)
+    for _, row in bursts.iterrows():
+        print(f"  [{row['template_id']}] {row['cmdb_id']} @ {row['minute']}: {row['count']} 条 "
+              f"(基线 {row['mean']:.1f}±{row['std']:.1f}, 得分 {row['score']:.1f})  "
+              f"{miner.template(row['template_id'])[:80]}")
+    
+    if output:
+        write_table(window.assign(template=window['template_id'].map(miner.template)), output)
+
+
+def emit_templates(out, file_path: str, start: int, end: int, component: str | None = None, top_n: int = 10,
+                   output: str | None = None, state_file: str | None = None, use_cache: bool = True):
+    """--format json|arrow：模板分布与突增模板"""
+    counts, n_minutes, miner, known = mine_templates(file_path, component, state_file, use_cache)
+    window = window_counts(counts, start, end)
+    out.record('summary', file=file_path, start=start, end=end, component=component, logs=int(window['count'].sum()),
+               templates=int(window['template_id'].nunique()), known=known, created=miner.created)
+    if len(window):
+        totals = window.groupby('template_id')['count'].sum().sort_values(ascending=False).head(top_n)
+        out.table('templates', totals.reset_index().assign(template=totals.index.map(miner.template)))
+        with stage('detect') as span:
+            bursts = burst_scores(counts, n_minutes, start, end).head(top_n)
+            span.rows = len(counts)
+        out.table('bursts', bursts.assign(template=bursts['template_id'].map(miner.template)))
+    if output:
+        write_table(window.assign(template=window['template_id'].map(miner.template)), output)
+
+
+def emit_log_results(out, df: pd.DataFrame, args, rows: int, indexed: bool, start: int | None = None, end: int | None = None):
+    """--format json|arrow：与文本报告相同的模式，只输出计数和前 --top 条示例日志"""
+    samples = [col for col in ('timestamp', 'cmdb_id', 'value') if col in df.columns]
+    out.record('summary', file=args.file, start=start, end=end, component=args.component, rows=rows)
+    result = None
+    if args.errors or args.search:
+        if indexed:
+            result = df
+        else:
+            result = analyze_errors(df) if args.errors else search_logs(df, args.search)
+        counts = result['cmdb_id'].value_counts()
+        out.record('matches', pattern=None if args.errors else args.search, count=len(result))
+        out.table('by_component', counts[counts > 0], args.top)
+        out.table('samples', result[samples], args.top)
+    elif args.by_component:
+        result = analyze_by_component(df)
+        out.table('by_component', result, args.top)
+    else:
+        counts = df['cmdb_id'].value_counts()
+        out.record('overview', logs=len(df), components=int(df['cmdb_id'].nunique()))
+        out.table('by_component', counts[counts > 0], args.top)
+        out.table('samples', df[samples], args.top)
+    if args.output and result is not None:
+        write_table(result, args.output)
+
+
+def report_log_results(df: pd.DataFrame, args, stats: dict | None = None, start: int | None = None, end: int | None = None):
+    """文本报告：按参数中的模式分析已加载（或索引检索出）的日志并输出"""
+    print(f"加载日志数据: {stats['rows'] if stats is not None else len(df)} 条")
     print(f"列: {list(df.columns)}")
     
     if args.time_range:
-        start, end = map(int, args.time_range.split(','))
-        df = df[(df['timestamp'] >= start) & (df['timestamp'] <= end)]
-        print(f"时间范围过滤后: {len(df)} 条")
+        print(f"时间范围过滤: {start} ~ {end}")
     
     if args.component:
-        df = df[df['cmdb_id'].str.contains(args.component, case=False, na=False)]
-        print(f"组件过滤后: {len(df)} 条")
+        if stats is None:
+            df = filter_component(df, args.component)
+        print(f"组件过滤后: {stats['component_rows'] if stats is not None else len(df)} 条")
     
     if args.errors:
         print(f"\n{'='*60}")
         print("错误日志分析:")
         print(f"{'='*60}")
-        errors = analyze_errors(df)
+        errors = df if stats is not None else analyze_errors(df)
         print(f"错误日志数: {len(errors)}")
         
         if len(errors) > 0:
             print(f"\n按组件分布:")
-            error_by_comp = errors['cmdb_id'].value_counts().head(args.top)
+            error_by_comp = errors['cmdb_id'].value_counts()
+            error_by_comp = error_by_comp[error_by_comp > 0].head(args.top)  # category 列会列出未出现的组件
             print(error_by_comp.to_string())
             
             print(f"\n示例日志 (前{args.top}条):")
-            for idx, row in errors.head(args.top).iterrows():
-                ts = row.get('timestamp', 'N/A')
-                comp = row.get('cmdb_id', 'N/A')
-                value = row.get('value', '')[:100]
-                print(f"  [{ts}] {comp}: {value}...")
+            print_samples(errors, args.top)
         
         if args.output:
-            errors.to_csv(args.output, index=False)
+            write_table(errors, args.output)
     
     elif args.search:
         print(f"\n{'='*60}")
         print(f"搜索结果 (pattern: {args.search}):")
         print(f"{'='*60}")
-        results = search_logs(df, args.search)
+        results = df if stats is not None else search_logs(df, args.search)
         print(f"匹配日志数: {len(results)}")
         
         if len(results) > 0:
             print(f"\n示例 (前{args.top}条):")
-            for idx, row in results.head(args.top).iterrows():
-                ts = row.get('timestamp', 'N/A')
-                comp = row.get('cmdb_id', 'N/A')
-                value = row.get('value', '')[:100]
-                print(f"  [{ts}] {comp}: {value}...")
+            print_samples(results, args.top)
         
         if args.output:
-            results.to_csv(args.output, index=False)
+            write_table(results, args.output)
     
     elif args.by_component:
         print(f"\n{'='*60}")
@@ -132,7 +235,7 @@ def main():
         print(stats.head(args.top).to_string(index=False))
         
         if args.output:
-            stats.to_csv(args.output, index=False)
+            write_table(stats, args.output)
     
     else:
         print(f"\n{'='*60}")
@@ -143,15 +246,98 @@ def main():
         if 'cmdb_id' in df.columns:
             print(f"唯一组件数: {df['cmdb_id'].nunique()}")
             print(f"\nTop {args.top} 组件:")
-            print(df['cmdb_id'].value_counts().head(args.top).to_string())
+            counts = df['cmdb_id'].value_counts()
+            print(counts[counts > 0].head(args.top).to_string())
         
         print(f"\n示例日志 (前{args.top}条):")
-        for idx, row in df.head(args.top).iterrows():
-            ts = row.get('timestamp', 'N/A')
-            comp = row.get('cmdb_id', 'N/A')
-            value = row.get('value', '')[:80]
-            print(f"  [{ts}] {comp}: {value}...")
+        print_samples(df, args.top, width=80)
+
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Log Analysis Tool for OpenRCA')
+    parser.add_argument('--file', type=str, required=True, help='Log CSV file path')
+    parser.add_argument('--time-range', type=str, help='Time range (start_ts,end_ts)')
+    parser.add_argument('--errors', action='store_true', help='Find error logs')
+    parser.add_argument('--search', type=str, help='Search pattern (regex)')
+    parser.add_argument('--by-component', action='store_true', help='Group by component')
+    parser.add_argument('--component', type=str, help='Filter by component name')
+    parser.add_argument('--templates', action='store_true', help='Mine message templates and rank per-pod bursts')
+    parser.add_argument('--template-state', type=str, help='Template miner state file (default: next to the telemetry cache)')
+    parser.add_argument('--top', type=int, default=10, help='Top N results')
+    parser.add_argument('--output', type=str, help='Output file path (.csv, .parquet or .arrow/.ipc/.feather)')
+    parser.add_argument('--no-cache', action='store_true', help='Read the CSV directly instead of the columnar cache')
+    parser.add_argument('--no-index', action='store_true', help='Scan every log line instead of using the trigram index')
+    add_format_arguments(parser)
+    add_profile_arguments(parser)
+    add_server_argument(parser)
+    
+    args = parser.parse_args(argv)
+    forward_if_requested(args, 'analyze_log', argv)
+    check_format_arguments(parser, args)
+    check_profile_arguments(parser, args)
+    
+    with profile_session(args, 'analyze_log'):
+        run(parser, args)
 
 
+def run(parser, args):
+    """按参数执行模板挖掘、错误/搜索或概览分析"""
+    path = Path(args.file)
+    if not path.exists():
+        print(f"错误: 文件不存在 {args.file}")
+        sys.exit(1)
+    
+    # 导出结果时保留完整列，否则只读取分析需要的列
+    columns = None if args.output else ['timestamp', 'cmdb_id', 'value']
+    
+    start = end = None
+    if args.time_range:
+        start, end = map(int, args.time_range.split(','))
+    
+    if args.templates and args.format != 'text':
+        with structured_output(args.format, args.max_rows) as out, stage('report', format=args.format):
+            emit_templates(out, args.file, start, end, args.component, args.top, args.output, args.template_state,
+                           not args.no_cache)
+        return
+    if args.templates:
+        with stage('report'):
+            analyze_templates(args.file, start, end, args.component, args.top, args.output, args.template_state,
+                              not args.no_cache)
+        return
+    
+    # 错误/搜索模式先用三元组索引求候选行，只读取并校验候选行；索引无法缩小范围时全量扫描
+    matches = None
+    if (args.errors or args.search) and not args.no_index:
+        pattern = '|'.join(ERROR_PATTERNS) if args.errors else args.search
+        with stage('search', file=args.file) as span:
+            matches, stats = search_indexed(args.file, pattern, re.IGNORECASE, start, end, args.component, columns)
+            if stats is not None:
+                span.rows = stats['rows']
+            if matches is not None:
+                span.set(matches=len(matches))
+    
+    if args.format != 'text':
+        if matches is None:
+            with stage('load', file=args.file) as span:
+                df = load_telemetry(args.file, columns=columns, start_ts=start, end_ts=end, use_cache=not args.no_cache)
+                span.rows = rows = len(df)
+            if args.component:
+                df = filter_component(df, args.component)
+        else:
+            df, rows = matches, stats['rows']
+        with structured_output(args.format, args.max_rows) as out, stage('report', format=args.format):
+            emit_log_results(out, df, args, rows, matches is not None, start, end)
+        return
+    
+    if matches is None:
+        with stage('load', file=args.file) as span:
+            df = load_telemetry(args.file, columns=columns, start_ts=start, end_ts=end, use_cache=not args.no_cache)
+            span.rows = len(df)
+    else:
+        df = matches
+    with stage('report'):
+        report_log_results(df, args, stats if matches is not None else None, start, end)
+
 if __name__ == '__main__':
     main()
\ No newline at end of file
@@ -5,163 +5,526 @@ Metric Analyzer for OpenRCA - 服务指标分析工具
 
 Usage:
     python analyze_metric.py --file metric_service.csv --start "2022-03-20 09:00:00" --end "2022-03-20 09:30:00"
-    
-Output: 直接输出分析结果到stdout，供Agent解析
+
+    # 批量模式：一次加载数据和阈值，对多个时间窗口统一打分（文件或stdin，每行 [id,]start,end）
+    python analyze_metric.py --file metric_service.csv --windows windows.csv
+    cat windows.csv | python analyze_metric.py --file metric_service.csv --windows -
+
+    # 内存受限：估算占用超过上限时按块扫描计算阈值（t-digest 近似值），只加载窗口内的数据
+    python analyze_metric.py --file metric_service.csv --start ... --end ... --max-memory 2G
+
+    # 在线跟踪：持续读取新追加的数据，服务KPI的 EWMA 均值越过阈值时立即输出（状态写入检查点）
+    python analyze_metric.py --file metric_service.csv --follow
+
+    # 变点检测：全天每个服务每个KPI的变化起点、幅度和方向，按最早起点排序服务（--start/--end 可选，只限定起点范围）
+    python analyze_metric.py --file metric_service.csv --changepoint
+
+Output: 直接输出分析结果到stdout，供Agent解析；批量模式输出JSON
 """
 
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from common.rca_client import add_server_argument, forward_early, forward_if_requested
+
+if __name__ == '__main__':
+    forward_early('analyze_metric')  # --server: 在导入 pandas 之前转发给常驻服务
+
 import argparse
+import json
 import pandas as pd
 import numpy as np
 from datetime import datetime
-import pytz
-import sys
-from pathlib import Path
 
+from common.changepoint import (DEFAULT_MIN_CHANGE, DEFAULT_MIN_SCORE, changepoint_result, emit_changepoints,
+                                frame_matrix, print_changepoints)
+from common.chunked import fits_in_memory, iter_chunks
+from common.follow import DEFAULT_ALPHA, DEFAULT_INTERVAL, LONG_COLUMNS, StreamDetector, checkpoint_path, follow
+from common.output import add_format_arguments, check_format_arguments, structured_output, write_table
+from common.profiling import add_profile_arguments, check_profile_arguments, profile_session, stage
+from common.sketches import TDigest
+from common.telemetry_cache import load_telemetry, parse_size
+from common.time_utils import parse_datetime, parse_time, zone
+
+
+SERVICE_COLUMNS = ['service', 'timestamp', 'rr', 'sr', 'mrt']
+PERCENTILES = [95, 90, 75, 50, 25, 10, 5]
+
+# 成功率类指标低于P5为异常，响应时间高于P95为异常
+BELOW_KPIS = ['rr', 'sr']
+ABOVE_KPIS = ['mrt']
+
+
+def compute_service_thresholds(df: pd.DataFrame) -> dict:
+    """用完整数据计算每个KPI的全局分位数阈值"""
+    thresholds = {}
+    for col in BELOW_KPIS + ABOVE_KPIS:
+        values = df[col].dropna().to_numpy()
+        thresholds[col] = dict(zip([f'P{p}' for p in PERCENTILES], np.percentile(values, PERCENTILES)))
+    return thresholds
+
+
+def stream_service_thresholds(file_path: str, max_memory: int) -> dict:
+    """
+    内存受限模式：按块扫描整个文件，每个KPI一个 t-digest
+
+    返回总行数、时间范围和与 compute_service_thresholds 同格式的近似阈值。
+    """
+    digests = {col: TDigest() for col in BELOW_KPIS + ABOVE_KPIS}
+    rows = 0
+    first, last = None, None
+    for chunk in iter_chunks(file_path, SERVICE_COLUMNS, max_memory=max_memory):
+        if len(chunk) == 0:
+            continue
+        rows += len(chunk)
+        ts = chunk['timestamp']
+        first = ts.min() if first is None else min(first, ts.min())
+        last = ts.max() if last is None else max(last, ts.max())
+        for col, digest in digests.items():
+            digest.add(chunk[col].to_numpy(dtype=np.float64))
+    thresholds = {col: {f'P{p}': digest.quantile(p / 100) for p in PERCENTILES} for col, digest in digests.items()}
+    return {'rows': rows, 'time_range': (first, last), 'thresholds': thresholds}
+
+
+def _score_service_windows(frame: pd.DataFrame, thresholds: dict) -> pd.DataFrame:
+    """
+    对带 window 列的数据按 (窗口, 服务) 分组打分，返回异常长表
+
+    同一窗口内按偏离程度降序；偏离相同时保持服务首次出现、rr/sr/mrt 的顺序。
+    """
+    grouped = frame.groupby(['window', 'service'], sort=False, observed=True)
+    stats = grouped.agg(
+        rr_mean=('rr', 'mean'), rr_min=('rr', 'min'), rr_count=('rr', 'count'),
+        sr_mean=('sr', 'mean'), sr_min=('sr', 'min'), sr_count=('sr', 'count'),
+        mrt_mean=('mrt', 'mean'), mrt_max=('mrt', 'max'), mrt_count=('mrt', 'count'),
+    ).reset_index()
+    stats['order'] = np.arange(len(stats))
+
+    parts = []
+    for rank, kpi in enumerate(BELOW_KPIS + ABOVE_KPIS):
+        below = kpi in BELOW_KPIS
+        threshold = thresholds[kpi]['P5' if below else 'P95']
+        extremum = f'{kpi}_min' if below else f'{kpi}_max'
+        mean = stats[f'{kpi}_mean']
+        hit = (stats[f'{kpi}_count'] > 0) & ((mean < threshold) if below else (mean > threshold))
+        part = stats.loc[hit, ['window', 'service', 'order']].copy()
+        part['kpi'] = kpi
+        part['kpi_rank'] = rank
+        part['value'] = mean[hit]
+        part['extremum_name'] = 'min' if below else 'max'
+        part['extremum'] = stats.loc[hit, extremum]
+        part['threshold'] = threshold
+        part['type'] = 'below' if below else 'above'
+        part['deviation'] = ((threshold - mean[hit]) if below else (mean[hit] - threshold)) / threshold
+        parts.append(part)
+
+    result = pd.concat(parts, ignore_index=True)
+    result = result.sort_values(['order', 'kpi_rank'], kind='stable')
+    result = result.sort_values('deviation', ascending=False, kind='stable')
+    return result.sort_values('window', kind='stable')
+
+
+def _anomaly_records(scored: pd.DataFrame) -> list:
+    """转换为与报告一致的异常字典（rr/sr 带 min，mrt 带 max）"""
+    records = []
+    for row in scored.itertuples(index=False):
+        records.append({
+            'service': row.service,
+            'kpi': row.kpi,
+            'value': row.value,
+            row.extremum_name: row.extremum,
+            'threshold': row.threshold,
+            'type': row.type,
+            'deviation': row.deviation,
+        })
+    return records
+
+
+def detect_service_anomalies(filtered: pd.DataFrame, thresholds: dict) -> list:
+    """检测单个时间窗口内的服务层异常，按偏离程度降序"""
+    scored = _score_service_windows(filtered.assign(window=0), thresholds)
+    return _anomaly_records(scored)
+
+
+def score_service_windows(df: pd.DataFrame, windows: list, thresholds: dict) -> list:
+    """
+    在一次向量化计算中为多个时间窗口打分
+
+    windows 为 (id, start_ts, end_ts) 列表（秒级，闭区间，可重叠）。
+    每个窗口通过在排序后的时间戳上二分定位行区间，展开后按 (窗口, 服务) 统一分组。
+    """
+    ts = df['timestamp'].to_numpy()
+    order = np.argsort(ts, kind='stable')
+    sorted_ts = ts[order]
+
+    starts = np.array([w[1] for w in windows], dtype=np.int64)
+    ends = np.array([w[2] for w in windows], dtype=np.int64)
+    lo = np.searchsorted(sorted_ts, starts, side='left')
+    hi = np.searchsorted(sorted_ts, ends, side='right')
+    lengths = np.maximum(hi - lo, 0)
+
+    window_ids = np.repeat(np.arange(len(windows)), lengths)
+    offsets = np.repeat(lo - np.cumsum(lengths) + lengths, lengths) + np.arange(lengths.sum())
+    expanded = df.iloc[order[offsets]][SERVICE_COLUMNS].assign(window=window_ids)
+
+    by_window = {}
+    if len(expanded):
+        scored = _score_service_windows(expanded, thresholds)
+        by_window = {i: _anomaly_records(part) for i, part in scored.groupby('window', sort=False)}
+
+    results = []
+    for i, (window_id, start_ts, end_ts) in enumerate(windows):
+        anomalies = by_window.get(i, [])
+        results.append({
+            'id': window_id,
+            'start': int(start_ts),
+            'end': int(end_ts),
+            'rows': int(lengths[i]),
+            'anomalies': anomalies,
+        })
+    return results
+
+
+def window_anomaly_table(windows: list) -> pd.DataFrame:
+    """批量结果展开为每个异常一行（带窗口 id/start/end），没有异常的窗口不出现"""
+    columns = ['window', 'start', 'end', 'service', 'kpi', 'value', 'min', 'max', 'threshold', 'type', 'deviation']
+    rows = [{'window': window['id'], 'start': window['start'], 'end': window['end'], **anomaly}
+            for window in windows for anomaly in window['anomalies']]
+    return pd.DataFrame(rows).reindex(columns=columns)
+
+
+def read_windows(source: str, tz) -> list:
+    """读取窗口列表，每行 [id,]start,end；'-' 表示stdin，# 开头为注释"""
+    lines = sys.stdin.read().splitlines() if source == '-' else Path(source).read_text().splitlines()
+    windows = []
+    for line in lines:
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+        fields = [f.strip() for f in line.split(',')]
+        if len(fields) == 2:
+            window_id = str(len(windows))
+        elif len(fields) == 3:
+            window_id = fields.pop(0)
+        else:
+            raise ValueError(f"无法解析窗口: {line}")
+        if fields[0] == 'start':
+            continue  # 表头
+        windows.append((window_id, parse_time(fields[0], tz), parse_time(fields[1], tz)))
+    return windows
+
+
+def analyze_service_windows(file_path: str, windows: list, use_cache: bool = True, max_memory: int | None = None) -> dict:
+    """
+    批量模式：加载一次数据、计算一次阈值，对所有窗口打分
+
+    内存受限时阈值按块近似计算，只加载覆盖所有窗口的时间区间。
+    """
+    if max_memory and windows and not fits_in_memory(file_path, SERVICE_COLUMNS, max_memory):
+        with stage('threshold', chunked=True) as span:
+            scan = stream_service_thresholds(file_path, max_memory)
+            span.rows = scan['rows']
+        rows, thresholds = scan['rows'], scan['thresholds']
+        with stage('load', file=file_path) as span:
+            df = load_telemetry(file_path, columns=SERVICE_COLUMNS, start_ts=min(w[1] for w in windows),
+                                end_ts=max(w[2] for w in windows), use_cache=use_cache)
+            span.rows = len(df)
+    else:
+        with stage('load', file=file_path) as span:
+            df = load_telemetry(file_path, columns=SERVICE_COLUMNS, use_cache=use_cache)
+            span.rows = len(df)
+        with stage('threshold') as span:
+            rows, thresholds = len(df), compute_service_thresholds(df)
+            span.rows = rows
+    with stage('detect', windows=len(windows)) as span:
+        scored = score_service_windows(df, windows, thresholds)
+        span.rows = sum(window['rows'] for window in scored)
+    return {
+        'file': file_path,
+        'rows': rows,
+        'thresholds': {kpi: {k: float(v) for k, v in th.items()} for kpi, th in thresholds.items()},
+        'windows': scored,
+    }
 
-def analyze_service_metrics(file_path: str, start_dt: datetime, end_dt: datetime):
-    """分析服务层指标"""
-    tz = pytz.timezone('Asia/Shanghai')
-    start_ts = int(start_dt.timestamp())
-    end_ts = int(end_dt.timestamp())
+
+def service_window_result(file_path: str, start_ts: int, end_ts: int, use_cache: bool = True,
+                          max_memory: int | None = None) -> dict:
+    """
+    单窗口分析的结构化结果：全局阈值、窗口内数据量和按偏离程度降序的异常
+
+    设置 max_memory 且整体加载会超过上限时按块计算阈值，只加载窗口内的数据。
+    """
+    chunked = bool(max_memory) and not fits_in_memory(file_path, SERVICE_COLUMNS, max_memory)
+    if chunked:
+        with stage('threshold', chunked=True) as span:
+            scan = stream_service_thresholds(file_path, max_memory)
+            span.rows = scan['rows']
+        rows, thresholds, time_range = scan['rows'], scan['thresholds'], scan['time_range']
+        with stage('load', file=file_path) as span:
+            filtered = load_telemetry(file_path, columns=SERVICE_COLUMNS, start_ts=start_ts, end_ts=end_ts,
+                                      use_cache=use_cache)
+            span.rows = len(filtered)
+    else:
+        with stage('load', file=file_path) as span:
+            df = load_telemetry(file_path, columns=SERVICE_COLUMNS, use_cache=use_cache)
+            span.rows = len(df)
+        with stage('threshold') as span:
+            rows, thresholds = len(df), compute_service_thresholds(df)
+            span.rows = rows
+        time_range = (df['timestamp'].min(), df['timestamp'].max())
+        with stage('filter') as span:
+            filtered = df[(df['timestamp'] >= start_ts) & (df['timestamp'] <= end_ts)]
+            span.rows = len(filtered)
+    with stage('detect') as span:
+        anomalies = detect_service_anomalies(filtered, thresholds) if len(filtered) else []
+        span.rows = len(filtered)
+        span.set(anomalies=len(anomalies))
+    return {
+        'rows': rows,
+        'chunked': chunked,
+        'time_range': time_range,
+        'thresholds': thresholds,
+        'window_rows': len(filtered),
+        'anomalies': anomalies,
+    }
+
+
+def analyze_service_metrics(file_path: str, start_dt: datetime, end_dt: datetime, use_cache: bool = True,
+                            max_memory: int | None = None):
+    """分析服务层指标；设置 max_memory 且整体加载会超过上限时按块计算阈值"""
+    tz = zone()
+    result = service_window_result(file_path, int(start_dt.timestamp()), int(end_dt.timestamp()), use_cache,
+                                   max_memory)
+    with stage('report'):
+        print(f"{'='*70}")
+        print(f"服务层指标分析报告")
+        print(f"{'='*70}")
+        print(f"数据文件: {file_path}")
+        print(f"总数据量: {result['rows']} 条")
+        print(f"时间范围: {start_dt} ~ {end_dt}")
+        print(f"分析时间: {datetime.now(tz).strftime('%Y-%m-%d %H:%M:%S')}")
+        if result['chunked']:
+            print(f"读取模式: 分块扫描（预计占用超过 {max_memory / 1024 / 1024:.1f} MB，阈值为 t-digest 近似值）")
     
-    df = pd.read_csv(file_path)
+        print(f"\n{'#'*70}")
+        print(f"# 第一步：计算全局阈值（使用完整数据）")
+        print(f"{'#'*70}")
     
-    print(f"{'='*70}")
-    print(f"服务层指标分析报告")
-    print(f"{'='*70}")
-    print(f"数据文件: {file_path}")
-    print(f"总数据量: {len(df)} 条")
-    print(f"时间范围: {start_dt} ~ {end_dt}")
-    print(f"分析时间: {datetime.now(tz).strftime('%Y-%m-%d %H:%M:%S')}")
+        thresholds = result['thresholds']
+        for col in BELOW_KPIS + ABOVE_KPIS:
+            print(f"{col}: P95={thresholds[col]['P95']:.2f}, P50={thresholds[col]['P50']:.2f}, P5={thresholds[col]['P5']:.2f}")
     
-    print(f"\n{'#'*70}")
-    print(f"# 第一步：计算全局阈值（使用完整数据）")
-    print(f"{'#'*70}")
+        print(f"\n{'#'*70}")
+        print(f"# 第二步：过滤故障时间窗口数据")
+        print(f"{'#'*70}")
     
-    thresholds = {}
-    for col in ['rr', 'sr', 'mrt']:
-        values = df[col].dropna()
-        thresholds[col] = {
-            'P95': np.percentile(values, 95),
-            'P90': np.percentile(values, 90),
-            'P75': np.percentile(values, 75),
-            'P50': np.percentile(values, 50),
-            'P25': np.percentile(values, 25),
-            'P10': np.percentile(values, 10),
-            'P5': np.percentile(values, 5)
-        }
-        print(f"{col}: P95={thresholds[col]['P95']:.2f}, P50={thresholds[col]['P50']:.2f}, P5={thresholds[col]['P5']:.2f}")
-    
-    print(f"\n{'#'*70}")
-    print(f"# 第二步：过滤故障时间窗口数据")
-    print(f"{'#'*70}")
-    
-    filtered = df[(df['timestamp'] >= start_ts) & (df['timestamp'] <= end_ts)]
-    print(f"时间窗口内数据: {len(filtered)} 条")
-    
-    if len(filtered) == 0:
-        print(f"警告: 指定时间范围内无数据！")
-        print(f"数据时间范围: {df['timestamp'].min()} ~ {df['timestamp'].max()}")
-        return
+        print(f"时间窗口内数据: {result['window_rows']} 条")
     
-    print(f"\n{'#'*70}")
-    print(f"# 第三步：检测异常 - 服务层")
-    print(f"{'#'*70}")
-    
-    anomalies = []
-    
-    for service in filtered['service'].unique():
-        svc_data = filtered[filtered['service'] == service]
-        
-        for kpi in ['rr', 'sr']:
-            values = svc_data[kpi].dropna()
-            if len(values) == 0:
-                continue
-            
-            mean_val = values.mean()
-            min_val = values.min()
-            threshold_p5 = thresholds[kpi]['P5']
-            
-            if mean_val < threshold_p5:
-                deviation = (threshold_p5 - mean_val) / threshold_p5
-                anomalies.append({
-                    'service': service,
-                    'kpi': kpi,
-                    'value': mean_val,
-                    'min': min_val,
-                    'threshold': threshold_p5,
-                    'type': 'below',
-                    'deviation': deviation
-                })
-        
-        for kpi in ['mrt']:
-            values = svc_data[kpi].dropna()
-            if len(values) == 0:
-                continue
-            
-            mean_val = values.mean()
-            max_val = values.max()
-            threshold_p95 = thresholds[kpi]['P95']
-            
-            if mean_val > threshold_p95:
-                deviation = (mean_val - threshold_p95) / threshold_p95
-                anomalies.append({
-                    'service': service,
-                    'kpi': kpi,
-                    'value': mean_val,
-                    'max': max_val,
-                    'threshold': threshold_p95,
-                    'type': 'above',
-                    'deviation': deviation
-                })
-    
-    if not anomalies:
-        print(f"未检测到明显异常")
-        print(f"\n建议：尝试放宽阈值（如使用P90替代P95）")
-    else:
-        anomalies.sort(key=lambda x: x['deviation'], reverse=True)
-        
-        print(f"\n检测到 {len(anomalies)} 个异常指标：\n")
-        
-        for i, a in enumerate(anomalies, 1):
-            direction = '↓' if a['type'] == 'below' else '↑'
-            extremum = f"min={a.get('min', a.get('max', 'N/A')):.2f}"
-            print(f"{i}. [{a['service']}] {a['kpi']} {direction}")
-            print(f"   均值={a['value']:.2f}, 阈值(P{'5' if a['type']=='below' else '95'})={a['threshold']:.2f}, {extremum}")
-            print(f"   偏离程度: {a['deviation']*100:.1f}%")
-            print()
-    
-    print(f"{'#'*70}")
-    print(f"# 第四步：结论与建议")
-    print(f"{'#'*70}")
-    
-    if anomalies:
-        top = anomalies[0]
-        print(f"\n最显著异常: {top['service']} - {top['kpi']}")
-        print(f"偏离阈值: {top['deviation']*100:.1f}%")
-        print(f"\n建议: 分析该服务的容器层指标和链路追踪")
-    else:
-        print(f"\n建议: 检查容器层资源指标 (CPU/Memory/Disk I/O)")
+        if result['window_rows'] == 0:
+            print(f"警告: 指定时间范围内无数据！")
+            first, last = result['time_range']
+            print(f"数据时间范围: {first} ~ {last}")
+            return
+    
+        print(f"\n{'#'*70}")
+        print(f"# 第三步：检测异常 - 服务层")
+        print(f"{'#'*70}")
+    
+        anomalies = result['anomalies']
+    
+        if not anomalies:
+            print(f"未检测到明显异常")
+            print(f"\n建议：尝试放宽阈值（如使用P90替代P95）")
+        else:
+            print(f"\n检测到 {len(anomalies)} 个异常指标：\n")
+    
+            for i, a in enumerate(anomalies, 1):
+                direction = '↓' if a['type'] == 'below' else '↑'
+                extremum = f"min={a.get('min', a.get('max', 'N/A')):.2f}"
+                print(f"{i}. [{a['service']}] {a['kpi']} {direction}")
+                print(f"   均值={a['value']:.2f}, 阈值(P{'5' if a['type']=='below' else '95'})={a['threshold']:.2f}, {extremum}")
+                print(f"   偏离程度: {a['deviation']*100:.1f}%")
+                print()
+    
+        print(f"{'#'*70}")
+        print(f"# 第四步：结论与建议")
+        print(f"{'#'*70}")
+    
+        if anomalies:
+            top = anomalies[0]
+            print(f"\n最显著异常: {top['service']} - {top['kpi']}")
+            print(f"偏离阈值: {top['deviation']*100:.1f}%")
+            print(f"\n建议: 分析该服务的容器层指标和链路追踪")
+        else:
+            print(f"\n建议: 检查容器层资源指标 (CPU/Memory/Disk I/O)")
+
+
+def emit_service_metrics(out, file_path: str, start_ts: int, end_ts: int, use_cache: bool = True,
+                         max_memory: int | None = None):
+    """--format json|arrow：单窗口的概要、阈值和异常"""
+    result = service_window_result(file_path, start_ts, end_ts, use_cache, max_memory)
+    first, last = result['time_range']
+    with stage('report', format=out.fmt):
+        out.record('summary', file=file_path, rows=result['rows'], start=start_ts, end=end_ts,
+                   window_rows=result['window_rows'], anomalies=len(result['anomalies']), chunked=result['chunked'],
+                   data_start=first, data_end=last)
+        out.table('thresholds', _threshold_rows(result['thresholds']))
+        out.table('anomalies', result['anomalies'])
+
+
+def emit_service_windows(out, file_path: str, windows: list, use_cache: bool = True, max_memory: int | None = None):
+    """--format json|arrow：批量模式每个窗口一节，异常数超过 --max-rows 时截断（anomaly_count 为总数）"""
+    result = analyze_service_windows(file_path, windows, use_cache, max_memory)
+    with stage('report', format=out.fmt):
+        out.record('summary', file=file_path, rows=result['rows'], windows=len(result['windows']))
+        out.table('thresholds', _threshold_rows(result['thresholds']))
+        for window in result['windows']:
+            out.record('window', **{**window, 'anomaly_count': len(window['anomalies']),
+                                    'anomalies': window['anomalies'][:out.max_rows]})
+
 
+def service_changepoints(file_path: str, start_ts: int | None = None, end_ts: int | None = None, use_cache: bool = True,
+                         min_score: float = DEFAULT_MIN_SCORE, min_change: float = DEFAULT_MIN_CHANGE) -> dict:
+    """每个 (服务, KPI) 为一条序列，检测全天的变化起点；start_ts/end_ts 只限定起点所在的范围"""
+    with stage('load', file=file_path) as span:
+        df = load_telemetry(file_path, columns=SERVICE_COLUMNS, use_cache=use_cache)
+        values, times, labels = frame_matrix(df, 'service', BELOW_KPIS + ABOVE_KPIS)
+        span.rows = len(df)
+    return changepoint_result(values, times, labels, start_ts, end_ts, min_score, min_change, component='service',
+                              kpi='kpi', rows=len(df))
 
-def main():
+
+def _threshold_rows(thresholds: dict) -> list:
+    """{KPI: {P95: ..}} 展开为每个KPI一行"""
+    return [{'kpi': kpi, **{name: float(value) for name, value in th.items()}} for kpi, th in thresholds.items()]
+
+
+def follow_service_metrics(file_path: str, alpha: float = DEFAULT_ALPHA, interval: float = DEFAULT_INTERVAL,
+                           checkpoint: str | None = None, on_event=None):
+    """在线跟踪服务层指标：rr/sr 低于全局P5、mrt 高于全局P95，窗口均值换成每个服务KPI的 EWMA 均值"""
+    def to_long(frame: pd.DataFrame) -> pd.DataFrame:
+        long = frame.melt(id_vars=['timestamp', 'service'], value_vars=BELOW_KPIS + ABOVE_KPIS, var_name='kpi')
+        return long.rename(columns={'service': 'component'})[LONG_COLUMNS]
+
+    config = {'analyzer': 'metric', 'alpha': alpha}
+    path = Path(checkpoint) if checkpoint else checkpoint_path(file_path, 'follow_metric.json')
+
+    print(f"{'='*70}")
+    print("服务层指标在线跟踪")
+    print(f"{'='*70}")
+    print(f"数据文件: {file_path}")
+    print(f"规则: EWMA均值(alpha={alpha}) 低于全局P5 ({'/'.join(BELOW_KPIS)}) 或高于全局P95 ({'/'.join(ABOVE_KPIS)})")
+    print(f"检查点: {path}", flush=True)
+
+    detector = StreamDetector(below=set(BELOW_KPIS), alpha=alpha)
+    follow(file_path, detector, to_long, path, config, interval=interval, on_event=on_event)
+
+
+def main(argv=None):
     parser = argparse.ArgumentParser(description='Metric Analyzer for OpenRCA')
     parser.add_argument('--file', type=str, required=True, help='Metric CSV file path (e.g., metric_service.csv)')
-    parser.add_argument('--start', type=str, required=True, help='Start time (YYYY-MM-DD HH:MM:SS)')
-    parser.add_argument('--end', type=str, required=True, help='End time (YYYY-MM-DD HH:MM:SS)')
+    parser.add_argument('--start', type=str, help='Start time (YYYY-MM-DD HH:MM:SS)')
+    parser.add_argument('--end', type=str, help='End time (YYYY-MM-DD HH:MM:SS)')
+    parser.add_argument('--windows', type=str, help='Batch mode: window list file ("-" for stdin), one [id,]start,end per line')
+    parser.add_argument('--output', type=str,
+                        help='Batch mode: .json writes the full result, .csv/.parquet/.arrow one row per anomaly')
+    parser.add_argument('--no-cache', action='store_true', help='Read the CSV directly instead of the columnar cache')
+    parser.add_argument('--max-memory', type=str,
+                        help='Memory ceiling, e.g. 2G; files estimated not to fit are scanned in chunks')
+    parser.add_argument('--changepoint', action='store_true',
+                        help='Find the onset, magnitude and direction of changes in every service KPI of the day '
+                             '(--start/--end optionally limit where onsets are reported)')
+    parser.add_argument('--min-score', type=float, default=DEFAULT_MIN_SCORE,
+                        help='Changepoint: minimum CUSUM score (mean shift in noise standard deviations)')
+    parser.add_argument('--min-change', type=float, default=DEFAULT_MIN_CHANGE,
+                        help='Changepoint: minimum change relative to the mean before the onset')
+    parser.add_argument('--follow', action='store_true', help='Tail the file and report anomalies as samples arrive')
+    parser.add_argument('--interval', type=float, default=DEFAULT_INTERVAL, help='Follow mode: poll interval in seconds')
+    parser.add_argument('--alpha', type=float, default=DEFAULT_ALPHA, help='Follow mode: EWMA smoothing factor')
+    parser.add_argument('--checkpoint', type=str, help='Follow mode: checkpoint file (default: next to the cache)')
+    add_format_arguments(parser)
+    add_profile_arguments(parser)
+    add_server_argument(parser)
     
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
+    forward_if_requested(args, 'analyze_metric', argv)
+    check_format_arguments(parser, args)
+    check_profile_arguments(parser, args)
     
+    with profile_session(args, 'analyze_metric'):
+        run(parser, args)
+
+
+def run(parser, args):
+    """按参数执行单窗口、批量或在线跟踪分析"""
     if not Path(args.file).exists():
         print(f"错误: 文件不存在 {args.file}")
         sys.exit(1)
     
-    tz = pytz.timezone('Asia/Shanghai')
-    start_dt = tz.localize(datetime.strptime(args.start, '%Y-%m-%d %H:%M:%S'))
-    end_dt = tz.localize(datetime.strptime(args.end, '%Y-%m-%d %H:%M:%S'))
+    tz = zone()
+    max_memory = parse_size(args.max_memory) if args.max_memory else None
+    
+    if args.windows:
+        windows = read_windows(args.windows, tz)
+        if args.format != 'text':
+            with structured_output(args.format, args.max_rows) as out:
+                emit_service_windows(out, args.file, windows, use_cache=not args.no_cache, max_memory=max_memory)
+            return
+        result = analyze_service_windows(args.file, windows, use_cache=not args.no_cache, max_memory=max_memory)
+        with stage('report'):
+            if args.output and Path(args.output).suffix.lower() != '.json':
+                table = window_anomaly_table(result['windows'])
+                write_table(table, args.output)
+                print(f"已写入 {len(windows)} 个窗口的 {len(table)} 条异常: {args.output}")
+                return
+            text = json.dumps(result, ensure_ascii=False, indent=2)
+            if args.output:
+                Path(args.output).write_text(text)
+                print(f"已写入 {len(windows)} 个窗口的结果: {args.output}")
+            else:
+                print(text)
+        return
+    
+    if args.follow:
+        if args.format != 'text':
+            with structured_output(args.format, args.max_rows) as out:
+                follow_service_metrics(args.file, args.alpha, args.interval, args.checkpoint,
+                                       on_event=lambda event: out.record('event', **event))
+            return
+        follow_service_metrics(args.file, args.alpha, args.interval, args.checkpoint)
+        return
+    
+    if args.changepoint:
+        if args.max_memory:
+            parser.error('--changepoint and --max-memory cannot be combined')
+        if bool(args.start) != bool(args.end):
+            parser.error('--start and --end must be given together')
+        start_ts = parse_time(args.start, tz) if args.start else None
+        end_ts = parse_time(args.end, tz) if args.end else None
+        result = service_changepoints(args.file, start_ts, end_ts, use_cache=not args.no_cache,
+                                      min_score=args.min_score, min_change=args.min_change)
+        if args.format != 'text':
+            with structured_output(args.format, args.max_rows) as out, stage('report', format=out.fmt):
+                emit_changepoints(out, result, file=args.file)
+            return
+        with stage('report'):
+            print_changepoints('服务层指标变点检测报告', args.file, result, tz, 's')
+        return
+    
+    if not args.start or not args.end:
+        parser.error('--start and --end are required unless --windows, --follow or --changepoint is given')
+    
+    start_dt, end_dt = parse_datetime(args.start, tz), parse_datetime(args.end, tz)
+    
+    if args.format != 'text':
+        with structured_output(args.format, args.max_rows) as out:
+            emit_service_metrics(out, args.file, int(start_dt.timestamp()), int(end_dt.timestamp()),
+                                 use_cache=not args.no_cache, max_memory=max_memory)
+        return
     
-    analyze_service_metrics(args.file, start_dt, end_dt)
+    analyze_service_metrics(args.file, start_dt, end_dt, use_cache=not args.no_cache, max_memory=max_memory)
 
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
@@ -15,14 +15,37 @@ Examples:
     
     # 分析最慢的调用链
     python analyze_trace.py --file trace_span.csv --slow-traces --top 10
+    
+    # 批量计算窗口内所有trace的关键路径、self-time热点和最深错误span
+    python analyze_trace.py --file trace_span.csv --time-range "1647781200000,1647784800000" --critical-path
+    
+    # 服务依赖图与故障传播排名（边表按时间桶缓存，新窗口增量计算）
+    python analyze_trace.py --file trace_span.csv --time-range "1647781200000,1647784800000" --dependency-graph
+
+    # 按操作 × Pod 的延迟分位数（合并按分钟保存的 DDSketch，不重新扫描span）
+    python analyze_trace.py --file trace_span.csv --time-range "1647781200000,1647784800000" --latency --by operation_name,cmdb_id
 """
 
-import argparse
-import pandas as pd
 import sys
 from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from common.rca_client import add_server_argument, forward_early, forward_if_requested
+
+if __name__ == '__main__':
+    forward_early('analyze_trace')  # --server: 在导入 pandas 之前转发给常驻服务
+
+import argparse
+import pandas as pd
 from collections import defaultdict
 
+from common.latency_store import KEYS as LATENCY_KEYS, latency_quantiles, open_latency
+from common.span_tree import SpanIndex
+from common.trace_graph import DEFAULT_BUCKET_SECONDS, aggregate_edges, load_edges, propagation_scores
+from common.output import add_format_arguments, check_format_arguments, structured_output, write_table
+from common.profiling import add_profile_arguments, check_profile_arguments, profile_session, stage
+from common.telemetry_cache import load_telemetry
+
 
 def analyze_errors_by_component(df: pd.DataFrame) -> pd.DataFrame:
     """按组件统计错误"""
@@ -32,7 +55,7 @@ def analyze_errors_by_component(df: pd.DataFrame) -> pd.DataFrame:
         print("未发现错误trace")
         return pd.DataFrame()
     
-    error_stats = errors.groupby('cmdb_id').agg({
+    error_stats = errors.groupby('cmdb_id', observed=True).agg({
         'trace_id': 'count',
         'duration': ['mean', 'max']
     }).reset_index()
@@ -53,45 +76,191 @@ def analyze_slow_traces(df: pd.DataFrame, top_n: int = 10) -> pd.DataFrame:
     return slowest
 
 
-def analyze_call_chain(df: pd.DataFrame, trace_id: str) -> pd.DataFrame:
-    """分析单个trace的调用链"""
-    trace_data = df[df['trace_id'] == trace_id].copy()
+def analyze_call_chain(df: pd.DataFrame, trace_id: str, index: SpanIndex = None) -> pd.DataFrame:
+    """分析单个trace的调用链，按调用树深度优先排列并标注 self-time 与关键路径"""
+    if not {'span_id', 'parent_span'}.issubset(df.columns):
+        trace_data = df[df['trace_id'] == trace_id].copy()
+        if len(trace_data) == 0:
+            print(f"未找到 trace_id: {trace_id}")
+        return trace_data.sort_values('timestamp')
+    
+    index = index if index is not None else SpanIndex(df)
+    trace_data = index.trace_spans(trace_id)
     
     if len(trace_data) == 0:
         print(f"未找到 trace_id: {trace_id}")
         return pd.DataFrame()
     
-    if 'parent_span' in trace_data.columns and 'span_id' in trace_data.columns:
-        trace_data = trace_data.sort_values('timestamp')
-    
     return trace_data
 
 
-def main():
-    parser = argparse.ArgumentParser(description='Trace Analysis Tool for OpenRCA')
-    parser.add_argument('--file', type=str, required=True, help='Trace CSV file path')
-    parser.add_argument('--time-range', type=str, help='Time range (start_ms,end_ms)')
-    parser.add_argument('--errors-by-component', action='store_true', help='Group errors by component')
-    parser.add_argument('--slow-traces', action='store_true', help='Find slowest traces')
-    parser.add_argument('--trace-id', type=str, help='Analyze specific trace')
-    parser.add_argument('--top', type=int, default=10, help='Top N results')
-    parser.add_argument('--output', type=str, help='Output file path')
+def analyze_critical_paths(df: pd.DataFrame, index: SpanIndex = None):
+    """
+    批量计算时间范围内所有trace的关键路径
     
-    args = parser.parse_args()
+    返回 (按根span耗时降序的trace摘要, 按组件汇总的关键路径热点与最深错误span)
+    """
+    with stage('index') as span:
+        index = index if index is not None else SpanIndex(df)
+        span.rows = len(df)
+    with stage('critical_path') as span:
+        summary = index.trace_summary()
+        span.rows = len(summary)
+    if len(summary) == 0:
+        return summary, pd.DataFrame()
     
-    path = Path(args.file)
-    if not path.exists():
-        print(f"错误: 文件不存在 {args.file}")
-        sys.exit(1)
+    summary = summary.sort_values('duration', ascending=False, kind='stable')
     
-    df = pd.read_csv(args.file)
+    hotspots = summary.groupby('hotspot').agg(
+        hotspot_traces=('trace_id', 'count'),
+        avg_self_time=('hotspot_self_time', 'mean'),
+    )
+    deepest = summary.dropna(subset=['deepest_error']).groupby('deepest_error').size().rename('deepest_error_traces')
+    components = hotspots.join(deepest, how='outer').fillna({'hotspot_traces': 0, 'deepest_error_traces': 0})
+    components = components.astype({'hotspot_traces': 'int64', 'deepest_error_traces': 'int64'})
+    components = components.rename_axis('cmdb_id').reset_index()
+    components = components.sort_values(['deepest_error_traces', 'hotspot_traces'], ascending=False, kind='stable')
+    
+    return summary, components
+
+
+def analyze_dependency_graph(file_path: str, start: int, end: int, bucket_seconds: int, top_n: int = 10,
+                             output: str | None = None, use_cache: bool = True):
+    """服务依赖图：调用边的错误与耗时，以及故障传播得分排名"""
+    with stage('load', file=file_path) as span:
+        edges = load_edges(file_path, start, end, bucket_seconds, use_cache=use_cache)
+        span.rows = len(edges)
+    print(f"调用边: {len(edges)} 条 (时间桶 {bucket_seconds}s, {edges['bucket'].nunique()} 个桶)")
+    if start is not None and end is not None:
+        print(f"时间范围过滤: {start} ~ {end}")
+    
+    if len(edges) == 0:
+        print("未发现调用边")
+        return
+    
+    graph = aggregate_edges(edges)
+    print(f"\n{'='*60}")
+    print(f"调用边 (按错误数排序, 前{top_n}):")
+    print(f"{'='*60}")
+    print(graph.head(top_n).to_string(index=False))
+    
+    with stage('detect') as span:
+        ranking = propagation_scores(edges)
+        span.rows = len(edges)
+    print(f"\n{'='*60}")
+    print("故障传播排名 (得分高表示错误从该组件开始向上游传播):")
+    print(f"{'='*60}")
+    print(ranking.head(top_n).to_string(index=False))
+    
+    if output:
+        write_table(edges, output)
+
+
+def emit_dependency_graph(out, file_path: str, start: int, end: int, bucket_seconds: int, top_n: int = 10,
+                          output: str | None = None, use_cache: bool = True):
+    """--format json|arrow：调用边与故障传播排名"""
+    with stage('load', file=file_path) as span:
+        edges = load_edges(file_path, start, end, bucket_seconds, use_cache=use_cache)
+        span.rows = len(edges)
+    out.record('summary', file=file_path, start=start, end=end, edges=len(edges), bucket_seconds=bucket_seconds,
+               buckets=int(edges['bucket'].nunique()))
+    if len(edges):
+        out.table('edges', aggregate_edges(edges), top_n)
+        with stage('detect') as span:
+            ranking = propagation_scores(edges)
+            span.rows = len(edges)
+        out.table('propagation', ranking, top_n)
+    if output:
+        write_table(edges, output)
+
+
+def analyze_latency(file_path: str, start: int | None = None, end: int | None = None, by=('operation_name',),
+                    interval: int | None = None) -> tuple:
+    """
+    延迟分位数：打开（首次为按块构建）按分钟保存的 DDSketch，合并窗口内的概要
+
+    按 by 分组时按 p99 降序，按时间桶分组（interval 分钟）时按时间顺序。
+    """
+    with stage('sketch', file=file_path) as span:
+        store = open_latency(file_path)
+        span.rows = store.meta['rows']
+    with stage('merge') as span:
+        table = latency_quantiles(store, start, end, by, interval=interval)
+        if not interval and len(by):
+            table = table.sort_values('p99', ascending=False, kind='stable').reset_index(drop=True)
+        span.rows = int(table['spans'].sum())
+        span.set(groups=len(table))
+    return store, table
+
+
+def report_latency(file_path: str, args, start: int | None = None, end: int | None = None):
+    """文本报告：延迟分位数表"""
+    store, table = analyze_latency(file_path, start, end, args.by, args.interval)
+    with stage('report'):
+        print(f"\n{'='*60}")
+        print(f"延迟分位数 (DDSketch，相对误差 ≤ {store.meta['alpha']:.0%}):")
+        print(f"{'='*60}")
+        print(f"概要: {store.meta['rows']:,} 条span，{store.meta['cells']:,} 个 (操作, Pod, 分钟) 单元")
+        if args.time_range:
+            first, last = store.covered(start, end)
+            print(f"时间范围: {start} ~ {end}（按整分钟计入 {first} ~ {last}）")
+        print(f"窗口内span数: {int(table['spans'].sum())}, 分组数: {len(table)}")
+        if len(table) > 0:
+            print(table.head(args.top).to_string(index=False, float_format=lambda v: f"{v:.2f}"))
+        if args.output:
+            write_table(table, args.output)
+
+
+def emit_latency(out, file_path: str, args, start: int | None = None, end: int | None = None):
+    """--format json|arrow：概要信息和延迟分位数表"""
+    store, table = analyze_latency(file_path, start, end, args.by, args.interval)
+    with stage('report', format=out.fmt):
+        first, last = store.covered(start, end)
+        out.record('summary', file=file_path, start=start, end=end, covered_start=first, covered_end=last,
+                   spans=int(table['spans'].sum()), groups=len(table), alpha=store.meta['alpha'], by=list(args.by), interval=args.interval)
+        out.table('latency', table, args.top)
+        if args.output:
+            write_table(table, args.output)
+
+
+def emit_trace_results(out, df: pd.DataFrame, args, start: int | None = None, end: int | None = None):
+    """--format json|arrow：与文本报告相同的模式，只输出结果表（top-k 表按 --top 截断）"""
+    out.record('summary', file=args.file, start=start, end=end, spans=len(df))
+    result = None
+    if args.errors_by_component:
+        result = analyze_errors_by_component(df)
+        out.table('errors_by_component', result)
+    elif args.slow_traces:
+        result = analyze_slow_traces(df, args.top)
+        out.table('slow_traces', result)
+    elif args.critical_path:
+        result, components = analyze_critical_paths(df)
+        out.table('traces', result, args.top)
+        out.table('components', components, args.top)
+    elif args.trace_id:
+        out.table('spans', analyze_call_chain(df, args.trace_id))
+    else:
+        overview = {'traces': int(df['trace_id'].nunique())}
+        if 'status_code' in df.columns and len(df):
+            errors = int((df['status_code'] != 0).sum())
+            overview.update(error_spans=errors, error_rate=errors / len(df))
+        if 'duration' in df.columns and len(df):
+            duration = df['duration']
+            overview.update(duration_mean=duration.mean(), duration_max=duration.max(),
+                            duration_p95=duration.quantile(0.95))
+        out.record('overview', **overview)
+        out.table('components', df['cmdb_id'].value_counts(), args.top)
+    if args.output and result is not None:
+        write_table(result, args.output)
+
+
+def report_trace_results(df: pd.DataFrame, args, start: int | None = None, end: int | None = None):
+    """文本报告：按参数中的模式分析已加载的trace并输出"""
     print(f"加载trace数据: {len(df)} 条")
     print(f"列: {list(df.columns)}")
     
     if args.time_range:
-        start, end = map(int, args.time_range.split(','))
-        df = df[(df['timestamp'] >= start) & (df['timestamp'] <= end)]
-        print(f"时间范围过滤后: {len(df)} 条")
+        print(f"时间范围过滤: {start} ~ {end}")
     
     if args.errors_by_component:
         print(f"\n{'='*60}")
@@ -102,7 +271,7 @@ def main():
             print(error_stats.to_string(index=False))
         
         if args.output:
-            error_stats.to_csv(args.output, index=False)
+            write_table(error_stats, args.output)
     
     elif args.slow_traces:
         print(f"\n{'='*60}")
@@ -112,7 +281,22 @@ def main():
         print(slowest.to_string(index=False))
         
         if args.output:
-            slowest.to_csv(args.output, index=False)
+            write_table(slowest, args.output)
+    
+    elif args.critical_path:
+        print(f"\n{'='*60}")
+        print(f"关键路径分析 (最慢的 {args.top} 条trace):")
+        print(f"{'='*60}")
+        summary, components = analyze_critical_paths(df)
+        if len(summary) > 0:
+            print(f"trace数: {len(summary)}")
+            print(summary.head(args.top)[['trace_id', 'spans', 'duration', 'critical_path', 'hotspot', 'hotspot_self_time',
+                           'deepest_error']].to_string(index=False))
+            print("\n组件汇总 (关键路径self-time热点 / 最深错误span):")
+            print(components.head(args.top).to_string(index=False))
+        
+        if args.output:
+            write_table(summary, args.output)
     
     elif args.trace_id:
         print(f"\n{'='*60}")
@@ -144,5 +328,88 @@ def main():
         print(df['cmdb_id'].value_counts().head(10).to_string())
 
 
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Trace Analysis Tool for OpenRCA')
+    parser.add_argument('--file', type=str, required=True, help='Trace CSV file path')
+    parser.add_argument('--time-range', type=str, help='Time range (start_ms,end_ms)')
+    parser.add_argument('--errors-by-component', action='store_true', help='Group errors by component')
+    parser.add_argument('--slow-traces', action='store_true', help='Find slowest traces')
+    parser.add_argument('--trace-id', type=str, help='Analyze specific trace')
+    parser.add_argument('--critical-path', action='store_true', help='Critical path, self-time and deepest error of every trace')
+    parser.add_argument('--dependency-graph', action='store_true', help='Caller->callee edges and error propagation ranking')
+    parser.add_argument('--bucket', type=int, default=DEFAULT_BUCKET_SECONDS, help='Time bucket of the edge table in seconds')
+    parser.add_argument('--latency', action='store_true', help='p50/p95/p99 latency merged from per-minute sketches')
+    parser.add_argument('--by', type=str, default='operation_name',
+                        help='Latency grouping: comma-separated operation_name,cmdb_id (empty for one overall row)')
+    parser.add_argument('--interval', type=int, help='Latency: also group by time buckets of this many minutes')
+    parser.add_argument('--top', type=int, default=10, help='Top N results')
+    parser.add_argument('--output', type=str, help='Output file path (.csv, .parquet or .arrow/.ipc/.feather)')
+    parser.add_argument('--no-cache', action='store_true', help='Read the CSV directly instead of the columnar cache')
+    add_format_arguments(parser)
+    add_profile_arguments(parser)
+    add_server_argument(parser)
+    
+    args = parser.parse_args(argv)
+    forward_if_requested(args, 'analyze_trace', argv)
+    check_format_arguments(parser, args)
+    args.by = [name.strip() for name in args.by.split(',') if name.strip()]
+    unknown = [name for name in args.by if name not in LATENCY_KEYS]
+    if unknown:
+        parser.error(f"--by 只支持 {','.join(LATENCY_KEYS)}: {','.join(unknown)}")
+    check_profile_arguments(parser, args)
+    
+    with profile_session(args, 'analyze_trace'):
+        run(parser, args)
+
+
+def run(parser, args):
+    """按参数中的模式加载trace并输出报告"""
+    path = Path(args.file)
+    if not path.exists():
+        print(f"错误: 文件不存在 {args.file}")
+        sys.exit(1)
+    
+    start = end = None
+    if args.time_range:
+        start, end = map(int, args.time_range.split(','))
+    
+    if args.dependency_graph and args.format != 'text':
+        with structured_output(args.format, args.max_rows) as out:
+            emit_dependency_graph(out, args.file, start, end, args.bucket, args.top, args.output, not args.no_cache)
+        return
+    if args.dependency_graph:
+        analyze_dependency_graph(args.file, start, end, args.bucket, args.top, args.output, not args.no_cache)
+        return
+    if args.latency and args.format != 'text':
+        with structured_output(args.format, args.max_rows) as out:
+            emit_latency(out, args.file, args, start, end)
+        return
+    if args.latency:
+        report_latency(args.file, args, start, end)
+        return
+    
+    # 只读取当前模式需要的列，调用链分析保留完整span
+    if args.errors_by_component:
+        columns = ['timestamp', 'cmdb_id', 'trace_id', 'duration', 'status_code']
+    elif args.slow_traces:
+        columns = ['timestamp', 'cmdb_id', 'trace_id', 'duration']
+    elif args.critical_path:
+        columns = ['timestamp', 'cmdb_id', 'trace_id', 'span_id', 'parent_span', 'duration', 'status_code']
+    elif args.trace_id:
+        columns = None
+    else:
+        columns = ['timestamp', 'cmdb_id', 'trace_id', 'duration', 'status_code']
+    
+    with stage('load', file=args.file) as span:
+        df = load_telemetry(args.file, columns=columns, start_ts=start, end_ts=end, use_cache=not args.no_cache)
+        span.rows = len(df)
+    if args.format != 'text':
+        with structured_output(args.format, args.max_rows) as out, stage('report', format=args.format):
+            emit_trace_results(out, df, args, start, end)
+        return
+    with stage('report'):
+        report_trace_results(df, args, start, end)
+
 if __name__ == '__main__':
     main()
\ No newline at end of file
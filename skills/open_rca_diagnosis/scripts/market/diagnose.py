@@ -0,0 +1,499 @@
+#!/usr/bin/env python3
+"""
+Incident Diagnoser for OpenRCA
+一站式诊断 - 一次调用完成 服务层 → 容器层 → 链路 → 日志 → 结论 的诊断流程
+
+各数据文件只加载一次，在线程中并发读取；各层分析作为依赖图中的阶段执行，
+互不依赖的阶段并行运行，整体耗时取决于最慢的依赖链而不是各阶段之和：
+
+    load_service   ─→ service   ─┐
+    load_container ─→ container ─┼─→ log ─→ conclusion
+    load_trace     ─→ trace     ─┤
+    load_log       ──────────────┘
+    load_service + load_container ─→ correlation
+
+每个分析阶段产出一个 Evidence（层级、摘要、按得分排序的发现、明细），
+日志阶段在窗口内的错误日志中核实前面各层指向的候选组件，结论阶段合并为组件排名。
+跨层相关阶段把异常服务KPI与容器指标做滞后相关，只作为佐证列出，不参与结论投票。
+
+Usage:
+    python diagnose.py --data-dir cloudbed-1/telemetry/2022_03_20 --start "2022-03-20 09:00:00" --end "2022-03-20 09:30:00"
+
+    # 单独指定文件，输出JSON
+    python diagnose.py --metric-file metric_service.csv --container-file metric_container.csv \\
+        --trace-file trace_span.csv --log-file log_service.csv --start 1647738000 --end 1647739800 --output rca.json
+"""
+
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import argparse
+import json
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import asdict, dataclass, field
+from datetime import datetime
+
+import pandas as pd
+
+from common.output import add_format_arguments, check_format_arguments, structured_output
+from common.profiling import add_profile_arguments, check_profile_arguments, profile_session, stage
+from common.span_tree import SpanIndex
+from common.telemetry_cache import DATA_ERRORS, load_telemetry
+from common.time_utils import file_time_unit, parse_time, window_bounds, zone
+from common.trace_graph import load_edges, propagation_scores
+from market.analyze_container import (
+    CONTAINER_COLUMNS,
+    RESOURCE_REASONS,
+    compute_kpi_thresholds,
+    detect_container_anomalies,
+)
+from market.analyze_correlation import correlate_frames
+from market.analyze_log import analyze_errors
+from market.analyze_metric import SERVICE_COLUMNS, compute_service_thresholds, detect_service_anomalies
+from market.scan_fleet import ANALYSIS_FILES, LOG_MIN_Z, TIMEZONE, canonical_component, rank_components
+
+TRACE_COLUMNS = ['timestamp', 'cmdb_id', 'span_id', 'trace_id', 'duration', 'status_code', 'parent_span']
+LOG_COLUMNS = ['timestamp', 'cmdb_id', 'value']
+
+# 日志阶段核实的候选组件数和每个组件保留的错误日志样例数
+CANDIDATES = 5
+LOG_SAMPLES = 3
+
+DEFAULT_WORKERS = 8
+
+# 报告中各层证据的顺序
+STAGE_ORDER = ['service', 'container', 'trace', 'log', 'correlation', 'conclusion']
+
+
+@dataclass
+class Evidence:
+    """一个分析阶段的结构化结果；findings 为 {'component', 'signal', 'value', 'score'}，按得分降序"""
+    stage: str
+    layer: str
+    summary: str = ''
+    findings: list = field(default_factory=list)
+    details: dict = field(default_factory=dict)
+    seconds: float = 0.0
+    error: str = None
+
+
+def locate_files(data_dir: str | None = None, overrides: dict | None = None) -> dict:
+    """数据类型 -> 文件路径；在 data_dir 的标准子目录或 data_dir 本身中查找，显式指定的文件优先"""
+    files = {}
+    if data_dir:
+        root = Path(data_dir)
+        for kind, relatives in ANALYSIS_FILES.items():
+            for relative in relatives:
+                for candidate in (root / relative, root / Path(relative).name):
+                    if candidate.exists() and kind not in files:
+                        files[kind] = str(candidate)
+    for kind, path in (overrides or {}).items():
+        if path:
+            files[kind] = path
+    return files
+
+
+def service_stage(inputs: dict, start_ts: int, end_ts: int) -> Evidence:
+    """服务层：窗口均值相对全局阈值的偏离"""
+    df = inputs['load_service']
+    thresholds = compute_service_thresholds(df)
+    filtered = df[(df['timestamp'] >= start_ts) & (df['timestamp'] <= end_ts)]
+    anomalies = detect_service_anomalies(filtered, thresholds) if len(filtered) else []
+    findings = [{
+        'component': a['service'],
+        'signal': f"{a['kpi']} {'↓' if a['type'] == 'below' else '↑'} 均值={a['value']:.2f} 阈值={a['threshold']:.2f}",
+        'value': float(a['value']),
+        'score': float(a['deviation']),
+    } for a in anomalies]
+    return Evidence('service', '服务层', f"窗口内 {len(filtered)} 条, {len(findings)} 个异常指标", findings, {
+        'rows': len(df),
+        'window_rows': len(filtered),
+        'thresholds': {kpi: {k: float(v) for k, v in th.items()} for kpi, th in thresholds.items()},
+    })
+
+
+def container_stage(inputs: dict, start_ts: int, end_ts: int) -> Evidence:
+    """容器层：窗口均值超过全局P95的容器KPI"""
+    df = inputs['load_container']
+    filtered = df[(df['timestamp'] >= start_ts) & (df['timestamp'] <= end_ts)]
+    anomalies = detect_container_anomalies(filtered, compute_kpi_thresholds(df)) if len(filtered) else []
+    findings = [{
+        'component': a['cmdb_id'],
+        'signal': f"{a['resource_type']}: {a['kpi_name']} 均值={a['value']:.2f} P95={a['threshold']:.2f}",
+        'value': float(a['value']),
+        'score': float(a['deviation']),
+        'resource_type': a['resource_type'],
+    } for a in anomalies]
+    return Evidence('container', '容器层', f"窗口内 {len(filtered)} 条, {len(findings)} 个异常容器KPI", findings, {
+        'rows': len(df),
+        'window_rows': len(filtered),
+        'containers': int(df['cmdb_id'].nunique()),
+    })
+
+
+def correlation_stage(inputs: dict, start_ts: int, end_ts: int) -> Evidence:
+    """跨层相关：异常服务KPI与容器指标的滞后相关，每个服务KPI取得分最高的容器KPI（不参与结论投票）"""
+    result = correlate_frames(inputs['load_service'], {'container': inputs['load_container']}, start_ts, end_ts)
+    causes = result['causes']
+    best = causes.drop_duplicates(['target', 'kpi']).sort_values('score', ascending=False, kind='stable')
+    findings = [{
+        'component': canonical_component(row.cmdb_id),
+        'signal': f"{row.target} {row.kpi} ← {row.kpi_name} r={row.corr:+.2f} 领先={row.lag}s lead={row.lead:+.2f}",
+        'value': float(row.corr),
+        'score': float(row.score),
+    } for row in best.itertuples(index=False)]
+    return Evidence('correlation', '跨层相关', f"{len(result['targets'])} 个异常服务KPI, "
+                    f"{result['processed']}/{result['candidates']} 条容器序列", findings, {
+                        'targets': [f"{service}:{kpi}" for service, kpi in result['targets']],
+                        'causes': causes.to_dict('records'),
+                    })
+
+
+def trace_stage(inputs: dict, file_path: str, start_ts: int, end_ts: int) -> Evidence:
+    """链路：窗口内的错误span、故障传播得分和最深错误span"""
+    spans = inputs['load_trace']
+    lo, hi = window_bounds(start_ts, end_ts, file_time_unit(file_path))
+    details = {'spans': len(spans), 'traces': int(spans['trace_id'].nunique())}
+
+    errors = spans[spans['status_code'] != 0]
+    by_component = errors.groupby('cmdb_id', observed=True).size().sort_values(ascending=False, kind='stable')
+    details['errors_by_component'] = {str(k): int(v) for k, v in by_component.head(10).items()}
+
+    if len(errors):
+        summary = SpanIndex(spans).trace_summary()
+        deepest = summary['deepest_error'].dropna().value_counts()
+        details['deepest_error_traces'] = {str(k): int(v) for k, v in deepest.head(10).items()}
+
+    scores = propagation_scores(load_edges(file_path, lo, hi))
+    scores = scores[scores['score'] > 0]
+    findings = [{
+        'component': row.cmdb_id,
+        'signal': f"错误传播 in_errors={row.in_errors} own_error_rate={row.own_error_rate:.2f}",
+        'value': float(row.own_error_rate),
+        'score': float(row.score),
+    } for row in scores.itertuples(index=False)]
+    return Evidence('trace', '链路', f"{details['traces']} 条trace, {len(errors)} 个错误span, "
+                    f"{len(findings)} 个传播源", findings, details)
+
+
+def candidate_components(evidence: list, limit: int = CANDIDATES) -> list:
+    """前面各层发现按 rank_components 合并后得分最高的组件"""
+    ranking = rank_components([dict(f, cloudbed='', analysis=e.stage) for e in evidence for f in e.findings])
+    return ranking['component'].head(limit).tolist()
+
+
+def _service_of(component: str) -> str:
+    """组件所属服务：去掉节点前缀和实例/协议后缀（shippingservice-1、shippingservice-grpc -> shippingservice）"""
+    name = canonical_component(component)
+    return name.rsplit('-', 1)[0] if '-' in name else name
+
+
+def log_stage(inputs: dict) -> Evidence:
+    """
+    日志：窗口内错误日志按组件计数，并核实前面各层指向的候选组件
+
+    以各组件错误日志数的中位数为期望，得分为泊松近似下的 z 值，只保留 z > LOG_MIN_Z 的组件；
+    候选组件优先按组件名精确匹配，日志中没有该组件时按服务名匹配（服务层的 xxx-grpc）。
+    """
+    logs = inputs['load_log']
+    errors = analyze_errors(logs)
+    components = errors['cmdb_id'].astype(str)
+    counts = components.value_counts()
+    counts = counts[counts > 0]
+
+    upstream = [inputs[name] for name in ('service', 'container', 'trace') if name in inputs]
+    verified = {}
+    for candidate in candidate_components(upstream):
+        matched = [c for c in counts.index if canonical_component(c) == candidate]
+        if not matched:
+            matched = [c for c in counts.index if _service_of(c) == _service_of(candidate)]
+        sample = errors.loc[components.isin(matched).to_numpy(), 'value'].astype(str)
+        verified[candidate] = {
+            'matched': matched,
+            'error_logs': int(counts[matched].sum()),
+            'samples': sample.str.replace('\n', ' ', regex=False).drop_duplicates().head(LOG_SAMPLES).tolist(),
+        }
+
+    expected = float(counts.median()) if len(counts) else 0.0
+    z = ((counts - expected) / (expected + 1) ** 0.5).sort_values(ascending=False, kind='stable')
+    findings = [{
+        'component': cmdb_id,
+        'signal': f"错误日志 {int(counts[cmdb_id])} 条 (各组件中位数 {expected:.0f})",
+        'value': float(counts[cmdb_id]),
+        'score': float(value),
+    } for cmdb_id, value in z[z > LOG_MIN_Z].items()]
+    confirmed = sum(1 for v in verified.values() if v['error_logs'])
+    return Evidence('log', '日志', f"窗口内 {len(logs)} 条日志, {len(errors)} 条错误日志, "
+                    f"{confirmed}/{len(verified)} 个候选组件有错误日志", findings, {
+                        'rows': len(logs),
+                        'error_logs': len(errors),
+                        'candidates': verified,
+                    })
+
+
+def conclusion_stage(inputs: dict) -> Evidence:
+    """结论：合并各层发现为组件排名，最显著组件的原因优先取容器层资源类型"""
+    evidence = [inputs[name] for name in ('service', 'container', 'trace', 'log') if name in inputs]
+    anomalies = [dict(f, cloudbed='', analysis=e.stage) for e in evidence for f in e.findings]
+    ranking = rank_components(anomalies)
+    if len(ranking) == 0:
+        return Evidence('conclusion', '结论', '未检测到明显异常')
+
+    top = ranking.iloc[0]
+    reason = None
+    container = inputs.get('container')
+    if container is not None:
+        for finding in container.findings:
+            if canonical_component(finding['component']) == top['component']:
+                reason = RESOURCE_REASONS.get(finding['resource_type'])
+                break
+    if reason is None and 'trace' in top['analyses'].split(','):
+        reason = 'error propagation (trace)'
+    layers = len(evidence)
+    agreeing = len(top['analyses'].split(','))
+    findings = [{
+        'component': row.component,
+        'signal': row.evidence,
+        'value': float(row.score),
+        'score': float(row.score),
+        'analyses': row.analyses,
+    } for row in ranking.head(10).itertuples(index=False)]
+    return Evidence('conclusion', '结论', f"根因组件: {top['component']} ({reason or '原因待确认'})", findings, {
+        'root_cause_component': top['component'],
+        'root_cause_reason': reason,
+        'confidence': f"{agreeing}/{layers} 层证据一致",
+    })
+
+
+def build_stages(files: dict, start_ts: int, end_ts: int, use_cache: bool = True) -> dict:
+    """
+    阶段名 -> (函数, 必需的前置阶段, 可选的前置阶段)
+
+    函数接收已完成前置阶段的结果；必需的前置阶段失败时该阶段被跳过，可选的只在成功时传入。
+    缺少对应数据文件的分支不创建。
+    """
+    stages = {}
+    if 'metric' in files:
+        stages['load_service'] = (lambda inputs: load_telemetry(
+            files['metric'], columns=SERVICE_COLUMNS, use_cache=use_cache), [], [])
+        stages['service'] = (lambda inputs: service_stage(inputs, start_ts, end_ts), ['load_service'], [])
+    if 'container' in files:
+        stages['load_container'] = (lambda inputs: load_telemetry(
+            files['container'], columns=CONTAINER_COLUMNS, use_cache=use_cache), [], [])
+        stages['container'] = (lambda inputs: container_stage(inputs, start_ts, end_ts), ['load_container'], [])
+    if 'metric' in files and 'container' in files:
+        stages['correlation'] = (lambda inputs: correlation_stage(inputs, start_ts, end_ts),
+                                 ['load_service', 'load_container'], [])
+    if 'trace' in files:
+        def load_trace(inputs):
+            lo, hi = window_bounds(start_ts, end_ts, file_time_unit(files['trace']))
+            return load_telemetry(files['trace'], columns=TRACE_COLUMNS, start_ts=lo, end_ts=hi, use_cache=use_cache)
+        stages['load_trace'] = (load_trace, [], [])
+        stages['trace'] = (lambda inputs: trace_stage(inputs, files['trace'], start_ts, end_ts), ['load_trace'], [])
+    if 'log' in files:
+        def load_log(inputs):
+            lo, hi = window_bounds(start_ts, end_ts, file_time_unit(files['log']))
+            return load_telemetry(files['log'], columns=LOG_COLUMNS, start_ts=lo, end_ts=hi, use_cache=use_cache)
+        stages['load_log'] = (load_log, [], [])
+        stages['log'] = (log_stage, ['load_log'], [name for name in ('service', 'container', 'trace')
+                                                   if name in stages])
+    analyses = [name for name in ('service', 'container', 'trace', 'log') if name in stages]
+    if analyses:
+        stages['conclusion'] = (conclusion_stage, [], analyses)
+    return stages
+
+
+def _run_stage(name: str, func, inputs: dict):
+    """在工作线程中执行一个阶段，--profile 时记为同名的剖析阶段"""
+    with stage(name) as span:
+        result = func(inputs)
+        if isinstance(result, pd.DataFrame):
+            span.rows = len(result)
+        return result
+
+
+def run_stages(stages: dict, workers: int = DEFAULT_WORKERS, progress=None) -> dict:
+    """
+    按依赖关系在线程池中执行阶段，前置阶段全部结束的阶段立即提交
+
+    返回 阶段名 -> {'result', 'error', 'start', 'end'}（时间为相对开始的秒数）。阶段中的预期错误
+    （DATA_ERRORS）记入 error，以它为必需前置的阶段被跳过；其他异常按程序错误抛出。
+    """
+    began = time.perf_counter()
+    runs = {}
+    pending = dict(stages)
+    running = {}
+
+    def ready(name):
+        _, required, optional = pending[name]
+        return all(dep in runs for dep in required + optional)
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        while pending or running:
+            for name in [name for name in pending if ready(name)]:
+                func, required, optional = pending.pop(name)
+                failed = [dep for dep in required if runs[dep]['error'] is not None]
+                if failed:
+                    now = time.perf_counter() - began
+                    runs[name] = {'result': None, 'error': f"前置阶段失败: {','.join(failed)}", 'start': now, 'end': now}
+                    if progress:
+                        progress(name, runs[name])
+                    continue
+                inputs = {dep: runs[dep]['result'] for dep in required + optional if runs[dep]['error'] is None}
+                start = time.perf_counter() - began
+                running[pool.submit(_run_stage, name, func, inputs)] = (name, start)
+            if not running:
+                continue
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name, start = running.pop(future)
+                end = time.perf_counter() - began
+                try:
+                    runs[name] = {'result': future.result(), 'error': None, 'start': start, 'end': end}
+                except DATA_ERRORS as error:
+                    runs[name] = {'result': None, 'error': f"{type(error).__name__}: {error}", 'start': start, 'end': end}
+                if isinstance(runs[name]['result'], Evidence):
+                    runs[name]['result'].seconds = end - start
+                if progress:
+                    progress(name, runs[name])
+    return runs
+
+
+def diagnose(files: dict, start_ts: int, end_ts: int, workers: int = DEFAULT_WORKERS, use_cache: bool = True,
+             progress=None) -> dict:
+    """执行完整诊断，返回各阶段的 Evidence、耗时和总耗时"""
+    began = time.perf_counter()
+    runs = run_stages(build_stages(files, start_ts, end_ts, use_cache), workers, progress)
+    evidence = []
+    for name in sorted(runs, key=lambda name: (STAGE_ORDER.index(name) if name in STAGE_ORDER else -1)):
+        run = runs[name]
+        result = run['result']
+        if isinstance(result, Evidence):
+            evidence.append(result)
+        elif run['error'] is not None and not name.startswith('load_'):
+            evidence.append(Evidence(name, name, error=run['error'], seconds=run['end'] - run['start']))
+    return {
+        'evidence': evidence,
+        'timeline': {name: {'start': run['start'], 'end': run['end'], 'error': run['error']} for name, run in runs.items()},
+        'seconds': time.perf_counter() - began,
+    }
+
+
+def emit_diagnosis(out, files: dict, start_ts: int, end_ts: int, workers: int = DEFAULT_WORKERS, top: int = 5,
+                   use_cache: bool = True):
+    """--format json|arrow：每个分析阶段完成时立即写出其证据（发现按 top 截断），最后写出时间线"""
+    out.record('summary', files=files, start=start_ts, end=end_ts)
+
+    def progress(name, run):
+        if name.startswith('load_'):
+            return
+        evidence = run['result'] if isinstance(run['result'], Evidence) else Evidence(name, name, error=run['error'])
+        record = asdict(evidence)
+        record.update(finding_count=len(evidence.findings), findings=evidence.findings[:min(top, out.max_rows)])
+        out.record('evidence', **record)
+
+    result = diagnose(files, start_ts, end_ts, workers, use_cache, progress)
+    timeline = [{'stage': name, **run} for name, run in result['timeline'].items()]
+    out.table('timeline', sorted(timeline, key=lambda run: run['start']))
+    out.record('total', seconds=result['seconds'])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Incident Diagnoser for OpenRCA')
+    parser.add_argument('--data-dir', type=str, help='Telemetry directory of one date (metric/, trace/, log/)')
+    parser.add_argument('--metric-file', type=str, help='Service metric file (overrides --data-dir)')
+    parser.add_argument('--container-file', type=str, help='Container metric file (overrides --data-dir)')
+    parser.add_argument('--trace-file', type=str, help='Trace span file (overrides --data-dir)')
+    parser.add_argument('--log-file', type=str, help='Service log file (overrides --data-dir)')
+    parser.add_argument('--start', type=str, required=True, help='Start time (YYYY-MM-DD HH:MM:SS or epoch seconds)')
+    parser.add_argument('--end', type=str, required=True, help='End time (YYYY-MM-DD HH:MM:SS or epoch seconds)')
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS, help='Threads for loading and stages')
+    parser.add_argument('--top', type=int, default=5, help='Findings shown per layer')
+    parser.add_argument('--output', type=str, help='Write evidence and timeline as JSON')
+    parser.add_argument('--no-cache', action='store_true', help='Read the CSV directly instead of the columnar cache')
+    add_format_arguments(parser)
+    add_profile_arguments(parser)
+
+    args = parser.parse_args(argv)
+    check_format_arguments(parser, args)
+    check_profile_arguments(parser, args)
+
+    with profile_session(args, 'diagnose'):
+        run(parser, args)
+
+
+def run(parser, args):
+    """定位数据文件、执行诊断并输出报告"""
+
+    files = locate_files(args.data_dir, {
+        'metric': args.metric_file, 'container': args.container_file,
+        'trace': args.trace_file, 'log': args.log_file,
+    })
+    missing = [path for path in files.values() if not Path(path).exists()]
+    if missing:
+        print(f"错误: 文件不存在 {', '.join(missing)}")
+        sys.exit(1)
+    if not files:
+        parser.error('no telemetry files found; pass --data-dir or the per-layer --*-file options')
+
+    tz = zone(TIMEZONE)
+    start_ts, end_ts = parse_time(args.start, tz), parse_time(args.end, tz)
+
+    if args.format != 'text':
+        with structured_output(args.format, args.max_rows) as out, stage('report', format=args.format):
+            emit_diagnosis(out, files, start_ts, end_ts, args.workers, args.top, not args.no_cache)
+        return
+
+    print(f"{'='*70}")
+    print("故障根因诊断")
+    print(f"{'='*70}")
+    for kind, path in files.items():
+        print(f"{kind:<10} {path}")
+    print(f"时间范围: {datetime.fromtimestamp(start_ts, tz)} ~ {datetime.fromtimestamp(end_ts, tz)}")
+
+    def progress(name, run):
+        status = f"失败: {run['error']}" if run['error'] else '完成'
+        print(f"  [{run['start']:6.2f}s → {run['end']:6.2f}s] {name:<15} {status}", flush=True)
+
+    print("\n阶段执行:")
+    result = diagnose(files, start_ts, end_ts, args.workers, not args.no_cache, progress)
+    busy = sum(t['end'] - t['start'] for t in result['timeline'].values())
+    print(f"总耗时: {result['seconds']:.2f}s (各阶段耗时之和 {busy:.2f}s)")
+
+    with stage('report'):
+        for evidence in result['evidence']:
+            print(f"\n{'#'*70}")
+            print(f"# {evidence.layer} ({evidence.stage}, {evidence.seconds:.2f}s)")
+            print(f"{'#'*70}")
+            if evidence.error:
+                print(f"失败: {evidence.error}")
+                continue
+            print(evidence.summary)
+            for i, finding in enumerate(evidence.findings[:args.top], 1):
+                print(f"  {i}. [{finding['component']}] 得分={finding['score']:.2f}  {finding['signal'][:120]}")
+            if evidence.stage == 'log':
+                for candidate, info in evidence.details['candidates'].items():
+                    print(f"  候选 {candidate}: {info['error_logs']} 条错误日志")
+                    for sample in info['samples']:
+                        print(f"    {sample[:120]}")
+            if evidence.stage == 'conclusion' and 'confidence' in evidence.details:
+                print(f"置信度: {evidence.details['confidence']}")
+
+        if args.output:
+            report = {
+                'files': files,
+                'start': start_ts,
+                'end': end_ts,
+                'seconds': result['seconds'],
+                'timeline': result['timeline'],
+                'evidence': [asdict(evidence) for evidence in result['evidence']],
+            }
+            Path(args.output).write_text(json.dumps(report, ensure_ascii=False, indent=2, default=str))
+            print(f"\n结果已保存到: {args.output}")
+
+
+if __name__ == '__main__':
+    main()
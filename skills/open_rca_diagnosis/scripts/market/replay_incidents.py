@@ -0,0 +1,355 @@
+#!/usr/bin/env python3
+"""
+Incident Replay for OpenRCA
+批量故障回放 - 对一批带标注的故障窗口执行与 scan_fleet.py 相同的诊断，输出每个故障的候选根因
+
+故障按涉及的数据文件分组：每个 (cloudbed, 日期, 分析类型) 的文件在进程池中作为一个任务，
+只加载一次、只计算一次全天阈值，然后对落在该文件上的所有故障窗口打分；各文件的结果按故障
+合并后用 scan_fleet.rank_components 排名。总耗时随不同数据文件的个数增长，而不是随故障数增长。
+
+故障列表为带表头的CSV（- 表示stdin）：
+    start,end       窗口（YYYY-MM-DD HH:MM:SS 或秒级时间戳，北京时间）
+    timestamp       没有 start/end 时使用：取包含该时刻、按 --window 分钟对齐的窗口（OpenRCA record.csv）
+    id              可选，默认为行号
+    cloudbed        可选，不指定时为 --data-root 下的全部 cloudbed
+    component       可选，标注的根因组件；指定时报告其在候选中的名次和 top-k 命中率
+                    （候选为该组件本身，或候选是标注服务的实例，如 shippingservice-1 之于 shippingservice）
+
+Usage:
+    python replay_incidents.py --data-root /data/market --incidents incidents.csv
+
+    # OpenRCA 的 record.csv，每个故障取所在的30分钟窗口，结果保存为 Parquet
+    python replay_incidents.py --data-root /data/market/Market --incidents record.csv --window 30 \\
+        --analyses metric,container,trace --workers 8 --top 5 --output replay.parquet
+"""
+
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import argparse
+import csv
+import io
+import time
+from datetime import datetime
+
+import pandas as pd
+
+from common.output import add_format_arguments, check_format_arguments, structured_output, write_table
+from common.profiling import add_profile_arguments, check_profile_arguments, profile_session, stage
+from common.telemetry_cache import parse_size
+from common.time_utils import parse_time, zone
+from market.scan_fleet import ANALYZERS, TIMEZONE, canonical_component, discover_tasks, rank_components, run_pool
+
+DEFAULT_WINDOW_MINUTES = 30
+DEFAULT_TOP = 5
+
+
+def read_incidents(source: str, tz, window_minutes: int = DEFAULT_WINDOW_MINUTES) -> list:
+    """读取故障列表，返回 {'id', 'cloudbed', 'start', 'end', 'component'} 列表"""
+    text = sys.stdin.read() if source == '-' else Path(source).read_text(encoding='utf-8-sig')
+    reader = csv.DictReader(io.StringIO(text))
+    fields = {name.strip().lower() for name in reader.fieldnames or []}
+    if not ({'start', 'end'} <= fields or 'timestamp' in fields):
+        raise ValueError(f"故障列表需要 start,end 列或 timestamp 列: {source}")
+
+    width = window_minutes * 60
+    incidents = []
+    for row in reader:
+        row = {(key or '').strip().lower(): (value or '').strip() for key, value in row.items()}
+        if row.get('start') and row.get('end'):
+            start_ts, end_ts = parse_time(row['start'], tz), parse_time(row['end'], tz)
+        elif row.get('timestamp'):
+            moment = parse_time(row['timestamp'].split('.')[0], tz)
+            start_ts = moment - moment % width
+            end_ts = start_ts + width - 1
+        else:
+            continue
+        incidents.append({
+            'id': row.get('id') or str(len(incidents)),
+            'cloudbed': row.get('cloudbed') or None,
+            'start': start_ts,
+            'end': end_ts,
+            'component': row.get('component') or None,
+        })
+    return incidents
+
+
+def plan_replay(data_root: str, incidents: list, analyses: list | None = None) -> list:
+    """
+    按数据文件把故障分组为任务
+
+    每个任务对应一个数据文件（字段同 scan_fleet.discover_tasks），windows 为落在该文件上的
+    (故障序号, start, end) 列表；大文件在前以便进程池尽早开始最慢的任务。
+    """
+    tasks = {}
+    for index, incident in enumerate(incidents):
+        cloudbeds = [incident['cloudbed']] if incident['cloudbed'] else None
+        for task in discover_tasks(data_root, incident['start'], incident['end'], cloudbeds, analyses):
+            task = tasks.setdefault((task['file'], task['analysis']), dict(task, windows=[]))
+            task['windows'].append((index, incident['start'], incident['end']))
+    return sorted(tasks.values(), key=lambda task: task['bytes'], reverse=True)
+
+
+def replay_task(task: dict, use_cache: bool = True) -> dict:
+    """
+    在工作进程中处理一个数据文件：加载一次，再对每个故障窗口打分
+
+    返回加载（含全天阈值）耗时和每个窗口的异常列表及打分耗时。
+    """
+    began = time.perf_counter()
+    prepare, score = ANALYZERS[task['analysis']]
+    state = prepare(task['file'], [(start_ts, end_ts) for _, start_ts, end_ts in task['windows']], use_cache)
+    load_seconds = time.perf_counter() - began
+
+    windows = []
+    for index, start_ts, end_ts in task['windows']:
+        scored = time.perf_counter()
+        anomalies = score(state, start_ts, end_ts)
+        for anomaly in anomalies:
+            anomaly.update(cloudbed=task['cloudbed'], date=task['date'], analysis=task['analysis'])
+        windows.append({'incident': index, 'anomalies': anomalies, 'seconds': time.perf_counter() - scored})
+    return {'load_seconds': load_seconds, 'windows': windows, 'seconds': time.perf_counter() - began}
+
+
+def matches(component: str, truth: str) -> bool:
+    """候选组件是否命中标注：同名，或候选为标注服务的实例（shippingservice-1 命中 shippingservice）"""
+    component, truth = canonical_component(component), canonical_component(truth)
+    return component == truth or component.rsplit('-', 1)[0] == truth
+
+
+def score_incidents(incidents: list, scan: dict, top: int = DEFAULT_TOP) -> list:
+    """
+    合并各文件任务的结果，每个故障一行
+
+    耗时为该故障在各文件上的打分耗时之和，加上各文件加载耗时按该文件上的故障数均摊的部分；
+    rank 为第一个命中标注的候选名次（未命中为 None）。
+    """
+    anomalies = [[] for _ in incidents]
+    seconds = [0.0] * len(incidents)
+    files = [0] * len(incidents)
+    failed = [[] for _ in incidents]
+    for _, result in scan['results']:
+        share = result['load_seconds'] / len(result['windows'])
+        for window in result['windows']:
+            anomalies[window['incident']].extend(window['anomalies'])
+            seconds[window['incident']] += window['seconds'] + share
+            files[window['incident']] += 1
+    for failure in scan['failures']:
+        for index, _, _ in failure['windows']:
+            failed[index].append(failure['analysis'])
+
+    rows = []
+    for index, incident in enumerate(incidents):
+        ranking = rank_components(anomalies[index])
+        candidates = ranking.head(top)
+        rank = None
+        if incident['component']:
+            hits = [i for i, name in enumerate(ranking['component'], 1) if matches(name, incident['component'])]
+            rank = hits[0] if hits else None
+        row = {
+            'id': incident['id'],
+            'cloudbed': incident['cloudbed'],
+            'start': incident['start'],
+            'end': incident['end'],
+            'files': files[index],
+            'anomalies': len(anomalies[index]),
+            'seconds': seconds[index],
+        }
+        for i in range(top):
+            row[f'top_{i + 1}'] = candidates['component'].iloc[i] if i < len(candidates) else None
+            row[f'score_{i + 1}'] = float(candidates['score'].iloc[i]) if i < len(candidates) else None
+        row.update(component=incident['component'], rank=rank, failed=','.join(sorted(set(failed[index]))) or None)
+        rows.append(row)
+    return rows
+
+
+def incident_frame(rows: list) -> pd.DataFrame:
+    """结果表：名次为可空整数列"""
+    frame = pd.DataFrame(rows)
+    if len(frame):
+        frame['rank'] = frame['rank'].astype('Int64')
+    return frame
+
+
+def accuracy(rows: list, top: int = DEFAULT_TOP) -> dict:
+    """有标注的故障中根因排在第1名和前 top 名以内的比例"""
+    labeled = [row for row in rows if row['component']]
+    if not labeled:
+        return {'labeled': 0}
+    return {
+        'labeled': len(labeled),
+        'top1': sum(1 for row in labeled if row['rank'] == 1) / len(labeled),
+        f'top{top}': sum(1 for row in labeled if row['rank'] is not None and row['rank'] <= top) / len(labeled),
+    }
+
+
+def _task_status(task: dict) -> dict:
+    """任务概要：窗口列表只保留故障数"""
+    status = {key: value for key, value in task.items() if key != 'windows'}
+    status['incidents'] = len(task['windows'])
+    return status
+
+
+def replay(incidents: list, tasks: list, workers: int | None = None, max_memory: int = 0, use_cache: bool = True,
+           top: int = DEFAULT_TOP, progress=None, quiet: bool = False) -> dict:
+    """在进程池中执行所有文件任务并合并为每个故障的结果"""
+    began = time.perf_counter()
+    with stage('replay', tasks=len(tasks), incidents=len(incidents)):
+        scan = run_pool(replay_task, tasks, (use_cache,), workers, max_memory, progress, quiet)
+    with stage('rank') as span:
+        rows = score_incidents(incidents, scan, top)
+        span.rows = len(rows)
+    return {
+        'rows': rows,
+        'failures': [_task_status(failure) for failure in scan['failures']],
+        'workers': scan['workers'],
+        'retried': scan['retried'],
+        'seconds': time.perf_counter() - began,
+    }
+
+
+def emit_replay(out, data_root: str, incidents: list, tasks: list, workers: int | None = None, max_memory: int = 0,
+                use_cache: bool = True, top: int = DEFAULT_TOP) -> dict:
+    """--format json|arrow：每个文件任务完成时写出其状态，最后写出每个故障的结果和命中率"""
+    out.record('summary', data_root=data_root, incidents=len(incidents), files=len(tasks))
+
+    def progress(done, total, task, result, error):
+        status = {'error': f"{type(error).__name__}: {error}"} if error is not None else {
+            'load_seconds': result['load_seconds'], 'seconds': result['seconds']}
+        out.record('task', done=done, total=total, **_task_status(task), **status)
+
+    result = replay(incidents, tasks, workers, max_memory, use_cache, top, progress, quiet=True)
+    out.table('incidents', incident_frame(result['rows']))
+    out.record('totals', workers=result['workers'], retried=result['retried'], seconds=result['seconds'],
+               **accuracy(result['rows'], top))
+    out.table('failures', result['failures'])
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Incident Replay for OpenRCA')
+    parser.add_argument('--data-root', type=str, required=True, help='Directory containing cloudbed-N/telemetry/')
+    parser.add_argument('--incidents', type=str, required=True,
+                        help='Incident CSV with a header ("-" for stdin): start,end or timestamp; optional id, '
+                             'cloudbed, component')
+    parser.add_argument('--window', type=int, default=DEFAULT_WINDOW_MINUTES,
+                        help='Window in minutes for rows that only have a timestamp (aligned to the hour)')
+    parser.add_argument('--analyses', type=str, default=','.join(ANALYZERS),
+                        help=f"Comma-separated analyses ({','.join(ANALYZERS)})")
+    parser.add_argument('--workers', type=int, help='Worker processes (default: available cores)')
+    parser.add_argument('--max-memory', type=str, help='Address-space limit per worker, e.g. 4G')
+    parser.add_argument('--top', type=int, default=DEFAULT_TOP, help='Root cause candidates per incident')
+    parser.add_argument('--output', type=str, help='Write the per-incident table (.parquet, .arrow or CSV)')
+    parser.add_argument('--no-cache', action='store_true', help='Read the CSV directly instead of the columnar cache')
+    add_format_arguments(parser)
+    add_profile_arguments(parser)
+
+    args = parser.parse_args(argv)
+    check_format_arguments(parser, args)
+    check_profile_arguments(parser, args)
+
+    with profile_session(args, 'replay_incidents'):
+        run(parser, args)
+
+
+def run(parser, args):
+    """读取故障列表、按文件分组回放并输出每个故障的候选根因"""
+
+    if not Path(args.data_root).is_dir():
+        print(f"错误: 目录不存在 {args.data_root}")
+        sys.exit(1)
+    if args.incidents != '-' and not Path(args.incidents).exists():
+        print(f"错误: 文件不存在 {args.incidents}")
+        sys.exit(1)
+    if args.window <= 0 or 60 % args.window:
+        parser.error('--window must divide an hour (e.g. 10, 15, 30, 60)')
+
+    analyses = [name.strip() for name in args.analyses.split(',') if name.strip()]
+    unknown = sorted(set(analyses) - set(ANALYZERS))
+    if unknown:
+        parser.error(f"unknown analyses: {','.join(unknown)}")
+
+    tz = zone(TIMEZONE)
+    try:
+        incidents = read_incidents(args.incidents, tz, args.window)
+    except ValueError as error:
+        parser.error(str(error))
+    max_memory = parse_size(args.max_memory) if args.max_memory else 0
+    use_cache = not args.no_cache
+
+    with stage('plan', incidents=len(incidents)) as span:
+        tasks = plan_replay(args.data_root, incidents, analyses)
+        span.rows = len(tasks)
+
+    if args.format != 'text':
+        with structured_output(args.format, args.max_rows) as out:
+            result = emit_replay(out, args.data_root, incidents, tasks, args.workers, max_memory, use_cache, args.top)
+        if args.output:
+            write_table(incident_frame(result['rows']), args.output)
+        return
+
+    print(f"{'='*70}")
+    print("故障批量回放")
+    print(f"{'='*70}")
+    print(f"数据目录: {args.data_root}")
+    print(f"故障数: {len(incidents)}  数据文件: {len(tasks)}  "
+          f"(逐个诊断需加载 {sum(len(task['windows']) for task in tasks)} 次)")
+
+    if not tasks:
+        print("警告: 故障窗口内没有找到数据文件！")
+        return
+
+    def progress(done, total, task, result, error):
+        name = f"{task['cloudbed']} {task['date']} {task['analysis']:<9} {Path(task['file']).name}"
+        if error is not None:
+            print(f"  [{done}/{total}] {name}  失败: {type(error).__name__}: {error}")
+        else:
+            print(f"  [{done}/{total}] {name}  加载 {result['load_seconds']:.1f}s  "
+                  f"{len(task['windows'])} 个故障  共 {result['seconds']:.1f}s")
+
+    result = replay(incidents, tasks, args.workers, max_memory, use_cache, args.top, progress)
+    rows = result['rows']
+
+    with stage('report'):
+        print(f"\n工作进程: {result['workers']}  总耗时: {result['seconds']:.1f}s  "
+              f"完成: {len(tasks) - len(result['failures'])}/{len(tasks)}  重试: {result['retried']}")
+
+        print(f"\n{'='*70}")
+        print(f"每个故障的候选根因 (Top {args.top}):")
+        print(f"{'='*70}")
+        for row in rows:
+            start = datetime.fromtimestamp(row['start'], tz).strftime('%Y-%m-%d %H:%M')
+            end = datetime.fromtimestamp(row['end'], tz).strftime('%H:%M')
+            candidates = [f"{row[f'top_{i}']}({row[f'score_{i}']:.2f})" for i in range(1, args.top + 1)
+                          if row[f'top_{i}'] is not None]
+            label = ''
+            if row['component']:
+                label = f"  标注={row['component']} 名次={row['rank'] or '-'}"
+            print(f"{row['id']:<8} {row['cloudbed'] or '*':<12} {start}~{end}  {row['seconds']:.2f}s{label}")
+            print(f"   {', '.join(candidates) or '未检测到明显异常'}"
+                  f"{'  (失败: ' + row['failed'] + ')' if row['failed'] else ''}")
+
+        scores = accuracy(rows, args.top)
+        if scores['labeled']:
+            print(f"\n{'='*70}")
+            print(f"命中率 ({scores['labeled']} 个有标注的故障):")
+            print(f"{'='*70}")
+            print(f"  Top 1: {scores['top1']:.1%}")
+            print(f"  Top {args.top}: {scores[f'top{args.top}']:.1%}")
+
+        if result['failures']:
+            print(f"\n{'='*70}")
+            print(f"失败任务 ({len(result['failures'])} 个，涉及的故障结果不完整):")
+            print(f"{'='*70}")
+            for failure in result['failures']:
+                print(f"  {failure['cloudbed']} {failure['date']} {failure['analysis']}: {failure['error']}")
+
+        if args.output:
+            write_table(incident_frame(rows), args.output)
+            print(f"\n结果已保存到: {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,525 @@
+#!/usr/bin/env python3
+"""
+Fleet Scanner for OpenRCA
+多cloudbed批量扫描 - 在进程池中并行分析所有 cloudbed/日期 的遥测数据，合并为全局异常排名
+
+按数据目录和时间窗口发现 {data_root}/cloudbed-N/telemetry/YYYY_MM_DD/ 下的数据文件，
+每个 (cloudbed, 日期, 分析类型) 作为一个任务在进程池中执行（服务层指标、容器层指标、
+trace故障传播、错误日志增量）。各分析的得分按全局最大值归一化后按 (cloudbed, 组件) 求和排名。
+
+单个任务失败只影响自身；工作进程崩溃导致进程池损坏时，未完成的任务各自在独立进程中重试一次，
+已完成的结果保留，报告中列出失败的任务。
+
+Usage:
+    python scan_fleet.py --data-root /data/market --start "2022-03-20 09:00:00" --end "2022-03-20 09:30:00"
+
+    # 只扫描部分cloudbed和分析类型，限制每个工作进程的内存
+    python scan_fleet.py --data-root /data/market --start "2022-03-20 09:00:00" --end "2022-03-20 09:30:00" \\
+        --cloudbeds cloudbed-1,cloudbed-2 --analyses metric,trace --workers 8 --max-memory 4G
+
+    # 输出JSON（异常明细、全局排名和失败任务）
+    python scan_fleet.py --data-root /data/market --start 1647738000 --end 1647739800 --output fleet.json
+"""
+
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import argparse
+import json
+import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+from common.log_index import search as search_indexed
+from common.output import add_format_arguments, check_format_arguments, structured_output
+from common.profiling import add_profile_arguments, check_profile_arguments, profile_session, stage
+from common.telemetry_cache import DATA_ERRORS, load_telemetry, parse_size
+from common.time_utils import file_time_unit, parse_time, window_bounds, zone
+from common.trace_graph import load_edges, propagation_scores, window_edges, window_scores
+from market.analyze_container import compute_kpi_thresholds, detect_container_anomalies
+from market.analyze_log import ERROR_PATTERNS, analyze_errors
+from market.analyze_metric import (
+    SERVICE_COLUMNS,
+    compute_service_thresholds,
+    detect_service_anomalies,
+    score_service_windows,
+)
+
+# 分析类型 -> 相对日期目录的数据文件
+ANALYSIS_FILES = {
+    'metric': ['metric/metric_service.csv'],
+    'container': ['metric/metric_container.csv'],
+    'trace': ['trace/trace_span.csv'],
+    'log': ['log/log_service.csv', 'log/log_proxy.csv'],
+}
+
+DATE_FORMAT = '%Y_%m_%d'
+TIMEZONE = 'Asia/Shanghai'
+
+# 错误日志突增的最小 z 值
+LOG_MIN_Z = 3.0
+
+
+def default_workers() -> int:
+    """当前进程可用的CPU数（考虑 taskset/cgroup 亲和性）"""
+    if hasattr(os, 'sched_getaffinity'):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def canonical_component(name: str) -> str:
+    """容器指标的 node-N.pod 与trace/日志中的 pod 对齐"""
+    if name.startswith('node-') and '.' in name:
+        return name.split('.', 1)[1]
+    return name
+
+
+def discover_tasks(data_root: str, start_ts: int, end_ts: int, cloudbeds: list | None = None,
+                   analyses: list | None = None) -> list:
+    """
+    发现窗口覆盖的 cloudbed/日期 数据文件
+
+    日期目录按北京时间划分；data_root 本身包含 telemetry/ 时视为单个cloudbed。
+    返回任务列表，大文件在前以便进程池尽早开始最慢的任务。
+    """
+    tz = zone(TIMEZONE)
+    analyses = analyses or list(ANALYSIS_FILES)
+    root = Path(data_root)
+
+    first = datetime.fromtimestamp(start_ts, tz).date()
+    last = datetime.fromtimestamp(end_ts, tz).date()
+    dates = [(first + timedelta(days=i)).strftime(DATE_FORMAT) for i in range((last - first).days + 1)]
+
+    if (root / 'telemetry').is_dir():
+        beds = [root]
+    else:
+        beds = sorted(path for path in root.iterdir() if (path / 'telemetry').is_dir())
+    if cloudbeds:
+        beds = [bed for bed in beds if bed.name in cloudbeds]
+
+    tasks = []
+    for bed in beds:
+        for date in dates:
+            day_dir = bed / 'telemetry' / date
+            for analysis in analyses:
+                for relative in ANALYSIS_FILES[analysis]:
+                    path = day_dir / relative
+                    if path.exists():
+                        tasks.append({
+                            'cloudbed': bed.name,
+                            'date': date,
+                            'analysis': analysis,
+                            'file': str(path),
+                            'bytes': path.stat().st_size,
+                        })
+    tasks.sort(key=lambda task: task['bytes'], reverse=True)
+    return tasks
+
+
+def _time_index(df: pd.DataFrame, windows: list):
+    """多个窗口时按时间戳排序一次，之后每个窗口二分定位；单个窗口直接布尔过滤"""
+    if len(windows) < 2:
+        return None
+    ts = df['timestamp'].to_numpy()
+    order = np.argsort(ts, kind='stable')
+    return ts[order], order
+
+
+def window_rows(df: pd.DataFrame, index, start_ts: int, end_ts: int) -> pd.DataFrame:
+    """[start_ts, end_ts] 内的行，保持文件中的顺序（与布尔过滤的结果相同）"""
+    if index is None:
+        return df[(df['timestamp'] >= start_ts) & (df['timestamp'] <= end_ts)]
+    sorted_ts, order = index
+    lo = np.searchsorted(sorted_ts, start_ts, side='left')
+    hi = np.searchsorted(sorted_ts, end_ts, side='right')
+    return df.iloc[np.sort(order[lo:hi])]
+
+
+def prepare_metric(file_path: str, windows: list, use_cache: bool = True) -> dict:
+    """服务层指标：加载全天数据、计算一次全天阈值；多个窗口时在一次分组计算中全部打分"""
+    df = load_telemetry(file_path, columns=SERVICE_COLUMNS, use_cache=use_cache)
+    thresholds = compute_service_thresholds(df)
+    scored = {}
+    if len(windows) > 1:
+        batch = score_service_windows(df, [(i, start_ts, end_ts) for i, (start_ts, end_ts) in enumerate(windows)],
+                                      thresholds)
+        scored = {(window['start'], window['end']): window['anomalies'] for window in batch}
+    return {'df': df, 'thresholds': thresholds, 'scored': scored}
+
+
+def metric_anomalies(state: dict, start_ts: int, end_ts: int) -> list:
+    """服务层指标：窗口均值相对全天阈值的偏离"""
+    anomalies = state['scored'].get((start_ts, end_ts))
+    if anomalies is None:
+        df = state['df']
+        filtered = df[(df['timestamp'] >= start_ts) & (df['timestamp'] <= end_ts)]
+        anomalies = detect_service_anomalies(filtered, state['thresholds']) if len(filtered) else []
+    return [{
+        'component': a['service'],
+        'signal': f"{a['kpi']} {'↓' if a['type'] == 'below' else '↑'}",
+        'value': float(a['value']),
+        'score': float(a['deviation']),
+    } for a in anomalies]
+
+
+def prepare_container(file_path: str, windows: list, use_cache: bool = True) -> dict:
+    """容器层指标：加载全天数据，计算一次各KPI的全天P95"""
+    df = load_telemetry(file_path, columns=['timestamp', 'cmdb_id', 'kpi_name', 'value'], use_cache=use_cache)
+    thresholds = compute_kpi_thresholds(df) if len(df) else None
+    return {'df': df, 'index': _time_index(df, windows), 'thresholds': thresholds}
+
+
+def container_anomalies(state: dict, start_ts: int, end_ts: int) -> list:
+    """容器层指标：窗口均值超过全天P95的KPI"""
+    filtered = window_rows(state['df'], state['index'], start_ts, end_ts)
+    if len(filtered) == 0:
+        return []
+    return [{
+        'component': a['cmdb_id'],
+        'signal': f"{a['resource_type']}: {a['kpi_name']}",
+        'value': float(a['value']),
+        'score': float(a['deviation']),
+    } for a in detect_container_anomalies(filtered, state['thresholds'])]
+
+
+def prepare_trace(file_path: str, windows: list, use_cache: bool = True) -> dict:
+    """trace：一次加载覆盖所有窗口的边表（按时间桶缓存）；多个窗口时在一次分组计算中全部打分"""
+    unit = file_time_unit(file_path)
+    if unit is None:
+        return {'unit': None}
+    bounds = [window_bounds(start_ts, end_ts, unit) for start_ts, end_ts in windows]
+    edges = load_edges(file_path, min(lo for lo, _ in bounds), max(hi for _, hi in bounds), use_cache=use_cache)
+    scored = dict(zip(windows, window_scores(edges, bounds))) if len(windows) > 1 else {}
+    return {'unit': unit, 'edges': edges, 'scored': scored}
+
+
+def trace_anomalies(state: dict, start_ts: int, end_ts: int) -> list:
+    """trace：窗口内的故障传播得分"""
+    if state['unit'] is None:
+        return []
+    scores = state['scored'].get((start_ts, end_ts))
+    if scores is None:
+        scores = propagation_scores(window_edges(state['edges'], *window_bounds(start_ts, end_ts, state['unit'])))
+    scores = scores[scores['score'] > 0]
+    return [{
+        'component': row.cmdb_id,
+        'signal': f"错误传播 in_errors={row.in_errors} own_error_rate={row.own_error_rate:.2f}",
+        'value': float(row.own_error_rate),
+        'score': float(row.score),
+    } for row in scores.itertuples(index=False)]
+
+
+def prepare_log(file_path: str, windows: list, use_cache: bool = True) -> dict:
+    """日志：一次找出全部错误日志和文件的时间范围"""
+    pattern = '|'.join(ERROR_PATTERNS)
+    errors = None
+    if use_cache:  # 三元组索引同样是 sidecar，--no-cache 时直接扫描
+        errors, _ = search_indexed(file_path, pattern, re.IGNORECASE, columns=['timestamp', 'cmdb_id', 'value'])
+    if errors is None:
+        df = load_telemetry(file_path, columns=['timestamp', 'cmdb_id', 'value'], use_cache=use_cache)
+        errors = analyze_errors(df)
+        bounds = (df['timestamp'].min(), df['timestamp'].max()) if len(df) else None
+    else:
+        ts = load_telemetry(file_path, columns=['timestamp'], use_cache=use_cache)['timestamp']
+        bounds = (ts.min(), ts.max()) if len(ts) else None
+    return {'errors': errors, 'bounds': bounds}
+
+
+def log_anomalies(state: dict, start_ts: int, end_ts: int) -> list:
+    """
+    日志：窗口内错误日志数相对全天平均水平的突增
+
+    期望值 = 窗口外错误数 × 窗口时长 / 窗口外时长，得分为泊松近似下的 z 值
+    (窗口数 - 期望) / sqrt(期望 + 1)，只保留 z > LOG_MIN_Z 的pod；持续报错的pod不会因此排在前面。
+    """
+    errors = state['errors']
+    if len(errors) == 0:
+        return []
+    bounds = state['bounds'] or (start_ts, end_ts)
+
+    in_window = (errors['timestamp'] >= start_ts) & (errors['timestamp'] <= end_ts)
+    window_counts = errors.loc[in_window, 'cmdb_id'].value_counts()
+    outside_counts = errors.loc[~in_window, 'cmdb_id'].value_counts()
+
+    window_len = max(min(end_ts, bounds[1]) - max(start_ts, bounds[0]) + 1, 1)
+    outside_len = max(int(bounds[1] - bounds[0]) + 1 - window_len, 1)
+    expected = outside_counts.reindex(window_counts.index).fillna(0) * window_len / outside_len
+    z = (window_counts - expected) / np.sqrt(expected + 1)
+    z = z[z > LOG_MIN_Z].sort_values(ascending=False, kind='stable')
+    return [{
+        'component': cmdb_id,
+        'signal': f"错误日志 {int(window_counts[cmdb_id])} 条 (期望 {expected[cmdb_id]:.1f})",
+        'value': float(window_counts[cmdb_id]),
+        'score': float(value),
+    } for cmdb_id, value in z.items()]
+
+
+# 分析类型 -> (准备, 打分)：准备函数每个文件调用一次（加载数据、计算全天阈值），
+# 打分函数对每个窗口调用一次
+ANALYZERS = {
+    'metric': (prepare_metric, metric_anomalies),
+    'container': (prepare_container, container_anomalies),
+    'trace': (prepare_trace, trace_anomalies),
+    'log': (prepare_log, log_anomalies),
+}
+
+
+def _init_worker(max_memory: int, quiet: bool = False):
+    """
+    限制工作进程的地址空间，超出时分配失败（MemoryError）而不是拖垮整机
+
+    quiet 时工作进程的 print 转到 stderr（结构化输出模式下 stdout 只包含结果）。
+    """
+    if quiet:
+        sys.stdout = sys.stderr
+    if max_memory:
+        import resource
+        _, hard = resource.getrlimit(resource.RLIMIT_AS)
+        limit = max_memory if hard == resource.RLIM_INFINITY else min(max_memory, hard)
+        resource.setrlimit(resource.RLIMIT_AS, (limit, hard))
+
+
+def run_task(task: dict, start_ts: int, end_ts: int, use_cache: bool = True) -> dict:
+    """在工作进程中执行单个任务，返回异常列表和耗时"""
+    began = time.perf_counter()
+    prepare, score = ANALYZERS[task['analysis']]
+    anomalies = score(prepare(task['file'], [(start_ts, end_ts)], use_cache), start_ts, end_ts)
+    for anomaly in anomalies:
+        anomaly.update(cloudbed=task['cloudbed'], date=task['date'], analysis=task['analysis'])
+    return {'anomalies': anomalies, 'seconds': time.perf_counter() - began}
+
+
+def _run_isolated(func, task: dict, args: tuple, max_memory: int, quiet: bool = False) -> dict:
+    """在单独的进程中执行任务，进程崩溃只影响该任务"""
+    with ProcessPoolExecutor(max_workers=1, initializer=_init_worker, initargs=(max_memory, quiet)) as pool:
+        return pool.submit(func, task, *args).result()
+
+
+def _failure(task: dict, error: BaseException) -> dict:
+    return {**task, 'error': f"{type(error).__name__}: {error}"}
+
+
+def run_pool(func, tasks: list, args: tuple = (), workers: int | None = None, max_memory: int = 0, progress=None,
+             quiet: bool = False) -> dict:
+    """
+    在进程池中对每个任务执行 func(task, *args)（func 须为模块级函数）
+
+    任务内的预期错误（DATA_ERRORS）记为该任务失败，其他异常按程序错误抛出；进程池损坏（工作进程
+    被杀或崩溃）时，未完成的任务各自在独立进程中重试一次，仍然崩溃的记为失败。返回 {'results': [(task, result)], 'failures': [...]}。
+    """
+    workers = max(1, min(workers or default_workers(), len(tasks) or 1))
+    results, failures, broken = [], [], []
+
+    def report(task, result=None, error=None):
+        if progress:
+            progress(len(results) + len(failures), len(tasks), task, result, error)
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(max_memory, quiet)) as pool:
+        futures = {pool.submit(func, task, *args): task for task in tasks}
+        for future in as_completed(futures):
+            task = futures[future]
+            try:
+                result = future.result()
+            except BrokenProcessPool:
+                broken.append(task)
+                continue
+            except DATA_ERRORS as error:
+                failures.append(_failure(task, error))
+                report(task, error=error)
+                continue
+            results.append((task, result))
+            report(task, result)
+
+    if broken:
+        with ThreadPoolExecutor(max_workers=workers) as threads:
+            futures = {threads.submit(_run_isolated, func, task, args, max_memory, quiet): task for task in broken}
+            for future in as_completed(futures):
+                task = futures[future]
+                try:
+                    result = future.result()
+                except (BrokenProcessPool, *DATA_ERRORS) as error:
+                    failures.append(_failure(task, error))
+                    report(task, error=error)
+                    continue
+                results.append((task, result))
+                report(task, result)
+
+    return {'results': results, 'failures': failures, 'retried': len(broken), 'workers': workers}
+
+
+def scan_fleet(tasks: list, start_ts: int, end_ts: int, workers: int | None = None, max_memory: int = 0,
+               use_cache: bool = True, progress=None, quiet: bool = False) -> dict:
+    """在进程池中对同一个时间窗口执行所有任务，返回格式同 run_pool"""
+    return run_pool(run_task, tasks, (start_ts, end_ts, use_cache), workers, max_memory, progress, quiet)
+
+
+def rank_components(anomalies: list) -> pd.DataFrame:
+    """
+    合并各cloudbed的异常为全局排名
+
+    每种分析的得分除以该分析在全部cloudbed中的最大得分，同一组件在每种分析中取最大值，
+    跨分析求和；被多种信号同时指向的组件排在前面。
+    """
+    if not anomalies:
+        return pd.DataFrame(columns=['cloudbed', 'component', 'score', 'analyses', 'evidence'])
+
+    df = pd.DataFrame(anomalies)
+    df['component'] = df['component'].astype(str).map(canonical_component)
+    top = df.groupby('analysis')['score'].transform('max')
+    df['normalized'] = np.where(top > 0, df['score'] / top.where(top > 0, 1), 0.0)
+
+    df = df.sort_values('normalized', ascending=False, kind='stable')
+    best = df.drop_duplicates(['cloudbed', 'component', 'analysis'])
+    ranking = best.groupby(['cloudbed', 'component'], sort=False).agg(
+        score=('normalized', 'sum'),
+        analyses=('analysis', lambda values: ','.join(sorted(values))),
+        evidence=('signal', lambda values: ' | '.join(values)),
+    ).reset_index()
+    return ranking.sort_values(['score', 'cloudbed', 'component'], ascending=[False, True, True],
+                               kind='stable', ignore_index=True)
+
+
+def emit_fleet(out, tasks: list, start_ts: int, end_ts: int, workers: int | None = None, max_memory: int = 0,
+               use_cache: bool = True, top: int = 20):
+    """--format json|arrow：每个任务完成时写出其状态和异常数，最后写出全局排名和失败任务"""
+    out.record('summary', start=start_ts, end=end_ts, tasks=len(tasks))
+
+    def progress(done, total, task, result, error):
+        status = {'error': f"{type(error).__name__}: {error}"} if error is not None else {
+            'seconds': result['seconds'], 'anomalies': len(result['anomalies'])}
+        out.record('task', done=done, total=total, **task, **status)
+
+    with stage('scan', tasks=len(tasks)) as span:
+        scan = scan_fleet(tasks, start_ts, end_ts, workers, max_memory, use_cache, progress, quiet=True)
+        anomalies = [anomaly for _, result in scan['results'] for anomaly in result['anomalies']]
+        span.rows = len(anomalies)
+    out.record('totals', workers=scan['workers'], completed=len(scan['results']), retried=scan['retried'],
+               anomalies=len(anomalies))
+    with stage('rank'):
+        ranking = rank_components(anomalies)
+    out.table('ranking', ranking, top)
+    out.table('failures', scan['failures'])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Fleet Scanner for OpenRCA')
+    parser.add_argument('--data-root', type=str, required=True, help='Directory containing cloudbed-N/telemetry/')
+    parser.add_argument('--start', type=str, required=True, help='Start time (YYYY-MM-DD HH:MM:SS or epoch seconds)')
+    parser.add_argument('--end', type=str, required=True, help='End time (YYYY-MM-DD HH:MM:SS or epoch seconds)')
+    parser.add_argument('--cloudbeds', type=str, help='Comma-separated cloudbed names (default: all)')
+    parser.add_argument('--analyses', type=str, default=','.join(ANALYZERS),
+                        help=f"Comma-separated analyses ({','.join(ANALYZERS)})")
+    parser.add_argument('--workers', type=int, help='Worker processes (default: available cores)')
+    parser.add_argument('--max-memory', type=str, help='Address-space limit per worker, e.g. 4G')
+    parser.add_argument('--top', type=int, default=20, help='Top N components')
+    parser.add_argument('--output', type=str, help='Write anomalies, ranking and failures as JSON')
+    parser.add_argument('--no-cache', action='store_true', help='Read the CSV directly instead of the columnar cache')
+    add_format_arguments(parser)
+    add_profile_arguments(parser)
+
+    args = parser.parse_args(argv)
+    check_format_arguments(parser, args)
+    check_profile_arguments(parser, args)
+
+    with profile_session(args, 'scan_fleet'):
+        run(parser, args)
+
+
+def run(parser, args):
+    """发现任务、并行扫描并输出全局排名"""
+
+    if not Path(args.data_root).is_dir():
+        print(f"错误: 目录不存在 {args.data_root}")
+        sys.exit(1)
+
+    analyses = [name.strip() for name in args.analyses.split(',') if name.strip()]
+    unknown = sorted(set(analyses) - set(ANALYZERS))
+    if unknown:
+        parser.error(f"unknown analyses: {','.join(unknown)}")
+
+    tz = zone(TIMEZONE)
+    start_ts, end_ts = parse_time(args.start, tz), parse_time(args.end, tz)
+    cloudbeds = [name.strip() for name in args.cloudbeds.split(',')] if args.cloudbeds else None
+    max_memory = parse_size(args.max_memory) if args.max_memory else 0
+
+    with stage('discover', data_root=args.data_root) as span:
+        tasks = discover_tasks(args.data_root, start_ts, end_ts, cloudbeds, analyses)
+        span.rows = len(tasks)
+
+    if args.format != 'text':
+        with structured_output(args.format, args.max_rows) as out:
+            emit_fleet(out, tasks, start_ts, end_ts, args.workers, max_memory, not args.no_cache, args.top)
+        return
+
+    print(f"{'='*70}")
+    print("多cloudbed批量扫描")
+    print(f"{'='*70}")
+    print(f"数据目录: {args.data_root}")
+    print(f"时间范围: {datetime.fromtimestamp(start_ts, tz)} ~ {datetime.fromtimestamp(end_ts, tz)}")
+    print(f"任务数: {len(tasks)} ({len({(t['cloudbed'], t['date']) for t in tasks})} 个 cloudbed/日期)")
+
+    if not tasks:
+        print("警告: 时间范围内没有找到数据文件！")
+        return
+
+    def progress(done, total, task, result, error):
+        name = f"{task['cloudbed']} {task['date']} {task['analysis']:<9} {Path(task['file']).name}"
+        if error is not None:
+            print(f"  [{done}/{total}] {name}  失败: {type(error).__name__}: {error}")
+        else:
+            print(f"  [{done}/{total}] {name}  {result['seconds']:.1f}s  {len(result['anomalies'])} 个异常")
+
+    began = time.perf_counter()
+    with stage('scan', tasks=len(tasks)) as span:
+        scan = scan_fleet(tasks, start_ts, end_ts, args.workers, max_memory, not args.no_cache, progress)
+        elapsed = time.perf_counter() - began
+        anomalies = [anomaly for _, result in scan['results'] for anomaly in result['anomalies']]
+        span.rows = len(anomalies)
+
+    with stage('rank'):
+        ranking = rank_components(anomalies)
+
+    with stage('report'):
+        print(f"\n工作进程: {scan['workers']}  总耗时: {elapsed:.1f}s  "
+              f"完成: {len(scan['results'])}/{len(tasks)}  重试: {scan['retried']}")
+
+        print(f"\n{'='*70}")
+        print(f"全局异常排名 (Top {args.top}):")
+        print(f"{'='*70}")
+        if len(ranking) == 0:
+            print("未检测到明显异常")
+        for i, row in enumerate(ranking.head(args.top).itertuples(index=False), 1):
+            print(f"{i}. [{row.cloudbed}] {row.component}  得分={row.score:.2f}  ({row.analyses})")
+            print(f"   {row.evidence[:150]}")
+
+        if scan['failures']:
+            print(f"\n{'='*70}")
+            print(f"失败任务 ({len(scan['failures'])} 个，以上为部分结果):")
+            print(f"{'='*70}")
+            for failure in scan['failures']:
+                print(f"  {failure['cloudbed']} {failure['date']} {failure['analysis']}: {failure['error']}")
+
+        if args.output:
+            report = {
+                'start': start_ts,
+                'end': end_ts,
+                'tasks': len(tasks),
+                'completed': len(scan['results']),
+                'ranking': ranking.to_dict('records'),
+                'anomalies': anomalies,
+                'failures': scan['failures'],
+            }
+            Path(args.output).write_text(json.dumps(report, ensure_ascii=False, indent=2, default=str))
+            print(f"\n结果已保存到: {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+KPI Analyzer for Telecom - 电信场景指标分析工具
+适用于 metric_container / metric_middleware / metric_node / metric_service.csv
+（itemid,name,bomc_id,timestamp,value,cmdb_id，毫秒时间戳）：itemid/bomc_id 读取时即丢弃，
+按块计算阈值 + 检测故障窗口内越过阈值的组件KPI
+
+各组件（os_xxx、docker_xxx、db_xxx）的同名KPI量级差别很大，阈值默认按每个组件自身的全天分布计算。
+
+Usage:
+    python analyze_kpi.py --file metric_node.csv --start "2020-04-11 10:00:00" --end "2020-04-11 10:30:00"
+
+    # 按组件过滤，或与 market 一样按KPI跨组件计算阈值
+    python analyze_kpi.py --file metric_service.csv --start ... --end ... --component db_00 --baseline kpi
+"""
+
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from common.rca_client import add_server_argument, forward_early, forward_if_requested
+
+if __name__ == '__main__':
+    forward_early('telecom_analyze_kpi')  # --server: 在导入 pandas 之前转发给常驻服务
+
+import argparse
+
+import pandas as pd
+
+from common.output import add_format_arguments, check_format_arguments
+from common.profiling import add_profile_arguments, check_profile_arguments, profile_session
+from common.scene_scan import add_scene_arguments, run_scene
+
+KPI_COLUMNS = ['timestamp', 'cmdb_id', 'name', 'value']
+
+# 资源类型 -> KPI名称（小写）中的关键词，按顺序匹配
+RESOURCE_KEYWORDS = {
+    'cpu': ['cpu'],
+    'network_loss': ['loss', 'drop', 'retrans'],
+    'network_delay': ['delay', 'latency', 'rtt', 'ping', 'queue'],
+    'connection': ['connect', 'session', 'client', 'proc', 'thread'],
+    'availability': ['on_off', 'alive', 'status', 'state'],
+}
+
+# 资源类型 -> 候选根因原因（specs/telecom_spec.md）
+RESOURCE_REASONS = {
+    'cpu': 'CPU fault',
+    'network_loss': 'network loss',
+    'network_delay': 'network delay',
+    'connection': 'db connection limit',
+    'availability': 'db close',
+}
+
+
+def classify_kpi(kpi_name: str) -> tuple:
+    """(资源类型, 候选根因原因)"""
+    kpi_lower = kpi_name.lower()
+    for res_type, keywords in RESOURCE_KEYWORDS.items():
+        if any(kw in kpi_lower for kw in keywords):
+            return res_type, RESOURCE_REASONS[res_type]
+    return 'other', None
+
+
+def to_long(chunk: pd.DataFrame) -> pd.DataFrame:
+    return chunk.rename(columns={'cmdb_id': 'component', 'name': 'kpi'})
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Telecom KPI Analyzer for OpenRCA')
+    add_scene_arguments(parser, 'Metric file (metric_container/middleware/node/service.csv)',
+                        baseline='series', min_deviation=0.5)
+    add_format_arguments(parser)
+    add_profile_arguments(parser)
+    add_server_argument(parser)
+
+    args = parser.parse_args(argv)
+    forward_if_requested(args, 'telecom_analyze_kpi', argv)
+    check_format_arguments(parser, args)
+    check_profile_arguments(parser, args)
+
+    with profile_session(args, 'telecom_analyze_kpi'):
+        run(parser, args)
+
+
+def run(parser, args):
+    run_scene(parser, args, f"电信场景指标分析报告 ({Path(args.file).stem})", KPI_COLUMNS, to_long,
+              classify=classify_kpi)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+Trace Analyzer for Telecom - 电信场景链路分析工具
+按块扫描 trace_span.csv（startTime 为毫秒）：每个组件的耗时（elapsed）和失败率（error），
+JDBC 调用另按数据源（dsName，即 db_xxx）统计耗时（ds_elapsed）；检测故障窗口内平均耗时超过
+自身全天P95、或失败率高于自身全天水平的组件
+
+Usage:
+    python analyze_trace.py --file trace_span.csv --start "2020-04-11 10:00:00" --end "2020-04-11 10:30:00"
+"""
+
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from common.rca_client import add_server_argument, forward_early, forward_if_requested
+
+if __name__ == '__main__':
+    forward_early('telecom_analyze_trace')  # --server: 在导入 pandas 之前转发给常驻服务
+
+import argparse
+
+import numpy as np
+import pandas as pd
+from pandas.api.types import union_categoricals
+
+from common.output import add_format_arguments, check_format_arguments
+from common.profiling import add_profile_arguments, check_profile_arguments, profile_session
+from common.scene_scan import add_scene_arguments, run_scene
+
+# traceId/id/pid/serviceName 不参与统计，读取时即丢弃
+TRACE_COLUMNS = ['startTime', 'elapsedTime', 'success', 'cmdb_id', 'dsName']
+
+KPIS = ['elapsed', 'error', 'ds_elapsed']
+
+# 失败率按每个组件自身的全天失败率判定
+RULES = {'error': 'rate'}
+
+
+def to_long(chunk: pd.DataFrame) -> pd.DataFrame:
+    """每个span展开为 elapsed、error 两行，JDBC 调用再加一行以数据源为组件的 ds_elapsed"""
+    n = len(chunk)
+    jdbc = chunk['dsName'].notna().to_numpy()
+    success = chunk['success']
+    ok = [v for v in success.dropna().unique() if str(v).lower() == 'true']
+    elapsed = chunk['elapsedTime'].to_numpy(dtype=np.float32)
+    cmdb_id = chunk['cmdb_id'].astype('category')
+    return pd.DataFrame({
+        'timestamp': np.concatenate([chunk['startTime'].to_numpy()] * 2 + [chunk['startTime'].to_numpy()[jdbc]]),
+        'component': union_categoricals([cmdb_id, cmdb_id, chunk['dsName'][jdbc].astype('category')],
+                                        ignore_order=True),
+        'kpi': pd.Categorical.from_codes(np.repeat(np.arange(len(KPIS), dtype=np.int8), [n, n, int(jdbc.sum())]),
+                                         KPIS),
+        'value': np.concatenate([elapsed, (~success.isin(ok)).to_numpy(dtype=np.float32), elapsed[jdbc]]),
+    })
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Telecom Trace Analyzer for OpenRCA')
+    add_scene_arguments(parser, 'Trace file (trace_span.csv)', baseline='series', min_deviation=0.5)
+    add_format_arguments(parser)
+    add_profile_arguments(parser)
+    add_server_argument(parser)
+
+    args = parser.parse_args(argv)
+    forward_if_requested(args, 'telecom_analyze_trace', argv)
+    check_format_arguments(parser, args)
+    check_profile_arguments(parser, args)
+
+    with profile_session(args, 'telecom_analyze_trace'):
+        run(parser, args)
+
+
+def run(parser, args):
+    run_scene(parser, args, '电信场景链路分析报告', TRACE_COLUMNS, to_long, rules=RULES)
+
+
+if __name__ == '__main__':
+    main()
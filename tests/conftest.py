@@ -0,0 +1,6 @@
+"""OpenRCA 分析脚本的单元测试：脚本以 common/market 等包的形式导入"""
+
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'skills' / 'open_rca_diagnosis' / 'scripts'))
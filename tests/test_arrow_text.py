@@ -0,0 +1,33 @@
+"""Arrow 文本内核与 pandas/Python re 的结果一致"""
+
+import re
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from common.arrow_text import match_mask, truncate
+
+VALUES = ['Connection REFUSED by peer', 'timeout after 3s', None, 'abcabc', '', 'ünïcödé Timeout',
+          'payment went through (transaction_id: 42)', 'line1\nline2']
+
+PATTERNS = ['refused', 'TIMEOUT', 'time.*3s|peer', r'(abc)\1', r'pay(?=ment)', r'^line2', r'\(transaction_id: \d+\)']
+
+
+def expected(values: pd.Series, pattern: str, flags: int) -> np.ndarray:
+    return values.astype(object).str.contains(pattern, regex=True, flags=flags, na=False).to_numpy(dtype=bool)
+
+
+@pytest.mark.filterwarnings('ignore:This pattern is interpreted as a regular expression')
+@pytest.mark.parametrize('dtype', ['str', object, 'category'])
+@pytest.mark.parametrize('pattern', PATTERNS)
+@pytest.mark.parametrize('flags', [0, re.IGNORECASE, re.IGNORECASE | re.MULTILINE])
+def test_match_mask_matches_python_re(dtype, pattern, flags):
+    values = pd.Series(VALUES, dtype=dtype)
+    assert match_mask(values, pattern, flags).tolist() == expected(values, pattern, flags).tolist()
+
+
+@pytest.mark.parametrize('dtype', ['str', object, 'category'])
+def test_truncate_by_characters(dtype):
+    values = pd.Series(VALUES, dtype=dtype)
+    assert truncate(values, 5) == [value[:5] if isinstance(value, str) else '' for value in VALUES]
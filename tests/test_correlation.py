@@ -0,0 +1,42 @@
+"""跨层相关的截断标记：只有超过时间预算跳过批次时才算截断"""
+
+import numpy as np
+import pandas as pd
+
+from common.correlation import Aligned, rank_causes
+
+STEP = 60
+BINS = 120
+
+
+def aligned(n_series, seed=0):
+    rng = np.random.default_rng(seed)
+    keys = pd.DataFrame({'cmdb_id': [f"pod-{i}" for i in range(n_series)], 'kpi_name': 'cpu'})
+    return Aligned(keys, rng.normal(size=(n_series, BINS)).cumsum(axis=1), 0, STEP)
+
+
+def test_no_targets_is_not_truncated():
+    targets = Aligned(pd.DataFrame(columns=['service', 'kpi']), np.empty((0, BINS)), 0, STEP)
+    result = rank_causes(targets, {'container': aligned(20)}, 3600, 5400)
+    assert result['processed'] == 0
+    assert result['candidates'] == 20
+    assert result['truncated'] is False
+    assert len(result['causes']) == 0
+
+
+def test_complete_run_is_not_truncated():
+    targets = aligned(2, seed=1)
+    targets.keys.columns = ['service', 'kpi']
+    result = rank_causes(targets, {'container': aligned(20)}, 3600, 5400)
+    assert result['processed'] == result['candidates'] == 20
+    assert result['truncated'] is False
+
+
+def test_budget_exhausted_is_truncated(monkeypatch):
+    from common import correlation
+    monkeypatch.setattr(correlation, 'BATCH_BYTES', 1)  # 每批一条候选序列
+    targets = aligned(2, seed=1)
+    targets.keys.columns = ['service', 'kpi']
+    result = rank_causes(targets, {'container': aligned(20)}, 3600, 5400, budget=0.0)
+    assert result['processed'] == 1
+    assert result['truncated'] is True
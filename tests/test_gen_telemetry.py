@@ -0,0 +1,43 @@
+"""合成数据生成器：行数随 --rows 增长，低于最小规模的文件被标记"""
+
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'skills' / 'open_rca_diagnosis' / 'benchmarks'))
+from gen_telemetry import SHARES, generate, min_rows
+from run_benchmarks import scaling_exponents
+
+FILES = ['metric_container', 'metric_service', 'log_service']
+SCALES = (10_000, 400_000, 1_600_000)
+
+
+@pytest.fixture(scope='module')
+def generated(tmp_path_factory):
+    root = tmp_path_factory.mktemp('gen')
+    return {rows: generate(str(root / str(rows)), rows, files=FILES)['files'] for rows in SCALES}
+
+
+def test_rows_grow_with_requested_rows(generated):
+    for name in FILES:
+        counts = [generated[rows][name]['rows'] for rows in SCALES[1:]]
+        assert counts[1] > 3 * counts[0], name
+        assert not any(generated[rows][name]['floored'] for rows in SCALES[1:])
+
+
+def test_files_below_minimum_are_floored(generated):
+    small = generated[SCALES[0]]
+    assert small['metric_container']['floored']
+    assert small['metric_container']['rows'] == min_rows('metric_container')
+    assert small['log_service']['rows'] == int(SCALES[0] * SHARES['log_service'])
+    assert not small['log_service']['floored']
+
+
+def test_scaling_exponents_skip_floored_points():
+    results = [
+        {'case': 'container', 'rows': 12_000, 'time': 0.5, 'floored': True},
+        {'case': 'container', 'rows': 12_000, 'time': 0.1, 'floored': False},
+        {'case': 'container', 'rows': 120_000, 'time': 1.0, 'floored': False},
+    ]
+    assert scaling_exponents(results)['container'] == pytest.approx([1.0])
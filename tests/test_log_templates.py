@@ -0,0 +1,65 @@
+"""模板突增得分：基线取整个计数表（全天），只在时间窗口内的分钟中取峰值"""
+
+import numpy as np
+import pandas as pd
+
+from common.log_templates import TemplateMiner, burst_scores, window_counts
+
+T0 = 1647705600
+
+
+def day_counts(spike_minute: int, spike: int = 30, n_minutes: int = 1440) -> pd.DataFrame:
+    """两个序列：模板1 在 pod-a 上每分钟1条、某一分钟突增；模板2 在 pod-b 上每10分钟1条"""
+    minutes = T0 + 60 * np.arange(n_minutes)
+    steady = pd.DataFrame({'template_id': 1, 'cmdb_id': 'pod-a', 'minute': minutes, 'count': 1})
+    steady.loc[spike_minute, 'count'] = spike
+    sparse = pd.DataFrame({'template_id': 2, 'cmdb_id': 'pod-b', 'minute': minutes[::10], 'count': 1})
+    return pd.concat([steady, sparse], ignore_index=True).sort_values('minute', kind='stable')
+
+
+def test_burst_baseline_is_whole_table_not_window():
+    counts = day_counts(spike_minute=600)
+    start, end = T0 + 600 * 60, T0 + 630 * 60
+    bursts = burst_scores(counts, 1440, start, end)
+
+    top = bursts.iloc[0]
+    assert (top['template_id'], top['cmdb_id'], top['minute']) == (1, 'pod-a', start)
+    series = counts[counts['template_id'] == 1]['count']
+    assert top['mean'] == series.sum() / 1440
+    assert top['std'] == np.sqrt((series ** 2).sum() / 1440 - top['mean'] ** 2)
+
+    # 只以窗口为基线时突增把自身的基线抬高，得分明显更低
+    window_only = burst_scores(window_counts(counts, start, end), 30)
+    assert top['score'] > 2 * window_only.iloc[0]['score']
+
+
+def test_burst_peak_only_inside_window():
+    counts = day_counts(spike_minute=100)
+    bursts = burst_scores(counts, 1440, T0 + 600 * 60, T0 + 630 * 60)
+    assert bursts['minute'].between(T0 + 600 * 60, T0 + 630 * 60).all()
+    assert len(burst_scores(counts, 1440, T0 + 2000 * 60, T0 + 2010 * 60)) == 0
+
+
+def test_burst_scores_on_filtered_subset():
+    counts = day_counts(spike_minute=600)
+    subset = counts[counts['cmdb_id'] == 'pod-a']
+    assert not burst_scores(subset, 1440).isna().any().any()
+    assert burst_scores(subset, 1440).iloc[0]['minute'] == T0 + 600 * 60
+
+
+def test_window_counts_aligned_end_is_inclusive():
+    counts = day_counts(spike_minute=0, n_minutes=10)
+    steady = counts[counts['template_id'] == 1]
+    assert window_counts(steady, T0 + 60, T0 + 180)['minute'].tolist() == [T0 + 60, T0 + 120, T0 + 180]
+    assert window_counts(steady, T0 + 60, T0 + 179)['minute'].tolist() == [T0 + 60, T0 + 120]
+    assert window_counts(steady, T0 + 90, T0 + 150)['minute'].tolist() == [T0 + 60, T0 + 120]
+    assert window_counts(steady, T0 + 60, T0 + 60)['minute'].tolist() == [T0 + 60]
+
+
+def test_miner_ignores_structured_prefix_in_similarity():
+    miner = TemplateMiner()
+    first = miner.add('severity: info, message: Getting supported currencies...')
+    second = miner.add('severity: info, message: payment went through')
+    again = miner.add('severity: info, message: Getting supported currencies...')
+    assert first != second
+    assert again == first
@@ -0,0 +1,51 @@
+"""常驻服务的内存预算：超出预算的文件在加载前就被识别，不读取整个文件"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from common import telemetry_cache
+
+T0 = 1647705600
+
+
+@pytest.fixture
+def metric_csv(tmp_path, monkeypatch):
+    monkeypatch.setenv('OPENRCA_CACHE_DIR', str(tmp_path / 'cache'))
+    minutes = np.arange(2000) * 60 + T0
+    frame = pd.DataFrame({
+        'timestamp': minutes,
+        'cmdb_id': 'frontend-0',
+        'kpi_name': 'container_cpu_usage_seconds',
+        'value': np.arange(len(minutes)) / 7,
+    })
+    path = tmp_path / 'metric_container.csv'
+    frame.to_csv(path, index=False)
+    yield path
+    telemetry_cache.set_memory_budget(0)
+
+
+def test_over_budget_file_is_not_loaded(metric_csv, monkeypatch):
+    telemetry_cache.set_memory_budget(1024)
+    loads = []
+    real_load = telemetry_cache._load_file
+    monkeypatch.setattr(telemetry_cache, '_load_file', lambda *args: loads.append(args) or real_load(*args))
+
+    frame = telemetry_cache.load_telemetry(str(metric_csv), start_ts=T0, end_ts=T0 + 600)
+    assert len(frame) == 11
+    # 只有带时间窗口的读取，没有不带窗口的整文件加载
+    assert [args[2:4] for args in loads] == [(T0, T0 + 600)]
+    assert telemetry_cache.memory_stats()['files'] == []
+
+
+@pytest.mark.parametrize('cached', [False, True])
+def test_estimate_tracks_loaded_size(metric_csv, cached):
+    if cached:
+        telemetry_cache.ensure_cache(str(metric_csv))
+    estimate = telemetry_cache._estimate_resident_bytes(metric_csv.resolve())
+
+    telemetry_cache.set_memory_budget(64 << 20)
+    telemetry_cache.load_telemetry(str(metric_csv))
+    [resident] = telemetry_cache.memory_stats()['files']
+    assert resident['rows'] == 2000
+    assert 0.5 * resident['bytes'] <= estimate <= 2 * resident['bytes']
@@ -0,0 +1,70 @@
+"""缓存目录不可写时退回直接读取CSV：结果与不使用缓存相同，只提示一行"""
+
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from common import log_index, series_store, telemetry_cache, ts_index
+
+T0 = 1647705600
+
+
+def write_data(directory):
+    directory.mkdir(exist_ok=True)
+    rng = np.random.default_rng(0)
+    minutes = np.arange(120) * 60 + T0
+    metric = pd.DataFrame({
+        'timestamp': np.repeat(minutes, 2),
+        'cmdb_id': np.tile(['frontend-0', 'cartservice-1'], len(minutes)),
+        'kpi_name': 'container_cpu_usage_seconds',
+        'value': rng.random(2 * len(minutes)).round(4),
+    })
+    metric.to_csv(directory / 'metric_container.csv', index=False)
+    log = pd.DataFrame({
+        'log_id': [f"id{i}" for i in range(len(minutes))],
+        'timestamp': minutes,
+        'cmdb_id': np.where(np.arange(len(minutes)) % 3 == 0, 'frontend-0', 'cartservice-1'),
+        'log_name': 'log_proxy',
+        'value': [f"request {i} {'failed: connection refused' if i % 10 == 0 else 'ok'}" for i in range(len(minutes))],
+    })
+    log.to_csv(directory / 'log_service.csv', index=False)
+    return directory / 'metric_container.csv', directory / 'log_service.csv'
+
+
+def check_fallback(metric_csv, log_csv, capsys):
+    start, end = T0 + 600, T0 + 1800
+    assert telemetry_cache.ensure_cache(str(metric_csv)) is None
+    assert 'metric_container' in capsys.readouterr().err
+
+    frame = telemetry_cache.load_telemetry(str(metric_csv), start_ts=start, end_ts=end)
+    expected = pd.read_csv(metric_csv)
+    expected = expected[(expected['timestamp'] >= start) & (expected['timestamp'] <= end)]
+    assert frame['value'].tolist() == expected['value'].tolist()
+    assert len(ts_index.read_time_range(str(metric_csv), start, end)) == len(expected)
+
+    matrix = series_store.open_matrix(str(metric_csv))
+    assert matrix.values.shape[0] == 2
+    assert np.nansum(matrix.values) == pytest.approx(pd.read_csv(metric_csv)['value'].sum(), rel=1e-5)
+
+    assert log_index.search(str(log_csv), 'connection refused') == (None, None)
+    assert capsys.readouterr().err.count('无法写入') >= 1
+
+
+def test_cache_root_not_a_directory(tmp_path, monkeypatch, capsys):
+    metric_csv, log_csv = write_data(tmp_path / 'data')
+    (tmp_path / 'blocker').write_text('')
+    monkeypatch.setenv('OPENRCA_CACHE_DIR', str(tmp_path / 'blocker' / 'cache'))
+    check_fallback(metric_csv, log_csv, capsys)
+
+
+@pytest.mark.skipif(hasattr(os, 'geteuid') and os.geteuid() == 0, reason='root 不受目录权限限制')
+def test_read_only_data_dir(tmp_path, monkeypatch, capsys):
+    metric_csv, log_csv = write_data(tmp_path / 'data')
+    monkeypatch.delenv('OPENRCA_CACHE_DIR', raising=False)
+    (tmp_path / 'data').chmod(0o555)
+    try:
+        check_fallback(metric_csv, log_csv, capsys)
+    finally:
+        (tmp_path / 'data').chmod(0o755)
@@ -0,0 +1,111 @@
+"""概要结构：分块建立后合并应与整个数据流一次建立一致（在误差范围内）"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from common.sketches import ColumnProfile, DDSketch, HyperLogLog, TDigest
+
+
+@pytest.fixture
+def latencies():
+    return np.random.default_rng(0).lognormal(mean=3, sigma=1, size=200_000)
+
+
+def test_hyperloglog_merge_matches_single_stream():
+    values = pd.Series(np.arange(100_000)).astype(str)
+    whole, left, right = HyperLogLog(), HyperLogLog(), HyperLogLog()
+    whole.add(values)
+    left.add(values[:60_000])
+    right.add(values[40_000:])
+    left.merge(right)
+    assert np.array_equal(left.registers, whole.registers)
+    assert abs(whole.estimate() - 100_000) / 100_000 < 0.03
+
+
+def test_hyperloglog_small_cardinality_is_exact_enough():
+    sketch = HyperLogLog()
+    sketch.add(pd.Series(['a', 'b', 'c', 'a', None]))
+    assert sketch.estimate() == 3
+
+
+def test_hyperloglog_int_and_float_chunks_hash_alike():
+    ints, floats = HyperLogLog(), HyperLogLog()
+    ints.add(pd.Series([1, 2, 3]))
+    floats.add(pd.Series([1.0, 2.0, 3.0]))
+    assert np.array_equal(ints.registers, floats.registers)
+
+
+def test_hyperloglog_rejects_different_precision():
+    with pytest.raises(ValueError):
+        HyperLogLog(14).merge(HyperLogLog(12))
+
+
+def test_tdigest_merge_close_to_exact(latencies):
+    merged = TDigest()
+    for part in np.array_split(latencies, 7):
+        digest = TDigest()
+        digest.add(part)
+        merged.merge(digest)
+    assert merged.count == len(latencies)
+    assert merged.min == latencies.min() and merged.max == latencies.max()
+    for q in (0.5, 0.9, 0.99):
+        exact = np.quantile(latencies, q)
+        assert abs(merged.quantile(q) - exact) / exact < 0.02
+
+
+def test_tdigest_state_round_trip(latencies):
+    digest = TDigest()
+    digest.add(latencies)
+    restored = TDigest.from_state(digest.to_state())
+    assert restored.quantile(0.95) == digest.quantile(0.95)
+
+
+def test_tdigest_empty_is_nan():
+    assert np.isnan(TDigest().quantile(0.5))
+
+
+def test_ddsketch_merge_equals_single_stream(latencies):
+    whole = DDSketch()
+    whole.add(latencies)
+    merged = DDSketch()
+    for part in np.array_split(latencies, 5)[::-1]:
+        sketch = DDSketch()
+        sketch.add(part)
+        merged.merge(sketch)
+    assert merged.offset == whole.offset
+    assert np.array_equal(merged.bins, whole.bins)
+    assert merged.count == whole.count
+
+
+@pytest.mark.parametrize('q', [0.0, 0.5, 0.9, 0.99, 1.0])
+def test_ddsketch_relative_error_within_alpha(latencies, q):
+    sketch = DDSketch(alpha=0.01)
+    sketch.add(latencies)
+    exact = np.sort(latencies)[int(np.floor(q * (len(latencies) - 1)))]
+    assert abs(sketch.quantile(q) - exact) <= 0.01 * exact + 1e-9
+
+
+def test_ddsketch_counts_non_positive_as_zero():
+    sketch = DDSketch()
+    sketch.add([0, 0, 0, 5, 10])
+    assert sketch.zero_count == 3
+    assert sketch.quantile(0.5) == 0.0
+    restored = DDSketch.from_state(sketch.to_state())
+    assert restored.quantile(1.0) == pytest.approx(10, rel=0.01)
+
+
+def test_column_profile_distinct_exact_while_heavy_hitters_fit():
+    profile = ColumnProfile(top_k=10)
+    for chunk in np.array_split(np.arange(40) % 7, 4):
+        profile.add(pd.Series(chunk))
+    profile.add(pd.Series([None, None], dtype='float64'))
+    assert profile.distinct_exact
+    assert profile.distinct() == 7
+
+
+def test_column_profile_distinct_estimate_capped_by_rows():
+    profile = ColumnProfile(p=4, top_k=2)
+    profile.add(pd.Series([f"id{i}" for i in range(30)] + [None]))
+    assert not profile.distinct_exact
+    assert profile.distinct() <= 30
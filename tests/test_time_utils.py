@@ -0,0 +1,43 @@
+"""时间单位识别与窗口换算"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from common.time_utils import detect_unit, to_epoch_ms, unit_of, unit_scale, window_bounds
+
+
+@pytest.mark.parametrize('ts, unit', [
+    (1647705600, 's'),
+    (1647705600123, 'ms'),
+    (1647705600123456, 'us'),
+    (1647705600123456789, 'ns'),
+    (None, 's'),
+    (float('nan'), 's'),
+])
+def test_unit_of_by_magnitude(ts, unit):
+    assert unit_of(ts) == unit
+
+
+def test_unit_scale():
+    assert unit_scale(1647705600) == 1
+    assert unit_scale(1647705600000) == 1000
+
+
+def test_detect_unit_ignores_missing_values():
+    assert detect_unit(np.array([np.nan, 1647705600123.0])) == 'ms'
+    assert detect_unit(np.array([], dtype=np.int64)) == 's'
+    assert detect_unit(pd.Series([1647705600, 1647705660])) == 's'
+
+
+def test_window_bounds_closed_interval():
+    assert window_bounds(1647705600, 1647707400) == (1647705600, 1647707400)
+    assert window_bounds(1647705600, 1647707400, 'ms') == (1647705600000, 1647707400999)
+    assert window_bounds(1647705600, 1647707400, None) == (1647705600, 1647707400)
+
+
+def test_to_epoch_ms_units_agree():
+    seconds = np.array([1647705600, 1647705601])
+    assert to_epoch_ms(seconds).tolist() == [1647705600000, 1647705601000]
+    assert to_epoch_ms(seconds * 1000).tolist() == [1647705600000, 1647705601000]
+    assert to_epoch_ms(pd.Series(['2022-03-20 00:00:00'])).tolist() == [1647705600000]
@@ -0,0 +1,46 @@
+"""时间索引的记录切分：引号内的换行不是记录边界，块边界可以落在记录中间"""
+
+import io
+
+import pandas as pd
+import pytest
+
+from common.ts_index import iter_records
+
+ROWS = [
+    (1647705600, 'frontend-0', 'plain message'),
+    (1647705601, 'cartservice-1', 'multi\nline "quoted"\nmessage'),
+    (1647705602, 'frontend-1', 'comma, inside'),
+    (1647705603, 'shippingservice-2', '"""'),
+    (1647705604, 'frontend-2', 'last line'),
+]
+
+
+def write_log(path, newline_at_end=True):
+    frame = pd.DataFrame(ROWS, columns=['timestamp', 'cmdb_id', 'value'])
+    frame.insert(0, 'log_id', [f"id{i}" for i in range(len(frame))])
+    frame['log_name'] = 'log_proxy'
+    text = frame.to_csv(index=False, lineterminator='\n')
+    path.write_bytes(text.encode() if newline_at_end else text.rstrip('\n').encode())
+    return path.read_bytes()
+
+
+@pytest.mark.parametrize('block_bytes', [7, 32, 1 << 20])
+@pytest.mark.parametrize('newline_at_end', [True, False])
+def test_iter_records_splits_on_quote_parity(tmp_path, block_bytes, newline_at_end):
+    data = write_log(tmp_path / 'log_service.csv', newline_at_end)
+    blocks = list(iter_records(str(tmp_path / 'log_service.csv'), ['timestamp', 'cmdb_id', 'value'], block_bytes))
+
+    frame = pd.concat([block for _, _, block in blocks], ignore_index=True)
+    assert frame['timestamp'].tolist() == [row[0] for row in ROWS]
+    assert frame['value'].tolist() == [row[2] for row in ROWS]
+
+    # 每条记录的字节区间可以单独解析出同一行
+    header = data[:data.index(b'\n') + 1]
+    starts = [int(s) for block_starts, _, _ in blocks for s in block_starts]
+    ends = [int(e) for _, block_ends, _ in blocks for e in block_ends]
+    assert starts[0] == len(header) and ends[-1] == len(data)
+    assert starts[1:] == ends[:-1]
+    for (start, end), row in zip(zip(starts, ends), ROWS):
+        record = pd.read_csv(io.BytesIO(header + data[start:end]))
+        assert record['value'].iloc[0] == row[2]